@@ -0,0 +1,180 @@
+"""Self-hosted ASGI server mode.
+
+Serves the same routes as API Gateway by translating each request into the
+event shape the Lambda handlers expect and calling them directly, so
+validation, target building and selection are shared rather than forked.
+Handlers run on a bounded thread pool whenever they may touch storage;
+redirects for links already in the warm cache (packed ones once all their
+shards are loaded) are answered on the event loop without a thread hop,
+from the cache entry taken when the request was routed.
+Replicating a code that turns hot runs on a thread of its own.
+
+Run with uvicorn (not a Lambda dependency, install it separately)::
+
+    STORAGE_BACKEND=sqlite python asgi.py --workers 4
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+if __name__ == "__main__":
+    # Set before the handlers are imported: they load the hot set and
+    # health scores from storage at import time.
+    os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+
+import generate_link
+import redirect
+
+MAX_BODY_BYTES = 10 * 1024 * 1024
+STORAGE_THREADS = int(os.environ.get("ASGI_STORAGE_THREADS", "32"))
+
+_executor: ThreadPoolExecutor | None = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=STORAGE_THREADS, thread_name_prefix="storage")
+    return _executor
+
+
+def _shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+    redirect._visits.close()
+    if redirect._events is not None:
+        redirect._events.close()
+
+
+def build_event(scope: dict, body: bytes, path_parameters: dict | None = None) -> dict:
+    """Translate an ASGI HTTP scope into an API Gateway HTTP API (v2) event."""
+    headers = {}
+    for name, value in scope.get("headers", []):
+        key = name.decode("latin-1").lower()
+        value = value.decode("latin-1")
+        headers[key] = f"{headers[key]},{value}" if key in headers else value
+    client = scope.get("client") or ("", 0)
+    return {
+        "rawPath": scope["path"],
+        "rawQueryString": scope.get("query_string", b"").decode("latin-1"),
+        "headers": headers,
+        "body": body.decode("utf-8") if body else None,
+        "pathParameters": path_parameters,
+        "requestContext": {"http": {"method": scope["method"], "path": scope["path"], "sourceIp": client[0]}},
+    }
+
+
+def route(method: str, path: str) -> tuple[Callable[[dict, Any], dict] | None, dict | None, bool]:
+    """Return (handler, path parameters, may block on storage) for a request, or (None, None, False)."""
+    if method == "POST" and path == "/generate-link":
+        return generate_link.handler, None, True
+    if method == "POST" and path == "/generate-links":
+        return generate_link.bulk_handler, None, True
+    if method == "POST" and path == "/resolve":
+        return redirect.resolve_handler, None, True
+    segments = path.strip("/").split("/")
+    if method in ("GET", "HEAD") and len(segments) == 1 and segments[0]:
+        short_code = segments[0]
+        cached = redirect.cached_entry(short_code)
+        if cached is None:
+            return redirect.handler, {"short_code": short_code}, True
+        return functools.partial(redirect.handler, cached=cached), {"short_code": short_code}, False
+    if method == "PATCH" and len(segments) == 1 and segments[0]:
+        return generate_link.update_handler, {"short_code": segments[0]}, True
+    return None, None, False
+
+
+async def _read_body(receive: Callable) -> bytes | None:
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            return None
+        chunks.append(chunk)
+        if not message.get("more_body", False):
+            return b"".join(chunks)
+
+
+async def _send_result(send: Callable, result: dict, include_body: bool = True) -> None:
+    body = (result.get("body") or "").encode("utf-8")
+    headers = [(k.lower().encode("latin-1"), str(v).encode("latin-1")) for k, v in (result.get("headers") or {}).items()]
+    headers.append((b"content-length", str(len(body)).encode("latin-1")))
+    await send({"type": "http.response.start", "status": result["statusCode"], "headers": headers})
+    await send({"type": "http.response.body", "body": body if include_body else b""})
+
+
+async def _lifespan(receive: Callable, send: Callable) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            _get_executor()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await asyncio.get_running_loop().run_in_executor(None, _shutdown)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope: dict, receive: Callable, send: Callable) -> None:
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    handler, path_parameters, blocking = route(scope["method"], scope["path"])
+    if handler is None:
+        await _send_result(send, {"statusCode": 404, "body": json.dumps({"error": "Not found"})})
+        return
+
+    body = await _read_body(receive)
+    if body is None:
+        await _send_result(send, {"statusCode": 413, "body": json.dumps({"error": "Request body too large"})})
+        return
+
+    event = build_event(scope, body, path_parameters)
+    if blocking:
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(_get_executor(), handler, event, None)
+    else:
+        result = handler(event, None)
+    await _send_result(send, result, include_body=scope["method"] != "HEAD")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve Qaktus over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("Server mode needs uvicorn: uv pip install uvicorn")
+
+    uvicorn.run(
+        "asgi:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        lifespan="on",
+        access_log=False,
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
+    )
+
+
+if __name__ == "__main__":
+    main()
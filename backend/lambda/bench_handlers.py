@@ -0,0 +1,203 @@
+"""Micro-benchmarks for the handlers and their hot helpers.
+
+Every case runs against in-memory storage, so results reflect our own code
+rather than network latency. Results are written as JSON and can be
+compared against a stored baseline; the script exits non-zero when any
+case is slower than the baseline by more than the threshold.
+
+    python bench_handlers.py --output bench.json
+    python bench_handlers.py --baseline bench.json --threshold 0.25
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import timeit
+from typing import Callable
+
+import generate_link
+import redirect
+from sampler import AliasSampler
+from storage import MemoryStorage
+from target_codec import pack_link
+
+TARGET_SIZES = [1, 10, 1_000, 10_000]
+
+
+def make_targets(n: int) -> list[dict]:
+    return [{"url": f"https://example.com/{i}", "weight": (i % 7) + 1, "visits": 0} for i in range(n)]
+
+
+def make_body(n: int) -> dict:
+    return {"urls": [{"original_url": f"https://example.com/{i}", "weight": (i % 7) + 1} for i in range(n)]}
+
+
+def measure(fn: Callable[[], object], repeat: int = 5, min_time: float = 0.2) -> dict:
+    """Time ``fn`` and return per-call latency (median and best of ``repeat`` runs) and throughput."""
+    timer = timeit.Timer(fn)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time:
+            break
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9)))
+    per_call = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    median = statistics.median(per_call)
+    return {
+        "ns_per_call": median * 1e9,
+        "best_ns_per_call": min(per_call) * 1e9,
+        "ops_per_sec": 1 / median if median else float("inf"),
+        "loops": number,
+    }
+
+
+def _use_memory_storage() -> MemoryStorage:
+    store = MemoryStorage()
+    generate_link._storage = store
+    redirect._storage = store
+    redirect._cache.clear()
+    return store
+
+
+def build_cases() -> dict[str, Callable[[], Callable[[], object]]]:
+    """Map case name to a setup function that returns the callable to time."""
+    cases: dict[str, Callable[[], Callable[[], object]]] = {}
+
+    cases["generate_base62"] = lambda: generate_link.generate_base62
+
+    for n in TARGET_SIZES:
+        def pick_url_case(n=n):
+            targets = make_targets(n)
+            return lambda: redirect.pick_url(targets)
+
+        def cached_pick_case(n=n):
+            sampler = AliasSampler(make_targets(n))
+            return sampler.pick
+
+        def validate_case(n=n):
+            body = make_body(n)
+            return lambda: generate_link.validate_body(body)
+
+        def sticky_pick_case(n=n):
+            sampler = AliasSampler(make_targets(n))
+            return lambda: sampler.pick_index_for("visitor-1", "bench")
+
+        cases[f"pick_url[{n}]"] = pick_url_case
+        cases[f"sampler.pick[{n}]"] = cached_pick_case
+        cases[f"sampler.pick_index_for[{n}]"] = sticky_pick_case
+        cases[f"validate_body[{n}]"] = validate_case
+
+    for n in [1, 10]:
+        def generate_handler_case(n=n):
+            _use_memory_storage()
+            event = {"body": json.dumps(make_body(n))}
+            return lambda: generate_link.handler(event, None)
+
+        cases[f"generate_link.handler[{n}]"] = generate_handler_case
+
+    for n in TARGET_SIZES:
+        def redirect_warm_case(n=n):
+            store = _use_memory_storage()
+            store.put_if_absent({"short_code": "bench", "targets": make_targets(n), "expires_at": 2**40})
+            event = {"pathParameters": {"short_code": "bench"}}
+            return lambda: redirect.handler(event, None)
+
+        def redirect_cold_case(n=n):
+            store = _use_memory_storage()
+            store.put_if_absent({"short_code": "bench", "targets": make_targets(n), "expires_at": 2**40})
+            event = {"pathParameters": {"short_code": "bench"}}
+
+            def call():
+                redirect._cache.invalidate("bench")
+                return redirect.handler(event, None)
+
+            return call
+
+        cases[f"redirect.handler[warm,{n}]"] = redirect_warm_case
+        cases[f"redirect.handler[cold,{n}]"] = redirect_cold_case
+
+    for n in [1_000, 10_000]:
+        def redirect_cold_packed_case(n=n):
+            store = _use_memory_storage()
+            store.batch_put(pack_link({"short_code": "bench", "targets": make_targets(n), "expires_at": 2**40}))
+            event = {"pathParameters": {"short_code": "bench"}}
+
+            def call():
+                redirect._cache.invalidate("bench")
+                return redirect.handler(event, None)
+
+            return call
+
+        cases[f"redirect.handler[cold,packed,{n}]"] = redirect_cold_packed_case
+
+    return cases
+
+
+def run(names: list[str] | None = None, repeat: int = 5, min_time: float = 0.2) -> dict:
+    cases = build_cases()
+    results = {}
+    for name, setup in cases.items():
+        if names and not any(pattern in name for pattern in names):
+            continue
+        results[name] = measure(setup(), repeat=repeat, min_time=min_time)
+        redirect._visits.reset()
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "timestamp": int(time.time()),
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[dict]:
+    """Return the cases whose median latency grew by more than ``threshold`` (0.25 = 25%)."""
+    regressions = []
+    for name, result in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            continue
+        ratio = result["ns_per_call"] / base["ns_per_call"]
+        if ratio > 1 + threshold:
+            regressions.append({
+                "name": name,
+                "baseline_ns": base["ns_per_call"],
+                "current_ns": result["ns_per_call"],
+                "ratio": ratio,
+            })
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against results stored in this file")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown (default 0.25)")
+    parser.add_argument("--filter", action="append", help="only run cases whose name contains this")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="approximate seconds per repeat")
+    args = parser.parse_args(argv)
+
+    report = run(args.filter, repeat=args.repeat, min_time=args.min_time)
+    for name, result in report["results"].items():
+        print(f"{name:40s} {result['ns_per_call'] / 1000:12.2f} us/call {result['ops_per_sec']:14.0f} ops/s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        for r in regressions:
+            print(f"REGRESSION {r['name']}: {r['baseline_ns']:.0f} ns -> {r['current_ns']:.0f} ns ({r['ratio']:.2f}x)")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
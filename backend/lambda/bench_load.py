@@ -0,0 +1,343 @@
+"""Load generator replaying Zipf-distributed traffic against Qaktus.
+
+Creates ``--codes`` links, then sends a mix of redirects and link
+creations from ``--concurrency`` threads. Redirects pick codes with Zipf
+popularity (the k-th most popular code gets weight ``1 / k ** s``), so a
+few codes take most of the traffic as they do in production. For each
+concurrency level it reports throughput and p50/p95/p99 latency per
+request type.
+
+In-process mode (the default) calls the Lambda handlers directly against
+``STORAGE_BACKEND`` (``memory`` unless set) and also counts storage calls
+per request and collision retries in ``put_item_with_retry``. With
+``--url`` the same traffic goes over HTTP to a running server such as
+``asgi.py``; storage calls are not visible there.
+
+    python bench_load.py --codes 10000 --requests 50000 --concurrency 1,8,32
+    python bench_load.py --url http://127.0.0.1:8000 --concurrency 16 --output load.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+from urllib.parse import urlsplit
+
+import generate_link
+import redirect
+import storage
+from sampler import AliasSampler
+
+BULK_CHUNK = 1000
+
+
+def zipf_weights(n: int, s: float) -> list[float]:
+    return [1 / k**s for k in range(1, n + 1)]
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * q // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def link_body(rng: random.Random, targets: int) -> dict:
+    return {"urls": [
+        {"original_url": f"https://example.com/{rng.randrange(10**9)}", "weight": rng.randint(1, 100)}
+        for _ in range(targets)
+    ]}
+
+
+# --- Storage call accounting ---
+
+def local_storage() -> storage.Storage:
+    """A fresh in-memory store, or the ``STORAGE_BACKEND`` one when that is set."""
+    backend = os.environ.get("STORAGE_BACKEND", "memory")
+    if backend == "memory":
+        return storage.MemoryStorage()
+    return storage.create_storage(backend, os.environ.get("TABLE_NAME", "qaktus-links"))
+
+
+class CountingStorage:
+    """Wraps a storage backend and counts calls per operation, by the request type being served.
+
+    Calls made outside a request (such as the background visit flush) are
+    counted under ``background``. A ``put_if_absent`` that finds the key
+    taken is counted as a collision.
+    """
+
+    def __init__(self, inner):
+        self._inner = inner
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.calls: dict[str, Counter] = defaultdict(Counter)
+        self.collisions = 0
+
+    @property
+    def request_type(self) -> str:
+        return getattr(self._local, "request_type", "background")
+
+    @request_type.setter
+    def request_type(self, value: str) -> None:
+        self._local.request_type = value
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._inner, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            with self._lock:
+                self.calls[self.request_type][name] += 1
+                if name == "put_if_absent" and result is False:
+                    self.collisions += 1
+            return result
+
+        return call
+
+
+# --- Clients ---
+
+class InProcessClient:
+    """Calls the handlers directly."""
+
+    def __init__(self, store: CountingStorage):
+        self.store = store
+
+    def create_links(self, bodies: list[dict]) -> list[str]:
+        event = {"body": json.dumps({"links": bodies})}
+        results = json.loads(generate_link.bulk_handler(event, None)["body"])["results"]
+        return [r["short_code"] for r in results if "short_code" in r]
+
+    def redirect(self, code: str) -> int:
+        self.store.request_type = "redirect"
+        try:
+            return redirect.handler({"pathParameters": {"short_code": code}, "headers": {}}, None)["statusCode"]
+        finally:
+            self.store.request_type = "background"
+
+    def create(self, body: dict) -> int:
+        self.store.request_type = "create"
+        try:
+            return generate_link.handler({"body": json.dumps(body), "headers": {}}, None)["statusCode"]
+        finally:
+            self.store.request_type = "background"
+
+
+class HttpClient:
+    """Sends requests to a running server, one keep-alive connection per thread."""
+
+    def __init__(self, base_url: str):
+        parts = urlsplit(base_url)
+        self.scheme = parts.scheme
+        self.netloc = parts.netloc
+        self.prefix = parts.path.rstrip("/")
+        self._local = threading.local()
+
+    def _request(self, method: str, path: str, body: dict | None = None) -> tuple[int, bytes]:
+        import http.client
+
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+            conn = self._local.conn = cls(self.netloc, timeout=30)
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload else {}
+        try:
+            conn.request(method, self.prefix + path, body=payload, headers=headers)
+            response = conn.getresponse()
+            return response.status, response.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self._local.conn = None
+            raise
+
+    def create_links(self, bodies: list[dict]) -> list[str]:
+        _, data = self._request("POST", "/generate-links", {"links": bodies})
+        return [r["short_code"] for r in json.loads(data)["results"] if "short_code" in r]
+
+    def redirect(self, code: str) -> int:
+        return self._request("GET", f"/{code}")[0]
+
+    def create(self, body: dict) -> int:
+        return self._request("POST", "/generate-link", body)[0]
+
+
+# --- Runs ---
+
+def seed_links(client, count: int, targets: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    codes: list[str] = []
+    while len(codes) < count:
+        bodies = [link_body(rng, targets) for _ in range(min(BULK_CHUNK, count - len(codes)))]
+        codes.extend(client.create_links(bodies))
+    return codes
+
+
+def run_level(
+    client,
+    codes: list[str],
+    requests: int,
+    concurrency: int,
+    create_ratio: float,
+    zipf_s: float,
+    targets: int,
+    seed: int,
+) -> dict:
+    """Send ``requests`` requests from ``concurrency`` threads; return latencies and outcomes per type."""
+    popularity = AliasSampler([{"url": code, "weight": w} for code, w in zip(codes, zipf_weights(len(codes), zipf_s))])
+    latencies: dict[str, list[float]] = defaultdict(list)
+    statuses: dict[str, Counter] = defaultdict(Counter)
+    lock = threading.Lock()
+
+    def worker(index: int, count: int) -> None:
+        rng = random.Random(seed * 1000 + index)
+        local_latencies: dict[str, list[float]] = defaultdict(list)
+        local_statuses: dict[str, Counter] = defaultdict(Counter)
+        for _ in range(count):
+            if rng.random() < create_ratio:
+                request_type, call = "create", (lambda body=link_body(rng, targets): client.create(body))
+            else:
+                code = popularity.urls[popularity.pick_index()]
+                request_type, call = "redirect", (lambda code=code: client.redirect(code))
+            start = time.perf_counter()
+            try:
+                status = call()
+            except Exception as e:
+                status = type(e).__name__
+            local_latencies[request_type].append((time.perf_counter() - start) * 1000)
+            local_statuses[request_type][status] += 1
+        with lock:
+            for request_type, values in local_latencies.items():
+                latencies[request_type].extend(values)
+                statuses[request_type].update(local_statuses[request_type])
+
+    shares = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency), shares))
+    elapsed = time.perf_counter() - start
+
+    result: dict[str, Any] = {"concurrency": concurrency, "requests": requests, "seconds": elapsed,
+                              "requests_per_sec": requests / elapsed if elapsed else 0.0, "types": {}}
+    for request_type, values in sorted(latencies.items()):
+        values.sort()
+        result["types"][request_type] = {
+            "count": len(values),
+            "p50_ms": percentile(values, 50),
+            "p95_ms": percentile(values, 95),
+            "p99_ms": percentile(values, 99),
+            "statuses": {str(k): v for k, v in statuses[request_type].items()},
+        }
+    return result
+
+
+def _storage_stats(store: CountingStorage, level: dict, before: dict[str, Counter], collisions_before: int) -> None:
+    for request_type, stats in level["types"].items():
+        calls = store.calls[request_type] - before.get(request_type, Counter())
+        stats["storage_calls_per_request"] = sum(calls.values()) / stats["count"]
+        stats["storage_calls"] = dict(calls)
+    level["collision_retries"] = store.collisions - collisions_before
+
+
+def run(
+    codes: int = 1000,
+    requests: int = 10_000,
+    concurrency: list[int] | None = None,
+    create_ratio: float = 0.05,
+    zipf_s: float = 1.1,
+    targets: int = 3,
+    url: str | None = None,
+    seed: int = 0,
+) -> dict:
+    store = None
+    if url:
+        client: Any = HttpClient(url)
+    else:
+        store = CountingStorage(local_storage())
+        generate_link._storage = store
+        redirect._storage = store
+        client = InProcessClient(store)
+
+    seeded = seed_links(client, codes, targets, seed)
+    levels = []
+    for level_concurrency in concurrency or [1, 8]:
+        if store is not None:
+            redirect._cache.clear()
+            before = {k: Counter(v) for k, v in store.calls.items()}
+            collisions = store.collisions
+        level = run_level(client, seeded, requests, level_concurrency, create_ratio, zipf_s, targets, seed)
+        if store is not None:
+            _storage_stats(store, level, before, collisions)
+        levels.append(level)
+    if store is not None:
+        redirect._visits.flush()
+
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "timestamp": int(time.time()),
+        "mode": "http" if url else "in-process",
+        "storage": None if url else os.environ.get("STORAGE_BACKEND", "memory"),
+        "codes": len(seeded),
+        "zipf_s": zipf_s,
+        "create_ratio": create_ratio,
+        "levels": levels,
+    }
+
+
+def _print_report(report: dict, out: Callable[[str], None] = print) -> None:
+    out(f"{report['mode']} storage={report['storage']} codes={report['codes']} zipf_s={report['zipf_s']} "
+        f"create_ratio={report['create_ratio']}")
+    for level in report["levels"]:
+        extra = f"  collision retries {level['collision_retries']}" if "collision_retries" in level else ""
+        out(f"concurrency {level['concurrency']:4d}: {level['requests_per_sec']:10.0f} req/s{extra}")
+        for request_type, stats in level["types"].items():
+            calls = stats.get("storage_calls_per_request")
+            calls_text = f"  {calls:.2f} storage calls/req" if calls is not None else ""
+            out(f"  {request_type:9s} n={stats['count']:<7d} p50 {stats['p50_ms']:8.3f} ms  "
+                f"p95 {stats['p95_ms']:8.3f} ms  p99 {stats['p99_ms']:8.3f} ms{calls_text}")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--codes", type=int, default=1000, help="links created before the run")
+    parser.add_argument("--requests", type=int, default=10_000, help="requests per concurrency level")
+    parser.add_argument("--concurrency", default="1,8", help="comma-separated thread counts")
+    parser.add_argument("--create-ratio", type=float, default=0.05, help="share of requests that create links")
+    parser.add_argument("--zipf-s", type=float, default=1.1, help="Zipf exponent of code popularity")
+    parser.add_argument("--targets", type=int, default=3, help="targets per created link")
+    parser.add_argument("--url", help="send requests to this server instead of calling handlers in-process")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    report = run(
+        codes=args.codes,
+        requests=args.requests,
+        concurrency=[int(c) for c in args.concurrency.split(",")],
+        create_ratio=args.create_ratio,
+        zipf_s=args.zipf_s,
+        targets=args.targets,
+        url=args.url,
+        seed=args.seed,
+    )
+    _print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""Cold-start benchmark for the DynamoDB access path.
+
+Each sample runs in a fresh interpreter and reports three phases: importing
+the redirect module, building the DynamoDB client, and the first
+``GetItem`` plus item decoding. The DynamoDB response is served by
+botocore's ``Stubber``, so no network or credentials are needed and the
+numbers isolate our own start-up cost.
+
+``lean`` is the path the handlers use (low-level botocore client, our own
+codec, lazy imports). ``boto3_resource`` reproduces the previous path
+(``boto3.resource(...).Table`` with its ``Decimal`` deserializer) for
+comparison.
+
+    python bench_startup.py --samples 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+VARIANTS = ["lean", "boto3_resource"]
+TARGET_COUNT = 10
+
+_PRELUDE = """
+import json, sys, time
+t0 = time.perf_counter()
+import redirect
+"""
+
+_LEAN = _PRELUDE + """
+import storage
+t1 = time.perf_counter()
+store = storage.DynamoStorage("links")
+client = store._get_client()
+t2 = time.perf_counter()
+from botocore.stub import Stubber
+stubber = Stubber(client)
+stubber.add_response("get_item", {"Item": storage.serialize_item(ITEM)})
+stubber.activate()
+item = store.get("bench", attributes=redirect.LINK_ATTRIBUTES)
+t3 = time.perf_counter()
+"""
+
+_BOTO3_RESOURCE = _PRELUDE + """
+import boto3
+t1 = time.perf_counter()
+table = boto3.resource("dynamodb").Table("links")
+client = table.meta.client
+t2 = time.perf_counter()
+from boto3.dynamodb.types import TypeSerializer
+from botocore.stub import Stubber
+serializer = TypeSerializer()
+stubber = Stubber(client)
+stubber.add_response("get_item", {"Item": {k: serializer.serialize(v) for k, v in ITEM.items()}})
+stubber.activate()
+item = table.get_item(Key={"short_code": "bench"})["Item"]
+t3 = time.perf_counter()
+"""
+
+_REPORT = """
+assert len(item["targets"]) == len(ITEM["targets"])
+print(json.dumps({"import_ms": (t1 - t0) * 1e3, "client_ms": (t2 - t1) * 1e3, "first_request_ms": (t3 - t2) * 1e3}))
+"""
+
+_SCRIPTS = {"lean": _LEAN, "boto3_resource": _BOTO3_RESOURCE}
+
+
+def _item_literal(target_count: int) -> str:
+    targets = [{"url": f"https://example.com/{i}", "weight": (i % 7) + 1, "visits": 0} for i in range(target_count)]
+    return f"ITEM = {{'short_code': 'bench', 'targets': {targets!r}, 'expires_at': 2 ** 40}}\n"
+
+
+def sample(variant: str, target_count: int = TARGET_COUNT) -> dict:
+    """Run one fresh interpreter for ``variant`` and return its phase timings in milliseconds."""
+    script = _item_literal(target_count) + _SCRIPTS[variant] + _REPORT
+    env = {
+        **os.environ,
+        "STORAGE_BACKEND": "dynamodb",
+        "TABLE_NAME": "links",
+        "AWS_DEFAULT_REGION": os.environ.get("AWS_DEFAULT_REGION", "us-east-1"),
+        "AWS_ACCESS_KEY_ID": "bench",
+        "AWS_SECRET_ACCESS_KEY": "bench",
+    }
+    env.pop("AWS_LAMBDA_FUNCTION_NAME", None)
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def run(variants: list[str] | None = None, samples: int = 5, target_count: int = TARGET_COUNT) -> dict:
+    results = {}
+    for variant in variants or VARIANTS:
+        runs = [sample(variant, target_count) for _ in range(samples)]
+        summary = {phase: statistics.median(r[phase] for r in runs) for phase in runs[0]}
+        summary["total_ms"] = sum(summary.values())
+        results[variant] = summary
+    return {"samples": samples, "target_count": target_count, "results": results}
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--variant", action="append", choices=VARIANTS, help="only run these variants")
+    parser.add_argument("--samples", type=int, default=5, help="fresh interpreters per variant (median is reported)")
+    parser.add_argument("--targets", type=int, default=TARGET_COUNT, help="targets in the stubbed item")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    report = run(args.variant, samples=args.samples, target_count=args.targets)
+    print(f"{'variant':16s} {'import':>10s} {'client':>10s} {'first req':>10s} {'total':>10s}")
+    for variant, r in report["results"].items():
+        print(
+            f"{variant:16s} {r['import_ms']:8.1f}ms {r['client_ms']:8.1f}ms "
+            f"{r['first_request_ms']:8.1f}ms {r['total_ms']:8.1f}ms"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
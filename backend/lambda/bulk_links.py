@@ -0,0 +1,401 @@
+"""Bulk import and export of links, for migrations and backups.
+
+``import`` streams links from a file and writes them to the links table in
+chunks of ``--chunk-size`` records:
+
+- NDJSON: one ``POST /generate-link`` body per line, optionally with the
+  ``short_code`` to keep and an ``expires_at``. Lines written by ``export``
+  (with ``targets`` instead of ``urls``) are accepted too and keep their
+  ``visits``.
+- CSV: a header row and the columns ``original_url``, ``weight`` (default
+  1) and optionally ``short_code`` and ``expires_at``. Consecutive rows
+  with the same ``short_code`` form one link; rows without one are
+  single-target links.
+
+Imported links can be updated with ``PATCH`` only if their record carries
+the ``edit_key_hash`` that ``export`` writes; no edit keys are issued here.
+
+Each chunk is parsed and validated like a ``POST /generate-link`` body by
+``--workers`` processes. Links without a code get fresh ones, in either
+``CODE_ALLOCATOR`` mode checked against the table and the chunk's own
+codes, since batch writes overwrite whatever they hit. Codes that
+are already taken are skipped, and every rejected record goes to the
+``--errors`` file. Imported links start at version 1 and expire after 30
+days unless they say otherwise. Writes go out in batches that shrink,
+with pauses that grow, while the table throttles. After every chunk the
+progress is saved to ``--checkpoint``, and a rerun continues from there,
+reusing the codes of a chunk that was cut short.
+
+``export`` scans the table in ``--segments`` parallel segments and writes
+one NDJSON line per live link, with its targets (read from its shards if
+it is packed), visits, rules, expiry, version and edit key hash. Lines are written a page
+at a time, so memory stays bounded whatever the table size::
+
+    python bulk_links.py import old-links.csv --workers 8
+    python bulk_links.py export backup.ndjson --segments 16
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Iterator
+
+import generate_link
+import storage
+from hot_keys import REPLICA_SEPARATOR
+from target_codec import SHARD_SEPARATOR
+
+# Codes carried over from another shortener; anything else a URL path can hold would clash with internal keys.
+CODE_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+EDIT_KEY_HASH_PATTERN = re.compile(r"[0-9a-f]{64}")
+DEFAULT_TTL = 30 * 24 * 60 * 60
+EXPORT_ATTRIBUTES = ["short_code", "targets", "rules", "format", "shards", "version", "expires_at", "edit_key_hash"]
+EXPORT_FLUSH_LINES = 500
+TAKEN = "Short code already exists"
+
+
+# --- Reading ---
+
+def detect_format(path: str) -> str:
+    return "csv" if path.lower().endswith(".csv") else "ndjson"
+
+
+def _csv_records(f) -> Iterator[dict]:
+    rows = csv.DictReader(f)
+    link: dict | None = None
+    for row in rows:
+        code = (row.get("short_code") or "").strip() or None
+        entry = {"original_url": row.get("original_url")}
+        weight = (row.get("weight") or "").strip()
+        try:
+            entry["weight"] = float(weight) if weight else 1
+        except ValueError:
+            entry["weight"] = weight
+        if link is not None and code is not None and link.get("short_code") == code:
+            link["urls"].append(entry)
+            continue
+        if link is not None:
+            yield link
+        link = {"urls": [entry]}
+        if code is not None:
+            link["short_code"] = code
+        expires_at = (row.get("expires_at") or "").strip()
+        if expires_at:
+            link["expires_at"] = int(expires_at) if expires_at.isdigit() else expires_at
+    if link is not None:
+        yield link
+
+
+def read_records(path: str, fmt: str) -> Iterator[Any]:
+    """Records of an input file, one per link: a dict for CSV, the raw line for NDJSON (parsed by the workers)."""
+    with open(path, newline="" if fmt == "csv" else None, encoding="utf-8") as f:
+        if fmt == "csv":
+            yield from _csv_records(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield line
+
+
+# --- Validation (in worker processes) ---
+
+def prepare(record: Any, default_expires_at: int) -> tuple[dict | None, str | None]:
+    """Turn one record into a link item without a code (unless it brings one), or explain why not."""
+    if isinstance(record, str):
+        try:
+            record = json.loads(record)
+        except json.JSONDecodeError:
+            return None, "Invalid JSON"
+    if not isinstance(record, dict):
+        return None, "Record must be an object"
+    visits = None
+    if "urls" not in record and isinstance(record.get("targets"), list):
+        targets = [t if isinstance(t, dict) else {} for t in record["targets"]]
+        record = {**record, "urls": [{"original_url": t.get("url"), "weight": t.get("weight")} for t in targets]}
+        visits = [t.get("visits", 0) for t in targets]
+    if isinstance(record.get("urls"), list) and not all(isinstance(entry, dict) for entry in record["urls"]):
+        return None, "Every entry of 'urls' must be an object"
+    error = generate_link.validate_body(record)
+    if error:
+        return None, error
+    if not all(isinstance(entry["original_url"], str) and entry["original_url"] for entry in record["urls"]):
+        return None, "Every 'original_url' must be a non-empty string"
+
+    code = record.get("short_code")
+    if code is not None and not (isinstance(code, str) and CODE_PATTERN.fullmatch(code)):
+        return None, "Field 'short_code' must be 1-64 letters, digits, '-' or '_'"
+    expires_at = record.get("expires_at", default_expires_at)
+    if isinstance(expires_at, bool) or not isinstance(expires_at, int) or expires_at <= 0:
+        return None, "Field 'expires_at' must be a positive integer timestamp"
+    edit_key_hash = record.get("edit_key_hash")
+    valid_hash = isinstance(edit_key_hash, str) and EDIT_KEY_HASH_PATTERN.fullmatch(edit_key_hash)
+    if edit_key_hash is not None and not valid_hash:
+        return None, "Field 'edit_key_hash' must be a lowercase hex SHA-256"
+
+    targets = generate_link.build_targets(record["urls"])
+    if visits is not None:
+        for target, count in zip(targets, visits):
+            target["visits"] = count if isinstance(count, int) and not isinstance(count, bool) and count > 0 else 0
+    return generate_link.link_item(code, targets, expires_at, generate_link.link_rules(record), edit_key_hash), None
+
+
+def _prepare_all(records: list, default_expires_at: int, pool, workers: int) -> list[tuple[dict | None, str | None]]:
+    if pool is None:
+        return [prepare(record, default_expires_at) for record in records]
+    chunksize = max(1, len(records) // (workers * 4))
+    return list(pool.map(prepare, records, itertools.repeat(default_expires_at), chunksize=chunksize))
+
+
+# --- Writing ---
+
+class AdaptiveWriter:
+    """Writes items through ``batch_put``, backing off while the table throttles.
+
+    ``batch_put`` already retries unprocessed items a few times. When items
+    are still left over, or the call fails with a retryable error, the
+    batch size halves and the pause between batches doubles; every batch
+    that goes through grows the size again and halves the pause. After
+    ``max_attempts`` failed rounds in a row ``write`` gives up with
+    ``StorageError``.
+    """
+
+    def __init__(
+        self,
+        store,
+        batch_size: int = 1000,
+        min_batch_size: int = storage.BATCH_WRITE_SIZE,
+        max_delay: float = 20.0,
+        max_attempts: int = 8,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.store = store
+        self.max_batch_size = batch_size
+        self.batch_size = batch_size
+        self.min_batch_size = min_batch_size
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.sleep = sleep
+        self.delay = 0.0
+        self.throttled = 0
+
+    def write(self, items: list[dict]) -> None:
+        pending = list(items)
+        failures = 0
+        while pending:
+            if self.delay:
+                self.sleep(self.delay)
+            batch, pending = pending[:self.batch_size], pending[self.batch_size:]
+            try:
+                failed = self.store.batch_put(batch)
+            except storage.RetryableStorageError:
+                failed = batch
+            if not failed:
+                failures = 0
+                self.batch_size = min(self.max_batch_size, self.batch_size * 2)
+                self.delay = self.delay / 2 if self.delay > 0.05 else 0.0
+                continue
+            failures += 1
+            self.throttled += 1
+            if failures >= self.max_attempts:
+                raise storage.StorageError(f"{len(failed) + len(pending)} items unwritten after {failures} attempts")
+            self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+            self.delay = min(self.max_delay, max(0.1, self.delay * 2))
+            pending = failed + pending
+
+
+# --- Import ---
+
+def load_checkpoint(path: str) -> dict:
+    if not os.path.exists(path):
+        return {"records": 0, "imported": 0, "skipped": 0, "invalid": 0, "writing": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_checkpoint(path: str, state: dict) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def import_links(
+    path: str,
+    store,
+    fmt: str | None = None,
+    workers: int = 4,
+    chunk_size: int = 5000,
+    checkpoint: str | None = None,
+    errors: str | None = None,
+    writer: AdaptiveWriter | None = None,
+    out: Callable[[str], None] = print,
+) -> dict:
+    """Import the links in ``path``; return the counts of imported, skipped and invalid records."""
+    fmt = fmt or detect_format(path)
+    checkpoint = checkpoint or f"{path}.checkpoint"
+    errors = errors or f"{path}.errors.ndjson"
+    writer = writer or AdaptiveWriter(store)
+    generate_link.use_storage(store)
+    state = load_checkpoint(checkpoint)
+    default_expires_at = int(time.time()) + DEFAULT_TTL
+
+    records = itertools.islice(read_records(path, fmt), state["records"], None)
+    pool = None
+    if workers > 0:
+        # Spawned, not forked: the parent may already run background threads.
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        for chunk in itertools.batched(records, chunk_size):
+            start = state["records"]
+            prepared = _prepare_all(list(chunk), default_expires_at, pool, workers)
+            # Codes this chunk was being written under when the last run stopped.
+            resumed = {int(n): code for n, code in state["writing"].items()}
+            rejected: list[tuple[int, str]] = []
+            to_write: dict[int, dict] = {}
+            to_check: dict[str, int] = {}
+            to_allocate: list[int] = []
+            for n, (item, error) in enumerate(prepared, start):
+                if error:
+                    rejected.append((n, error))
+                elif n in resumed:
+                    to_write[n] = {**item, "short_code": resumed[n]}
+                elif item["short_code"] is None:
+                    to_write[n] = item
+                    to_allocate.append(n)
+                elif item["short_code"] in to_check:
+                    rejected.append((n, "Duplicate short code in input"))
+                else:
+                    to_write[n] = item
+                    to_check[item["short_code"]] = n
+
+            taken = generate_link.existing_codes(list(to_check)) if to_check else set()
+            for code in taken:
+                n = to_check[code]
+                del to_write[n]
+                rejected.append((n, TAKEN))
+            # Fresh codes are checked against storage and kept clear of the codes this chunk brings, so
+            # the unconditional batch write below never replaces a link.
+            reserved = set(to_check) | set(resumed.values())
+            for n, code in zip(to_allocate, generate_link.allocate_unique_codes(len(to_allocate), reserved)):
+                if code is None:
+                    del to_write[n]
+                    rejected.append((n, "Could not generate a unique short code"))
+                else:
+                    to_write[n]["short_code"] = code
+
+            state["writing"] = {str(n): item["short_code"] for n, item in to_write.items()}
+            save_checkpoint(checkpoint, state)
+            writer.write([stored for item in to_write.values() for stored in generate_link.stored_items(item)])
+
+            with open(errors, "a") as f:
+                for n, error in sorted(rejected):
+                    f.write(json.dumps({"record": n, "error": error}) + "\n")
+            state["records"] = start + len(prepared)
+            state["imported"] += len(to_write)
+            state["skipped"] += sum(1 for _, error in rejected if error == TAKEN)
+            state["invalid"] += sum(1 for _, error in rejected if error != TAKEN)
+            state["writing"] = {}
+            save_checkpoint(checkpoint, state)
+            out(f"{state['records']} records: {state['imported']} imported, {state['skipped']} skipped, "
+                f"{state['invalid']} invalid")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return {k: state[k] for k in ("records", "imported", "skipped", "invalid")}
+
+
+# --- Export ---
+
+def _is_link_key(key: str) -> bool:
+    return REPLICA_SEPARATOR not in key and SHARD_SEPARATOR not in key
+
+
+def export_record(item: dict) -> dict:
+    """The NDJSON record of a stored link item, with a packed link's targets read back from its shards."""
+    code = item["short_code"]
+    targets = generate_link.current_targets(code, item)
+    record = {
+        "short_code": code,
+        "targets": [{"url": t["url"], "weight": t["weight"], "visits": t.get("visits", 0)} for t in targets],
+    }
+    for key in ("rules", "expires_at"):
+        if key in item:
+            record[key] = item[key]
+    record["version"] = int(item.get("version", 1))
+    if "edit_key_hash" in item:
+        record["edit_key_hash"] = item["edit_key_hash"]
+    return record
+
+
+def export_links(output: str, store, segments: int = 8, include_expired: bool = False) -> int:
+    """Write every link to ``output`` as NDJSON, scanning ``segments`` segments in parallel; return the count."""
+    generate_link.use_storage(store)
+    lock = threading.Lock()
+    now = time.time()
+    tmp = f"{output}.part"
+
+    def dump(segment: int) -> int:
+        lines: list[str] = []
+        count = 0
+        for item in store.scan(segment, segments, attributes=EXPORT_ATTRIBUTES):
+            if not _is_link_key(item["short_code"]) or not (item.get("targets") or item.get("shards")):
+                continue
+            if not include_expired and "expires_at" in item and int(item["expires_at"]) <= now:
+                continue
+            lines.append(json.dumps(export_record(item)) + "\n")
+            count += 1
+            if len(lines) >= EXPORT_FLUSH_LINES:
+                with lock:
+                    f.writelines(lines)
+                lines.clear()
+        with lock:
+            f.writelines(lines)
+        return count
+
+    with open(tmp, "w", encoding="utf-8") as f, ThreadPoolExecutor(max_workers=segments) as pool:
+        total = sum(pool.map(dump, range(segments)))
+    os.replace(tmp, output)
+    return total
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    imports = commands.add_parser("import", help="import links from a CSV or NDJSON file")
+    imports.add_argument("path")
+    imports.add_argument("--format", choices=["csv", "ndjson"], help="default: from the file extension")
+    imports.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="validation processes (0: none)")
+    imports.add_argument("--chunk-size", type=int, default=5000, help="records validated and written at a time")
+    imports.add_argument("--checkpoint", help="progress file (default: <path>.checkpoint)")
+    imports.add_argument("--errors", help="rejected records (default: <path>.errors.ndjson)")
+    exports = commands.add_parser("export", help="export every live link to an NDJSON file")
+    exports.add_argument("output")
+    exports.add_argument("--segments", type=int, default=8, help="parallel scan segments")
+    exports.add_argument("--include-expired", action="store_true")
+    args = parser.parse_args(argv)
+
+    store = storage.from_env("TABLE_NAME")
+    try:
+        if args.command == "import":
+            counts = import_links(args.path, store, args.format, args.workers, args.chunk_size,
+                                  args.checkpoint, args.errors)
+            print(f"Imported {counts['imported']} links ({counts['skipped']} skipped, {counts['invalid']} invalid)")
+        else:
+            count = export_links(args.output, store, args.segments, args.include_expired)
+            print(f"Exported {count} links to {args.output}")
+    except storage.StorageError as e:
+        print(f"Stopped: {e}. Run the same command again to continue.", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
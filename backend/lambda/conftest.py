@@ -1,9 +1,24 @@
 import pytest
 import generate_link
+import redirect
 
 
 @pytest.fixture(autouse=True)
-def reset_table():
-    generate_link._table = None
+def reset_storage():
+    generate_link._storage = None
+    generate_link._counter_storage = None
+    generate_link._allocator = None
+    redirect._storage = None
+    redirect._cache.clear()
+    redirect._visits.reset()
+    redirect._hot_keys.reset()
+    redirect._replicas.clear()
     yield
-    generate_link._table = None
+    generate_link._storage = None
+    generate_link._counter_storage = None
+    generate_link._allocator = None
+    redirect._storage = None
+    redirect._cache.clear()
+    redirect._visits.reset()
+    redirect._hot_keys.reset()
+    redirect._replicas.clear()
@@ -0,0 +1,203 @@
+"""Statistical checks that weighted picks follow the configured weights.
+
+``validate(counts, weights)`` runs a chi-square goodness-of-fit test and a
+Kolmogorov-Smirnov test (over the targets in list order) of observed pick
+counts against ``weight / total_weight``, and reports both p-values. Bins
+expected to receive fewer than 5 picks are pooled with their neighbours
+so the chi-square approximation holds for thousands of targets.
+
+    python distribution.py --weights 60,30,10 --samples 1000000
+    python distribution.py --random-targets 5000 --samples 10000000
+"""
+
+import argparse
+import math
+import random
+import sys
+from typing import Iterable, Sequence
+
+MIN_EXPECTED = 5.0
+
+
+def expected_probabilities(weights: Sequence[float]) -> list[float]:
+    total = float(sum(weights))
+    if total <= 0:
+        raise ValueError("Weights must sum to a positive number")
+    return [float(w) / total for w in weights]
+
+
+def counts_from_indices(indices: Iterable[int], n_targets: int) -> list[int]:
+    """Tally picked target indices (a list or a NumPy array) into per-target counts."""
+    if hasattr(indices, "dtype"):
+        import numpy as np
+
+        return np.bincount(indices, minlength=n_targets).tolist()
+    counts = [0] * n_targets
+    for i in indices:
+        counts[i] += 1
+    return counts
+
+
+# --- Chi-square ---
+
+def _gamma_q(a: float, x: float) -> float:
+    """Regularized upper incomplete gamma function Q(a, x)."""
+    if x <= 0:
+        return 1.0
+    log_prefix = a * math.log(x) - x - math.lgamma(a)
+    if x < a + 1:
+        # Series for P(a, x).
+        term = total = 1.0 / a
+        ap = a
+        for _ in range(10_000):
+            ap += 1
+            term *= x / ap
+            total += term
+            if abs(term) < abs(total) * 1e-15:
+                break
+        return max(0.0, 1.0 - total * math.exp(log_prefix))
+    # Continued fraction for Q(a, x) (modified Lentz).
+    tiny = 1e-300
+    b = x + 1 - a
+    c = 1 / tiny
+    d = 1 / b
+    h = d
+    for i in range(1, 10_000):
+        an = -i * (i - a)
+        b += 2
+        d = an * d + b
+        d = tiny if abs(d) < tiny else d
+        c = b + an / c
+        c = tiny if abs(c) < tiny else c
+        d = 1 / d
+        delta = d * c
+        h *= delta
+        if abs(delta - 1) < 1e-15:
+            break
+    return min(1.0, math.exp(log_prefix) * h)
+
+
+def chi_square_sf(statistic: float, dof: int) -> float:
+    """P(X >= statistic) for a chi-square distribution with ``dof`` degrees of freedom."""
+    if dof <= 0:
+        return 1.0
+    return _gamma_q(dof / 2, statistic / 2)
+
+
+def chi_square(counts: Sequence[int], probabilities: Sequence[float], min_expected: float = MIN_EXPECTED) -> tuple[float, int]:
+    """Chi-square statistic and degrees of freedom, pooling adjacent bins with small expectations."""
+    n = sum(counts)
+    bins: list[tuple[float, float]] = []
+    observed = expected = 0.0
+    for count, p in zip(counts, probabilities):
+        observed += count
+        expected += p * n
+        if expected >= min_expected:
+            bins.append((observed, expected))
+            observed = expected = 0.0
+    if expected > 0 or observed > 0:
+        if bins:
+            o, e = bins.pop()
+            bins.append((o + observed, e + expected))
+        else:
+            bins.append((observed, expected))
+    statistic = sum((o - e) ** 2 / e for o, e in bins if e > 0)
+    return statistic, len(bins) - 1
+
+
+# --- Kolmogorov-Smirnov ---
+
+def ks_statistic(counts: Sequence[int], probabilities: Sequence[float]) -> float:
+    """Largest gap between the observed and expected CDFs over targets in list order."""
+    n = sum(counts)
+    if n == 0:
+        return 0.0
+    observed = expected = gap = 0.0
+    for count, p in zip(counts, probabilities):
+        observed += count / n
+        expected += p
+        gap = max(gap, abs(observed - expected))
+    return gap
+
+
+def ks_sf(statistic: float, n: int) -> float:
+    """Asymptotic p-value of a one-sample KS statistic (Stephens' small-sample correction).
+
+    For a discrete distribution the test is conservative: p-values come out
+    larger than exact ones, so a failure is still a real failure.
+    """
+    if n <= 0:
+        return 1.0
+    root = math.sqrt(n)
+    lam = (root + 0.12 + 0.11 / root) * statistic
+    if lam < 0.3:
+        return 1.0
+    total = 0.0
+    for k in range(1, 101):
+        term = 2 * (-1) ** (k - 1) * math.exp(-2 * k * k * lam * lam)
+        total += term
+        if abs(term) < 1e-12:
+            break
+    return min(1.0, max(0.0, total))
+
+
+# --- Validation ---
+
+def validate(counts: Sequence[int], weights: Sequence[float], alpha: float = 0.001) -> dict:
+    """Test observed per-target ``counts`` against ``weights``; ``passed`` when neither test rejects at ``alpha``."""
+    if len(counts) != len(weights):
+        raise ValueError("counts and weights must have the same length")
+    probabilities = expected_probabilities(weights)
+    n = sum(counts)
+    chi2, dof = chi_square(counts, probabilities)
+    chi2_p = chi_square_sf(chi2, dof)
+    ks = ks_statistic(counts, probabilities)
+    ks_p = ks_sf(ks, n)
+    return {
+        "n": n,
+        "chi2": chi2,
+        "dof": dof,
+        "chi2_p": chi2_p,
+        "ks": ks,
+        "ks_p": ks_p,
+        "passed": chi2_p >= alpha and ks_p >= alpha,
+    }
+
+
+def validate_sampler(targets: list[dict], samples: int, alpha: float = 0.001, rng=None) -> dict:
+    """Draw ``samples`` picks with the vectorised sampler and validate them against the targets' weights."""
+    from sampler import AliasSampler
+
+    indices = AliasSampler(targets).pick_indices(samples, rng)
+    return validate(counts_from_indices(indices, len(targets)), [t["weight"] for t in targets], alpha)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--weights", help="comma-separated target weights")
+    group.add_argument("--random-targets", type=int, help="this many targets with random weights in [0.01, 100)")
+    parser.add_argument("--samples", type=int, default=1_000_000)
+    parser.add_argument("--alpha", type=float, default=0.001)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    if args.weights:
+        weights = [float(w) for w in args.weights.split(",")]
+    else:
+        rng = random.Random(args.seed)
+        weights = [rng.uniform(0.01, 100) for _ in range(args.random_targets)]
+    targets = [{"url": f"https://example.com/{i}", "weight": w} for i, w in enumerate(weights)]
+
+    import numpy as np
+
+    result = validate_sampler(targets, args.samples, args.alpha, np.random.default_rng(args.seed))
+    print(f"n={result['n']} targets={len(targets)}")
+    print(f"chi-square {result['chi2']:.2f} (dof {result['dof']}) p={result['chi2_p']:.4g}")
+    print(f"KS         {result['ks']:.3g} p={result['ks_p']:.4g}")
+    print("PASS" if result["passed"] else "FAIL")
+    return 0 if result["passed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+import importlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Callable, Iterable, Iterator
+from urllib.parse import urlsplit
+
+from visit_counter import install_shutdown_hooks
+
+logger = logging.getLogger()
+
+Sink = Callable[[list[dict]], None]
+
+_BOT = re.compile(r"bot|crawl|spider|slurp|preview|facebookexternalhit|curl|wget", re.IGNORECASE)
+_TABLET = re.compile(r"ipad|tablet", re.IGNORECASE)
+_MOBILE = re.compile(r"mobi|iphone|android", re.IGNORECASE)
+DEVICE_CLASSES = ("bot", "tablet", "mobile", "desktop", "unknown")
+
+
+def device_class(user_agent: str | None) -> str:
+    """Coarse client class from a User-Agent: bot, tablet, mobile, desktop or unknown."""
+    if not user_agent:
+        return "unknown"
+    if _BOT.search(user_agent):
+        return "bot"
+    if _TABLET.search(user_agent):
+        return "tablet"
+    if _MOBILE.search(user_agent):
+        return "mobile"
+    return "desktop"
+
+
+def visit_event(short_code: str, index: int, url: str, headers: dict | None) -> dict:
+    """One click, with only coarse client info: no IP address, cookies or full referrer."""
+    headers = {k.lower(): v for k, v in (headers or {}).items()}
+    referer = headers.get("referer")
+    return {
+        "ts": int(time.time() * 1000),
+        "code": short_code,
+        "target": index,
+        "url": url,
+        "country": headers.get("cloudfront-viewer-country"),
+        "device": device_class(headers.get("user-agent")),
+        "referer": (urlsplit(referer).hostname or None) if referer else None,
+    }
+
+
+class EventStream:
+    """Buffered, non-blocking event log.
+
+    ``record`` appends to an in-memory queue and returns; a daemon thread
+    hands batches to ``sink(events)`` once ``max_pending`` events are
+    queued, every ``flush_interval`` seconds, and on shutdown. When the
+    queue already holds ``max_buffer`` events, new ones are dropped and
+    counted instead of blocking the request. A failing sink drops its
+    batch.
+    """
+
+    def __init__(self, sink: Sink, max_pending: int = 500, flush_interval: float = 5.0, max_buffer: int = 50_000):
+        self._sink = sink
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._events: deque[dict] = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.flushed = 0
+        self.dropped = 0
+
+    def record(self, event: dict) -> None:
+        with self._lock:
+            if len(self._events) >= self.max_buffer:
+                self.dropped += 1
+                return
+            self._events.append(event)
+            full = len(self._events) >= self.max_pending
+        if self._thread is None:
+            self._start()
+        if full:
+            self._wake.set()
+
+    def pending(self) -> int:
+        return len(self._events)
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            with self._lock:
+                events, self._events = list(self._events), deque()
+            if not events:
+                return
+            try:
+                self._sink(events)
+                self.flushed += len(events)
+            except Exception:
+                logger.exception("Dropping %d visit events", len(events))
+                self.dropped += len(events)
+
+    def close(self) -> None:
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.flush_interval)
+        self.flush()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._events.clear()
+
+    def install_shutdown_hooks(self) -> None:
+        install_shutdown_hooks(self.close)
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="event-flusher", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        last_flush = time.monotonic()
+        while not self._stopped.is_set():
+            remaining = self.flush_interval - (time.monotonic() - last_flush)
+            self._wake.wait(timeout=max(remaining, 0))
+            self._wake.clear()
+            if self._stopped.is_set():
+                return
+            if self.pending() >= self.max_pending or time.monotonic() - last_flush >= self.flush_interval:
+                self.flush()
+                last_flush = time.monotonic()
+
+
+# --- Sinks ---
+
+class JsonLinesSink:
+    """Appends events to ``<directory>/events-<YYYY-MM-DD>-<pid>.jsonl``, one file per UTC day and process."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def __call__(self, events: list[dict]) -> None:
+        by_day: dict[str, list[str]] = {}
+        for event in events:
+            day = datetime.fromtimestamp(event["ts"] / 1000, tz=timezone.utc).strftime("%Y-%m-%d")
+            by_day.setdefault(day, []).append(json.dumps(event, separators=(",", ":")))
+        for day, lines in by_day.items():
+            path = os.path.join(self.directory, f"events-{day}-{os.getpid()}.jsonl")
+            with open(path, "a") as f:
+                f.write("\n".join(lines) + "\n")
+
+
+def stdout_sink(events: list[dict]) -> None:
+    """Write events as JSON lines to stdout, where Lambda ships them to CloudWatch Logs."""
+    sys.stdout.write("".join(json.dumps(e, separators=(",", ":")) + "\n" for e in events))
+    sys.stdout.flush()
+
+
+# --- Reading ---
+
+def read_events(paths: Iterable[str], field: str) -> Iterator[dict]:
+    """Yield the JSON objects with a string ``field`` in JSON-lines files, skipping every other line.
+
+    Logs exported from CloudWatch mix events with metric lines and Lambda's
+    START/END/REPORT lines, and may put a timestamp before each message, so
+    a line is read from its first ``{``.
+    """
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                start = line.find("{")
+                if start < 0:
+                    continue
+                try:
+                    event = json.loads(line[start:])
+                except ValueError:
+                    continue
+                if isinstance(event, dict) and isinstance(event.get(field), str):
+                    yield event
+
+
+def load_sink(spec: str) -> Sink | None:
+    """Build a sink from ``file:<directory>``, ``stdout`` or ``<module>:<callable>``; empty disables events."""
+    if not spec:
+        return None
+    if spec == "stdout":
+        return stdout_sink
+    if spec.startswith("file:"):
+        return JsonLinesSink(spec[len("file:"):])
+    module, sep, attr = spec.partition(":")
+    if not sep:
+        raise ValueError(f"Unknown VISIT_EVENTS_SINK: {spec!r}")
+    return getattr(importlib.import_module(module), attr)
+
+
+def from_env() -> EventStream | None:
+    sink = load_sink(os.environ.get("VISIT_EVENTS_SINK", ""))
+    if sink is None:
+        return None
+    return EventStream(
+        sink,
+        max_pending=int(os.environ.get("VISIT_EVENTS_FLUSH_SIZE", "500")),
+        flush_interval=float(os.environ.get("VISIT_EVENTS_FLUSH_INTERVAL", "5")),
+    )
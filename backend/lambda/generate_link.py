@@ -1,41 +1,229 @@
+import hashlib
+import hmac
 import json
 import logging
+import math
 import os
 import random
-import string
+import secrets
 import time
 from typing import Any
 
-import boto3
-from botocore.exceptions import ClientError
+import metrics
+import rate_limit
+import storage
+from code_allocator import BASE62, FeistelPermutation, SequenceAllocator
+from hot_keys import REPLICA_SEPARATOR, sync_replicas
+from routing_rules import normalize_rules, validate_rules
+from target_codec import PACKED_FORMAT, SHARD_SEPARATOR, pack_link, shard_key, unpack_targets
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-BASE62 = string.digits + string.ascii_lowercase + string.ascii_uppercase
 MAX_RETRIES = 5
+MAX_BULK_LINKS = 10_000
 
-# --- DynamoDB storage ---
-_table = None
+# "random" draws codes and retries on collision; "sequence" maps a reserved
+# counter through a keyed permutation and never collides.
+CODE_ALLOCATOR = os.environ.get("CODE_ALLOCATOR", "random")
+COUNTER_BLOCK_SIZE = int(os.environ.get("COUNTER_BLOCK_SIZE", "1000"))
+# Links with at least this many targets are stored packed and sharded (see target_codec).
+PACKED_TARGETS_THRESHOLD = int(os.environ.get("PACKED_TARGETS_THRESHOLD", "500"))
+# Links whose plain item would be larger than this are packed too, whatever
+# their target count, to stay clear of DynamoDB's 400 KB item limit.
+MAX_PLAIN_ITEM_BYTES = int(os.environ.get("MAX_PLAIN_ITEM_BYTES", str(300 * 1024)))
 
+# --- Storage ---
+_storage = None
+_counter_storage = None
+_allocator = None
 
-def _get_table():
-    global _table
-    if _table is None:
-        _table = boto3.resource("dynamodb").Table(os.environ["TABLE_NAME"])
-    return _table
 
+def _get_storage() -> storage.Storage:
+    global _storage
+    if _storage is None:
+        _storage = storage.from_env("TABLE_NAME")
+    return _storage
+
+
+def use_storage(store: storage.Storage) -> None:
+    """Create, check and allocate links against ``store`` instead of the ``TABLE_NAME`` table."""
+    global _storage
+    _storage = store
+
+
+def _get_counter_storage() -> storage.Storage:
+    global _counter_storage
+    if _counter_storage is None:
+        _counter_storage = storage.from_env("COUNTER_TABLE_NAME", key_name="name")
+    return _counter_storage
+
+
+# Per-client admission control for link creation (see rate_limit); None when disabled.
+_rate_limiter = rate_limit.from_env(_get_counter_storage)
+
+
+# Open the storage connection during Lambda init so the first request
+# does not pay for client construction and the TLS handshake.
+if "AWS_LAMBDA_FUNCTION_NAME" in os.environ:
+    _get_storage().warm()
+
+
+def estimated_size(value: Any) -> int:
+    """Roughly how many bytes ``value`` takes up in an item: its length as compact JSON."""
+    return len(json.dumps(value, separators=(",", ":"), default=str).encode("utf-8"))
+
+
+def needs_packing(targets: list[dict]) -> bool:
+    """Whether a link with these targets is stored packed: too many of them, or too large to fit one item."""
+    return len(targets) >= PACKED_TARGETS_THRESHOLD or estimated_size(targets) > MAX_PLAIN_ITEM_BYTES
+
+
+def stored_items(item: dict) -> list[dict]:
+    """The items a link is stored as: itself, or a shard directory followed by its packed shards."""
+    if not needs_packing(item["targets"]) and estimated_size(item) <= MAX_PLAIN_ITEM_BYTES:
+        return [item]
+    return pack_link(item)
+
+
+def link_item(
+    short_code: str,
+    targets: list[dict],
+    expires_at: int,
+    rules: list[dict] | None = None,
+    edit_key_hash: str | None = None,
+) -> dict:
+    """A new link's item, at version 1."""
+    item = {"short_code": short_code, "targets": targets, "expires_at": expires_at, "version": 1}
+    if rules:
+        item["rules"] = rules
+    if edit_key_hash:
+        item["edit_key_hash"] = edit_key_hash
+    return item
+
+
+def put_item(
+    short_code: str,
+    targets: list[dict],
+    expires_at: int,
+    rules: list[dict] | None = None,
+    edit_key_hash: str | None = None,
+) -> None:
+    # The primary item claims the code; shards are only written once it has.
+    item = link_item(short_code, targets, expires_at, rules, edit_key_hash)
+    primary, *shards = stored_items(item)
+    if not _get_storage().put_if_absent(primary):
+        raise KeyError(f"Short code '{short_code}' already exists")
+    if shards and batch_put_items(shards):
+        raise RuntimeError(f"Could not store the targets of '{short_code}'")
+
+
+def existing_codes(codes: list[str]) -> set[str]:
+    """Return the subset of codes that are already stored."""
+    return set(_get_storage().batch_get(codes, attributes=["short_code"]))
+
+
+def batch_put_items(items: list[dict]) -> list[dict]:
+    """Write items in batches; return the ones that could not be written."""
+    return _get_storage().batch_put(items)
+
+
+# --- Edit keys ---
+# Every link gets a random edit key when it is created. The key is only
+# ever in the response that created the link; the item keeps its SHA-256
+# as ``edit_key_hash``, which an update's ``Authorization: Bearer`` key
+# must match.
+EDIT_KEY_BYTES = 24
+
+
+def hash_edit_key(edit_key: str) -> str:
+    return hashlib.sha256(edit_key.encode("utf-8")).hexdigest()
+
+
+def new_edit_key() -> tuple[str, str]:
+    """A fresh edit key and its hash."""
+    edit_key = secrets.token_urlsafe(EDIT_KEY_BYTES)
+    return edit_key, hash_edit_key(edit_key)
+
+
+def bearer_token(event: dict) -> str | None:
+    """The key of an ``Authorization: Bearer <key>`` header, or None."""
+    headers = {k.lower(): v for k, v in (event.get("headers") or {}).items()}
+    scheme, _, token = (headers.get("authorization") or "").partition(" ")
+    token = token.strip()
+    return token if scheme.lower() == "bearer" and token else None
 
-def put_item(short_code: str, targets: list[dict], expires_at: int) -> None:
-    try:
-        _get_table().put_item(
-            Item={"short_code": short_code, "targets": targets, "expires_at": expires_at},
-            ConditionExpression="attribute_not_exists(short_code)",
-        )
-    except ClientError as e:
-        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
-            raise KeyError(f"Short code '{short_code}' already exists") from e
-        raise
+
+# --- Idempotent creation ---
+# An opted-in request is keyed by its normalised target set (and the
+# client's Idempotency-Key, if any) under "~dedup#<digest>", an item that
+# points at the link made for it and expires with that link.
+DEDUP_PREFIX = "~dedup#"
+
+
+def dedup_key(targets: list[dict], idempotency_key: str | None = None, rules: list[dict] | None = None) -> str:
+    """Key for a target set, ignoring target order and the scale of the weights.
+
+    Routing rules refer to targets by position, so with rules the URL order
+    counts too.
+    """
+    weights: dict[str, float] = {}
+    for target in targets:
+        weights[target["url"]] = weights.get(target["url"], 0.0) + float(target["weight"])
+    total = sum(weights.values())
+    normalised = sorted((url, round(weight / total, 12)) for url, weight in weights.items())
+    key: list[Any] = [idempotency_key, normalised]
+    if rules:
+        key += [[t["url"] for t in targets], rules]
+    payload = json.dumps(key, separators=(",", ":"), sort_keys=True)
+    return DEDUP_PREFIX + hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def find_duplicate(key: str) -> dict | None:
+    """The unexpired link recorded under a dedup key, as ``{"link", "expires_at"}``."""
+    with metrics.span("dedup_lookup"):
+        entry = _get_storage().get(key, attributes=["link", "expires_at"])
+    if entry and int(entry["expires_at"]) > time.time():
+        return entry
+    return None
+
+
+def claim_duplicate(key: str, short_code: str, expires_at: int) -> dict:
+    """Record ``short_code`` under ``key`` unless a live entry got there first; return the entry that won.
+
+    The link is written before it is claimed, so a returned code always
+    resolves. A request that loses the race leaves its own link unused
+    until the table's TTL removes it.
+    """
+    entry = {"short_code": key, "link": short_code, "expires_at": expires_at}
+    if _get_storage().put_if_absent(entry, expired_before=int(time.time()) + 1):
+        return entry
+    return find_duplicate(key) or entry
+
+
+def forget_duplicate(targets: list[dict], short_code: str, rules: list[dict] | None = None) -> None:
+    """Stop returning ``short_code`` for opted-in requests with ``targets``, once its targets have changed.
+
+    Only the entry keyed by the target set alone is expired; a client's
+    Idempotency-Key keeps returning the link it created.
+    """
+    _get_storage().update(dedup_key(targets, rules=rules), {"expires_at": int(time.time())}, expected={"link": short_code})
+
+
+# --- Counter-based code allocation ---
+
+def reserve_counter_block(size: int) -> int:
+    """Atomically reserve ``size`` counter values and return the first one."""
+    result = _get_counter_storage().increment("short_code", {"next_value": size}, must_exist=False)
+    return int(result["next_value"]) - size
+
+
+def _get_allocator() -> SequenceAllocator:
+    global _allocator
+    if _allocator is None:
+        permutation = FeistelPermutation(os.environ["CODE_PERMUTATION_KEY"].encode())
+        _allocator = SequenceAllocator(reserve_counter_block, permutation, COUNTER_BLOCK_SIZE)
+    return _allocator
 
 
 # --- Core logic ---
@@ -44,6 +232,18 @@ def generate_base62(length: int = 5) -> str:
     return "".join(random.choices(BASE62, k=length))
 
 
+def next_code() -> str:
+    """A fresh candidate code from the configured allocator.
+
+    Sequence codes never repeat, but they share the code space with links
+    created in random mode or imported, so they can still be taken and are
+    checked like random ones.
+    """
+    if CODE_ALLOCATOR == "sequence":
+        return _get_allocator().next_code()
+    return generate_base62()
+
+
 def build_targets(urls: list[dict]) -> list[dict]:
     return [
         {"url": entry["original_url"], "weight": entry["weight"], "visits": 0}
@@ -51,16 +251,30 @@ def build_targets(urls: list[dict]) -> list[dict]:
     ]
 
 
-def put_item_with_retry(short_code: str, targets: list[dict], expires_at: int) -> str:
+def link_rules(body: dict) -> list[dict] | None:
+    """The routing rules of a validated link body, as stored, or None if it has none."""
+    return normalize_rules(body["rules"]) if body.get("rules") else None
+
+
+def put_item_with_retry(
+    short_code: str,
+    targets: list[dict],
+    expires_at: int,
+    rules: list[dict] | None = None,
+    edit_key_hash: str | None = None,
+) -> str:
     for attempt in range(1, MAX_RETRIES + 1):
         try:
-            put_item(short_code, targets, expires_at)
+            with metrics.span("put_item"):
+                put_item(short_code, targets, expires_at, rules, edit_key_hash)
             logger.info("Short code created: %s (attempt %d)", short_code, attempt)
+            metrics.record("put_attempts", attempt, "Count")
             return short_code
         except KeyError:
             logger.warning("Collision on '%s', retrying (attempt %d)", short_code, attempt)
-            short_code = generate_base62()
+            short_code = next_code()
 
+    metrics.record("put_attempts", MAX_RETRIES, "Count")
     raise RuntimeError(f"Failed to generate a unique short code after {MAX_RETRIES} attempts")
 
 
@@ -76,6 +290,233 @@ def validate_body(body: dict) -> str | None:
             return f"Entry {i} is missing 'weight'"
         if not isinstance(entry["weight"], (int, float)) or entry["weight"] <= 0:
             return f"Entry {i} has an invalid weight (must be a positive number)"
+    if "rules" in body:
+        if needs_packing(build_targets(body["urls"])):
+            return (
+                f"Routing rules are only supported for links with fewer than {PACKED_TARGETS_THRESHOLD} URLs"
+                f" and under {MAX_PLAIN_ITEM_BYTES // 1024} KB of them"
+            )
+        return validate_rules(body["rules"], len(body["urls"]))
+    return None
+
+
+def allocate_unique_codes(count: int, exclude: set[str] | frozenset[str] = frozenset()) -> list[str | None]:
+    """Draw ``count`` distinct codes that are not yet stored and not in ``exclude``.
+
+    Since BatchWriteItem cannot carry a condition, collisions are found up
+    front with BatchGetItem and redrawn, up to ``MAX_RETRIES`` rounds. This
+    holds in "sequence" mode too, where a code can already belong to a link
+    created before the mode was switched on. ``exclude`` holds codes about
+    to be written in the same batch, which storage doesn't know of yet.
+    Slots that still collide after that are returned as None.
+    """
+    codes: list[str | None] = [None] * count
+    pending = list(range(count))
+    taken: set[str] = set(exclude)
+    for attempt in range(1, MAX_RETRIES + 1):
+        candidates = {}
+        for i in pending:
+            code = next_code()
+            while code in taken or code in candidates:
+                code = next_code()
+            candidates[code] = i
+        collisions = existing_codes(list(candidates))
+        pending = []
+        for code, i in candidates.items():
+            if code in collisions:
+                logger.warning("Collision on '%s', retrying (attempt %d)", code, attempt)
+                pending.append(i)
+            else:
+                codes[i] = code
+                taken.add(code)
+        if not pending:
+            break
+    return codes
+
+
+def create_links(entries: list[Any], expires_at: int) -> list[dict]:
+    """Create one link per entry and report a result or an error for each, in input order."""
+    results: list[dict] = [{} for _ in entries]
+    valid = []
+    for i, entry in enumerate(entries):
+        error = validate_body(entry) if isinstance(entry, dict) else "Entry must be an object"
+        if error:
+            results[i] = {"error": error}
+        else:
+            valid.append(i)
+
+    with metrics.span("allocate"):
+        codes = allocate_unique_codes(len(valid))
+    items = []
+    for i, code in zip(valid, codes):
+        if code is None:
+            results[i] = {"error": "Could not generate a unique short code. Please try again."}
+            continue
+        targets = build_targets(entries[i]["urls"])
+        rules = link_rules(entries[i])
+        edit_key, edit_key_hash = new_edit_key()
+        items.extend(stored_items(link_item(code, targets, expires_at, rules, edit_key_hash)))
+        results[i] = {
+            "short_code": code,
+            "short_url": f"https://short.ly/{code}",
+            "targets": targets,
+            "expires_at": expires_at,
+            "version": 1,
+            "edit_key": edit_key,
+        }
+        if rules:
+            results[i]["rules"] = rules
+
+    with metrics.span("batch_put"):
+        failed = batch_put_items(items)
+    # A failed shard fails its whole link.
+    failed_codes = {item["short_code"].split(SHARD_SEPARATOR)[0] for item in failed}
+    for i, result in enumerate(results):
+        if result.get("short_code") in failed_codes:
+            results[i] = {"error": "Could not store the link. Please try again."}
+    return results
+
+
+# --- In-place updates ---
+# Every link item carries a version, 1 when created. An update replaces the
+# targets only while the version the client read is still current, and
+# bumps it; redirect containers compare versions to tell whether their
+# cached copy of a link is still good.
+UPDATE_ATTRIBUTES = [
+    "targets", "rules", "format", "shards", "version", "expires_at", "replicas", "replica_until", "edit_key_hash",
+]
+# What describes a link's target set; those the new version doesn't use are removed.
+TARGET_ATTRIBUTES = ["targets", "rules", "format", "count", "total_weight", "shards"]
+
+
+class EditKeyMismatch(Exception):
+    """The edit key of an update is not the link's."""
+
+
+class VersionConflict(Exception):
+    """The link is no longer at the version an update was based on."""
+
+    def __init__(self, current: int):
+        super().__init__(f"Link is at version {current}")
+        self.current = current
+
+
+def current_targets(short_code: str, item: dict) -> list[dict]:
+    """The targets (with visits) of a stored link item, reading its shards if it is packed."""
+    if item.get("format") != PACKED_FORMAT:
+        return item["targets"]
+    version = int(item.get("version", 1))
+    keys = [shard_key(short_code, k, version) for k in range(len(item["shards"]))]
+    shards = _get_storage().batch_get(keys, attributes=["packed", "visits"])
+    if not all(key in shards for key in keys):
+        raise RuntimeError(f"Could not read the targets of '{short_code}'")
+    return unpack_targets([shards[key] for key in keys])
+
+
+def carry_visits(old: list[dict], new: list[dict]) -> list[dict]:
+    """Keep the visit counts of URLs that stay; the first new entry for a URL gets all of its visits."""
+    visits: dict[str, int] = {}
+    for target in old:
+        visits[target["url"]] = visits.get(target["url"], 0) + int(target.get("visits", 0))
+    return [{**target, "visits": visits.pop(target["url"], 0)} for target in new]
+
+
+def update_link(
+    short_code: str, targets: list[dict], version: int, rules: list[dict] | None = None, *, edit_key: str
+) -> dict | None:
+    """Replace the targets (and routing rules) of a link still at ``version``; return the new plain item.
+
+    Returns None when the link does not exist or has expired, raises
+    ``EditKeyMismatch`` when ``edit_key`` is not the link's (links stored
+    without one cannot be updated), and ``VersionConflict`` when it has
+    moved past ``version``. A packed
+    version's shards are written under keys of their own before the primary
+    points at them; the previous version's expire with the link. Visits
+    redirect containers still hold for the previous version are dropped
+    when they are flushed (see ``redirect.flush_visits``).
+    """
+    store = _get_storage()
+    with metrics.span("get_item"):
+        current = store.get(short_code, attributes=UPDATE_ATTRIBUTES)
+    if not current or not (current.get("targets") or current.get("shards")):
+        return None
+    if "expires_at" in current and int(current["expires_at"]) <= time.time():
+        return None
+    edit_key_hash = hash_edit_key(edit_key)
+    if not hmac.compare_digest(str(current.get("edit_key_hash", "")), edit_key_hash):
+        raise EditKeyMismatch(f"Wrong edit key for '{short_code}'")
+    if int(current.get("version", 1)) != version:
+        raise VersionConflict(int(current.get("version", 1)))
+
+    old_targets = current_targets(short_code, current)
+    item = {"short_code": short_code, "targets": carry_visits(old_targets, targets), "version": version + 1}
+    if rules:
+        item["rules"] = rules
+    if "expires_at" in current:
+        item["expires_at"] = current["expires_at"]
+    primary, *shards = stored_items(item)
+    if shards and batch_put_items(shards):
+        raise RuntimeError(f"Could not store the targets of '{short_code}'")
+
+    values = {k: v for k, v in primary.items() if k not in ("short_code", "expires_at")}
+    removed = [name for name in TARGET_ATTRIBUTES if name not in primary]
+    with metrics.span("update_item"):
+        applied = store.update(
+            short_code,
+            values,
+            expected={"version": current.get("version"), "edit_key_hash": edit_key_hash},
+            remove=removed,
+        )
+    if not applied:
+        latest = store.get(short_code, attributes=["short_code", "version"])
+        if latest is None:
+            return None
+        raise VersionConflict(int(latest.get("version", 1)))
+
+    # The update has been applied; failing this only leaves the entry to expire on its own.
+    try:
+        forget_duplicate(old_targets, short_code, current.get("rules"))
+    except storage.StorageError:
+        logger.exception("Updated %s but could not refresh its dedup entry", short_code)
+    refresh_replicas(short_code, primary)
+    return item
+
+
+def refresh_replicas(short_code: str, primary: dict) -> None:
+    """Bring the replicas of a just-updated link in line with ``primary``, or stop the link using them.
+
+    Replication may have started after the update read the link, so the
+    item as written is read back to find out. Its replicas are rewritten
+    only while it is still at ``primary``'s version; a later update
+    refreshes them itself. If they cannot be rewritten, the primary stops
+    advertising them so new readers go to the primary instead.
+    """
+    store = _get_storage()
+    version = primary["version"]
+    try:
+        latest = store.get(short_code, attributes=["version", "replicas", "replica_until"], consistent=True)
+        if latest and int(latest.get("version", 1)) == version:
+            sync_replicas(store, {**primary, **latest})
+        return
+    except storage.StorageError:
+        logger.exception("Updated %s but could not refresh its replicas; dropping them", short_code)
+    try:
+        store.update(short_code, {}, expected={"version": version}, remove=["replicas", "replica_until"])
+    except storage.StorageError:
+        logger.exception("Could not drop the replicas of %s; they expire at their replica_until", short_code)
+
+
+def validate_update_body(body: Any) -> str | None:
+    if not isinstance(body, dict):
+        return "Body must be a JSON object"
+    error = validate_body(body)
+    if error:
+        return error
+    if "version" not in body:
+        return "Missing required field: version"
+    version = body["version"]
+    if isinstance(version, bool) or not isinstance(version, int) or version < 1:
+        return "Field 'version' must be a positive integer"
     return None
 
 
@@ -90,33 +531,165 @@ def response(status_code: int, body: Any) -> dict:
     }
 
 
+def too_many_requests(retry_after: float) -> dict:
+    seconds = max(1, math.ceil(retry_after))
+    result = response(429, {"error": "Too many requests. Please slow down.", "retry_after": seconds})
+    result["headers"]["Retry-After"] = str(seconds)
+    return result
+
+
+def link_response(
+    status_code: int,
+    short_code: str,
+    targets: list[dict],
+    expires_at: int,
+    version: int | None = None,
+    rules: list[dict] | None = None,
+    edit_key: str | None = None,
+) -> dict:
+    body = {
+        "short_code": short_code,
+        "short_url": f"https://short.ly/{short_code}",
+        "targets": targets,
+        "expires_at": expires_at,
+    }
+    if rules:
+        body["rules"] = rules
+    if version is not None:
+        body["version"] = version
+    if edit_key is not None:
+        body["edit_key"] = edit_key
+    return response(status_code, body)
+
+
+@metrics.instrumented("generate_link")
 def handler(event: dict, context: Any) -> dict:
+    if _rate_limiter is not None:
+        retry_after = _rate_limiter.admit(rate_limit.client_key(event))
+        if retry_after:
+            metrics.record("rate_limited", 1, "Count")
+            return too_many_requests(retry_after)
+
     try:
-        raw_body = event.get("body", "{}")
-        body = json.loads(raw_body) if isinstance(raw_body, str) else raw_body
+        with metrics.span("parse"):
+            raw_body = event.get("body", "{}")
+            body = json.loads(raw_body) if isinstance(raw_body, str) else raw_body
     except json.JSONDecodeError:
         return response(400, {"error": "Invalid JSON body"})
 
-    error = validate_body(body)
+    with metrics.span("validate"):
+        error = validate_body(body)
     if error:
         return response(400, {"error": error})
 
     targets = build_targets(body["urls"])
-    short_code = generate_base62()
+    rules = link_rules(body)
     expires_at = int(time.time()) + 30 * 24 * 60 * 60
 
+    headers = {k.lower(): v for k, v in (event.get("headers") or {}).items()}
+    idempotency_key = headers.get("idempotency-key")
+    key = None
+    if idempotency_key is not None or body.get("idempotent") is True:
+        key = dedup_key(targets, idempotency_key, rules)
+        duplicate = find_duplicate(key)
+        if duplicate is not None:
+            return link_response(200, duplicate["link"], targets, duplicate["expires_at"], rules=rules)
+
+    edit_key, edit_key_hash = new_edit_key()
     try:
-        final_code = put_item_with_retry(short_code, targets, expires_at)
-    except RuntimeError as e:
+        with metrics.span("allocate"):
+            first_code = next_code()
+        final_code = put_item_with_retry(first_code, targets, expires_at, rules, edit_key_hash)
+    except (KeyError, RuntimeError) as e:
         logger.error(str(e))
         return response(500, {"error": "Could not generate a unique short code. Please try again."})
+    except storage.StorageError as e:
+        logger.error("Creating a link failed: %s", e)
+        return response(500, {"error": "Could not store the link. Please try again."})
 
-    return response(
-        201,
-        {
-            "short_code": final_code,
-            "short_url": f"https://short.ly/{final_code}",
-            "targets": targets,
-            "expires_at": expires_at,
-        },
+    if key is not None:
+        try:
+            with metrics.span("dedup_claim"):
+                entry = claim_duplicate(key, final_code, expires_at)
+        except storage.StorageError:
+            # The link is stored; it just won't be found by later duplicate requests.
+            logger.exception("Created %s but could not record it for deduplication", final_code)
+            entry = {"link": final_code}
+        if entry["link"] != final_code:
+            return link_response(200, entry["link"], targets, entry["expires_at"], rules=rules)
+
+    return link_response(201, final_code, targets, expires_at, version=1, rules=rules, edit_key=edit_key)
+
+
+@metrics.instrumented("generate_links")
+def bulk_handler(event: dict, context: Any) -> dict:
+    try:
+        with metrics.span("parse"):
+            raw_body = event.get("body", "{}")
+            body = json.loads(raw_body) if isinstance(raw_body, str) else raw_body
+    except json.JSONDecodeError:
+        return response(400, {"error": "Invalid JSON body"})
+
+    links = body.get("links") if isinstance(body, dict) else None
+    if not isinstance(links, list) or len(links) == 0:
+        return response(400, {"error": "Field 'links' must be a non-empty list"})
+    if len(links) > MAX_BULK_LINKS:
+        return response(400, {"error": f"At most {MAX_BULK_LINKS} links can be created per request"})
+    if _rate_limiter is not None:
+        # One token per link, so a bulk request can't outrun the single-link limit.
+        retry_after = _rate_limiter.admit(rate_limit.client_key(event), len(links))
+        if retry_after:
+            metrics.record("rate_limited", 1, "Count")
+            return too_many_requests(retry_after)
+
+    expires_at = int(time.time()) + 30 * 24 * 60 * 60
+    try:
+        results = create_links(links, expires_at)
+    except (RuntimeError, storage.StorageError) as e:
+        logger.error("Bulk creation failed: %s", e)
+        return response(500, {"error": "Could not create links. Please try again."})
+
+    status = 201 if all("short_code" in r for r in results) else 207
+    return response(status, {"results": results})
+
+
+@metrics.instrumented("update_link")
+def update_handler(event: dict, context: Any) -> dict:
+    short_code = (event.get("pathParameters") or {}).get("short_code")
+    if not short_code:
+        return response(400, {"error": "Missing short code"})
+    edit_key = bearer_token(event)
+    if edit_key is None:
+        result = response(401, {"error": "Missing edit key"})
+        result["headers"]["WWW-Authenticate"] = "Bearer"
+        return result
+    try:
+        with metrics.span("parse"):
+            raw_body = event.get("body") or "{}"
+            body = json.loads(raw_body) if isinstance(raw_body, str) else raw_body
+    except json.JSONDecodeError:
+        return response(400, {"error": "Invalid JSON body"})
+
+    with metrics.span("validate"):
+        error = validate_update_body(body)
+    if error:
+        return response(400, {"error": error})
+    if REPLICA_SEPARATOR in short_code or SHARD_SEPARATOR in short_code:
+        return response(404, {"error": "Short code not found"})
+
+    try:
+        item = update_link(
+            short_code, build_targets(body["urls"]), body["version"], link_rules(body), edit_key=edit_key
+        )
+    except EditKeyMismatch:
+        return response(403, {"error": "The edit key does not match this link"})
+    except VersionConflict as e:
+        return response(409, {"error": "The link was changed by another update", "version": e.current})
+    except (RuntimeError, storage.StorageError) as e:
+        logger.error("Updating %s failed: %s", short_code, e)
+        return response(500, {"error": "Could not update the link. Please try again."})
+    if item is None:
+        return response(404, {"error": "Short code not found"})
+    return link_response(
+        200, short_code, item["targets"], item.get("expires_at"), version=item["version"], rules=item.get("rules")
     )
@@ -0,0 +1,111 @@
+import threading
+import time
+from typing import Callable
+
+import storage
+
+# Replica items live next to the primary under "<short_code>#<k>". "#" never
+# appears in generated codes and cannot reach the redirect through a URL path.
+REPLICA_SEPARATOR = "#"
+# Primary-only attributes a replica never carries. The edit-key hash only
+# authorizes updates, which always go to the primary, so it stays there.
+_NOT_REPLICATED = ("expires_at", "replicas", "replica_until", "edit_key_hash")
+
+
+def replica_key(short_code: str, k: int) -> str:
+    return f"{short_code}{REPLICA_SEPARATOR}{k}"
+
+
+def make_replicas(item: dict, count: int, replica_until: int, key_name: str = "short_code") -> list[dict]:
+    """Copies of a link item under replica keys ``1..count``.
+
+    For a packed link only the shard directory is copied; readers of any
+    replica load the shards themselves from ``<short_code>~<k>``, or
+    ``<short_code>~<version>.<k>`` once the link has been updated past
+    version 1 (see ``target_codec.shard_key``).
+
+    A replica's ``expires_at`` is what the table's TTL deletes it by, so it
+    is set to when the replica stops being used; the link's own expiry
+    travels in ``link_expires_at``.
+    """
+    short_code = item[key_name]
+    link_expires_at = item.get("expires_at")
+    base = {k: v for k, v in item.items() if k != key_name and k not in _NOT_REPLICATED}
+    if link_expires_at is not None:
+        base["link_expires_at"] = link_expires_at
+    expires_at = replica_until if link_expires_at is None else min(replica_until, int(link_expires_at))
+    return [
+        {**base, key_name: replica_key(short_code, k), "replica_until": replica_until, "expires_at": expires_at}
+        for k in range(1, count + 1)
+    ]
+
+
+class HotKeyDetector:
+    """Counts requests per short code in fixed windows and flags the ones that cross a threshold.
+
+    All codes share the same window boundaries, so the counters are simply
+    dropped at the end of each window and memory stays bounded by the
+    number of distinct codes seen in one window.
+    """
+
+    def __init__(self, threshold: int, window: float = 10.0, clock: Callable[[], float] = time.monotonic):
+        self.threshold = threshold
+        self.window = window
+        self._clock = clock
+        self._counts: dict[str, int] = {}
+        self._window_start = clock()
+        self._lock = threading.Lock()
+
+    def record(self, short_code: str) -> bool:
+        """Count one request; return True exactly when this request makes the code hot for the window."""
+        if self.threshold <= 0:
+            return False
+        with self._lock:
+            now = self._clock()
+            if now - self._window_start >= self.window:
+                self._counts.clear()
+                self._window_start = now
+            count = self._counts.get(short_code, 0) + 1
+            self._counts[short_code] = count
+            return count == self.threshold
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counts.clear()
+            self._window_start = self._clock()
+
+
+def replicate(store, short_code: str, count: int, ttl: int) -> int | None:
+    """Write ``count`` replicas of a link and advertise them on the primary item.
+
+    Replicas are written before the primary is pointed at them, so a reader
+    that sees ``replicas`` on the primary always finds them. The primary is
+    only pointed at them while it is still at the version that was copied:
+    an update that lands in between would not know to rewrite them. Returns
+    the ``replica_until`` timestamp, or None if the link is gone, changed or
+    a write failed.
+    """
+    item = store.get(short_code)
+    if not item or not (item.get("targets") or item.get("shards")):
+        return None
+    replica_until = int(time.time()) + ttl
+    if store.batch_put(make_replicas(item, count, replica_until, store.key_name)):
+        return None
+    marker = {"replicas": count, "replica_until": replica_until}
+    if not store.update(short_code, marker, expected={"version": item.get("version")}):
+        return None
+    return replica_until
+
+
+def sync_replicas(store, item: dict) -> None:
+    """Rewrite the live replicas of ``item`` after its primary was changed.
+
+    Anything that modifies a link's targets or expiry calls this with the
+    new primary item so replicas never keep serving old weights. Raises
+    ``StorageError`` when a replica could not be rewritten.
+    """
+    count = int(item.get("replicas") or 0)
+    replica_until = int(item.get("replica_until") or 0)
+    if count and replica_until > time.time():
+        if store.batch_put(make_replicas(item, count, replica_until, store.key_name)):
+            raise storage.StorageError(f"Could not rewrite the replicas of '{item[store.key_name]}'")
@@ -0,0 +1,297 @@
+"""Hot-set snapshots: the most-requested links, preloaded into new redirect containers.
+
+A snapshot holds the targets of the top codes by request count and a
+``generation`` number, compressed into one object. Redirect containers load
+it during init and answer those codes after reading only their current
+``version`` (see ``redirect.get_link``) instead of the whole item; while
+serving, they check for a newer generation every
+``HOT_SET_REFRESH_INTERVAL`` seconds on a background thread, and stop using
+a snapshot older than ``HOT_SET_MAX_AGE`` seconds. ``HOT_SET_SOURCE``
+selects where snapshots live:
+
+- ``table``: the ``~hotset`` item of the links table
+- ``file:<path>``: a local file (self-hosting)
+- unset or empty: disabled
+
+Build and publish one from visit-event logs (the ``file:`` event sink)::
+
+    python hot_set.py events/*.jsonl --size 2000
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+from typing import Any, Callable, Iterable, Mapping
+
+import events
+
+logger = logging.getLogger()
+
+SNAPSHOT_KEY = "~hotset"
+# Stays clear of DynamoDB's 400 KB item limit with room for the other attributes.
+MAX_SNAPSHOT_BYTES = 350_000
+
+
+def encode_snapshot(snapshot: dict) -> bytes:
+    return zlib.compress(json.dumps(snapshot, separators=(",", ":")).encode("utf-8"), 9)
+
+
+def decode_snapshot(blob: bytes) -> dict:
+    return json.loads(zlib.decompress(blob))
+
+
+# --- Sources ---
+
+class TableSource:
+    """Snapshot kept as one item in the links table, next to the links themselves.
+
+    ``key`` names the item and ``field`` the snapshot entry that holds what
+    is published, so other snapshots (such as target health scores) can use
+    the same machinery.
+    """
+
+    def __init__(self, store, key: str = SNAPSHOT_KEY, field: str = "links"):
+        self.store = store
+        self.key = key
+        self.field = field
+
+    def generation(self) -> int:
+        item = self.store.get(self.key, attributes=["generation"])
+        return int(item["generation"]) if item else 0
+
+    def load(self) -> dict | None:
+        item = self.store.get(self.key, attributes=["packed"])
+        return decode_snapshot(item["packed"]) if item and "packed" in item else None
+
+    def publish(self, links: dict[str, dict]) -> int:
+        """Store ``links`` as the next generation; return that generation."""
+        generation = int(self.store.increment(self.key, {"generation": 1}, must_exist=False)["generation"])
+        snapshot = {"generation": generation, "built_at": int(time.time()), self.field: links}
+        self.store.update(self.key, {"packed": encode_snapshot(snapshot), "count": len(links)})
+        return generation
+
+
+class FileSource:
+    def __init__(self, path: str, field: str = "links"):
+        self.path = path
+        self.field = field
+
+    def generation(self) -> int:
+        snapshot = self.load()
+        return int(snapshot["generation"]) if snapshot else 0
+
+    def load(self) -> dict | None:
+        try:
+            with open(self.path, "rb") as f:
+                return decode_snapshot(f.read())
+        except FileNotFoundError:
+            return None
+
+    def publish(self, links: dict[str, dict]) -> int:
+        generation = self.generation() + 1
+        snapshot = {"generation": generation, "built_at": int(time.time()), self.field: links}
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(encode_snapshot(snapshot))
+        os.replace(tmp, self.path)
+        return generation
+
+
+def source_from_env(
+    get_storage: Callable[[], Any],
+    env: str = "HOT_SET_SOURCE",
+    key: str = SNAPSHOT_KEY,
+    field: str = "links",
+    default: str = "",
+) -> TableSource | FileSource | None:
+    spec = os.environ.get(env, default)
+    if not spec:
+        return None
+    if spec == "table":
+        return TableSource(get_storage(), key, field)
+    if spec.startswith("file:"):
+        return FileSource(spec[len("file:"):], field)
+    raise ValueError(f"Unknown {env}: {spec!r}")
+
+
+# --- Following a source ---
+
+class SnapshotFollower:
+    """Keeps the newest snapshot of a source, checking for a newer generation in the background.
+
+    Subclasses take what they need from a loaded snapshot in ``_apply``.
+    """
+
+    name = "snapshot"
+
+    def __init__(
+        self,
+        source,
+        refresh_interval: float,
+        max_age: float,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.source = source
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age
+        self.generation = 0
+        self.built_at = 0.0
+        self._clock = clock
+        self._next_check = 0.0
+        self._refreshing = threading.Lock()
+
+    def fresh(self) -> bool:
+        """Whether a snapshot is loaded and no older than ``max_age``."""
+        return self.generation > 0 and self._clock() - self.built_at <= self.max_age
+
+    def _apply(self, snapshot: dict) -> None:
+        raise NotImplementedError
+
+    def refresh(self) -> bool:
+        """Load the source's snapshot if it is newer than ours; return whether one was loaded."""
+        self._next_check = self._clock() + self.refresh_interval
+        if self.source.generation() <= self.generation:
+            return False
+        snapshot = self.source.load()
+        if snapshot is None or int(snapshot["generation"]) <= self.generation:
+            return False
+        self._apply(snapshot)
+        self.generation = int(snapshot["generation"])
+        self.built_at = float(snapshot["built_at"])
+        logger.info("Loaded %s generation %d (%d entries)", self.name, self.generation, len(self))
+        return True
+
+    def maybe_refresh(self) -> None:
+        """Start a background refresh when one is due. Never blocks the caller."""
+        if self._clock() < self._next_check or not self._refreshing.acquire(blocking=False):
+            return
+        self._next_check = self._clock() + self.refresh_interval
+        threading.Thread(target=self._refresh_in_background, name=f"{self.name.replace(' ', '-')}-refresh", daemon=True).start()
+
+    def _refresh_in_background(self) -> None:
+        try:
+            self.refresh()
+        except Exception:
+            logger.exception("Refreshing the %s failed", self.name)
+        finally:
+            self._refreshing.release()
+
+
+# --- In-process hot set ---
+
+class HotSet(SnapshotFollower):
+    """The links of the newest snapshot loaded, built with ``build_link(code, item)`` on first use.
+
+    ``build_link`` returns None for items that should not be served (for
+    example expired links). Nothing is served from a snapshot older than
+    ``max_age`` seconds.
+    """
+
+    name = "hot set"
+
+    def __init__(
+        self,
+        source,
+        build_link: Callable[[str, dict], Any],
+        refresh_interval: float = 300.0,
+        max_age: float = 3600.0,
+        clock: Callable[[], float] = time.time,
+    ):
+        super().__init__(source, refresh_interval, max_age, clock)
+        self._build_link = build_link
+        # (snapshot items, links built from them so far), replaced as a whole on refresh.
+        self._state: tuple[dict[str, dict], dict[str, Any]] = ({}, {})
+
+    def __len__(self) -> int:
+        return len(self._state[0])
+
+    def _apply(self, snapshot: dict) -> None:
+        self._state = (snapshot["links"], {})
+
+    def get(self, short_code: str) -> Any:
+        items, links = self._state
+        if not items or not self.fresh():
+            return None
+        link = links.get(short_code)
+        if link is None:
+            item = items.get(short_code)
+            if item is None:
+                return None
+            link = self._build_link(short_code, item)
+            if link is None:
+                return None
+            links[short_code] = link
+        if link.expires_at is not None and link.expires_at <= self._clock():
+            return None
+        return link
+
+
+# --- Building ---
+
+def counts_from_events(paths: Iterable[str]) -> Counter:
+    """Requests per code in JSON-lines visit-event files; lines that aren't visit events are skipped."""
+    return Counter(event["code"] for event in events.read_events(paths, "code"))
+
+
+def build_links(store, counts: Mapping[str, int], size: int) -> dict[str, dict]:
+    """Read the ``size`` most-requested links; return them most popular first, without visit counts.
+
+    Expired, missing and packed (very large) links are left out.
+    """
+    top = [code for code, _ in sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))[:size]]
+    items = store.batch_get(top, attributes=["targets", "rules", "expires_at", "version"])
+    now = time.time()
+    links = {}
+    for code in top:
+        item = items.get(code)
+        if not item or not item.get("targets"):
+            continue
+        if "expires_at" in item and int(item["expires_at"]) <= now:
+            continue
+        link = {"targets": [{"url": t["url"], "weight": t["weight"]} for t in item["targets"]]}
+        for key in ("rules", "expires_at", "version"):
+            if key in item:
+                link[key] = item[key]
+        links[code] = link
+    return links
+
+
+def fit(links: dict[str, dict], max_bytes: int = MAX_SNAPSHOT_BYTES) -> dict[str, dict]:
+    """Drop the least popular links until the encoded snapshot fits in ``max_bytes``."""
+    codes = list(links)
+    low, high = 0, len(codes)
+    while low < high:
+        mid = (low + high + 1) // 2
+        size = len(encode_snapshot({"generation": 0, "built_at": 0, "links": {c: links[c] for c in codes[:mid]}}))
+        if size <= max_bytes:
+            low = mid
+        else:
+            high = mid - 1
+    return {code: links[code] for code in codes[:low]}
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="JSON-lines visit-event files")
+    parser.add_argument("--size", type=int, default=2000, help="number of codes to include")
+    parser.add_argument("--output", help="write to this file instead of the links table")
+    args = parser.parse_args(argv)
+
+    import storage
+
+    store = storage.from_env("TABLE_NAME")
+    links = fit(build_links(store, counts_from_events(args.paths), args.size))
+    source = FileSource(args.output) if args.output else TableSource(store)
+    generation = source.publish(links)
+    print(f"Published hot set generation {generation} with {len(links)} links")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
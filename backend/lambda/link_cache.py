@@ -0,0 +1,121 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+# Sentinel stored for short codes known not to exist (negative caching).
+NOT_FOUND = object()
+
+
+class LinkCache:
+    """Bounded LRU cache with per-entry TTL for resolved links.
+
+    Lives at module level so it survives across invocations on a warm
+    container. Positive entries expire after ``ttl`` seconds or at the
+    item's ``expires_at``, whichever comes first; negative entries expire
+    after ``negative_ttl`` seconds. An expired positive entry is kept until
+    it is replaced or evicted, so ``stale`` can hand it back for the caller
+    to revalidate instead of rebuilding it.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 10_000,
+        ttl: float = 60.0,
+        negative_ttl: float = 5.0,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._clock = clock
+        self._entries: OrderedDict[str, tuple[Any, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Any:
+        """Return the cached value, ``NOT_FOUND`` for a negative entry, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, deadline = entry
+            if self._clock() >= deadline:
+                if value is NOT_FOUND:
+                    del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if value is NOT_FOUND:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return value
+
+    def stale(self, key: str) -> Any:
+        """The value of an expired positive entry, or None; doesn't touch stats or LRU order."""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] is NOT_FOUND or self._clock() < entry[1]:
+            return None
+        return entry[0]
+
+    def peek(self, key: str) -> Any:
+        """The value of a live entry (``NOT_FOUND`` for a negative one) or None, without touching stats or LRU order."""
+        entry = self._entries.get(key)
+        if entry is None or self._clock() >= entry[1]:
+            return None
+        return entry[0]
+
+    def contains(self, key: str) -> bool:
+        """Whether a live entry (positive or negative) exists, without touching stats or LRU order."""
+        entry = self._entries.get(key)
+        return entry is not None and self._clock() < entry[1]
+
+    def put(self, key: str, value: Any, expires_at: float | None = None) -> None:
+        deadline = self._clock() + self.ttl
+        if expires_at is not None:
+            deadline = min(deadline, float(expires_at))
+        self._store(key, value, deadline)
+
+    def put_not_found(self, key: str) -> None:
+        self._store(key, NOT_FOUND, self._clock() + self.negative_ttl)
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.negative_hits = self.misses = 0
+            self.evictions = self.expirations = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _store(self, key: str, value: Any, deadline: float) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, deadline)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
@@ -0,0 +1,202 @@
+"""Per-stage latency metrics.
+
+Handlers wrap each stage in ``metrics.span(name)``; durations are folded
+into per-stage histograms in process and written out once per invocation
+by ``flush``. ``METRICS_SINK`` selects where that goes:
+
+- ``emf``: CloudWatch Embedded Metric Format lines on stdout (Lambda
+  turns them into metrics without any API calls)
+- ``file:<path>``: the same JSON lines appended to a local file
+- unset or empty: disabled; spans are a shared no-op object
+"""
+
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Callable
+
+NAMESPACE = os.environ.get("METRICS_NAMESPACE", "Qaktus")
+# EMF accepts at most 100 values per metric in one document.
+MAX_VALUES_PER_DOCUMENT = 100
+# Units whose values are bucketed; anything else (counts, sizes) is kept exact.
+TIMING_UNITS = frozenset({"Microseconds", "Milliseconds", "Seconds"})
+
+# Handler whose invocation is running in this thread or task; recorded
+# values are kept apart per handler so concurrent requests to different
+# handlers (in the ASGI server) are flushed under the right dimension.
+_current_handler: ContextVar[str] = ContextVar("current_handler", default="")
+
+
+def bucket(value: float) -> float:
+    """Round to two significant digits, so a histogram of latencies stays small (<= 5% error)."""
+    return float(f"{value:.2g}")
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("_metrics", "_name", "_start")
+
+    def __init__(self, metrics: "Metrics", name: str):
+        self._metrics = metrics
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._metrics.record(self._name, (time.perf_counter() - self._start) * 1000)
+        return False
+
+
+class Metrics:
+    """Histogram aggregation with batched emission. Disabled when ``sink`` is None."""
+
+    def __init__(self, sink: Callable[[str], None] | None = None, namespace: str = NAMESPACE):
+        self.sink = sink
+        self.namespace = namespace
+        self._histograms: dict[tuple[str, str], dict[float, int]] = {}
+        self._units: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.sink is not None
+
+    def span(self, name: str):
+        """Context manager that records the time spent inside it under ``name`` (milliseconds)."""
+        if self.sink is None:
+            return _NOOP_SPAN
+        return _Span(self, name)
+
+    def record(self, name: str, value: float, unit: str = "Milliseconds") -> None:
+        if self.sink is None:
+            return
+        key = (_current_handler.get(), name)
+        if unit in TIMING_UNITS:
+            value = bucket(value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {}
+                self._units[name] = unit
+            histogram[value] = histogram.get(value, 0) + 1
+
+    def snapshot(self, handler: str = "") -> dict[str, dict[float, int]]:
+        with self._lock:
+            return {name: dict(h) for (owner, name), h in self._histograms.items() if owner == handler}
+
+    def flush(self, handler: str = "") -> None:
+        """Emit everything recorded for ``handler`` since its last flush as EMF documents."""
+        if self.sink is None:
+            return
+        with self._lock:
+            keys = [key for key in self._histograms if key[0] == handler]
+            histograms = {name: self._histograms.pop((owner, name)) for owner, name in keys}
+        if not histograms:
+            return
+        dimensions = {"Handler": handler} if handler else {}
+        for document in self._documents(histograms, self._units, dimensions):
+            self.sink(json.dumps(document, separators=(",", ":")))
+
+    def _documents(self, histograms: dict, units: dict, dimensions: dict) -> list[dict]:
+        # Expand each histogram into a value list, split across documents at the EMF limit.
+        values = {
+            name: [v for v, count in sorted(h.items()) for _ in range(count)]
+            for name, h in histograms.items()
+        }
+        documents = []
+        offset = 0
+        while any(len(v) > offset for v in values.values()):
+            names = [name for name, v in values.items() if len(v) > offset]
+            document: dict[str, Any] = {
+                "_aws": {
+                    "Timestamp": int(time.time() * 1000),
+                    "CloudWatchMetrics": [{
+                        "Namespace": self.namespace,
+                        "Dimensions": [list(dimensions)] if dimensions else [],
+                        "Metrics": [{"Name": name, "Unit": units[name]} for name in names],
+                    }],
+                },
+                **dimensions,
+            }
+            for name in names:
+                document[name] = values[name][offset:offset + MAX_VALUES_PER_DOCUMENT]
+            documents.append(document)
+            offset += MAX_VALUES_PER_DOCUMENT
+        return documents
+
+
+def _stdout_sink(line: str) -> None:
+    sys.stdout.write(line + "\n")
+    sys.stdout.flush()
+
+
+def _file_sink(path: str) -> Callable[[str], None]:
+    lock = threading.Lock()
+
+    def write(line: str) -> None:
+        with lock, open(path, "a") as f:
+            f.write(line + "\n")
+
+    return write
+
+
+def from_env() -> Metrics:
+    sink = os.environ.get("METRICS_SINK", "")
+    if not sink:
+        return Metrics()
+    if sink == "emf":
+        return Metrics(_stdout_sink)
+    if sink.startswith("file:"):
+        return Metrics(_file_sink(sink[len("file:"):]))
+    raise ValueError(f"Unknown METRICS_SINK: {sink!r}")
+
+
+_metrics = from_env()
+
+
+def span(name: str):
+    return _metrics.span(name)
+
+
+def record(name: str, value: float, unit: str = "Milliseconds") -> None:
+    _metrics.record(name, value, unit)
+
+
+def instrumented(handler_name: str) -> Callable:
+    """Time a whole handler invocation as ``total`` and flush its metrics when it returns."""
+
+    def decorate(fn: Callable[[dict, Any], dict]) -> Callable[[dict, Any], dict]:
+        @functools.wraps(fn)
+        def wrapper(event: dict, context: Any, **kwargs: Any) -> dict:
+            metrics = _metrics
+            if metrics.sink is None:
+                return fn(event, context, **kwargs)
+            token = _current_handler.set(handler_name)
+            try:
+                with metrics.span("total"):
+                    return fn(event, context, **kwargs)
+            finally:
+                _current_handler.reset(token)
+                metrics.flush(handler_name)
+
+        return wrapper
+
+    return decorate
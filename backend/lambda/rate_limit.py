@@ -0,0 +1,206 @@
+"""Token-bucket admission control for link creation.
+
+Every client has a bucket of ``CREATE_RATE_BURST`` tokens that refills at
+``CREATE_RATE_LIMIT`` tokens per second. A client is an identity API
+Gateway has verified (an authorizer's principal or a REST API key's id,
+kept only as a hash), or else its source IP; headers the caller sets
+itself are never trusted. Creating a link takes a token, and a bulk
+request takes one per link. Without enough tokens the request is refused
+with 429 and a ``Retry-After`` of the time until there are. A request
+costing more than the whole burst is admitted once the bucket is full and
+leaves it in debt, so the client still averages ``CREATE_RATE_LIMIT``.
+
+Each container keeps its own buckets, so a client spread over many
+containers could get more than its share. To close that gap, containers
+add up what they admitted per client in a counter for the current
+``CREATE_RATE_WINDOW`` seconds. The counter lives in the counters table,
+and the container writes to it every ``CREATE_RATE_SYNC_INTERVAL`` seconds
+on a background thread: one UpdateItem per active client, never on a
+request. Once a window's total reaches the window's budget (``rate *
+window + burst``), every container that syncs refuses the client until
+the window ends. Window counters expire on their own, through the table's
+TTL on ``expires_at``.
+
+Refusals, local or shared, never touch storage. When the counters table
+can't be reached, containers fall back to their local buckets.
+``CREATE_RATE_LIMIT`` unset or 0 disables the limit;
+``CREATE_RATE_WINDOW=0`` keeps it local to each container.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Callable
+
+import storage
+
+logger = logging.getLogger()
+
+COUNTER_PREFIX = "rate#"
+
+
+def verified_identity(context: dict) -> str | None:
+    """The caller as API Gateway verified it: an authorizer's principal, else a REST API key's id."""
+    authorizer = context.get("authorizer") or {}
+    principal = (
+        authorizer.get("principalId")
+        or ((authorizer.get("jwt") or {}).get("claims") or {}).get("sub")
+        or (authorizer.get("lambda") or {}).get("principalId")
+        or (authorizer.get("iam") or {}).get("userArn")
+    )
+    if principal:
+        return f"principal:{principal}"
+    api_key_id = (context.get("identity") or {}).get("apiKeyId")
+    return f"api-key:{api_key_id}" if api_key_id else None
+
+
+def client_key(event: dict) -> str:
+    """Who a request counts against: its verified identity, else its source IP."""
+    context = event.get("requestContext") or {}
+    identity = verified_identity(context)
+    if identity:
+        return "key:" + hashlib.sha256(identity.encode()).hexdigest()[:16]
+    ip = (context.get("http") or {}).get("sourceIp") or (context.get("identity") or {}).get("sourceIp")
+    return f"ip:{ip}" if ip else "anonymous"
+
+
+class TokenBucket:
+    """``tokens`` left as of ``updated``; the rate and size are the limiter's."""
+
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated = now
+
+    def take(self, rate: float, burst: float, now: float, cost: float = 1) -> float:
+        """Take ``cost`` tokens; return 0.0, or the seconds until there are enough.
+
+        A cost over ``burst`` only needs a full bucket and leaves it below zero.
+        """
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        needed = min(cost, burst)
+        if self.tokens >= needed:
+            self.tokens -= cost
+            return 0.0
+        return (needed - self.tokens) / rate
+
+
+class RateLimiter:
+    """Per-client token buckets, optionally kept in step across containers through shared window counters."""
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        get_store: Callable[[], Any] | None = None,
+        window: float = 10.0,
+        sync_interval: float = 1.0,
+        max_clients: int = 10_000,
+        clock: Callable[[], float] = time.time,
+    ):
+        if rate <= 0 or burst < 1:
+            raise ValueError("Rate limits need a positive rate and a burst of at least 1")
+        self.rate = rate
+        self.burst = burst
+        self.window = window
+        self.sync_interval = sync_interval
+        self.max_clients = max_clients
+        self._get_store = get_store if window > 0 else None
+        self._clock = clock
+        self._buckets: OrderedDict[str, TokenBucket] = OrderedDict()
+        self._blocked: dict[str, float] = {}
+        self._pending: Counter = Counter()
+        self._lock = threading.Lock()
+        self._next_sync = clock() + sync_interval
+        self._syncing = threading.Lock()
+
+    @property
+    def window_budget(self) -> float:
+        """Tokens a client may use across all containers in one shared window."""
+        return self.rate * self.window + self.burst
+
+    def admit(self, client: str, cost: float = 1) -> float:
+        """Admit a request worth ``cost`` tokens from ``client``; return 0.0, or the seconds to wait before retrying."""
+        now = self._clock()
+        with self._lock:
+            blocked_until = self._blocked.get(client)
+            if blocked_until is not None:
+                if now < blocked_until:
+                    return blocked_until - now
+                del self._blocked[client]
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = TokenBucket(self.burst, now)
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+            wait = bucket.take(self.rate, self.burst, now, cost)
+            if wait or self._get_store is None:
+                return wait
+            self._pending[client] += cost
+        self.maybe_sync()
+        return 0.0
+
+    def sync(self) -> None:
+        """Add the requests admitted since the last sync to the shared window counters."""
+        self._next_sync = self._clock() + self.sync_interval
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+        if not pending:
+            return
+        now = self._clock()
+        window = int(now // self.window)
+        window_end = (window + 1) * self.window
+        store = self._get_store()
+        blocked = {}
+        for client, count in pending.items():
+            try:
+                used = store.increment(
+                    f"{COUNTER_PREFIX}{client}#{window}",
+                    {"used": count},
+                    must_exist=False,
+                    values={"expires_at": int(window_end + self.window)},
+                )["used"]
+            except storage.StorageError as e:
+                logger.warning("Could not sync rate limits, using local buckets only: %s", e)
+                break
+            if used >= self.window_budget:
+                blocked[client] = window_end
+        with self._lock:
+            for client in [c for c, until in self._blocked.items() if until <= now]:
+                del self._blocked[client]
+            self._blocked.update(blocked)
+
+    def maybe_sync(self) -> None:
+        """Start a background sync when one is due. Never blocks the caller."""
+        if self._clock() < self._next_sync or not self._syncing.acquire(blocking=False):
+            return
+        self._next_sync = self._clock() + self.sync_interval
+        threading.Thread(target=self._sync_in_background, name="rate-limit-sync", daemon=True).start()
+
+    def _sync_in_background(self) -> None:
+        try:
+            self.sync()
+        except Exception:
+            logger.exception("Syncing rate limits failed")
+        finally:
+            self._syncing.release()
+
+
+def from_env(get_store: Callable[[], Any]) -> RateLimiter | None:
+    rate = float(os.environ.get("CREATE_RATE_LIMIT", "0"))
+    if rate <= 0:
+        return None
+    return RateLimiter(
+        rate,
+        float(os.environ.get("CREATE_RATE_BURST", "20")),
+        get_store,
+        window=float(os.environ.get("CREATE_RATE_WINDOW", "10")),
+        sync_interval=float(os.environ.get("CREATE_RATE_SYNC_INTERVAL", "1")),
+    )
@@ -1,35 +1,677 @@
 import json
+import logging
 import os
 import random
+import threading
+import time
 from typing import Any
 
-import boto3
+import events
+import hot_set
+import metrics
+import storage
+import target_health
+from hot_keys import REPLICA_SEPARATOR, HotKeyDetector, replica_key, replicate
+from link_cache import NOT_FOUND, LinkCache
+from routing_rules import RoutingRules
+from sampler import AliasSampler
+from target_codec import PACKED_FORMAT, SHARD_SEPARATOR, PackedTargets, ShardedSampler, shard_key, unpack_targets
+from visit_counter import RetryableFlushError, StaleFlushError, VisitBuffer
 
-_table = None
+logger = logging.getLogger()
 
+# Only what a redirect needs is read, keeping item size and decode work down.
+LINK_ATTRIBUTES = ["targets", "rules", "format", "shards", "version", "expires_at", "replicas", "replica_until"]
+# What a revalidation reads from the primary: the version, and whether the link has replicas to use next time.
+REVALIDATE_ATTRIBUTES = ["short_code", "version", "replicas", "replica_until"]
+REPLICA_ATTRIBUTES = ["targets", "rules", "format", "shards", "version", "link_expires_at", "replica_until"]
 
-def _get_table():
-    global _table
-    if _table is None:
-        _table = boto3.resource("dynamodb").Table(os.environ["TABLE_NAME"])
-    return _table
+_storage = None
+
+# --- Warm-container link cache ---
+_cache = LinkCache(
+    max_size=int(os.environ.get("LINK_CACHE_SIZE", "10000")),
+    ttl=float(os.environ.get("LINK_CACHE_TTL", "60")),
+    negative_ttl=float(os.environ.get("LINK_CACHE_NEGATIVE_TTL", "5")),
+)
+
+
+def _get_storage() -> storage.Storage:
+    global _storage
+    if _storage is None:
+        _storage = storage.from_env("TABLE_NAME")
+    return _storage
+
+
+# Open the storage connection during Lambda init so the first request
+# does not pay for client construction and the TLS handshake.
+if "AWS_LAMBDA_FUNCTION_NAME" in os.environ:
+    _get_storage().warm()
+
+
+def cache_stats() -> dict:
+    return _cache.stats()
+
+
+# Cache counters are recorded as metrics every CACHE_STATS_EVERY redirects,
+# as the change since the previous report, so cache sizing can be read off
+# CloudWatch rather than guessed.
+CACHE_STATS_EVERY = int(os.environ.get("CACHE_STATS_EVERY", "100"))
+CACHE_STATS_COUNTERS = ("hits", "negative_hits", "misses", "evictions", "expirations")
+_cache_stats_lock = threading.Lock()
+_cache_stats_reported = dict.fromkeys(CACHE_STATS_COUNTERS, 0)
+_cache_stats_countdown = CACHE_STATS_EVERY
+
+
+def report_cache_stats() -> None:
+    """Record the cache's counters since the last report, and its size, as metrics."""
+    with _cache_stats_lock:
+        stats = _cache.stats()
+        for name in CACHE_STATS_COUNTERS:
+            # The counters restart when the cache is cleared.
+            delta = stats[name] - _cache_stats_reported[name]
+            metrics.record(f"cache_{name}", delta if delta >= 0 else stats[name], "Count")
+            _cache_stats_reported[name] = stats[name]
+        metrics.record("cache_size", stats["size"], "Count")
+
+
+def _maybe_report_cache_stats() -> None:
+    global _cache_stats_countdown
+    if CACHE_STATS_EVERY <= 0:
+        return
+    _cache_stats_countdown -= 1
+    if _cache_stats_countdown <= 0:
+        _cache_stats_countdown = CACHE_STATS_EVERY
+        report_cache_stats()
+
+
+def _answers_from_memory(link: Any) -> bool:
+    # A cached packed link only counts once all of its shards are loaded; a
+    # pick may otherwise land in one that still has to be read.
+    return link is not None and (not isinstance(link, PackedLink) or link.sampler.loaded)
+
+
+def is_cached(short_code: str) -> bool:
+    """Whether resolving ``short_code`` can be answered without a storage call."""
+    return _answers_from_memory(_cache.peek(short_code))
+
+
+def cached_entry(short_code: str) -> Any:
+    """The cache entry for ``short_code`` (a link or ``NOT_FOUND``) if it answers without storage, else None.
+
+    Pass it to ``handler`` as ``cached``: the entry is taken once, so one
+    that expires in between still can't turn the request into a storage read.
+    """
+    if not is_cached(short_code):
+        return None
+    link = _cache.get(short_code)
+    return link if _answers_from_memory(link) else None
+
+
+# --- Write-behind visit counting ---
+# Paths per UpdateItem: about 2 KB of expression and 50 "+" operators,
+# well inside DynamoDB's 4 KB and 300-operator limits.
+VISIT_FLUSH_CHUNK = 50
+
+
+def _increment_visits(short_code: str, version: int | None, amounts: dict[str, int]) -> dict | None:
+    store = _get_storage()
+    if version is None:
+        return store.increment(short_code, amounts)
+    applied = store.increment(short_code, amounts, expected={"version": version})
+    if applied is None and version == 1:
+        # Links stored before versioning have no version attribute and are at version 1.
+        applied = store.increment(short_code, amounts, expected={"version": None})
+    return applied
+
+
+def flush_visits(short_code: str, version: int | None, increments: dict[int, int]) -> None:
+    """Apply buffered visit counts for one link (or one shard of a packed link).
+
+    Counts go out in increments of up to ``VISIT_FLUSH_CHUNK`` targets each.
+    A link's counts are by position in the target list of ``version``, so
+    every increment is conditional on the link still being at that version;
+    after an update the rest are dropped. Shard keys name their version, so
+    shard counts need no condition.
+    """
+    path = "visits[{}]" if SHARD_SEPARATOR in short_code else "targets[{}].visits"
+    pending = sorted(increments.items())
+    for start in range(0, len(pending), VISIT_FLUSH_CHUNK):
+        amounts = {path.format(index): n for index, n in pending[start:start + VISIT_FLUSH_CHUNK]}
+        try:
+            applied = _increment_visits(short_code, version, amounts)
+        except storage.RetryableStorageError as e:
+            raise RetryableFlushError(str(e), dict(pending[start:])) from e
+        if applied is None:
+            raise StaleFlushError(f"'{short_code}' is gone or no longer at version {version}")
+
+
+_visits = VisitBuffer(
+    flush_visits,
+    max_pending=int(os.environ.get("VISIT_FLUSH_SIZE", "500")),
+    flush_interval=float(os.environ.get("VISIT_FLUSH_INTERVAL", "10")),
+)
+_visits.install_shutdown_hooks()
+
+# Per-click event log for analytics; None unless VISIT_EVENTS_SINK is set.
+_events = events.from_env()
+if _events is not None:
+    _events.install_shutdown_hooks()
+
+
+# --- Sticky assignment ---
+# "ip", "header:<name>" or "cookie:<name>"; empty means every click is an
+# independent weighted draw.
+STICKY_KEY = os.environ.get("STICKY_KEY", "")
+
+
+def _cookies(event: dict) -> dict[str, str]:
+    raw = list(event.get("cookies") or [])
+    header = (event.get("headers") or {}).get("cookie")
+    if header:
+        raw.extend(header.split(";"))
+    cookies = {}
+    for pair in raw:
+        name, sep, value = pair.strip().partition("=")
+        if sep:
+            cookies.setdefault(name, value)
+    return cookies
+
+
+def visitor_key(event: dict, source: str | None = None) -> str | None:
+    """Extract the configured visitor identifier from a request, or None if it is absent."""
+    source = STICKY_KEY if source is None else source
+    if not source:
+        return None
+    kind, _, name = source.partition(":")
+    if kind == "ip":
+        context = event.get("requestContext") or {}
+        return (context.get("http") or {}).get("sourceIp") or (context.get("identity") or {}).get("sourceIp") or None
+    if kind == "header":
+        headers = {k.lower(): v for k, v in (event.get("headers") or {}).items()}
+        return headers.get(name.lower()) or None
+    if kind == "cookie":
+        return _cookies(event).get(name) or None
+    raise ValueError(f"Unknown STICKY_KEY source: {source!r}")
 
 
 def pick_url(targets: list[dict]) -> str:
     """Weighted random selection from targets list."""
-    urls = [t["url"] for t in targets]
-    weights = [float(t["weight"]) for t in targets]
-    return random.choices(urls, weights=weights, k=1)[0]
+    return AliasSampler(targets).pick()
+
+
+def pick_urls(targets: list[dict], n: int, rng=None):
+    """Draw ``n`` URLs at once with the same weighting as ``pick_url``, as a NumPy array.
+
+    For simulations and distribution checks; needs NumPy, which the
+    redirect Lambda does not ship.
+    """
+    import numpy as np
+
+    urls = np.asarray([t["url"] for t in targets], dtype=object)
+    return urls[AliasSampler(targets).pick_indices(n, rng)]
+
+
+class Link:
+    """A resolved link as kept in the warm-container cache."""
+
+    __slots__ = ("sampler", "rules", "expires_at", "version", "single_target", "routed")
+
+    def __init__(
+        self, targets: list[dict], expires_at: int | None = None, version: int = 1, rules: list[dict] | None = None
+    ):
+        self.sampler = AliasSampler(targets)
+        self.rules = RoutingRules(rules, targets) if rules else None
+        self.expires_at = int(expires_at) if expires_at is not None else None
+        self.version = version
+        self.single_target = self.rules is None and sum(1 for w in self.sampler.weights if w > 0) == 1
+        # (health score generation, {rule index or None: sampler over the weights adjusted for it})
+        self.routed: tuple[int, dict] | None = None
+
+    def rule_for(self, headers: dict | None, now: float) -> int | None:
+        """Index of the routing rule that applies to a request, or None for the link's own weights."""
+        if self.rules is None:
+            return None
+        return self.rules.match(headers or {}, now)
+
+    def visit_slot(self, short_code: str, index: int) -> tuple[str, int, int | None]:
+        """The item, list position and item version that count visits to target ``index``."""
+        return short_code, index, self.version
+
+
+class ShardMissingError(LookupError):
+    pass
+
+
+def _load_shard(short_code: str, k: int, version: int) -> PackedTargets:
+    with metrics.span("get_shard"):
+        item = _get_storage().get(shard_key(short_code, k, version), attributes=["packed"])
+    if not item or "packed" not in item:
+        raise ShardMissingError(f"Shard {k} of '{short_code}' not found")
+    return PackedTargets(item["packed"])
+
+
+class PackedLink(Link):
+    """A link stored packed and sharded; shards are read on first use and then cached with the link."""
+
+    __slots__ = ()
+
+    def __init__(self, short_code: str, shards: list[dict], expires_at: int | None = None, version: int = 1):
+        self.sampler = ShardedSampler(shards, lambda k: _load_shard(short_code, k, version))
+        self.rules = None
+        self.expires_at = int(expires_at) if expires_at is not None else None
+        self.version = version
+        self.single_target = False
+
+    def visit_slot(self, short_code: str, index: int) -> tuple[str, int, int | None]:
+        k, local = self.sampler.locate(index)
+        return shard_key(short_code, k, self.version), local, None
+
+
+# --- Hot-key replication ---
+# A code requested HOT_KEY_THRESHOLD times within HOT_KEY_WINDOW seconds in
+# one container gets HOT_KEY_REPLICAS copies of its item for REPLICA_TTL
+# seconds, and cache misses spread their reads across primary and copies.
+HOT_KEY_REPLICAS = int(os.environ.get("HOT_KEY_REPLICAS", "8"))
+REPLICA_TTL = int(os.environ.get("REPLICA_TTL", "3600"))
+_hot_keys = HotKeyDetector(
+    threshold=int(os.environ.get("HOT_KEY_THRESHOLD", "1000")),
+    window=float(os.environ.get("HOT_KEY_WINDOW", "10")),
+)
+# short code -> replica count for links known to be replicated, until replica_until.
+_replicas = LinkCache(max_size=10_000, ttl=REPLICA_TTL)
+
 
+def replicate_link(short_code: str) -> bool:
+    """Replicate a hot link unless it already has live replicas; never raises."""
+    if HOT_KEY_REPLICAS <= 0 or _replicas.contains(short_code):
+        return False
+    try:
+        replica_until = replicate(_get_storage(), short_code, HOT_KEY_REPLICAS, REPLICA_TTL)
+    except storage.StorageError:
+        logger.exception("Replicating hot link %s failed", short_code)
+        return False
+    if replica_until is None:
+        return False
+    _replicas.put(short_code, HOT_KEY_REPLICAS, replica_until)
+    return True
 
-def handler(event: dict, context: Any) -> dict:
+
+def replicate_in_background(short_code: str) -> threading.Thread:
+    """Replicate a link that just turned hot without holding up the request that noticed."""
+    thread = threading.Thread(target=replicate_link, args=(short_code,), name="hot-key-replication", daemon=True)
+    thread.start()
+    return thread
+
+
+def _read_link_item(short_code: str, min_version: int | None = None) -> dict | None:
+    """Read a link from a random replica when it has any, otherwise (or if that misses) from the primary.
+
+    A replica older than ``min_version`` is passed over for the primary.
+    """
+    now = time.time()
+    count = _replicas.get(short_code)
+    if count:
+        k = random.randrange(count + 1)
+        if k:
+            with metrics.span("get_item"):
+                replica = _get_storage().get(replica_key(short_code, k), attributes=REPLICA_ATTRIBUTES)
+            if (replica and replica.get("replica_until", 0) > now
+                    and (min_version is None or int(replica.get("version", 1)) >= min_version)):
+                item = {key: replica[key] for key in ("targets", "rules", "format", "shards", "version") if key in replica}
+                if replica.get("link_expires_at") is not None:
+                    item["expires_at"] = replica["link_expires_at"]
+                return item
+
+    with metrics.span("get_item"):
+        item = _get_storage().get(short_code, attributes=LINK_ATTRIBUTES)
+    if item and item.get("replicas") and item.get("replica_until", 0) > now:
+        _replicas.put(short_code, int(item["replicas"]), item["replica_until"])
+    return item
+
+
+def _is_packed(item: dict) -> bool:
+    return item.get("format") == PACKED_FORMAT and bool(item.get("shards"))
+
+
+def link_status(item: dict | None) -> str:
+    """"ok", "not_found" or "expired" for a stored link item (or None)."""
+    if not item or not (_is_packed(item) or item.get("targets")):
+        return "not_found"
+    if "expires_at" in item and int(item["expires_at"]) <= time.time():
+        return "expired"
+    return "ok"
+
+
+def build_link(short_code: str, item: dict) -> Link:
+    version = int(item.get("version", 1))
+    if _is_packed(item):
+        return PackedLink(short_code, item["shards"], item.get("expires_at"), version)
+    return Link(item["targets"], item.get("expires_at"), version, item.get("rules"))
+
+
+def _current_version(short_code: str) -> int | None:
+    """Read only the version of a link; None if the link is gone.
+
+    A replicated link is revalidated against a random live replica, so a
+    hot code's steady stream of revalidations stays off the primary's
+    partition. Replicas are rewritten with every update, and an update that
+    can't rewrite them stops the primary advertising them (see
+    ``generate_link.refresh_replicas``). Other links, and replicas that have
+    lapsed, are read from the primary, which also tells the container about
+    replicas made since it cached the link.
+    """
+    now = time.time()
+    count = _replicas.get(short_code)
+    if count:
+        with metrics.span("revalidate"):
+            replica = _get_storage().get(
+                replica_key(short_code, random.randint(1, count)), attributes=["version", "replica_until"]
+            )
+        if replica and replica.get("replica_until", 0) > now:
+            return int(replica.get("version", 1))
+    with metrics.span("revalidate"):
+        item = _get_storage().get(short_code, attributes=REVALIDATE_ATTRIBUTES)
+    if item is None:
+        return None
+    if item.get("replicas") and item.get("replica_until", 0) > now:
+        _replicas.put(short_code, int(item["replicas"]), item["replica_until"])
+    return int(item.get("version", 1))
+
+
+def get_link(short_code: str) -> Link | None:
+    """Resolve a short code, going through the warm-container cache.
+
+    A link whose cache entry has expired, or one from the hot-set snapshot,
+    is kept if a read of its version alone shows it unchanged; only a new
+    version is read in full and rebuilt.
+    """
+    link = _cache.get(short_code)
+    if link is NOT_FOUND:
+        return None
+    if link is not None:
+        return link
+    if _hot_set is not None:
+        _hot_set.maybe_refresh()
+    previous = _cache.stale(short_code)
+    if previous is None and _hot_set is not None:
+        previous = _hot_set.get(short_code)
+    current_version = None
+    if previous is not None and (previous.expires_at is None or previous.expires_at > time.time()):
+        current_version = _current_version(short_code)
+        if current_version == previous.version:
+            _cache.put(short_code, previous, previous.expires_at)
+            return previous
+
+    item = _read_link_item(short_code, current_version)
+    if link_status(item) != "ok":
+        _cache.put_not_found(short_code)
+        return None
+
+    link = build_link(short_code, item)
+    _cache.put(short_code, link, link.expires_at)
+    return link
+
+
+# --- Hot-set snapshot ---
+# Containers start with the most-requested links already in memory (see
+# hot_set), so a deploy or scale-out doesn't send them all to storage at once.
+
+def _hot_link(short_code: str, item: dict) -> Link | None:
+    return build_link(short_code, item) if link_status(item) == "ok" else None
+
+
+_hot_set = None
+_hot_set_source = hot_set.source_from_env(_get_storage)
+if _hot_set_source is not None:
+    _hot_set = hot_set.HotSet(
+        _hot_set_source,
+        _hot_link,
+        refresh_interval=float(os.environ.get("HOT_SET_REFRESH_INTERVAL", "300")),
+        max_age=float(os.environ.get("HOT_SET_MAX_AGE", "3600")),
+    )
+    try:
+        _hot_set.refresh()
+    except Exception:
+        logger.exception("Loading the hot set failed")
+
+
+# --- Health-aware routing ---
+# With HEALTH_ROUTING set, picks skip targets that are down (and with
+# "latency", lean toward fast ones) using scores published by
+# target_health.py. Scores are refreshed in the background; a request only
+# ever reads the copy in memory.
+_health = target_health.from_env(_get_storage)
+if _health is not None:
+    try:
+        _health.refresh()
+    except Exception:
+        logger.exception("Loading health scores failed")
+
+
+def routed_sampler(link: Link, rule: int | None = None):
+    """The sampler to pick from: the link's own or ``rule``'s, or one over its health-adjusted weights.
+
+    The adjusted sampler keeps target indices, so visits still count
+    against the configured targets, and is built once per score generation.
+    """
+    base = link.sampler if rule is None else link.rules.samplers[rule]
+    if _health is None or isinstance(link, PackedLink):
+        return base
+    _health.maybe_refresh()
+    generation = _health.current()
+    routed = link.routed
+    if routed is None or routed[0] != generation:
+        routed = link.routed = (generation, {})
+    sampler = routed[1].get(rule)
+    if sampler is None:
+        sampler = base
+        weights = _health.adjust(base.urls, base.weights)
+        if weights is not None:
+            sampler = AliasSampler([{"url": url, "weight": w} for url, w in zip(base.urls, weights)])
+        routed[1][rule] = sampler
+    return sampler
+
+
+# --- HTTP caching ---
+# Single-target links always resolve to the same URL, so browsers and CDNs
+# may keep the redirect; weighted links must reach us on every click unless
+# the pick is sticky, in which case the visitor's own cache may reuse it.
+REDIRECT_MAX_AGE = int(os.environ.get("REDIRECT_MAX_AGE", "86400"))
+STICKY_MAX_AGE = int(os.environ.get("STICKY_MAX_AGE", "300"))
+
+
+def _max_age(limit: int, expires_at: int | None) -> int:
+    if expires_at is None:
+        return limit
+    return max(0, min(limit, int(expires_at - time.time())))
+
+
+def redirect_response(link: Link, url: str, sticky: bool) -> dict:
+    """Build the redirect with status and caching headers suited to how ``url`` was chosen."""
+    headers = {"Location": url}
+    if link.single_target:
+        max_age = _max_age(REDIRECT_MAX_AGE, link.expires_at)
+        status = 301 if max_age else 302
+        headers["Cache-Control"] = f"public, max-age={max_age}" if max_age else "no-store"
+    elif sticky:
+        status = 302
+        max_age = _max_age(STICKY_MAX_AGE, link.expires_at)
+        headers["Cache-Control"] = f"private, max-age={max_age}" if max_age else "no-store"
+        kind, _, name = STICKY_KEY.partition(":")
+        if kind in ("header", "cookie"):
+            headers["Vary"] = name if kind == "header" else "Cookie"
+    else:
+        status = 302
+        headers["Cache-Control"] = "no-store"
+    return {"statusCode": status, "headers": headers, "body": ""}
+
+
+@metrics.instrumented("redirect")
+def handler(event: dict, context: Any, cached: Any = None) -> dict:
+    """Redirect to a target of the link; ``cached`` is an entry from ``cached_entry`` to use instead of looking it up."""
     short_code = (event.get("pathParameters") or {}).get("short_code")
     if not short_code:
         return {"statusCode": 400, "body": json.dumps({"error": "Missing short code"})}
+    _maybe_report_cache_stats()
+
+    with metrics.span("resolve"):
+        if _is_internal(short_code) or cached is NOT_FOUND:
+            link = None
+        else:
+            link = cached if cached is not None else get_link(short_code)
+    if link is None:
+        return {"statusCode": 404, "body": json.dumps({"error": "Short code not found"})}
+    if _hot_keys.record(short_code):
+        replicate_in_background(short_code)
 
-    item = _get_table().get_item(Key={"short_code": short_code}).get("Item")
-    if not item:
+    headers = event.get("headers")
+    sampler = routed_sampler(link, link.rule_for(headers, time.time()))
+    try:
+        with metrics.span("pick"):
+            visitor = None if link.single_target else visitor_key(event)
+            index = sampler.pick_index() if visitor is None else sampler.pick_index_for(visitor, short_code)
+            url = sampler.urls[index]
+    except ShardMissingError:
+        # The link is being written or was deleted under us; don't keep a half-loaded copy.
+        logger.warning("Packed link %s is missing a shard", short_code)
+        _cache.invalidate(short_code)
         return {"statusCode": 404, "body": json.dumps({"error": "Short code not found"})}
+    _visits.record(*link.visit_slot(short_code, index))
+    if _events is not None:
+        _events.record(events.visit_event(short_code, index, url, headers))
+    return redirect_response(link, url, sticky=visitor is not None)
+
+
+# --- Batch resolution ---
+MAX_RESOLVE_CODES = int(os.environ.get("MAX_RESOLVE_CODES", "1000"))
+
+
+def _is_internal(short_code: str) -> bool:
+    return REPLICA_SEPARATOR in short_code or SHARD_SEPARATOR in short_code
+
+
+def _resolved_pick(short_code: str, link: Link, headers: dict | None) -> dict:
+    sampler = routed_sampler(link, link.rule_for(headers, time.time()))
+    try:
+        url = sampler.urls[sampler.pick_index()]
+    except ShardMissingError:
+        _cache.invalidate(short_code)
+        return {"status": "not_found"}
+    return {"status": "ok", "url": url, "expires_at": link.expires_at}
+
+
+def resolve_codes(codes: list[str], pick: bool = False, headers: dict | None = None) -> dict[str, dict]:
+    """Resolve many codes with batched reads, keyed by code.
+
+    Each result has a ``status`` of ok, not_found or expired. An ok result
+    carries the link's ``targets`` (and ``rules``, if it has any), or with
+    ``pick`` one weighted-random ``url``, with routing rules matched against
+    ``headers``. Picks are served from, and fill, the warm-container cache;
+    target sets are always read from storage. Resolving is not a visit, so
+    nothing is counted.
+    """
+    results: dict[str, dict] = {}
+    to_read = []
+    for code in dict.fromkeys(codes):
+        if _is_internal(code):
+            results[code] = {"status": "not_found"}
+            continue
+        link = _cache.get(code) if pick else None
+        if isinstance(link, Link):
+            results[code] = _resolved_pick(code, link, headers)
+        else:
+            to_read.append(code)
+    if not to_read:
+        return results
+
+    with metrics.span("batch_get"):
+        items = _get_storage().batch_get(to_read, attributes=LINK_ATTRIBUTES)
+    found = {}
+    for code in to_read:
+        item = items.get(code)
+        status = link_status(item)
+        if status != "ok":
+            results[code] = {"status": status}
+            if pick:
+                _cache.put_not_found(code)
+        else:
+            found[code] = item
+
+    if pick:
+        for code, item in found.items():
+            link = build_link(code, item)
+            _cache.put(code, link, link.expires_at)
+            results[code] = _resolved_pick(code, link, headers)
+        return results
+
+    shard_keys = {
+        code: [shard_key(code, k, int(item.get("version", 1))) for k in range(len(item["shards"]))]
+        for code, item in found.items()
+        if _is_packed(item)
+    }
+    shards = {}
+    if shard_keys:
+        with metrics.span("batch_get_shards"):
+            all_keys = [key for keys in shard_keys.values() for key in keys]
+            shards = _get_storage().batch_get(all_keys, attributes=["packed", "visits"])
+    for code, item in found.items():
+        keys = shard_keys.get(code)
+        if keys is not None:
+            if not all(key in shards for key in keys):
+                results[code] = {"status": "not_found"}
+                continue
+            targets = unpack_targets([shards[key] for key in keys])
+        else:
+            targets = item["targets"]
+        results[code] = {
+            "status": "ok",
+            "targets": targets,
+            "expires_at": item.get("expires_at"),
+            "version": int(item.get("version", 1)),
+        }
+        if item.get("rules"):
+            results[code]["rules"] = item["rules"]
+    return results
+
+
+def _json_response(status_code: int, body: Any) -> dict:
+    return {
+        "statusCode": status_code,
+        "body": json.dumps(body),
+        "headers": {"Content-Type": "application/json", "Access-Control-Allow-Origin": "*"},
+    }
+
+
+def validate_resolve_body(body: Any) -> str | None:
+    if not isinstance(body, dict) or "codes" not in body:
+        return "Missing required field: codes"
+    codes = body["codes"]
+    if not isinstance(codes, list) or not codes:
+        return "Field 'codes' must be a non-empty list"
+    if len(codes) > MAX_RESOLVE_CODES:
+        return f"At most {MAX_RESOLVE_CODES} codes per request"
+    if not all(isinstance(code, str) and code for code in codes):
+        return "Every code must be a non-empty string"
+    if not isinstance(body.get("pick", False), bool):
+        return "Field 'pick' must be a boolean"
+    return None
+
+
+@metrics.instrumented("resolve")
+def resolve_handler(event: dict, context: Any) -> dict:
+    try:
+        raw_body = event.get("body") or "{}"
+        body = json.loads(raw_body) if isinstance(raw_body, str) else raw_body
+    except json.JSONDecodeError:
+        return _json_response(400, {"error": "Invalid JSON body"})
+    error = validate_resolve_body(body)
+    if error:
+        return _json_response(400, {"error": error})
 
-    url = pick_url(item["targets"])
-    return {"statusCode": 301, "headers": {"Location": url}, "body": ""}
+    try:
+        results = resolve_codes(body["codes"], pick=body.get("pick", False), headers=event.get("headers"))
+    except storage.StorageError as e:
+        logger.error("Resolving %d codes failed: %s", len(body["codes"]), e)
+        return _json_response(500, {"error": "Could not resolve the codes. Please try again."})
+    return _json_response(200, {"results": [{"short_code": code, **results[code]} for code in body["codes"]]})
@@ -0,0 +1,89 @@
+"""Roll visit-event JSON lines into Parquet partitioned by day and short code.
+
+Reads the files written by the ``file:`` visit-event sink (or any JSON lines
+with the same fields) and writes a Hive-partitioned dataset::
+
+    visits/day=2026-01-31/code=abc12/part-<run>-0.parquet
+
+which pandas loads column-wise, optionally pruning partitions::
+
+    pd.read_parquet("visits", filters=[("code", "=", "abc12")])
+
+Needs pyarrow (not a Lambda dependency, install it separately)::
+
+    python rollup_events.py events/*.jsonl --output visits
+"""
+
+import argparse
+import sys
+import uuid
+
+MAX_PARTITIONS = 1_000_000
+
+
+def _schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ("ts", pa.int64()),
+        ("code", pa.string()),
+        ("target", pa.int32()),
+        ("url", pa.string()),
+        ("country", pa.string()),
+        ("device", pa.string()),
+        ("referer", pa.string()),
+    ])
+
+
+def read_events(paths: list[str]):
+    """Parse JSON-lines event files into one Arrow table with a ``day`` column (UTC)."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    from pyarrow import json as pa_json
+
+    schema = _schema()
+    options = pa_json.ParseOptions(explicit_schema=schema, unexpected_field_behavior="ignore")
+    tables = [pa_json.read_json(path, parse_options=options) for path in paths]
+    table = pa.concat_tables(tables) if tables else schema.empty_table()
+    day = pc.strftime(pc.cast(table["ts"], pa.timestamp("ms", tz="UTC")), format="%Y-%m-%d")
+    return table.append_column("day", day)
+
+
+def rollup(paths: list[str], output: str) -> int:
+    """Append the events in ``paths`` to the dataset at ``output``; return the number of events written."""
+    import pyarrow.dataset as ds
+
+    table = read_events(paths)
+    if table.num_rows == 0:
+        return 0
+    ds.write_dataset(
+        table,
+        output,
+        format="parquet",
+        partitioning=["day", "code"],
+        partitioning_flavor="hive",
+        basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+        max_partitions=MAX_PARTITIONS,
+    )
+    return table.num_rows
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="JSON-lines event files")
+    parser.add_argument("--output", required=True, help="dataset directory")
+    args = parser.parse_args(argv)
+
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise SystemExit("The rollup needs pyarrow: uv pip install pyarrow")
+
+    count = rollup(args.paths, args.output)
+    print(f"Wrote {count} events to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
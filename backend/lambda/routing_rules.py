@@ -0,0 +1,124 @@
+"""Conditional routing rules: per-request weights chosen by country, device class and time of day.
+
+A link may carry ``rules``, tried in order before its own weights::
+
+    {"country": ["DE", "AT"], "device": ["mobile", "tablet"], "hours": [9, 17], "weights": [0, 100]}
+
+Each rule has at least one condition and a weight per target, in target
+order. A rule matches when every condition it has does: the viewer's
+country (the ``cloudfront-viewer-country`` header) is listed, the device
+class of the User-Agent (``events.DEVICE_CLASSES``) is listed, and the UTC
+hour is in ``[start, end)``, wrapping past midnight when ``start > end``.
+The first matching rule's weights are used; with none, the link's own.
+
+Rules are compiled once per link into a flat table with one entry for
+every combination of the conditions they use: each country they name plus
+"any other", each device class, each hour. A request is matched with one
+lookup in that table, however many rules there are, and only reads the
+headers the rules need.
+"""
+
+from events import DEVICE_CLASSES, device_class
+from sampler import AliasSampler
+
+COUNTRY_HEADER = "cloudfront-viewer-country"
+MAX_RULES = 32
+CONDITIONS = ("country", "device", "hours")
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def validate_rules(rules, target_count: int) -> str | None:
+    """Check the ``rules`` field of a link body with ``target_count`` targets; return an error or None."""
+    if not isinstance(rules, list):
+        return "Field 'rules' must be a list"
+    if len(rules) > MAX_RULES:
+        return f"At most {MAX_RULES} rules are allowed per link"
+    for i, rule in enumerate(rules):
+        if not isinstance(rule, dict):
+            return f"Rule {i} must be an object"
+        unknown = set(rule) - set(CONDITIONS) - {"weights"}
+        if unknown:
+            return f"Rule {i} has unknown fields: {', '.join(sorted(unknown))}"
+        if not any(name in rule for name in CONDITIONS):
+            return f"Rule {i} needs at least one of: {', '.join(CONDITIONS)}"
+        countries = rule.get("country", ["XX"])
+        if (not isinstance(countries, list) or not countries
+                or not all(isinstance(c, str) and len(c) == 2 and c.isascii() and c.isalpha() for c in countries)):
+            return f"Rule {i} has an invalid 'country' (must be a non-empty list of two-letter country codes)"
+        devices = rule.get("device", [DEVICE_CLASSES[0]])
+        if not isinstance(devices, list) or not devices or not all(d in DEVICE_CLASSES for d in devices):
+            return f"Rule {i} has an invalid 'device' (must be a non-empty list of: {', '.join(DEVICE_CLASSES)})"
+        hours = rule.get("hours", [0, 24])
+        if (not isinstance(hours, list) or len(hours) != 2
+                or not all(isinstance(h, int) and not isinstance(h, bool) and 0 <= h <= 24 for h in hours)
+                or hours[0] == hours[1]):
+            return f"Rule {i} has invalid 'hours' (must be [start, end] UTC hours from 0 to 24, start != end)"
+        weights = rule.get("weights")
+        if (not isinstance(weights, list) or len(weights) != target_count
+                or not all(_is_number(w) and w >= 0 for w in weights) or not any(w > 0 for w in weights)):
+            return f"Rule {i} has invalid 'weights' (must be one non-negative number per URL, not all zero)"
+    return None
+
+
+def normalize_rules(rules: list[dict]) -> list[dict]:
+    """Rules as stored: country codes upper-cased, nothing else changed."""
+    return [
+        {**rule, "country": [c.upper() for c in rule["country"]]} if "country" in rule else dict(rule)
+        for rule in rules
+    ]
+
+
+def _in_hours(hours: list[int], hour: int) -> bool:
+    start, end = int(hours[0]), int(hours[1])
+    return start <= hour < end if start < end else hour >= start or hour < end
+
+
+class RoutingRules:
+    """A link's rules compiled into a lookup table, with one sampler per rule."""
+
+    __slots__ = ("samplers", "_countries", "_devices", "_hours", "_table")
+
+    def __init__(self, rules: list[dict], targets: list[dict]):
+        urls = [t["url"] for t in targets]
+        self.samplers = [
+            AliasSampler([{"url": url, "weight": w} for url, w in zip(urls, rule["weights"])]) for rule in rules
+        ]
+        countries = sorted({c for rule in rules for c in rule.get("country", ())})
+        # Index 0 stands for any country no rule names (or none given).
+        self._countries = {c: i + 1 for i, c in enumerate(countries)} if countries else None
+        self._devices = {d: i for i, d in enumerate(DEVICE_CLASSES)} if any("device" in r for r in rules) else None
+        self._hours = any("hours" in rule for rule in rules)
+
+        country_axis: list[str | None] = [None, *countries] if countries else [None]
+        device_axis: list[str | None] = list(DEVICE_CLASSES) if self._devices is not None else [None]
+        hour_axis: list[int | None] = list(range(24)) if self._hours else [None]
+        table = bytearray()
+        for country in country_axis:
+            for device in device_axis:
+                for hour in hour_axis:
+                    table.append(next(
+                        (i + 1 for i, rule in enumerate(rules)
+                         if ("country" not in rule or country in rule["country"])
+                         and ("device" not in rule or device in rule["device"])
+                         and ("hours" not in rule or _in_hours(rule["hours"], hour))),
+                        0,
+                    ))
+        self._table = bytes(table)
+
+    def __len__(self) -> int:
+        return len(self.samplers)
+
+    def match(self, headers: dict, now: float) -> int | None:
+        """Index of the first rule matching a request with (lower-cased) ``headers`` at ``now``, or None."""
+        index = 0
+        if self._countries is not None:
+            index = self._countries.get((headers.get(COUNTRY_HEADER) or "").upper(), 0)
+        if self._devices is not None:
+            index = index * len(DEVICE_CLASSES) + self._devices[device_class(headers.get("user-agent"))]
+        if self._hours:
+            index = index * 24 + int(now // 3600) % 24
+        choice = self._table[index]
+        return choice - 1 if choice else None
@@ -0,0 +1,112 @@
+import hashlib
+import math
+import random
+
+
+class AliasSampler:
+    """Weighted sampler over a link's targets using Vose's alias method.
+
+    Building the tables is O(n) and happens once per link item; every pick
+    after that is O(1): one random draw, one index and one comparison.
+    Selection probabilities are ``weight / total_weight``, the same as
+    ``random.choices(urls, weights=weights)``.
+
+    ``pick_index_for`` is the deterministic counterpart used for sticky
+    assignment; it costs O(n) per pick instead of O(1).
+    """
+
+    __slots__ = ("urls", "weights", "prob", "alias", "n", "_url_bytes", "_arrays")
+
+    def __init__(self, targets: list[dict]):
+        if not targets:
+            raise ValueError("Cannot build a sampler from an empty targets list")
+        weights = [float(t["weight"]) for t in targets]
+        total = sum(weights)
+        if total <= 0:
+            raise ValueError("Target weights must sum to a positive number")
+
+        n = len(weights)
+        scaled = [w * n / total for w in weights]
+        prob = [1.0] * n
+        alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            prob[s] = scaled[s]
+            alias[s] = l
+            scaled[l] = (scaled[l] + scaled[s]) - 1.0
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+        # Whatever is left over is 1.0 up to rounding error.
+
+        self.urls = [t["url"] for t in targets]
+        self.weights = weights
+        self._url_bytes = None
+        self._arrays = None
+        self.prob = prob
+        self.alias = alias
+        self.n = n
+
+    def pick_index(self) -> int:
+        u = random.random() * self.n
+        i = int(u)
+        if i >= self.n:
+            i = self.n - 1
+        return i if u - i < self.prob[i] else self.alias[i]
+
+    def pick_index_for(self, visitor: str, salt: str = "") -> int:
+        """Deterministically pick a target for ``visitor`` using weighted rendezvous hashing.
+
+        Every target gets a score ``-ln(u) / weight`` where ``u`` is a uniform
+        hash of (visitor, salt, url), and the lowest score wins. Over many
+        visitors each target wins with probability ``weight / total_weight``.
+        Changing one target's weight only moves visitors to or from that
+        target, and adding or removing a target leaves every other
+        visitor's assignment alone.
+        """
+        if self.n == 1:
+            return 0
+        if self._url_bytes is None:
+            self._url_bytes = [url.encode("utf-8") for url in self.urls]
+        key = hashlib.blake2b(f"{salt}\0{visitor}".encode("utf-8"), digest_size=16).digest()
+        best, best_score = 0, math.inf
+        for i, url in enumerate(self._url_bytes):
+            weight = self.weights[i]
+            if weight <= 0:
+                continue
+            h = int.from_bytes(hashlib.blake2b(url, key=key, digest_size=8).digest(), "big")
+            score = -math.log((h + 1) / 2**64) / weight
+            if score < best_score:
+                best, best_score = i, score
+        return best
+
+    def pick_indices(self, size: int, rng=None):
+        """Draw ``size`` target indices at once as a NumPy array, from the same alias tables as ``pick_index``.
+
+        NumPy is imported on first use, so the redirect Lambda never loads it.
+        """
+        import numpy as np
+
+        if self._arrays is None:
+            self._arrays = (np.asarray(self.prob), np.asarray(self.alias, dtype=np.intp))
+        prob, alias = self._arrays
+        rng = np.random.default_rng() if rng is None else rng
+        u = rng.random(size) * self.n
+        i = np.minimum(u.astype(np.intp), self.n - 1)
+        return np.where(u - i < prob[i], i, alias[i])
+
+    def pick(self) -> str:
+        return self.urls[self.pick_index()]
+
+    def probabilities(self) -> list[float]:
+        """Selection probability of each target as encoded by the alias tables."""
+        result = [0.0] * self.n
+        for i in range(self.n):
+            result[i] += self.prob[i] / self.n
+            result[self.alias[i]] += (1.0 - self.prob[i]) / self.n
+        return result
@@ -0,0 +1,827 @@
+"""Storage backends shared by the Lambda handlers.
+
+``from_env`` picks the backend from ``STORAGE_BACKEND``:
+
+- ``dynamodb`` (default) — one DynamoDB table per ``Storage``.
+- ``memory`` — process-local dicts, shared by every handler in the process.
+- ``sqlite`` — one SQLite file (``SQLITE_PATH``) in WAL mode, one SQL table
+  per logical table.
+"""
+
+import base64
+import copy
+import json
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from typing import Any, Iterator
+
+# DynamoDB's own per-call caps for BatchWriteItem and BatchGetItem.
+BATCH_WRITE_SIZE = 25
+BATCH_GET_SIZE = 100
+BATCH_WORKERS = 8
+MAX_BATCH_ATTEMPTS = 5
+SCAN_PAGE_SIZE = 1000
+
+# DynamoDB errors after which a write is known not to have been applied.
+# InternalServerError is not one of them: the write may have gone through.
+RETRYABLE_ERROR_CODES = {
+    "ProvisionedThroughputExceededException",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+}
+
+_PATH_SEGMENT = re.compile(r"([A-Za-z_][A-Za-z0-9_]*)((?:\[\d+\])*)")
+
+
+class StorageError(Exception):
+    """A backend call failed."""
+
+
+class RetryableStorageError(StorageError):
+    """The operation definitely did not apply and can be retried."""
+
+
+class _ConditionFailed(Exception):
+    pass
+
+
+def parse_path(path: str) -> list[str | int]:
+    """Split a document path like ``targets[0].visits`` into ``["targets", 0, "visits"]``."""
+    segments: list[str | int] = []
+    for part in path.split("."):
+        match = _PATH_SEGMENT.fullmatch(part)
+        if not match:
+            raise ValueError(f"Invalid attribute path: {path!r}")
+        segments.append(match.group(1))
+        segments.extend(int(i) for i in re.findall(r"\[(\d+)\]", match.group(2)))
+    return segments
+
+
+def _chunks(seq: list, size: int) -> list[list]:
+    return [seq[i:i + size] for i in range(0, len(seq), size)]
+
+
+def _backoff(attempt: int) -> None:
+    time.sleep(min(0.05 * 2 ** attempt, 1.0) * random.random())
+
+
+def _project(item: dict, attributes: list[str] | None) -> dict:
+    if attributes is None:
+        return item
+    return {k: item[k] for k in attributes if k in item}
+
+
+def _apply_increments(item: dict, amounts: dict[str, int | float]) -> dict:
+    """Add ``amounts`` to the attributes at the given paths in place; return new top-level values."""
+    updated = {}
+    for path, amount in amounts.items():
+        segments = parse_path(path)
+        if len(segments) == 1:
+            item[path] = item.get(path, 0) + amount
+            updated[path] = item[path]
+            continue
+        node = item
+        for segment in segments[:-1]:
+            node = node[segment]
+        node[segments[-1]] += amount
+    return updated
+
+
+def _matches(item: dict, expected: dict[str, Any] | None) -> bool:
+    return all(item.get(name) == value for name, value in (expected or {}).items())
+
+
+def _apply_update(item: dict, values: dict[str, Any], remove: list[str] | None) -> None:
+    item.update(values)
+    for name in remove or ():
+        item.pop(name, None)
+
+
+class Storage:
+    """Interface for a table of items addressed by a single string key."""
+
+    key_name: str
+
+    def put_if_absent(self, item: dict, expired_before: int | None = None) -> bool:
+        """Store ``item`` unless its key exists; return whether it was written.
+
+        With ``expired_before``, an existing item whose ``expires_at`` is
+        earlier than that is replaced too, as if the table's TTL had already
+        deleted it.
+        """
+        raise NotImplementedError
+
+    def get(self, key: str, attributes: list[str] | None = None, consistent: bool = False) -> dict | None:
+        """Read one item. With ``consistent``, the read reflects every write that succeeded before it."""
+        raise NotImplementedError
+
+    def batch_get(self, keys: list[str], attributes: list[str] | None = None) -> dict[str, dict]:
+        """Return the stored items among ``keys``, keyed by key. Missing keys are left out."""
+        raise NotImplementedError
+
+    def batch_put(self, items: list[dict]) -> list[dict]:
+        """Store (overwrite) ``items``; return the ones that could not be written."""
+        raise NotImplementedError
+
+    def increment(
+        self,
+        key: str,
+        amounts: dict[str, int | float],
+        must_exist: bool = True,
+        values: dict[str, Any] | None = None,
+        expected: dict[str, Any] | None = None,
+    ) -> dict | None:
+        """Atomically add ``amounts`` to numeric attributes addressed by document path.
+
+        Returns the new values of the top-level paths, or None, changing
+        nothing, when ``must_exist`` is set and the item does not exist or
+        when an attribute named in ``expected`` does not hold the given value
+        (as for ``update``). Top-level counters start from 0; nested paths
+        must already exist. Top-level attributes in ``values`` are set in the
+        same write.
+        """
+        raise NotImplementedError
+
+    def update(
+        self,
+        key: str,
+        values: dict[str, Any],
+        must_exist: bool = True,
+        expected: dict[str, Any] | None = None,
+        remove: list[str] | None = None,
+    ) -> bool:
+        """Set top-level attributes of an item and delete the ones named in ``remove``.
+
+        Returns False, changing nothing, when ``must_exist`` is set and the
+        item does not exist, or when an attribute named in ``expected`` does
+        not currently hold the given value (None: is absent).
+        """
+        raise NotImplementedError
+
+    def scan(
+        self, segment: int = 0, total_segments: int = 1, attributes: list[str] | None = None
+    ) -> Iterator[dict]:
+        """Yield every item in segment ``segment`` of ``total_segments``, a page at a time.
+
+        The segments of one ``total_segments`` split the table without
+        overlap, so they can be scanned in parallel. Items written during a
+        scan may or may not be seen.
+        """
+        raise NotImplementedError
+
+    def warm(self) -> None:
+        """Prepare connections ahead of the first request. A no-op for local backends."""
+
+
+# --- DynamoDB ---
+
+def serialize(value: Any) -> dict:
+    """Encode a Python value as a DynamoDB attribute value."""
+    if isinstance(value, str):
+        return {"S": value}
+    if isinstance(value, bool):
+        return {"BOOL": value}
+    if isinstance(value, (int, float)):
+        return {"N": repr(value)}
+    if isinstance(value, dict):
+        return {"M": {k: serialize(v) for k, v in value.items()}}
+    if isinstance(value, (list, tuple)):
+        return {"L": [serialize(v) for v in value]}
+    if value is None:
+        return {"NULL": True}
+    if isinstance(value, bytes):
+        return {"B": value}
+    # Decimal and other numeric types.
+    return {"N": str(value)}
+
+
+def _number(text: str) -> int | float:
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def deserialize(value: dict) -> Any:
+    """Decode a DynamoDB attribute value.
+
+    Numbers come back as int or float rather than Decimal: link items only
+    hold weights, counters and timestamps, and the handlers use floats.
+    """
+    if "S" in value:
+        return value["S"]
+    if "N" in value:
+        return _number(value["N"])
+    if "M" in value:
+        return {k: deserialize(v) for k, v in value["M"].items()}
+    if "L" in value:
+        return [deserialize(v) for v in value["L"]]
+    if "BOOL" in value:
+        return value["BOOL"]
+    if "NULL" in value:
+        return None
+    if "B" in value:
+        return value["B"]
+    raise ValueError(f"Unsupported attribute value: {value!r}")
+
+
+def serialize_item(item: dict) -> dict:
+    return {k: serialize(v) for k, v in item.items()}
+
+
+def deserialize_item(item: dict) -> dict:
+    return {k: deserialize(v) for k, v in item.items()}
+
+
+_client_lock = threading.Lock()
+_shared_clients: dict[bool, Any] = {}
+
+
+def _get_shared_client(single_attempt: bool = False):
+    """One low-level DynamoDB client per process, built straight from botocore.
+
+    Skipping boto3 and its resource layer keeps the import and construction
+    cost out of cold starts; botocore clients are thread-safe and pool
+    ``DYNAMODB_MAX_POOL_CONNECTIONS`` HTTP connections. The
+    ``single_attempt`` client never retries on its own, for writes such as
+    increments that would apply twice if retried after a lost response.
+    """
+    client = _shared_clients.get(single_attempt)
+    if client is None:
+        with _client_lock:
+            client = _shared_clients.get(single_attempt)
+            if client is None:
+                import botocore.session
+                from botocore.config import Config
+
+                options: dict[str, Any] = {
+                    "max_pool_connections": int(os.environ.get("DYNAMODB_MAX_POOL_CONNECTIONS", "10")),
+                }
+                if single_attempt:
+                    options["retries"] = {"total_max_attempts": 1}
+                client = botocore.session.get_session().create_client("dynamodb", config=Config(**options))
+                _shared_clients[single_attempt] = client
+    return client
+
+
+def _projection(attributes: list[str]) -> dict:
+    return {
+        "ProjectionExpression": ", ".join(f"#a{i}" for i in range(len(attributes))),
+        "ExpressionAttributeNames": {f"#a{i}": a for i, a in enumerate(attributes)},
+    }
+
+
+class DynamoStorage(Storage):
+    """DynamoDB table accessed through the low-level client and our own item codec."""
+
+    def __init__(self, table_name: str, key_name: str = "short_code", client=None):
+        self.table_name = table_name
+        self.key_name = key_name
+        self._client = client
+        self._increment_client = client
+
+    def _get_client(self):
+        if self._client is None:
+            self._client = _get_shared_client()
+        return self._client
+
+    def _get_increment_client(self):
+        if self._increment_client is None:
+            self._increment_client = _get_shared_client(single_attempt=True)
+        return self._increment_client
+
+    def _key(self, key: str) -> dict:
+        return {self.key_name: {"S": key}}
+
+    @staticmethod
+    def _call(fn, **kwargs) -> Any:
+        """Invoke a client method, translating its errors into storage errors."""
+        from botocore.exceptions import BotoCoreError, ClientError, EndpointConnectionError
+
+        try:
+            return fn(**kwargs)
+        except ClientError as e:
+            code = e.response["Error"]["Code"]
+            if code == "ConditionalCheckFailedException":
+                raise _ConditionFailed from e
+            if code in RETRYABLE_ERROR_CODES:
+                raise RetryableStorageError(code) from e
+            raise StorageError(code) from e
+        except EndpointConnectionError as e:
+            raise RetryableStorageError(str(e)) from e
+        except BotoCoreError as e:
+            raise StorageError(str(e)) from e
+
+    def warm(self) -> None:
+        """Open the HTTPS connection ahead of the first request with a GetItem on an unused key."""
+        try:
+            self.get("~warmup", attributes=[self.key_name])
+        except StorageError:
+            pass
+
+    def put_if_absent(self, item: dict, expired_before: int | None = None) -> bool:
+        condition = {
+            "ConditionExpression": "attribute_not_exists(#key)",
+            "ExpressionAttributeNames": {"#key": self.key_name},
+        }
+        if expired_before is not None:
+            condition["ConditionExpression"] += " OR #expires_at < :expired_before"
+            condition["ExpressionAttributeNames"]["#expires_at"] = "expires_at"
+            condition["ExpressionAttributeValues"] = {":expired_before": serialize(expired_before)}
+        try:
+            self._call(self._get_client().put_item, TableName=self.table_name, Item=serialize_item(item), **condition)
+        except _ConditionFailed:
+            return False
+        return True
+
+    def get(self, key: str, attributes: list[str] | None = None, consistent: bool = False) -> dict | None:
+        kwargs = _projection(attributes) if attributes is not None else {}
+        if consistent:
+            kwargs["ConsistentRead"] = True
+        result = self._call(self._get_client().get_item, TableName=self.table_name, Key=self._key(key), **kwargs)
+        item = result.get("Item")
+        return None if item is None else deserialize_item(item)
+
+    def _batch_get_chunk(self, keys: list[str], attributes: list[str] | None) -> list[dict]:
+        request: dict[str, Any] = {"Keys": [self._key(k) for k in keys]}
+        if attributes is not None:
+            request.update(_projection(attributes))
+        found = []
+        for attempt in range(MAX_BATCH_ATTEMPTS):
+            result = self._call(self._get_client().batch_get_item, RequestItems={self.table_name: request})
+            found.extend(deserialize_item(i) for i in result.get("Responses", {}).get(self.table_name, []))
+            unprocessed = result.get("UnprocessedKeys", {}).get(self.table_name, {}).get("Keys", [])
+            if not unprocessed:
+                return found
+            request = {**request, "Keys": unprocessed}
+            _backoff(attempt)
+        raise RetryableStorageError(f"{len(request['Keys'])} keys unprocessed after {MAX_BATCH_ATTEMPTS} attempts")
+
+    def batch_get(self, keys: list[str], attributes: list[str] | None = None) -> dict[str, dict]:
+        from concurrent.futures import ThreadPoolExecutor
+
+        # The key is needed to match results back, so always project it.
+        if attributes is not None and self.key_name not in attributes:
+            attributes = [self.key_name, *attributes]
+        found = {}
+        with ThreadPoolExecutor(max_workers=BATCH_WORKERS) as pool:
+            chunks = _chunks(list(dict.fromkeys(keys)), BATCH_GET_SIZE)
+            for items in pool.map(lambda chunk: self._batch_get_chunk(chunk, attributes), chunks):
+                for item in items:
+                    found[item[self.key_name]] = item
+        return found
+
+    def _batch_write_chunk(self, items: list[dict]) -> list[dict]:
+        requests = [{"PutRequest": {"Item": serialize_item(item)}} for item in items]
+        for attempt in range(MAX_BATCH_ATTEMPTS):
+            result = self._call(self._get_client().batch_write_item, RequestItems={self.table_name: requests})
+            requests = result.get("UnprocessedItems", {}).get(self.table_name, [])
+            if not requests:
+                return []
+            _backoff(attempt)
+        return [deserialize_item(r["PutRequest"]["Item"]) for r in requests]
+
+    def batch_put(self, items: list[dict]) -> list[dict]:
+        from concurrent.futures import ThreadPoolExecutor
+
+        failed = []
+        with ThreadPoolExecutor(max_workers=BATCH_WORKERS) as pool:
+            for chunk_failed in pool.map(self._batch_write_chunk, _chunks(items, BATCH_WRITE_SIZE)):
+                failed.extend(chunk_failed)
+        return failed
+
+    def scan(
+        self, segment: int = 0, total_segments: int = 1, attributes: list[str] | None = None
+    ) -> Iterator[dict]:
+        request: dict[str, Any] = {"TableName": self.table_name, "Limit": SCAN_PAGE_SIZE}
+        if total_segments > 1:
+            request.update(Segment=segment, TotalSegments=total_segments)
+        if attributes is not None:
+            request.update(_projection(attributes))
+        attempt = 0
+        while True:
+            try:
+                result = self._call(self._get_client().scan, **request)
+            except RetryableStorageError:
+                attempt += 1
+                if attempt >= MAX_BATCH_ATTEMPTS:
+                    raise
+                _backoff(attempt)
+                continue
+            attempt = 0
+            for item in result.get("Items", []):
+                yield deserialize_item(item)
+            if "LastEvaluatedKey" not in result:
+                return
+            request["ExclusiveStartKey"] = result["LastEvaluatedKey"]
+
+    def increment(
+        self,
+        key: str,
+        amounts: dict[str, int | float],
+        must_exist: bool = True,
+        values: dict[str, Any] | None = None,
+        expected: dict[str, Any] | None = None,
+    ) -> dict | None:
+        # ADD only works on top-level attributes, so nested counters use SET x = x + :n.
+        names: dict[str, str] = {}
+        attribute_values: dict[str, Any] = {}
+        add_clauses = []
+        set_clauses = []
+        # One placeholder per attribute name, however many paths use it, keeps
+        # long lists of "targets[i].visits" short.
+        segment_names: dict[str, str] = {}
+        for i, (name, value) in enumerate((values or {}).items()):
+            names[f"#s{i}"] = name
+            attribute_values[f":s{i}"] = serialize(value)
+            set_clauses.append(f"#s{i} = :s{i}")
+        for i, (path, amount) in enumerate(amounts.items()):
+            parts = []
+            for segment in parse_path(path):
+                if isinstance(segment, int):
+                    parts[-1] += f"[{segment}]"
+                else:
+                    placeholder = segment_names.get(segment)
+                    if placeholder is None:
+                        placeholder = segment_names[segment] = f"#n{len(segment_names)}"
+                        names[placeholder] = segment
+                    parts.append(placeholder)
+            expr = ".".join(parts)
+            attribute_values[f":v{i}"] = serialize(amount)
+            if "." in path or "[" in path:
+                set_clauses.append(f"{expr} = {expr} + :v{i}")
+            else:
+                add_clauses.append(f"{expr} :v{i}")
+
+        update = []
+        if set_clauses:
+            update.append("SET " + ", ".join(set_clauses))
+        if add_clauses:
+            update.append("ADD " + ", ".join(add_clauses))
+        kwargs: dict[str, Any] = {
+            "TableName": self.table_name,
+            "Key": self._key(key),
+            "UpdateExpression": " ".join(update),
+            "ExpressionAttributeNames": names,
+            "ExpressionAttributeValues": attribute_values,
+            "ReturnValues": "UPDATED_NEW" if add_clauses else "NONE",
+        }
+        conditions = []
+        if must_exist:
+            names["#key"] = self.key_name
+            conditions.append("attribute_exists(#key)")
+        for i, (name, value) in enumerate((expected or {}).items()):
+            names[f"#e{i}"] = name
+            if value is None:
+                conditions.append(f"attribute_not_exists(#e{i})")
+            else:
+                attribute_values[f":e{i}"] = serialize(value)
+                conditions.append(f"#e{i} = :e{i}")
+        if conditions:
+            kwargs["ConditionExpression"] = " AND ".join(conditions)
+        try:
+            # Not retried by botocore: an ADD whose response was lost would count twice.
+            result = self._call(self._get_increment_client().update_item, **kwargs)
+        except _ConditionFailed:
+            return None
+        attributes = deserialize_item(result.get("Attributes", {}))
+        return {path: attributes[path] for path in amounts if path in attributes}
+
+    def update(
+        self,
+        key: str,
+        values: dict[str, Any],
+        must_exist: bool = True,
+        expected: dict[str, Any] | None = None,
+        remove: list[str] | None = None,
+    ) -> bool:
+        names = {f"#n{i}": name for i, name in enumerate(values)}
+        placeholders = {f":v{i}": serialize(v) for i, v in enumerate(values.values())}
+        update = []
+        if values:
+            update.append("SET " + ", ".join(f"#n{i} = :v{i}" for i in range(len(values))))
+        if remove:
+            names.update({f"#r{i}": name for i, name in enumerate(remove)})
+            update.append("REMOVE " + ", ".join(f"#r{i}" for i in range(len(remove))))
+        conditions = []
+        if must_exist:
+            names["#key"] = self.key_name
+            conditions.append("attribute_exists(#key)")
+        for i, (name, value) in enumerate((expected or {}).items()):
+            names[f"#e{i}"] = name
+            if value is None:
+                conditions.append(f"attribute_not_exists(#e{i})")
+            else:
+                placeholders[f":e{i}"] = serialize(value)
+                conditions.append(f"#e{i} = :e{i}")
+        kwargs: dict[str, Any] = {
+            "TableName": self.table_name,
+            "Key": self._key(key),
+            "UpdateExpression": " ".join(update),
+            "ExpressionAttributeNames": names,
+        }
+        if placeholders:
+            kwargs["ExpressionAttributeValues"] = placeholders
+        if conditions:
+            kwargs["ConditionExpression"] = " AND ".join(conditions)
+        try:
+            self._call(self._get_client().update_item, **kwargs)
+        except _ConditionFailed:
+            return False
+        return True
+
+
+# --- In-memory ---
+
+class MemoryStorage(Storage):
+    """Dict-backed store for tests, benchmarks and single-process self-hosting.
+
+    Puts and reads rely on single dict operations, which are atomic in
+    CPython, so they take no lock: ``put_if_absent`` is one ``setdefault``.
+    Only ``increment`` and ``update``, read-modify-writes, serialise on a lock.
+    """
+
+    def __init__(self, key_name: str = "short_code"):
+        self.key_name = key_name
+        self._items: dict[str, dict] = {}
+        self._increment_lock = threading.Lock()
+
+    def put_if_absent(self, item: dict, expired_before: int | None = None) -> bool:
+        item = copy.deepcopy(item)
+        key = item[self.key_name]
+        if expired_before is None:
+            return self._items.setdefault(key, item) is item
+        with self._increment_lock:
+            current = self._items.get(key)
+            if current is None:
+                return self._items.setdefault(key, item) is item
+            if "expires_at" not in current or current["expires_at"] >= expired_before:
+                return False
+            self._items[key] = item
+            return True
+
+    def get(self, key: str, attributes: list[str] | None = None, consistent: bool = False) -> dict | None:
+        item = self._items.get(key)
+        return None if item is None else copy.deepcopy(_project(item, attributes))
+
+    def batch_get(self, keys: list[str], attributes: list[str] | None = None) -> dict[str, dict]:
+        found = {}
+        for key in keys:
+            item = self.get(key, attributes)
+            if item is not None:
+                found[key] = item
+        return found
+
+    def batch_put(self, items: list[dict]) -> list[dict]:
+        for item in items:
+            self._items[item[self.key_name]] = copy.deepcopy(item)
+        return []
+
+    def scan(
+        self, segment: int = 0, total_segments: int = 1, attributes: list[str] | None = None
+    ) -> Iterator[dict]:
+        for key in list(self._items):
+            if zlib.crc32(key.encode("utf-8")) % total_segments == segment:
+                item = self.get(key, attributes)
+                if item is not None:
+                    yield item
+
+    def increment(
+        self,
+        key: str,
+        amounts: dict[str, int | float],
+        must_exist: bool = True,
+        values: dict[str, Any] | None = None,
+        expected: dict[str, Any] | None = None,
+    ) -> dict | None:
+        with self._increment_lock:
+            item = self._items.get(key)
+            if (item is None and must_exist) or not _matches(item or {}, expected):
+                return None
+            if item is None:
+                item = {self.key_name: key}
+            else:
+                item = copy.deepcopy(item)
+            updated = _apply_increments(item, amounts)
+            item.update(values or {})
+            self._items[key] = item
+            return updated
+
+    def update(
+        self,
+        key: str,
+        values: dict[str, Any],
+        must_exist: bool = True,
+        expected: dict[str, Any] | None = None,
+        remove: list[str] | None = None,
+    ) -> bool:
+        with self._increment_lock:
+            item = self._items.get(key)
+            if (item is None and must_exist) or not _matches(item or {}, expected):
+                return False
+            item = {self.key_name: key} if item is None else copy.deepcopy(item)
+            _apply_update(item, copy.deepcopy(values), remove)
+            self._items[key] = item
+            return True
+
+    def clear(self) -> None:
+        self._items.clear()
+
+
+# --- SQLite ---
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, bytes):
+        return {"__bytes__": base64.b64encode(value).decode("ascii")}
+    raise TypeError(f"Cannot store {type(value).__name__} values")
+
+
+def _json_object_hook(obj: dict) -> Any:
+    if len(obj) == 1 and "__bytes__" in obj:
+        return base64.b64decode(obj["__bytes__"])
+    return obj
+
+
+def _dumps(item: dict) -> str:
+    return json.dumps(item, default=_json_default)
+
+
+def _loads(text: str) -> dict:
+    return json.loads(text, object_hook=_json_object_hook)
+
+
+class SQLiteStorage(Storage):
+    """Single-file store for self-hosting on one box.
+
+    Items are stored as JSON, with bytes values base64-encoded. The database
+    runs in WAL mode so readers never block the writer; each thread keeps
+    its own connection, and sqlite3's statement cache keeps the fixed set
+    of queries below prepared.
+    """
+
+    def __init__(self, path: str, table_name: str, key_name: str = "short_code"):
+        self.path = path
+        self.key_name = key_name
+        self._table = '"' + table_name.replace('"', '""') + '"'
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {self._table} (key TEXT PRIMARY KEY, item TEXT NOT NULL)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            import sqlite3
+
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, cached_statements=64)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def put_if_absent(self, item: dict, expired_before: int | None = None) -> bool:
+        if expired_before is None:
+            cursor = self._connect().execute(
+                f"INSERT OR IGNORE INTO {self._table} (key, item) VALUES (?, ?)",
+                (item[self.key_name], _dumps(item)),
+            )
+        else:
+            cursor = self._connect().execute(
+                f"INSERT INTO {self._table} (key, item) VALUES (?, ?) ON CONFLICT (key) DO UPDATE"
+                f" SET item = excluded.item WHERE json_extract({self._table}.item, '$.expires_at') < ?",
+                (item[self.key_name], _dumps(item), expired_before),
+            )
+        return cursor.rowcount == 1
+
+    def get(self, key: str, attributes: list[str] | None = None, consistent: bool = False) -> dict | None:
+        row = self._connect().execute(f"SELECT item FROM {self._table} WHERE key = ?", (key,)).fetchone()
+        return None if row is None else _project(_loads(row[0]), attributes)
+
+    def batch_get(self, keys: list[str], attributes: list[str] | None = None) -> dict[str, dict]:
+        found = {}
+        conn = self._connect()
+        for chunk in _chunks(list(dict.fromkeys(keys)), BATCH_GET_SIZE):
+            placeholders = ", ".join("?" * len(chunk))
+            rows = conn.execute(f"SELECT key, item FROM {self._table} WHERE key IN ({placeholders})", chunk)
+            for key, item in rows:
+                found[key] = _project(_loads(item), attributes)
+        return found
+
+    def batch_put(self, items: list[dict]) -> list[dict]:
+        conn = self._connect()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO {self._table} (key, item) VALUES (?, ?)",
+                [(item[self.key_name], _dumps(item)) for item in items],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return []
+
+    def scan(
+        self, segment: int = 0, total_segments: int = 1, attributes: list[str] | None = None
+    ) -> Iterator[dict]:
+        conn = self._connect()
+        last = 0
+        while True:
+            rows = conn.execute(
+                f"SELECT rowid, item FROM {self._table} WHERE rowid > ? AND rowid % ? = ? ORDER BY rowid LIMIT ?",
+                (last, total_segments, segment, SCAN_PAGE_SIZE),
+            ).fetchall()
+            for _, item in rows:
+                yield _project(_loads(item), attributes)
+            if len(rows) < SCAN_PAGE_SIZE:
+                return
+            last = rows[-1][0]
+
+    def increment(
+        self,
+        key: str,
+        amounts: dict[str, int | float],
+        must_exist: bool = True,
+        values: dict[str, Any] | None = None,
+        expected: dict[str, Any] | None = None,
+    ) -> dict | None:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(f"SELECT item FROM {self._table} WHERE key = ?", (key,)).fetchone()
+            item = _loads(row[0]) if row else None
+            if (item is None and must_exist) or not _matches(item or {}, expected):
+                conn.execute("ROLLBACK")
+                return None
+            item = item or {self.key_name: key}
+            updated = _apply_increments(item, amounts)
+            item.update(values or {})
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self._table} (key, item) VALUES (?, ?)",
+                (key, _dumps(item)),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return updated
+
+    def update(
+        self,
+        key: str,
+        values: dict[str, Any],
+        must_exist: bool = True,
+        expected: dict[str, Any] | None = None,
+        remove: list[str] | None = None,
+    ) -> bool:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(f"SELECT item FROM {self._table} WHERE key = ?", (key,)).fetchone()
+            item = _loads(row[0]) if row else None
+            if (item is None and must_exist) or not _matches(item or {}, expected):
+                conn.execute("ROLLBACK")
+                return False
+            item = item or {self.key_name: key}
+            _apply_update(item, values, remove)
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self._table} (key, item) VALUES (?, ?)",
+                (key, _dumps(item)),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return True
+
+
+# --- Configuration ---
+
+_memory_tables: dict[str, MemoryStorage] = {}
+_memory_lock = threading.Lock()
+
+
+def create_storage(backend: str, table_name: str, key_name: str = "short_code") -> Storage:
+    if backend == "dynamodb":
+        return DynamoStorage(table_name, key_name)
+    if backend == "memory":
+        with _memory_lock:
+            if table_name not in _memory_tables:
+                _memory_tables[table_name] = MemoryStorage(key_name)
+            return _memory_tables[table_name]
+    if backend == "sqlite":
+        return SQLiteStorage(os.environ.get("SQLITE_PATH", "qaktus.db"), table_name, key_name)
+    raise ValueError(f"Unknown storage backend: {backend!r}")
+
+
+def from_env(table_env: str = "TABLE_NAME", key_name: str = "short_code") -> Storage:
+    """Build the configured backend for the table named by the ``table_env`` variable."""
+    backend = os.environ.get("STORAGE_BACKEND", "dynamodb")
+    if backend == "dynamodb":
+        table_name = os.environ[table_env]
+    else:
+        table_name = os.environ.get(table_env, table_env.lower())
+    return create_storage(backend, table_name, key_name)
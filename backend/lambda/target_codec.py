@@ -0,0 +1,221 @@
+"""Packed, compressed storage for links with many targets.
+
+A plain link item holds ``targets`` as a DynamoDB list of maps, which runs
+into the 400 KB item limit at a few thousand targets and makes every read
+decode all of them. Links with at least ``PACKED_TARGETS_THRESHOLD``
+targets are stored instead as:
+
+- a primary item with a shard directory: ``format``, ``count``,
+  ``total_weight`` and ``shards`` (each shard's cumulative weight at its
+  end and its target count)
+- one item per shard, ``<short_code>~<k>``, holding ``packed`` (a
+  zlib-compressed blob) and that shard's ``visits`` list. A shard holds
+  thousands of targets, so visits are added to it a bounded number of
+  list positions per write (see ``redirect.flush_visits``). Shards written
+  for a later ``version`` of the link (see ``generate_link.update_link``)
+  are keyed ``<short_code>~<version>.<k>``, so readers still holding the
+  previous directory never load another version's shards.
+
+A blob is laid out (little-endian) as::
+
+    version: u8 | count: u32 | cumulative weights: f64[count]
+    | url offsets: u32[count + 1] | urls: utf-8
+
+so a pick is one binary search over the cumulative weights and one slice
+of the URL bytes; nothing else is parsed.
+"""
+
+import bisect
+import hashlib
+import random
+import struct
+import zlib
+from typing import Callable
+
+PACKED_FORMAT = "packed"
+SHARD_SEPARATOR = "~"
+VERSION = 1
+# Raw (uncompressed) bytes per shard. zlib never grows data by more than a
+# few bytes per block, so a shard stays well inside DynamoDB's item limit.
+MAX_SHARD_BYTES = 256 * 1024
+_HEADER = struct.Struct("<BI")
+
+
+def shard_key(short_code: str, k: int, version: int = 1) -> str:
+    if version == 1:
+        return f"{short_code}{SHARD_SEPARATOR}{k}"
+    return f"{short_code}{SHARD_SEPARATOR}{version}.{k}"
+
+
+def encode(urls: list[str], cumulative: list[float]) -> bytes:
+    """Pack URLs and their cumulative weights (relative to the start of the shard) into a compressed blob."""
+    encoded = [url.encode("utf-8") for url in urls]
+    offsets = [0]
+    for url in encoded:
+        offsets.append(offsets[-1] + len(url))
+    count = len(urls)
+    raw = b"".join([
+        _HEADER.pack(VERSION, count),
+        struct.pack(f"<{count}d", *cumulative),
+        struct.pack(f"<{count + 1}I", *offsets),
+        *encoded,
+    ])
+    return zlib.compress(raw, 6)
+
+
+class PackedTargets:
+    """A decompressed shard. Reads URLs and weights straight out of the buffer on demand."""
+
+    __slots__ = ("count", "total", "_cumulative", "_offsets", "_urls")
+
+    def __init__(self, blob: bytes):
+        raw = memoryview(zlib.decompress(blob))
+        version, count = _HEADER.unpack_from(raw)
+        if version != VERSION:
+            raise ValueError(f"Unsupported packed targets version: {version}")
+        start = _HEADER.size
+        self.count = count
+        self._cumulative = raw[start:start + 8 * count].cast("d")
+        start += 8 * count
+        self._offsets = raw[start:start + 4 * (count + 1)].cast("I")
+        self._urls = raw[start + 4 * (count + 1):]
+        self.total = self._cumulative[-1] if count else 0.0
+
+    def index_for(self, x: float) -> int:
+        """Index of the target whose cumulative weight range contains ``x`` in ``[0, total)``."""
+        return min(bisect.bisect_right(self._cumulative, x), self.count - 1)
+
+    def url(self, i: int) -> str:
+        return bytes(self._urls[self._offsets[i]:self._offsets[i + 1]]).decode("utf-8")
+
+    def weight(self, i: int) -> float:
+        return self._cumulative[i] - (self._cumulative[i - 1] if i else 0.0)
+
+    def targets(self) -> list[dict]:
+        return [{"url": self.url(i), "weight": self.weight(i)} for i in range(self.count)]
+
+
+def pack_link(item: dict, max_shard_bytes: int = MAX_SHARD_BYTES, key_name: str = "short_code") -> list[dict]:
+    """Split a plain link item into a directory item followed by its shard items."""
+    short_code = item[key_name]
+    version = int(item.get("version", 1))
+    targets = item["targets"]
+    extra = {k: v for k, v in item.items() if k not in (key_name, "targets")}
+
+    shards: list[list[dict]] = [[]]
+    size = 0
+    for target in targets:
+        # 8 bytes of weight, 4 of offset, plus the URL.
+        cost = 12 + len(target["url"].encode("utf-8"))
+        if shards[-1] and size + cost > max_shard_bytes:
+            shards.append([])
+            size = 0
+        shards[-1].append(target)
+        size += cost
+
+    directory = []
+    shard_items = []
+    running = 0.0
+    for k, shard in enumerate(shards):
+        base = running
+        cumulative = []
+        for target in shard:
+            running += float(target["weight"])
+            cumulative.append(running - base)
+        directory.append({"end": running, "count": len(shard)})
+        shard_item = {
+            key_name: shard_key(short_code, k, version),
+            "packed": encode([t["url"] for t in shard], cumulative),
+            "visits": [int(t.get("visits", 0)) for t in shard],
+        }
+        if "expires_at" in item:
+            shard_item["expires_at"] = item["expires_at"]
+        shard_items.append(shard_item)
+
+    primary = {
+        **extra,
+        key_name: short_code,
+        "format": PACKED_FORMAT,
+        "count": len(targets),
+        "total_weight": running,
+        "shards": directory,
+    }
+    return [primary, *shard_items]
+
+
+def unpack_targets(shard_items: list[dict]) -> list[dict]:
+    """Rebuild the plain ``targets`` list (with visits) from a link's shard items, in order."""
+    targets = []
+    for shard in shard_items:
+        packed = PackedTargets(shard["packed"])
+        visits = shard.get("visits") or [0] * packed.count
+        for i, target in enumerate(packed.targets()):
+            targets.append({**target, "visits": visits[i]})
+    return targets
+
+
+class ShardedSampler:
+    """Weighted picks over a packed link, loading only the shard a pick lands in.
+
+    ``load_shard(k)`` returns the ``PackedTargets`` for shard ``k``; each is
+    loaded once and kept. Offers the same ``pick_index``, ``pick_index_for``
+    and ``urls[i]`` interface as ``AliasSampler``, with O(log n) picks.
+    Sticky picks hash the visitor to a point on the cumulative weight line,
+    so they are stable but, unlike rendezvous hashing, a weight change can
+    move visitors between unchanged targets.
+    """
+
+    __slots__ = ("n", "total", "_ends", "_starts", "_load_shard", "_shards", "urls")
+
+    def __init__(self, directory: list[dict], load_shard: Callable[[int], PackedTargets]):
+        self._ends = [float(shard["end"]) for shard in directory]
+        self._starts = [0]
+        for shard in directory[:-1]:
+            self._starts.append(self._starts[-1] + int(shard["count"]))
+        self.n = self._starts[-1] + int(directory[-1]["count"])
+        self.total = self._ends[-1]
+        self._load_shard = load_shard
+        self._shards: dict[int, PackedTargets] = {}
+        self.urls = _ShardedUrls(self)
+
+    @property
+    def loaded(self) -> bool:
+        """Whether every shard has been loaded, so no pick needs a read."""
+        return len(self._shards) == len(self._ends)
+
+    def shard(self, k: int) -> PackedTargets:
+        shard = self._shards.get(k)
+        if shard is None:
+            shard = self._shards[k] = self._load_shard(k)
+        return shard
+
+    def locate(self, index: int) -> tuple[int, int]:
+        """Map a global target index to (shard number, index within the shard)."""
+        k = bisect.bisect_right(self._starts, index) - 1
+        return k, index - self._starts[k]
+
+    def _index_at(self, x: float) -> int:
+        k = min(bisect.bisect_right(self._ends, x), len(self._ends) - 1)
+        base = self._ends[k - 1] if k else 0.0
+        return self._starts[k] + self.shard(k).index_for(x - base)
+
+    def pick_index(self) -> int:
+        return self._index_at(random.random() * self.total)
+
+    def pick_index_for(self, visitor: str, salt: str = "") -> int:
+        digest = hashlib.blake2b(f"{salt}\0{visitor}".encode("utf-8"), digest_size=8).digest()
+        return self._index_at(int.from_bytes(digest, "big") / 2**64 * self.total)
+
+
+class _ShardedUrls:
+    __slots__ = ("_sampler",)
+
+    def __init__(self, sampler: ShardedSampler):
+        self._sampler = sampler
+
+    def __getitem__(self, index: int) -> str:
+        k, local = self._sampler.locate(index)
+        return self._sampler.shard(k).url(local)
+
+    def __len__(self) -> int:
+        return self._sampler.n
@@ -0,0 +1,222 @@
+"""Per-target health and latency scores for health-aware routing.
+
+A prober (this module's CLI, run on a schedule) checks the destination URLs
+that get traffic and publishes one compact snapshot of scores, one
+``[up, latency_ms, failures]`` list per URL. Passive reports are merged into
+the same scores. They are JSON lines such as
+``{"url": "https://example.com", "ok": false, "latency_ms": 1200}``, from
+sources like real-user beacons or load balancer logs. A URL is down after
+``--unhealthy-after`` consecutive failures and up again after one success;
+latency is smoothed across rounds.
+
+Redirect containers follow the snapshot the way they follow the hot set.
+They load it during init and check for a newer generation every
+``HEALTH_REFRESH_INTERVAL`` seconds on a background thread, so a redirect
+never waits on a health check. ``HEALTH_ROUTING`` picks the mode:
+
+- ``skip``: targets that are down get no traffic
+- ``latency``: as ``skip``, and each weight is also divided by
+  ``1 + latency_ms / HEALTH_LATENCY_SCALE_MS``, favouring faster targets
+  within the configured split
+- unset or empty: disabled
+
+URLs without a score count as up. When every target of a link is down, or
+the snapshot is older than ``HEALTH_MAX_AGE`` seconds, the configured
+weights are used unchanged. Packed (very large) links are never adjusted.
+Snapshots live where ``HEALTH_SOURCE`` says (``table``, the default, for
+the ``~health`` item of the links table, or ``file:<path>``)::
+
+    python target_health.py events/*.jsonl --reports reports/*.jsonl --max-urls 5000
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable
+
+import events
+from hot_set import FileSource, SnapshotFollower, TableSource, fit, source_from_env
+
+SCORES_KEY = "~health"
+MODES = ("skip", "latency")
+# Weight given to the newest latency sample.
+LATENCY_SMOOTHING = 0.3
+
+
+def update_score(previous: list | None, ok: bool, latency_ms: float | None, unhealthy_after: int = 2) -> list:
+    """Fold one probe or report into a URL's ``[up, latency_ms, failures]`` score."""
+    failures = 0 if ok else (previous[2] if previous else 0) + 1
+    latency = previous[1] if previous else 0
+    if ok and latency_ms is not None:
+        latency = latency_ms if not latency else latency + LATENCY_SMOOTHING * (latency_ms - latency)
+    return [1 if failures < unhealthy_after else 0, round(latency, 1), failures]
+
+
+# --- In-process scores ---
+
+class HealthScores(SnapshotFollower):
+    """The newest score snapshot, applied to a link's configured weights by ``adjust``."""
+
+    name = "health scores"
+
+    def __init__(
+        self,
+        source,
+        mode: str = "skip",
+        latency_scale_ms: float = 200.0,
+        refresh_interval: float = 60.0,
+        max_age: float = 900.0,
+        clock: Callable[[], float] = time.time,
+    ):
+        if mode not in MODES:
+            raise ValueError(f"Unknown HEALTH_ROUTING mode: {mode!r}")
+        super().__init__(source, refresh_interval, max_age, clock)
+        self.mode = mode
+        self.latency_scale_ms = latency_scale_ms
+        self._scores: dict[str, list] = {}
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def _apply(self, snapshot: dict) -> None:
+        self._scores = snapshot["scores"]
+
+    def current(self) -> int:
+        """Generation of the scores in effect, or 0 when none are (nothing loaded, or too old)."""
+        return self.generation if self.fresh() else 0
+
+    def adjust(self, urls: list[str], weights: list[float]) -> list[float] | None:
+        """Weights for ``urls`` after applying the scores, or None when they would be the configured ones."""
+        scores = self._scores
+        if not scores or not self.fresh():
+            return None
+        adjusted = []
+        changed = False
+        for url, weight in zip(urls, weights):
+            score = scores.get(url)
+            if score is not None and weight > 0:
+                if not score[0]:
+                    weight, changed = 0.0, True
+                elif self.mode == "latency" and score[1]:
+                    weight, changed = weight / (1 + score[1] / self.latency_scale_ms), True
+            adjusted.append(weight)
+        if not changed or not any(w > 0 for w in adjusted):
+            return None
+        return adjusted
+
+
+def from_env(get_storage: Callable[[], Any]) -> HealthScores | None:
+    mode = os.environ.get("HEALTH_ROUTING", "")
+    if not mode:
+        return None
+    source = source_from_env(get_storage, "HEALTH_SOURCE", SCORES_KEY, "scores", default="table")
+    return HealthScores(
+        source,
+        mode,
+        latency_scale_ms=float(os.environ.get("HEALTH_LATENCY_SCALE_MS", "200")),
+        refresh_interval=float(os.environ.get("HEALTH_REFRESH_INTERVAL", "60")),
+        max_age=float(os.environ.get("HEALTH_MAX_AGE", "900")),
+    )
+
+
+# --- Probing ---
+
+def probe(url: str, timeout: float = 3.0) -> tuple[bool, float | None]:
+    """HEAD ``url`` (GET when HEAD isn't allowed); return whether it is up and how long it took, in ms.
+
+    Redirects are followed. Any response below 500 counts as up: the
+    destination answered, even if it turned a bot away.
+    """
+    import urllib.error
+    import urllib.request
+
+    for method in ("HEAD", "GET"):
+        request = urllib.request.Request(url, method=method, headers={"User-Agent": "qaktus-health-probe/1"})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        except (OSError, ValueError):
+            return False, None
+        latency_ms = (time.perf_counter() - start) * 1000
+        if method == "HEAD" and status in (405, 501):
+            continue
+        return status < 500, latency_ms
+    return False, None
+
+
+def probe_all(urls: list[str], timeout: float = 3.0, workers: int = 32) -> dict[str, tuple[bool, float | None]]:
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return dict(zip(urls, pool.map(lambda url: probe(url, timeout), urls)))
+
+
+# --- Building ---
+
+def urls_from_events(paths: Iterable[str], max_urls: int) -> list[str]:
+    """The ``max_urls`` most-visited destination URLs in JSON-lines visit-event files, most visited first.
+
+    Lines that aren't visit events are skipped (see ``events.read_events``).
+    """
+    counts = Counter(event["url"] for event in events.read_events(paths, "url"))
+    return [url for url, _ in counts.most_common(max_urls)]
+
+
+def reports_from_files(paths: Iterable[str]) -> list[dict]:
+    """The ``{"url", "ok", "latency_ms"}`` reports in JSON-lines files, skipping lines that aren't reports."""
+    return [report for report in events.read_events(paths, "url") if "ok" in report]
+
+
+def build_scores(
+    previous: dict[str, list],
+    probes: dict[str, tuple[bool, float | None]],
+    reports: list[dict],
+    unhealthy_after: int = 2,
+) -> dict[str, list]:
+    """Scores for this round: probed URLs in probe order, then URLs only seen in reports.
+
+    URLs neither probed nor reported this round are dropped.
+    """
+    scores: dict[str, list] = {}
+    for url, (ok, latency_ms) in probes.items():
+        scores[url] = update_score(previous.get(url), ok, latency_ms, unhealthy_after)
+    for report in reports:
+        url = report["url"]
+        current = scores.get(url, previous.get(url))
+        scores[url] = update_score(current, bool(report["ok"]), report.get("latency_ms"), unhealthy_after)
+    return scores
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="JSON-lines visit-event files naming the URLs to probe")
+    parser.add_argument("--reports", nargs="*", default=[], help="JSON-lines passive reports to merge")
+    parser.add_argument("--max-urls", type=int, default=2000, help="probe at most this many of the most-visited URLs")
+    parser.add_argument("--timeout", type=float, default=3.0, help="seconds per probe")
+    parser.add_argument("--workers", type=int, default=32, help="concurrent probes")
+    parser.add_argument("--unhealthy-after", type=int, default=2, help="consecutive failures before a URL is down")
+    parser.add_argument("--output", help="write to this file instead of the links table")
+    args = parser.parse_args(argv)
+
+    if args.output:
+        source: Any = FileSource(args.output, field="scores")
+    else:
+        import storage
+
+        source = TableSource(storage.from_env("TABLE_NAME"), SCORES_KEY, "scores")
+    snapshot = source.load()
+    previous = snapshot["scores"] if snapshot else {}
+    probes = probe_all(urls_from_events(args.paths, args.max_urls), args.timeout, args.workers)
+    scores = fit(build_scores(previous, probes, reports_from_files(args.reports), args.unhealthy_after))
+    generation = source.publish(scores)
+    down = sum(1 for score in scores.values() if not score[0])
+    print(f"Published health scores generation {generation} for {len(scores)} URLs ({down} down)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
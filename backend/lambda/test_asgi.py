@@ -0,0 +1,157 @@
+import asyncio
+import json
+
+import pytest
+import asgi
+import generate_link
+import redirect
+from storage import MemoryStorage
+from target_codec import pack_link
+
+
+def call(method: str, path: str, body: bytes = b"", headers: list | None = None) -> dict:
+    """Drive the ASGI app once and collect the response."""
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "headers": headers or [],
+        "client": ("203.0.113.7", 5000),
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi.app(scope, receive, send))
+    start, body_message = sent
+    return {
+        "status": start["status"],
+        "headers": {k.decode(): v.decode() for k, v in start["headers"]},
+        "body": body_message["body"],
+    }
+
+
+# ---------------------------------------------------------------------------
+# TestBuildEvent
+# ---------------------------------------------------------------------------
+
+class TestBuildEvent:
+    def test_headers_are_lowercased_and_joined(self):
+        scope = {
+            "method": "GET",
+            "path": "/abc12",
+            "headers": [(b"X-Visitor", b"a"), (b"x-visitor", b"b")],
+            "client": ("203.0.113.7", 1),
+        }
+        event = asgi.build_event(scope, b"", {"short_code": "abc12"})
+        assert event["headers"] == {"x-visitor": "a,b"}
+        assert event["pathParameters"] == {"short_code": "abc12"}
+        assert event["requestContext"]["http"]["sourceIp"] == "203.0.113.7"
+
+    def test_body_is_decoded(self):
+        scope = {"method": "POST", "path": "/generate-link", "headers": []}
+        assert asgi.build_event(scope, b'{"a": 1}')["body"] == '{"a": 1}'
+
+
+# ---------------------------------------------------------------------------
+# TestApp
+# ---------------------------------------------------------------------------
+
+class TestApp:
+    @pytest.fixture(autouse=True)
+    def memory_storage(self):
+        shared = MemoryStorage()
+        generate_link._storage = shared
+        redirect._storage = shared
+        yield shared
+
+    def _create(self, urls):
+        response = call("POST", "/generate-link", json.dumps({"urls": urls}).encode())
+        return response, json.loads(response["body"])
+
+    def test_generate_link_returns_201(self):
+        response, body = self._create([{"original_url": "https://example.com", "weight": 1}])
+        assert response["status"] == 201
+        assert response["headers"]["content-type"] == "application/json"
+        assert body["targets"][0]["url"] == "https://example.com"
+
+    def test_created_link_redirects(self):
+        _, body = self._create([{"original_url": "https://example.com", "weight": 1}])
+        response = call("GET", f"/{body['short_code']}")
+        assert response["status"] == 301
+        assert response["headers"]["location"] == "https://example.com"
+
+    def test_cached_redirect_matches_uncached(self):
+        _, body = self._create([{"original_url": "https://example.com", "weight": 1}])
+        first = call("GET", f"/{body['short_code']}")
+        assert redirect.is_cached(body["short_code"])
+        second = call("GET", f"/{body['short_code']}")
+        assert first == second
+
+    def test_cached_redirect_does_not_read_storage_if_the_entry_expires(self, monkeypatch):
+        _, body = self._create([{"original_url": "https://example.com", "weight": 1}])
+        code = body["short_code"]
+        call("GET", f"/{code}")
+        handler, path_parameters, blocking = asgi.route("GET", f"/{code}")
+        assert blocking is False
+        redirect._cache.invalidate(code)
+        monkeypatch.setattr(redirect, "get_link", lambda short_code: pytest.fail("storage read on the event loop"))
+        event = asgi.build_event({"method": "GET", "path": f"/{code}", "headers": []}, b"", path_parameters)
+        assert handler(event, None)["headers"]["Location"] == "https://example.com"
+
+    def test_packed_link_is_cached_once_all_shards_are_loaded(self, memory_storage):
+        targets = [{"url": f"https://example.com/{i}", "weight": 1, "visits": 0} for i in range(20)]
+        memory_storage.batch_put(pack_link({"short_code": "big00", "targets": targets}, max_shard_bytes=100))
+        assert call("GET", "/big00")["status"] == 302
+        assert asgi.route("GET", "/big00")[2] is True
+        link = redirect.get_link("big00")
+        for k in range(len(memory_storage.get("big00")["shards"])):
+            link.sampler.shard(k)
+        assert asgi.route("GET", "/big00")[2] is False
+
+    def test_head_redirect_has_no_body(self):
+        _, body = self._create([{"original_url": "https://example.com", "weight": 1}])
+        response = call("HEAD", f"/{body['short_code']}")
+        assert response["status"] == 301
+        assert response["body"] == b""
+
+    def test_unknown_code_returns_404(self):
+        assert call("GET", "/nope0")["status"] == 404
+
+    def test_validation_errors_match_lambda_handler(self):
+        response, body = self._create([])
+        assert response["status"] == 400
+        assert body == json.loads(generate_link.handler({"body": json.dumps({"urls": []})}, None)["body"])
+
+    def test_bulk_route(self):
+        links = [{"urls": [{"original_url": "https://a.com", "weight": 1}]}]
+        response = call("POST", "/generate-links", json.dumps({"links": links}).encode())
+        assert response["status"] == 201
+
+    def test_resolve_route(self):
+        _, body = self._create([{"original_url": "https://example.com", "weight": 1}])
+        response = call("POST", "/resolve", json.dumps({"codes": [body["short_code"]], "pick": True}).encode())
+        assert response["status"] == 200
+        assert json.loads(response["body"])["results"][0]["url"] == "https://example.com"
+
+    def test_patch_route_updates_link(self):
+        _, body = self._create([{"original_url": "https://a.com", "weight": 1}])
+        update = {"urls": [{"original_url": "https://b.com", "weight": 1}], "version": 1}
+        headers = [(b"authorization", f"Bearer {body['edit_key']}".encode())]
+        response = call("PATCH", f"/{body['short_code']}", json.dumps(update).encode(), headers)
+        assert response["status"] == 200
+        assert json.loads(response["body"])["version"] == 2
+
+    def test_unknown_route_returns_404(self):
+        assert call("DELETE", "/abc12")["status"] == 404
+        assert call("GET", "/a/b")["status"] == 404
+
+    def test_oversized_body_returns_413(self, monkeypatch):
+        monkeypatch.setattr(asgi, "MAX_BODY_BYTES", 10)
+        response = call("POST", "/generate-link", b"x" * 11)
+        assert response["status"] == 413
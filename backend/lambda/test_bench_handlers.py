@@ -0,0 +1,59 @@
+import json
+
+import bench_handlers
+from bench_handlers import compare, measure
+
+
+def _report(**latencies):
+    return {"results": {name: {"ns_per_call": ns} for name, ns in latencies.items()}}
+
+
+# ---------------------------------------------------------------------------
+# TestMeasure
+# ---------------------------------------------------------------------------
+
+class TestMeasure:
+    def test_reports_latency_and_throughput(self):
+        result = measure(lambda: None, repeat=2, min_time=0.01)
+        assert result["ns_per_call"] > 0
+        assert result["best_ns_per_call"] <= result["ns_per_call"]
+        assert result["ops_per_sec"] > 0
+
+
+# ---------------------------------------------------------------------------
+# TestCompare
+# ---------------------------------------------------------------------------
+
+class TestCompare:
+    def test_slowdown_within_threshold_passes(self):
+        assert compare(_report(a=120), _report(a=100), threshold=0.25) == []
+
+    def test_slowdown_beyond_threshold_is_reported(self):
+        regressions = compare(_report(a=130), _report(a=100), threshold=0.25)
+        assert [r["name"] for r in regressions] == ["a"]
+        assert regressions[0]["ratio"] == 1.3
+
+    def test_cases_missing_from_baseline_are_ignored(self):
+        assert compare(_report(new=1000), _report(), threshold=0.25) == []
+
+
+# ---------------------------------------------------------------------------
+# TestMain
+# ---------------------------------------------------------------------------
+
+class TestMain:
+    def test_writes_json_and_flags_regressions(self, tmp_path):
+        output = tmp_path / "bench.json"
+        args = ["--filter", "generate_base62", "--repeat", "1", "--min-time", "0.01", "--output", str(output)]
+        assert bench_handlers.main(args) == 0
+        report = json.loads(output.read_text())
+        assert "generate_base62" in report["results"]
+
+        baseline = tmp_path / "baseline.json"
+        baseline.write_text(json.dumps(_report(generate_base62=0.001)))
+        assert bench_handlers.main(args + ["--baseline", str(baseline)]) == 1
+
+    def test_every_case_runs(self):
+        report = bench_handlers.run(["[1]", "[warm,1]", "[cold,1]"], repeat=1, min_time=0.001)
+        assert "redirect.handler[cold,1]" in report["results"]
+        assert "generate_link.handler[1]" in report["results"]
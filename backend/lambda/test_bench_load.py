@@ -0,0 +1,147 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import bench_load
+import pytest
+from bench_load import CountingStorage, HttpClient, percentile, zipf_weights
+from storage import MemoryStorage
+
+
+# ---------------------------------------------------------------------------
+# TestHelpers
+# ---------------------------------------------------------------------------
+
+class TestHelpers:
+    def test_zipf_weights_fall_with_rank(self):
+        assert zipf_weights(3, 1.0) == [1.0, 0.5, 1 / 3]
+
+    def test_percentile_is_nearest_rank(self):
+        values = list(range(1, 101))
+        assert percentile(values, 50) == 50
+        assert percentile(values, 99) == 99
+        assert percentile([7.0], 95) == 7.0
+        assert percentile([], 50) == 0.0
+
+
+# ---------------------------------------------------------------------------
+# TestCountingStorage
+# ---------------------------------------------------------------------------
+
+class TestCountingStorage:
+    def test_counts_calls_by_request_type(self):
+        store = CountingStorage(MemoryStorage())
+        store.request_type = "create"
+        store.put_if_absent({"short_code": "abc12"})
+        store.request_type = "redirect"
+        store.get("abc12")
+        store.get("abc12")
+        assert store.calls["create"] == {"put_if_absent": 1}
+        assert store.calls["redirect"] == {"get": 2}
+
+    def test_other_threads_count_as_background(self):
+        store = CountingStorage(MemoryStorage())
+        store.request_type = "redirect"
+        thread = threading.Thread(target=store.get, args=("abc12",))
+        thread.start()
+        thread.join()
+        assert store.calls["background"] == {"get": 1}
+
+    def test_taken_key_counts_as_collision(self):
+        store = CountingStorage(MemoryStorage())
+        store.put_if_absent({"short_code": "abc12"})
+        store.put_if_absent({"short_code": "abc12"})
+        assert store.collisions == 1
+
+    def test_attributes_pass_through(self):
+        assert CountingStorage(MemoryStorage()).key_name == "short_code"
+
+
+# ---------------------------------------------------------------------------
+# TestRun
+# ---------------------------------------------------------------------------
+
+class TestRun:
+    def test_in_process_report(self):
+        report = bench_load.run(codes=50, requests=400, concurrency=[1, 4], create_ratio=0.1, seed=1)
+        assert report["mode"] == "in-process"
+        assert report["codes"] == 50
+        assert [level["concurrency"] for level in report["levels"]] == [1, 4]
+        for level in report["levels"]:
+            assert sum(t["count"] for t in level["types"].values()) == 400
+            redirects = level["types"]["redirect"]
+            assert redirects["statuses"] == {"302": redirects["count"]}
+            assert redirects["p50_ms"] <= redirects["p95_ms"] <= redirects["p99_ms"]
+            assert level["types"]["create"]["storage_calls_per_request"] >= 1
+            assert level["collision_retries"] == 0
+
+    def test_popular_codes_are_served_from_cache(self):
+        report = bench_load.run(codes=100, requests=2000, concurrency=[1], create_ratio=0.0, zipf_s=1.5)
+        assert report["levels"][0]["types"]["redirect"]["storage_calls_per_request"] < 0.1
+
+    def test_collisions_are_counted(self, monkeypatch):
+        # The first draw seeds the one link; the created link then collides twice.
+        codes = iter(["seed0", "taken", "taken"])
+        real = bench_load.generate_link.generate_base62
+        monkeypatch.setattr(bench_load.generate_link, "generate_base62", lambda: next(codes, None) or real())
+        store = MemoryStorage()
+        store.put_if_absent({"short_code": "taken"})
+        monkeypatch.setattr(bench_load, "local_storage", lambda: store)
+        report = bench_load.run(codes=1, requests=1, concurrency=[1], create_ratio=1.0)
+        assert report["levels"][0]["collision_retries"] == 2
+
+    def test_main_writes_json(self, tmp_path, capsys):
+        output = tmp_path / "load.json"
+        args = ["--codes", "10", "--requests", "50", "--concurrency", "2", "--output", str(output)]
+        assert bench_load.main(args) == 0
+        assert json.loads(output.read_text())["levels"][0]["concurrency"] == 2
+        assert "req/s" in capsys.readouterr().out
+
+
+# ---------------------------------------------------------------------------
+# TestHttpClient
+# ---------------------------------------------------------------------------
+
+class _StubServer(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=b""):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._send(302 if self.path == "/abc12" else 404)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.path == "/generate-links":
+            results = [{"short_code": f"c{i}"} for i in range(len(body["links"]))]
+            self._send(201, json.dumps({"results": results}).encode())
+        else:
+            self._send(201, b"{}")
+
+
+class TestHttpClient:
+    @pytest.fixture
+    def server(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _StubServer)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+        server.shutdown()
+
+    def test_requests_go_to_server(self, server):
+        client = HttpClient(server)
+        assert client.redirect("abc12") == 302
+        assert client.redirect("nope0") == 404
+        assert client.create({"urls": []}) == 201
+        assert client.create_links([{}, {}]) == ["c0", "c1"]
+
+    def test_http_run_has_no_storage_stats(self, server):
+        report = bench_load.run(codes=3, requests=20, concurrency=[2], url=server)
+        assert report["mode"] == "http"
+        assert "collision_retries" not in report["levels"][0]
+        assert "storage_calls_per_request" not in report["levels"][0]["types"]["redirect"]
@@ -0,0 +1,16 @@
+import json
+
+import bench_startup
+
+
+# ---------------------------------------------------------------------------
+# TestRun
+# ---------------------------------------------------------------------------
+
+class TestRun:
+    def test_reports_each_phase_for_the_lean_path(self, tmp_path):
+        output = tmp_path / "startup.json"
+        assert bench_startup.main(["--variant", "lean", "--samples", "1", "--output", str(output)]) == 0
+        result = json.loads(output.read_text())["results"]["lean"]
+        assert set(result) == {"import_ms", "client_ms", "first_request_ms", "total_ms"}
+        assert all(value > 0 for value in result.values())
@@ -0,0 +1,321 @@
+import json
+import time
+
+import bulk_links
+import generate_link
+import pytest
+import storage
+from bulk_links import AdaptiveWriter, export_links, import_links, prepare, read_records
+from storage import MemoryStorage, RetryableStorageError, StorageError
+
+FUTURE = int(time.time()) + 86400
+
+
+def _body(url="https://a.com", **extra):
+    return {"urls": [{"original_url": url, "weight": 1}], **extra}
+
+
+def _write_ndjson(path, records):
+    path.write_text("".join((r if isinstance(r, str) else json.dumps(r)) + "\n" for r in records))
+    return str(path)
+
+
+# ---------------------------------------------------------------------------
+# TestReading
+# ---------------------------------------------------------------------------
+
+class TestReading:
+    def test_csv_rows_with_one_code_form_one_link(self, tmp_path):
+        path = tmp_path / "links.csv"
+        path.write_text(
+            "short_code,original_url,weight,expires_at\n"
+            f"old1,https://a.com,70,{FUTURE}\n"
+            "old1,https://b.com,30,\n"
+            ",https://c.com,,\n"
+            ",https://d.com,2,\n"
+        )
+        assert list(read_records(str(path), "csv")) == [
+            {"short_code": "old1", "expires_at": FUTURE,
+             "urls": [{"original_url": "https://a.com", "weight": 70.0}, {"original_url": "https://b.com", "weight": 30.0}]},
+            {"urls": [{"original_url": "https://c.com", "weight": 1}]},
+            {"urls": [{"original_url": "https://d.com", "weight": 2.0}]},
+        ]
+
+    def test_ndjson_lines_are_passed_on_raw(self, tmp_path):
+        path = _write_ndjson(tmp_path / "links.ndjson", [_body(), "", "{oops"])
+        assert list(read_records(path, "ndjson")) == [json.dumps(_body()) + "\n", "{oops\n"]
+
+    def test_format_follows_extension(self):
+        assert bulk_links.detect_format("old.CSV") == "csv"
+        assert bulk_links.detect_format("backup.ndjson") == "ndjson"
+
+
+# ---------------------------------------------------------------------------
+# TestPrepare
+# ---------------------------------------------------------------------------
+
+class TestPrepare:
+    def test_body_becomes_item(self):
+        item, error = prepare(json.dumps(_body(short_code="old-1")), FUTURE)
+        assert error is None
+        assert item == {"short_code": "old-1", "targets": [{"url": "https://a.com", "weight": 1, "visits": 0}],
+                        "expires_at": FUTURE, "version": 1}
+
+    def test_exported_record_keeps_visits_and_rules(self):
+        record = {"short_code": "abc12", "version": 4, "expires_at": FUTURE,
+                  "targets": [{"url": "https://a.com", "weight": 1, "visits": 9}, {"url": "https://m.com", "weight": 1}],
+                  "rules": [{"device": ["mobile"], "weights": [0, 1]}]}
+        item, error = prepare(record, 1)
+        assert error is None
+        assert [t["visits"] for t in item["targets"]] == [9, 0]
+        assert item["rules"] == record["rules"]
+        assert item["version"] == 1
+
+    def test_edit_key_hash_is_kept(self):
+        edit_key_hash = generate_link.hash_edit_key("secret")
+        item, error = prepare(_body(short_code="old-1", edit_key_hash=edit_key_hash), FUTURE)
+        assert error is None
+        assert item["edit_key_hash"] == edit_key_hash
+
+    @pytest.mark.parametrize("record", [
+        "{oops",
+        "[]",
+        {"urls": []},
+        {"urls": ["https://a.com"]},
+        {"urls": [{"original_url": "", "weight": 1}]},
+        _body(short_code="a~b"),
+        _body(short_code="x" * 65),
+        _body(expires_at="soon"),
+        _body(edit_key_hash="secret"),
+        _body(rules=[{"device": ["mobile"], "weights": [1, 2]}]),
+    ])
+    def test_invalid_records_are_explained(self, record):
+        item, error = prepare(record, FUTURE)
+        assert item is None
+        assert error
+
+
+# ---------------------------------------------------------------------------
+# TestAdaptiveWriter
+# ---------------------------------------------------------------------------
+
+class ThrottlingStorage(MemoryStorage):
+    """Leaves everything past the first ``accept`` items of a batch unwritten while ``throttled`` lasts."""
+
+    def __init__(self, throttled=2, accept=10):
+        super().__init__()
+        self.throttled = throttled
+        self.accept = accept
+        self.batches = []
+
+    def batch_put(self, items):
+        self.batches.append(len(items))
+        if self.throttled and len(items) > self.accept:
+            self.throttled -= 1
+            super().batch_put(items[:self.accept])
+            return items[self.accept:]
+        return super().batch_put(items)
+
+
+class TestAdaptiveWriter:
+    def _items(self, n):
+        return [{"short_code": f"c{i:04d}"} for i in range(n)]
+
+    def test_throttling_shrinks_batches_and_pauses(self):
+        store = ThrottlingStorage()
+        pauses = []
+        writer = AdaptiveWriter(store, batch_size=100, min_batch_size=25, sleep=pauses.append)
+        writer.write(self._items(300))
+        assert len(store._items) == 300
+        assert store.batches[:3] == [100, 50, 25]
+        assert writer.throttled == 2
+        assert pauses[:2] == [0.1, 0.2]
+        assert writer.batch_size == 100
+
+    def test_retryable_errors_count_as_throttling(self):
+        store = MemoryStorage()
+        calls = iter([RetryableStorageError("throttled")])
+
+        def batch_put(items):
+            error = next(calls, None)
+            if error:
+                raise error
+            return MemoryStorage.batch_put(store, items)
+
+        store.batch_put = batch_put
+        writer = AdaptiveWriter(store, sleep=lambda s: None)
+        writer.write(self._items(3))
+        assert len(store._items) == 3
+        assert writer.throttled == 1
+
+    def test_gives_up_after_max_attempts(self):
+        store = ThrottlingStorage(throttled=100, accept=0)
+        writer = AdaptiveWriter(store, max_attempts=3, sleep=lambda s: None)
+        with pytest.raises(StorageError):
+            writer.write(self._items(5))
+
+
+# ---------------------------------------------------------------------------
+# TestImport
+# ---------------------------------------------------------------------------
+
+class TestImport:
+    @pytest.fixture
+    def store(self):
+        return MemoryStorage()
+
+    def _import(self, path, store, **kwargs):
+        kwargs.setdefault("workers", 0)
+        return import_links(path, store, out=lambda line: None, **kwargs)
+
+    def test_imports_valid_records_and_reports_the_rest(self, tmp_path, store):
+        store.put_if_absent({"short_code": "taken", "targets": []})
+        records = [_body(short_code="keep1"), _body(), "{oops", _body(short_code="taken"), _body(short_code="keep1")]
+        path = _write_ndjson(tmp_path / "links.ndjson", records)
+        counts = self._import(path, store, chunk_size=2)
+        assert counts == {"records": 5, "imported": 2, "skipped": 2, "invalid": 1}
+        assert store.get("keep1")["targets"][0]["url"] == "https://a.com"
+        assert len([key for key in store._items if key not in ("keep1", "taken")]) == 1
+        errors = [json.loads(line) for line in open(f"{path}.errors.ndjson")]
+        assert [(e["record"], e["error"]) for e in errors] == [
+            (2, "Invalid JSON"), (3, bulk_links.TAKEN), (4, bulk_links.TAKEN),
+        ]
+
+    def test_duplicate_codes_within_a_chunk_are_rejected(self, tmp_path, store):
+        path = _write_ndjson(tmp_path / "links.ndjson", [_body(short_code="dup"), _body("https://b.com", short_code="dup")])
+        assert self._import(path, store)["invalid"] == 1
+        assert store.get("dup")["targets"][0]["url"] == "https://a.com"
+
+    def test_fresh_codes_avoid_codes_in_the_chunk(self, tmp_path, store, monkeypatch):
+        draws = iter(["keep1", "fresh"])
+        monkeypatch.setattr(generate_link, "generate_base62", lambda: next(draws))
+        path = _write_ndjson(tmp_path / "links.ndjson", [_body(short_code="keep1"), _body("https://b.com")])
+        assert self._import(path, store)["imported"] == 2
+        assert store.get("keep1")["targets"][0]["url"] == "https://a.com"
+        assert store.get("fresh")["targets"][0]["url"] == "https://b.com"
+
+    def test_sequence_codes_never_overwrite_existing_links(self, tmp_path, store, monkeypatch):
+        monkeypatch.setattr(generate_link, "CODE_ALLOCATOR", "sequence")
+        monkeypatch.setenv("CODE_PERMUTATION_KEY", "test-key")
+        monkeypatch.setattr(generate_link, "_allocator", None)
+        monkeypatch.setattr(generate_link, "_counter_storage", MemoryStorage(key_name="name"))
+        generate_link.use_storage(store)
+        first = generate_link.next_code()
+        monkeypatch.setattr(generate_link, "_allocator", None)
+        monkeypatch.setattr(generate_link, "_counter_storage", MemoryStorage(key_name="name"))
+        store.put_if_absent({"short_code": first, "targets": [{"url": "https://legacy.com", "weight": 1}]})
+
+        path = _write_ndjson(tmp_path / "links.ndjson", [_body("https://b.com") for _ in range(3)])
+        assert self._import(path, store)["imported"] == 3
+        assert store.get(first)["targets"][0]["url"] == "https://legacy.com"
+        assert len(store._items) == 4
+
+    def test_large_links_are_packed(self, tmp_path, store, monkeypatch):
+        monkeypatch.setattr(generate_link, "PACKED_TARGETS_THRESHOLD", 3)
+        urls = [{"original_url": f"https://{i}.com", "weight": 1} for i in range(5)]
+        path = _write_ndjson(tmp_path / "links.ndjson", [{"urls": urls, "short_code": "big"}])
+        self._import(path, store)
+        assert store.get("big")["format"] == "packed"
+        assert store.get("big~0") is not None
+
+    def test_rerun_continues_from_checkpoint(self, tmp_path, store):
+        path = _write_ndjson(tmp_path / "links.ndjson", [_body(f"https://{i}.com") for i in range(6)])
+        writer = AdaptiveWriter(store)
+        real = writer.write
+        calls = []
+
+        def failing_second_chunk(items):
+            calls.append(len(items))
+            real(items)
+            if len(calls) == 2:
+                raise StorageError("throttled for too long")
+
+        writer.write = failing_second_chunk
+        with pytest.raises(StorageError):
+            self._import(path, store, chunk_size=2, writer=writer)
+        assert len(store._items) == 4
+        checkpoint = json.load(open(f"{path}.checkpoint"))
+        assert checkpoint["records"] == 2
+        interrupted = set(checkpoint["writing"].values())
+
+        counts = self._import(path, store, chunk_size=2)
+        assert counts == {"records": 6, "imported": 6, "skipped": 0, "invalid": 0}
+        assert len(store._items) == 6
+        assert interrupted <= set(store._items)
+
+    def test_completed_import_is_not_repeated(self, tmp_path, store):
+        path = _write_ndjson(tmp_path / "links.ndjson", [_body()])
+        self._import(path, store)
+        assert self._import(path, store)["imported"] == 1
+        assert len(store._items) == 1
+
+    def test_validation_in_worker_processes(self, tmp_path, store):
+        path = tmp_path / "links.csv"
+        path.write_text("original_url,weight\n" + "".join(f"https://{i}.com,{i + 1}\n" for i in range(20)) + ",1\n")
+        counts = self._import(str(path), store, workers=2, chunk_size=8)
+        assert counts == {"records": 21, "imported": 20, "skipped": 0, "invalid": 1}
+
+
+# ---------------------------------------------------------------------------
+# TestExport
+# ---------------------------------------------------------------------------
+
+class TestExport:
+    @pytest.fixture
+    def store(self, monkeypatch):
+        monkeypatch.setattr(generate_link, "PACKED_TARGETS_THRESHOLD", 3)
+        store = MemoryStorage()
+        generate_link.use_storage(store)
+        many = [{"url": f"https://{i}.com", "weight": 1, "visits": i} for i in range(4)]
+        items = [
+            generate_link.link_item("plain", [{"url": "https://a.com", "weight": 2, "visits": 5}], FUTURE,
+                                    [{"country": ["DE"], "weights": [1]}]),
+            *generate_link.stored_items(generate_link.link_item("big00", many, FUTURE)),
+            generate_link.link_item("old00", [{"url": "https://o.com", "weight": 1, "visits": 0}], 1),
+            {"short_code": "plain#1", "targets": [], "expires_at": FUTURE},
+            {"short_code": "~dedup#abc", "link": "plain", "expires_at": FUTURE},
+        ]
+        store.batch_put(items)
+        return store
+
+    def test_exports_live_links_only(self, tmp_path, store):
+        output = tmp_path / "backup.ndjson"
+        assert export_links(str(output), store, segments=3) == 2
+        records = {r["short_code"]: r for r in map(json.loads, output.read_text().splitlines())}
+        assert records["plain"] == {"short_code": "plain", "targets": [{"url": "https://a.com", "weight": 2, "visits": 5}],
+                                    "rules": [{"country": ["DE"], "weights": [1]}], "expires_at": FUTURE, "version": 1}
+        assert [t["visits"] for t in records["big00"]["targets"]] == [0, 1, 2, 3]
+        assert not (tmp_path / "backup.ndjson.part").exists()
+
+    def test_include_expired(self, tmp_path, store):
+        assert export_links(str(tmp_path / "all.ndjson"), store, segments=1, include_expired=True) == 3
+
+    def test_export_then_import_round_trips(self, tmp_path, store):
+        output = tmp_path / "backup.ndjson"
+        export_links(str(output), store)
+        restored = MemoryStorage()
+        import_links(str(output), restored, workers=0, out=lambda line: None)
+        generate_link.use_storage(restored)
+        assert generate_link.current_targets("big00", restored.get("big00")) == \
+            generate_link.current_targets("big00", store.get("big00"))
+        assert restored.get("plain")["rules"] == store.get("plain")["rules"]
+
+    def test_edit_key_hash_round_trips(self, tmp_path, store):
+        edit_key_hash = generate_link.hash_edit_key("secret")
+        store.update("plain", {"edit_key_hash": edit_key_hash})
+        output = tmp_path / "backup.ndjson"
+        export_links(str(output), store)
+        restored = MemoryStorage()
+        import_links(str(output), restored, workers=0, out=lambda line: None)
+        assert restored.get("plain")["edit_key_hash"] == edit_key_hash
+
+    def test_main(self, tmp_path, monkeypatch, capsys):
+        monkeypatch.setenv("STORAGE_BACKEND", "memory")
+        monkeypatch.setenv("TABLE_NAME", "bulk-links-main")
+        source = _write_ndjson(tmp_path / "links.ndjson", [_body(short_code="main1")])
+        assert bulk_links.main(["import", source, "--workers", "0"]) == 0
+        output = tmp_path / "out.ndjson"
+        assert bulk_links.main(["export", str(output), "--segments", "2"]) == 0
+        assert json.loads(output.read_text())["short_code"] == "main1"
+        assert "Exported 1 links" in capsys.readouterr().out
+        storage.create_storage("memory", "bulk-links-main").clear()
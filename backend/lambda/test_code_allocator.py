@@ -0,0 +1,110 @@
+import pytest
+from code_allocator import (
+    BASE62,
+    CODE_SPACE,
+    FeistelPermutation,
+    SequenceAllocator,
+    encode_base62,
+)
+
+
+# ---------------------------------------------------------------------------
+# TestEncodeBase62
+# ---------------------------------------------------------------------------
+
+class TestEncodeBase62:
+    def test_zero_is_padded(self):
+        assert encode_base62(0) == "00000"
+
+    def test_largest_value_is_all_last_char(self):
+        assert encode_base62(CODE_SPACE - 1) == BASE62[-1] * 5
+
+    def test_value_too_large_raises(self):
+        with pytest.raises(ValueError):
+            encode_base62(CODE_SPACE)
+
+    def test_distinct_values_give_distinct_codes(self):
+        assert len({encode_base62(n) for n in range(5000)}) == 5000
+
+
+# ---------------------------------------------------------------------------
+# TestFeistelPermutation
+# ---------------------------------------------------------------------------
+
+class TestFeistelPermutation:
+    def test_is_bijection_on_small_domain(self):
+        perm = FeistelPermutation(b"key", domain=1000)
+        assert sorted(perm.permute(x) for x in range(1000)) == list(range(1000))
+
+    def test_invert_round_trips_on_code_space(self):
+        perm = FeistelPermutation(b"key")
+        for x in [0, 1, 2, 12345, CODE_SPACE // 2, CODE_SPACE - 1]:
+            y = perm.permute(x)
+            assert 0 <= y < CODE_SPACE
+            assert perm.invert(y) == x
+
+    def test_consecutive_inputs_do_not_map_to_consecutive_outputs(self):
+        perm = FeistelPermutation(b"key")
+        outputs = [perm.permute(x) for x in range(100)]
+        assert sum(1 for a, b in zip(outputs, outputs[1:]) if abs(a - b) == 1) < 5
+
+    def test_different_keys_give_different_permutations(self):
+        a = FeistelPermutation(b"key-a")
+        b = FeistelPermutation(b"key-b")
+        assert [a.permute(x) for x in range(20)] != [b.permute(x) for x in range(20)]
+
+    def test_empty_key_raises(self):
+        with pytest.raises(ValueError):
+            FeistelPermutation(b"")
+
+    def test_out_of_domain_input_raises(self):
+        with pytest.raises(ValueError):
+            FeistelPermutation(b"key").permute(CODE_SPACE)
+
+
+# ---------------------------------------------------------------------------
+# TestSequenceAllocator
+# ---------------------------------------------------------------------------
+
+class TestSequenceAllocator:
+    def _allocator(self, block_size=10):
+        reservations = []
+        counter = {"next": 0}
+
+        def reserve(size):
+            start = counter["next"]
+            counter["next"] += size
+            reservations.append(start)
+            return start
+
+        return SequenceAllocator(reserve, FeistelPermutation(b"key"), block_size), reservations
+
+    def test_codes_are_unique_across_blocks(self):
+        allocator, _ = self._allocator(block_size=7)
+        codes = allocator.next_codes(500)
+        assert len(set(codes)) == 500
+        assert all(len(c) == 5 and all(ch in BASE62 for ch in c) for c in codes)
+
+    def test_reserves_one_block_per_block_size_codes(self):
+        allocator, reservations = self._allocator(block_size=10)
+        allocator.next_codes(25)
+        assert reservations == [0, 10, 20]
+
+    def test_two_allocators_sharing_a_counter_never_collide(self):
+        counter = {"next": 0}
+
+        def reserve(size):
+            start = counter["next"]
+            counter["next"] += size
+            return start
+
+        perm = FeistelPermutation(b"key")
+        a = SequenceAllocator(reserve, perm, block_size=5)
+        b = SequenceAllocator(reserve, perm, block_size=5)
+        codes = [a.next_code() if i % 3 else b.next_code() for i in range(300)]
+        assert len(set(codes)) == 300
+
+    def test_exhausted_space_raises(self):
+        allocator = SequenceAllocator(lambda size: CODE_SPACE, FeistelPermutation(b"key"), 10)
+        with pytest.raises(RuntimeError):
+            allocator.next_code()
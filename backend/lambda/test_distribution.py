@@ -0,0 +1,91 @@
+import pytest
+from distribution import (
+    chi_square,
+    chi_square_sf,
+    counts_from_indices,
+    expected_probabilities,
+    ks_sf,
+    ks_statistic,
+    main,
+    validate,
+    validate_sampler,
+)
+
+
+# ---------------------------------------------------------------------------
+# TestChiSquare
+# ---------------------------------------------------------------------------
+
+class TestChiSquare:
+    @pytest.mark.parametrize("critical, dof", [(10.828, 1), (18.467, 4), (20.515, 5), (149.449, 100)])
+    def test_sf_matches_critical_values_at_0_001(self, critical, dof):
+        assert chi_square_sf(critical, dof) == pytest.approx(0.001, rel=1e-3)
+
+    def test_sf_at_zero_is_one(self):
+        assert chi_square_sf(0.0, 3) == 1.0
+
+    def test_statistic_for_exact_counts_is_zero(self):
+        assert chi_square([50, 30, 20], [0.5, 0.3, 0.2]) == (0.0, 2)
+
+    def test_small_expected_bins_are_pooled(self):
+        # n = 20: expectations 10, 1, 1, 1, 7 pool into two bins (10 and 3 + 7).
+        statistic, dof = chi_square([10, 1, 1, 1, 7], [0.5, 0.05, 0.05, 0.05, 0.35])
+        assert dof == 1
+
+
+# ---------------------------------------------------------------------------
+# TestKolmogorovSmirnov
+# ---------------------------------------------------------------------------
+
+class TestKolmogorovSmirnov:
+    def test_statistic_is_largest_cdf_gap(self):
+        assert ks_statistic([60, 20, 20], [0.4, 0.4, 0.2]) == pytest.approx(0.2)
+
+    def test_sf_at_the_5_percent_critical_value(self):
+        n = 10_000
+        assert ks_sf(1.358 / n ** 0.5, n) == pytest.approx(0.05, abs=0.002)
+
+    def test_sf_of_small_gap_is_one(self):
+        assert ks_sf(0.0, 1000) == 1.0
+
+
+# ---------------------------------------------------------------------------
+# TestValidate
+# ---------------------------------------------------------------------------
+
+class TestValidate:
+    def test_expected_probabilities(self):
+        assert expected_probabilities([60, 30, 10]) == pytest.approx([0.6, 0.3, 0.1])
+        with pytest.raises(ValueError):
+            expected_probabilities([0, 0])
+
+    def test_counts_from_indices(self):
+        assert counts_from_indices([0, 2, 2], 4) == [1, 0, 2, 0]
+
+    def test_counts_from_numpy_indices(self):
+        np = pytest.importorskip("numpy")
+        assert counts_from_indices(np.array([0, 2, 2]), 4) == [1, 0, 2, 0]
+
+    def test_proportional_counts_pass(self):
+        result = validate([6000, 3000, 1000], [60, 30, 10])
+        assert result["passed"]
+        assert result["n"] == 10_000
+
+    def test_wrong_weights_fail(self):
+        result = validate([6000, 3000, 1000], [50, 40, 10])
+        assert not result["passed"]
+        assert result["chi2_p"] < 0.001
+
+    def test_length_mismatch_raises(self):
+        with pytest.raises(ValueError):
+            validate([1, 2], [1, 2, 3])
+
+    def test_validate_sampler_passes_for_the_alias_sampler(self):
+        np = pytest.importorskip("numpy")
+        targets = [{"url": f"https://{i}.com", "weight": w} for i, w in enumerate([1, 2, 4, 8, 1000])]
+        assert validate_sampler(targets, 500_000, rng=np.random.default_rng(11))["passed"]
+
+    def test_main(self, capsys):
+        pytest.importorskip("numpy")
+        assert main(["--weights", "60,30,10", "--samples", "100000", "--seed", "1"]) == 0
+        assert "PASS" in capsys.readouterr().out
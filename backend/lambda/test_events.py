@@ -0,0 +1,162 @@
+import json
+import threading
+
+import pytest
+import redirect
+from events import EventStream, JsonLinesSink, device_class, load_sink, read_events, stdout_sink, visit_event
+from storage import MemoryStorage
+
+MIXED_LOG = "".join(line + "\n" for line in [
+    "START RequestId: 8f5c Version: $LATEST",
+    json.dumps({"code": "a", "url": "https://a.com"}),
+    json.dumps({"_aws": {"Timestamp": 1, "CloudWatchMetrics": []}, "cache_hits": 3}),
+    "2026-10-18T12:00:00.000Z " + json.dumps({"code": "a", "url": "https://a.com"}),
+    "{truncated",
+    "[1, 2]",
+    json.dumps({"code": 7}),
+    json.dumps({"code": "b", "url": "https://b.com"}),
+    "END RequestId: 8f5c",
+    "REPORT RequestId: 8f5c Duration: 1.2 ms",
+])
+
+
+# ---------------------------------------------------------------------------
+# TestVisitEvent
+# ---------------------------------------------------------------------------
+
+class TestVisitEvent:
+    @pytest.mark.parametrize("user_agent, expected", [
+        (None, "unknown"),
+        ("Mozilla/5.0 (compatible; Googlebot/2.1)", "bot"),
+        ("Mozilla/5.0 (iPad; CPU OS 17_0 like Mac OS X)", "tablet"),
+        ("Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) Mobile/15E148", "mobile"),
+        ("Mozilla/5.0 (Linux; Android 14) Mobile Safari/537.36", "mobile"),
+        ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/126.0", "desktop"),
+    ])
+    def test_device_class(self, user_agent, expected):
+        assert device_class(user_agent) == expected
+
+    def test_only_coarse_client_info_is_kept(self):
+        event = visit_event("abc12", 1, "https://b.com", {
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0)",
+            "Referer": "https://news.example.org/story?id=1",
+            "CloudFront-Viewer-Country": "SI",
+            "Cookie": "vid=123",
+        })
+        assert event["code"] == "abc12"
+        assert event["target"] == 1
+        assert event["url"] == "https://b.com"
+        assert event["country"] == "SI"
+        assert event["device"] == "desktop"
+        assert event["referer"] == "news.example.org"
+        assert set(event) == {"ts", "code", "target", "url", "country", "device", "referer"}
+
+    def test_missing_headers(self):
+        event = visit_event("abc12", 0, "https://a.com", None)
+        assert event["country"] is None and event["referer"] is None
+        assert event["device"] == "unknown"
+
+
+# ---------------------------------------------------------------------------
+# TestEventStream
+# ---------------------------------------------------------------------------
+
+class TestEventStream:
+    def test_flush_hands_batch_to_sink(self):
+        batches = []
+        stream = EventStream(batches.append, max_pending=100, flush_interval=60)
+        stream.record({"n": 1})
+        stream.record({"n": 2})
+        assert batches == []
+        stream.flush()
+        assert batches == [[{"n": 1}, {"n": 2}]]
+        assert stream.pending() == 0
+        assert stream.flushed == 2
+
+    def test_full_batch_wakes_the_flusher(self):
+        flushed = threading.Event()
+        stream = EventStream(lambda events: flushed.set(), max_pending=3, flush_interval=60)
+        for n in range(3):
+            stream.record({"n": n})
+        assert flushed.wait(timeout=5)
+        stream.close()
+
+    def test_events_beyond_max_buffer_are_dropped(self):
+        stream = EventStream(lambda events: None, max_pending=100, flush_interval=60, max_buffer=2)
+        for n in range(5):
+            stream.record({"n": n})
+        assert stream.pending() == 2
+        assert stream.dropped == 3
+
+    def test_failing_sink_drops_batch(self):
+        def fail(events):
+            raise OSError("disk full")
+
+        stream = EventStream(fail, flush_interval=60)
+        stream.record({"n": 1})
+        stream.flush()
+        assert stream.dropped == 1
+        assert stream.pending() == 0
+
+    def test_close_flushes_remaining_events(self):
+        batches = []
+        stream = EventStream(batches.append, flush_interval=60)
+        stream.record({"n": 1})
+        stream.close()
+        assert batches == [[{"n": 1}]]
+
+
+# ---------------------------------------------------------------------------
+# TestSinks
+# ---------------------------------------------------------------------------
+
+class TestSinks:
+    def test_json_lines_sink_writes_one_file_per_day(self, tmp_path):
+        sink = JsonLinesSink(str(tmp_path / "events"))
+        day_ms = 86_400_000
+        sink([{"ts": 0, "code": "a"}, {"ts": day_ms, "code": "b"}, {"ts": 1, "code": "c"}])
+        files = sorted(p.name for p in (tmp_path / "events").iterdir())
+        assert [f.rsplit("-", 1)[0] for f in files] == ["events-1970-01-01", "events-1970-01-02"]
+        first = (tmp_path / "events" / files[0]).read_text().splitlines()
+        assert [json.loads(line)["code"] for line in first] == ["a", "c"]
+
+    def test_stdout_sink_writes_json_lines(self, capsys):
+        stdout_sink([{"code": "a"}, {"code": "b"}])
+        assert [json.loads(line) for line in capsys.readouterr().out.splitlines()] == [{"code": "a"}, {"code": "b"}]
+
+    def test_load_sink(self, tmp_path):
+        assert load_sink("") is None
+        assert load_sink("stdout") is stdout_sink
+        assert isinstance(load_sink(f"file:{tmp_path}"), JsonLinesSink)
+        assert load_sink("json:dumps") is json.dumps
+
+    def test_load_sink_rejects_unknown_spec(self):
+        with pytest.raises(ValueError):
+            load_sink("kinesis")
+
+
+# ---------------------------------------------------------------------------
+# TestRedirectEvents
+# ---------------------------------------------------------------------------
+
+class TestRedirectEvents:
+    def test_redirect_records_a_visit_event(self, monkeypatch):
+        batches = []
+        monkeypatch.setattr(redirect, "_events", EventStream(batches.append, flush_interval=60))
+        redirect._storage = MemoryStorage()
+        redirect._storage.put_if_absent({"short_code": "abc12", "targets": [{"url": "https://a.com", "weight": 1}]})
+        redirect.handler({"pathParameters": {"short_code": "abc12"}, "headers": {"user-agent": "curl/8.0"}}, None)
+        redirect._events.flush()
+        (event,) = batches[0]
+        assert (event["code"], event["target"], event["url"], event["device"]) == ("abc12", 0, "https://a.com", "bot")
+
+
+# ---------------------------------------------------------------------------
+# TestReadEvents
+# ---------------------------------------------------------------------------
+
+class TestReadEvents:
+    def test_other_log_lines_are_skipped(self, tmp_path):
+        path = tmp_path / "log.jsonl"
+        path.write_text(MIXED_LOG)
+        assert [e["code"] for e in read_events([str(path)], "code")] == ["a", "a", "b"]
@@ -1,21 +1,30 @@
 import json
 import random
+import time
 from unittest.mock import MagicMock
 
 import pytest
 import generate_link
-from botocore.exceptions import ClientError
+import redirect
 from generate_link import (
     BASE62,
+    MAX_BULK_LINKS,
     MAX_RETRIES,
+    allocate_unique_codes,
     build_targets,
+    bulk_handler,
     generate_base62,
     handler,
     put_item,
     put_item_with_retry,
+    reserve_counter_block,
     response,
+    update_handler,
     validate_body,
 )
+from rate_limit import RateLimiter
+from storage import MemoryStorage, RetryableStorageError, StorageError
+from target_codec import unpack_targets
 
 
 # ---------------------------------------------------------------------------
@@ -159,6 +168,33 @@ class TestValidateBody:
         assert error is not None
         assert "1" in error
 
+    def test_valid_rules_return_none(self):
+        body = {
+            "urls": [{"original_url": "https://a.com", "weight": 1}, {"original_url": "https://m.com", "weight": 1}],
+            "rules": [{"device": ["mobile"], "weights": [0, 1]}],
+        }
+        assert validate_body(body) is None
+
+    def test_invalid_rules_return_error(self):
+        body = {"urls": [{"original_url": "https://a.com", "weight": 1}], "rules": [{"device": ["mobile"], "weights": [0, 1]}]}
+        assert "weights" in validate_body(body)
+
+    def test_rules_on_packed_links_return_error(self, monkeypatch):
+        monkeypatch.setattr(generate_link, "PACKED_TARGETS_THRESHOLD", 2)
+        body = {
+            "urls": [{"original_url": "https://a.com", "weight": 1}, {"original_url": "https://m.com", "weight": 1}],
+            "rules": [{"device": ["mobile"], "weights": [0, 1]}],
+        }
+        assert "fewer than 2" in validate_body(body)
+
+    def test_rules_on_links_too_large_for_one_item_return_error(self, monkeypatch):
+        monkeypatch.setattr(generate_link, "MAX_PLAIN_ITEM_BYTES", 1024)
+        body = {
+            "urls": [{"original_url": "https://a.com/" + "x" * 2000, "weight": 1}],
+            "rules": [{"device": ["mobile"], "weights": [1]}],
+        }
+        assert "under 1 KB" in validate_body(body)
+
 
 # ---------------------------------------------------------------------------
 # TestPutItem
@@ -166,41 +202,74 @@ class TestValidateBody:
 
 class TestPutItem:
     @pytest.fixture(autouse=True)
-    def mock_table(self):
-        generate_link._table = MagicMock()
-        yield generate_link._table
+    def mock_storage(self):
+        generate_link._storage = MagicMock()
+        generate_link._storage.put_if_absent.return_value = True
+        yield generate_link._storage
 
-    def test_calls_put_item_on_table(self, mock_table):
+    def test_calls_put_if_absent_on_storage(self, mock_storage):
         put_item("abc12", [{"url": "https://example.com", "weight": 1, "visits": 0}], 9999999999)
-        mock_table.put_item.assert_called_once()
+        mock_storage.put_if_absent.assert_called_once()
 
-    def test_put_item_called_with_correct_item(self, mock_table):
+    def test_put_if_absent_called_with_correct_item(self, mock_storage):
         targets = [{"url": "https://example.com", "weight": 1, "visits": 0}]
         put_item("abc12", targets, 9999999999)
-        call_kwargs = mock_table.put_item.call_args[1]
-        assert call_kwargs["Item"] == {"short_code": "abc12", "targets": targets, "expires_at": 9999999999}
+        item = mock_storage.put_if_absent.call_args[0][0]
+        assert item == {"short_code": "abc12", "targets": targets, "expires_at": 9999999999, "version": 1}
 
-    def test_raises_key_error_on_conditional_check_failure(self, mock_table):
-        mock_table.put_item.side_effect = ClientError(
-            {"Error": {"Code": "ConditionalCheckFailedException", "Message": "already exists"}},
-            "PutItem",
-        )
+    def test_raises_key_error_when_code_exists(self, mock_storage):
+        mock_storage.put_if_absent.return_value = False
         with pytest.raises(KeyError):
             put_item("abc12", [], 9999999999)
 
-    def test_two_different_codes_can_be_stored(self, mock_table):
+    def test_two_different_codes_can_be_stored(self, mock_storage):
         put_item("aaaaa", [], 9999999999)
         put_item("bbbbb", [], 9999999999)
-        assert mock_table.put_item.call_count == 2
+        assert mock_storage.put_if_absent.call_count == 2
 
-    def test_other_client_error_is_not_swallowed(self, mock_table):
-        mock_table.put_item.side_effect = ClientError(
-            {"Error": {"Code": "ProvisionedThroughputExceededException", "Message": "throttled"}},
-            "PutItem",
-        )
-        with pytest.raises(ClientError):
+    def test_other_storage_error_is_not_swallowed(self, mock_storage):
+        mock_storage.put_if_absent.side_effect = RetryableStorageError("ProvisionedThroughputExceededException")
+        with pytest.raises(RetryableStorageError):
+            put_item("abc12", [], 9999999999)
+
+    def test_existing_item_in_memory_storage_collides(self):
+        generate_link._storage = MemoryStorage()
+        put_item("abc12", [], 9999999999)
+        with pytest.raises(KeyError):
             put_item("abc12", [], 9999999999)
 
+    def test_large_link_is_stored_packed(self, monkeypatch):
+        monkeypatch.setattr(generate_link, "PACKED_TARGETS_THRESHOLD", 3)
+        generate_link._storage = MemoryStorage()
+        targets = [{"url": f"https://{i}.com", "weight": 1, "visits": 0} for i in range(3)]
+        put_item("abc12", targets, 9999999999)
+        primary = generate_link._storage.get("abc12")
+        assert primary["format"] == "packed"
+        assert "targets" not in primary
+        assert unpack_targets([generate_link._storage.get("abc12~0")]) == [{**t, "weight": 1.0} for t in targets]
+
+    def test_link_too_large_for_one_item_is_stored_packed(self, monkeypatch):
+        monkeypatch.setattr(generate_link, "MAX_PLAIN_ITEM_BYTES", 10 * 1024)
+        generate_link._storage = MemoryStorage()
+        targets = [{"url": f"https://{i}.com/" + "x" * 5000, "weight": 1, "visits": 0} for i in range(3)]
+        put_item("abc12", targets, 9999999999)
+        primary = generate_link._storage.get("abc12")
+        assert primary["format"] == "packed"
+        assert primary["count"] == 3
+
+    def test_packed_collision_writes_no_shards(self, mock_storage, monkeypatch):
+        monkeypatch.setattr(generate_link, "PACKED_TARGETS_THRESHOLD", 1)
+        mock_storage.put_if_absent.return_value = False
+        with pytest.raises(KeyError):
+            put_item("abc12", [{"url": "https://a.com", "weight": 1, "visits": 0}], 9999999999)
+        mock_storage.batch_put.assert_not_called()
+
+    def test_unwritten_shard_raises(self, mock_storage, monkeypatch):
+        monkeypatch.setattr(generate_link, "PACKED_TARGETS_THRESHOLD", 1)
+        mock_storage.batch_put.side_effect = lambda items: items
+        with pytest.raises(RuntimeError):
+            put_item("abc12", [{"url": "https://a.com", "weight": 1, "visits": 0}], 9999999999)
+
 
 # ---------------------------------------------------------------------------
 # TestPutItemWithRetry
@@ -208,68 +277,42 @@ class TestPutItem:
 
 class TestPutItemWithRetry:
     @pytest.fixture(autouse=True)
-    def mock_table(self):
-        generate_link._table = MagicMock()
-        yield generate_link._table
+    def mock_storage(self):
+        generate_link._storage = MagicMock()
+        generate_link._storage.put_if_absent.return_value = True
+        yield generate_link._storage
 
-    def test_success_on_first_attempt(self, mock_table):
+    def test_success_on_first_attempt(self, mock_storage):
         code = put_item_with_retry("hello", [], 9999999999)
         assert code == "hello"
-        mock_table.put_item.assert_called_once()
+        mock_storage.put_if_absent.assert_called_once()
 
-    def test_success_after_one_collision(self, monkeypatch, mock_table):
+    def test_success_after_one_collision(self, monkeypatch, mock_storage):
         codes = iter(["second"])
         monkeypatch.setattr(generate_link, "generate_base62", lambda: next(codes))
-
-        call_count = {"n": 0}
-
-        def side_effect(**kwargs):
-            call_count["n"] += 1
-            if call_count["n"] == 1:
-                raise ClientError(
-                    {"Error": {"Code": "ConditionalCheckFailedException", "Message": ""}},
-                    "PutItem",
-                )
-
-        mock_table.put_item.side_effect = side_effect
+        mock_storage.put_if_absent.side_effect = [False, True]
         code = put_item_with_retry("first", [], 9999999999)
         assert code == "second"
 
-    def test_success_after_four_collisions(self, monkeypatch, mock_table):
-        call_count = {"n": 0}
-
-        def side_effect(**kwargs):
-            call_count["n"] += 1
-            if call_count["n"] < 5:
-                raise ClientError(
-                    {"Error": {"Code": "ConditionalCheckFailedException", "Message": ""}},
-                    "PutItem",
-                )
-
-        mock_table.put_item.side_effect = side_effect
+    def test_success_after_four_collisions(self, monkeypatch, mock_storage):
+        mock_storage.put_if_absent.side_effect = [False, False, False, False, True]
         code = put_item_with_retry("code0", [], 9999999999)
         assert isinstance(code, str)
         assert len(code) > 0
 
-    def test_raises_runtime_error_after_max_retries(self, monkeypatch, mock_table):
-        mock_table.put_item.side_effect = ClientError(
-            {"Error": {"Code": "ConditionalCheckFailedException", "Message": ""}},
-            "PutItem",
-        )
+    def test_raises_runtime_error_after_max_retries(self, monkeypatch, mock_storage):
+        mock_storage.put_if_absent.return_value = False
         with pytest.raises(RuntimeError):
             put_item_with_retry("code0", [], 9999999999)
 
-    def test_generate_base62_called_once_per_collision(self, monkeypatch, mock_table):
+    def test_generate_base62_called_once_per_collision(self, monkeypatch, mock_storage):
         gen_calls = {"n": 0}
 
         def counting_gen():
             gen_calls["n"] += 1
             return "newcode"
 
-        mock_table.put_item.side_effect = ClientError(
-            {"Error": {"Code": "ConditionalCheckFailedException", "Message": ""}},
-            "PutItem",
-        )
+        mock_storage.put_if_absent.return_value = False
         monkeypatch.setattr(generate_link, "generate_base62", counting_gen)
         with pytest.raises(RuntimeError):
             put_item_with_retry("start", [], 9999999999)
@@ -318,9 +361,9 @@ class TestHandler:
     }
 
     @pytest.fixture(autouse=True)
-    def mock_table(self):
-        generate_link._table = MagicMock()
-        yield generate_link._table
+    def memory_storage(self):
+        generate_link._storage = MemoryStorage()
+        yield generate_link._storage
 
     def test_success_returns_201(self):
         result = handler(self._valid_event, None)
@@ -345,9 +388,19 @@ class TestHandler:
         assert body["targets"][0]["url"] == "https://example.com"
         assert body["targets"][0]["visits"] == 0
 
-    def test_success_put_item_called(self, mock_table):
-        handler(self._valid_event, None)
-        mock_table.put_item.assert_called_once()
+    def test_success_item_is_stored(self, memory_storage):
+        result = handler(self._valid_event, None)
+        code = json.loads(result["body"])["short_code"]
+        item = memory_storage.get(code)
+        assert item["targets"][0]["url"] == "https://example.com"
+
+    def test_storage_error_returns_500(self, memory_storage, monkeypatch):
+        def unavailable(*args, **kwargs):
+            raise StorageError("ValidationException")
+
+        monkeypatch.setattr(memory_storage, "put_if_absent", unavailable)
+        result = handler(self._valid_event, None)
+        assert result["statusCode"] == 500
 
     def test_success_multiple_urls_all_targets_present(self):
         event = {
@@ -409,7 +462,7 @@ class TestHandler:
         monkeypatch.setattr(
             generate_link,
             "put_item_with_retry",
-            lambda code, targets, expires_at: (_ for _ in ()).throw(RuntimeError("exhausted")),
+            lambda code, targets, expires_at, rules=None, edit_key_hash=None: (_ for _ in ()).throw(RuntimeError("exhausted")),
         )
         result = handler(self._valid_event, None)
         assert result["statusCode"] == 500
@@ -418,8 +471,567 @@ class TestHandler:
         monkeypatch.setattr(
             generate_link,
             "put_item_with_retry",
-            lambda code, targets, expires_at: (_ for _ in ()).throw(RuntimeError("exhausted")),
+            lambda code, targets, expires_at, rules=None, edit_key_hash=None: (_ for _ in ()).throw(RuntimeError("exhausted")),
         )
         # Should not raise
         result = handler(self._valid_event, None)
         assert isinstance(result, dict)
+
+
+
+# ---------------------------------------------------------------------------
+# TestIdempotentHandler
+# ---------------------------------------------------------------------------
+
+class TestIdempotentHandler:
+    @pytest.fixture(autouse=True)
+    def memory_storage(self):
+        generate_link._storage = MemoryStorage()
+        yield generate_link._storage
+
+    @staticmethod
+    def _event(urls=None, headers=None, idempotent=True):
+        urls = urls or [{"original_url": "https://a.com", "weight": 60}, {"original_url": "https://b.com", "weight": 40}]
+        return {"body": json.dumps({"urls": urls, "idempotent": idempotent}), "headers": headers or {}}
+
+    def test_repeat_returns_existing_code_with_200(self):
+        first = handler(self._event(), None)
+        second = handler(self._event(), None)
+        assert first["statusCode"] == 201
+        assert second["statusCode"] == 200
+        assert json.loads(first["body"])["short_code"] == json.loads(second["body"])["short_code"]
+
+    def test_hit_costs_one_lookup_and_no_write(self, memory_storage, monkeypatch):
+        handler(self._event(), None)
+        monkeypatch.setattr(memory_storage, "put_if_absent", MagicMock(side_effect=AssertionError))
+        get = MagicMock(wraps=memory_storage.get)
+        monkeypatch.setattr(memory_storage, "get", get)
+        assert handler(self._event(), None)["statusCode"] == 200
+        assert get.call_count == 1
+
+    def test_order_and_weight_scale_do_not_matter(self):
+        first = handler(self._event(), None)
+        reordered = [{"original_url": "https://b.com", "weight": 2}, {"original_url": "https://a.com", "weight": 3}]
+        second = handler(self._event(reordered), None)
+        assert json.loads(first["body"])["short_code"] == json.loads(second["body"])["short_code"]
+
+    def test_different_weights_create_new_link(self):
+        first = handler(self._event(), None)
+        other = [{"original_url": "https://a.com", "weight": 50}, {"original_url": "https://b.com", "weight": 50}]
+        second = handler(self._event(other), None)
+        assert second["statusCode"] == 201
+        assert json.loads(first["body"])["short_code"] != json.loads(second["body"])["short_code"]
+
+    def test_idempotency_key_header_opts_in_and_separates(self):
+        first = handler(self._event(idempotent=False, headers={"Idempotency-Key": "k1"}), None)
+        again = handler(self._event(idempotent=False, headers={"idempotency-key": "k1"}), None)
+        other = handler(self._event(idempotent=False, headers={"Idempotency-Key": "k2"}), None)
+        codes = [json.loads(r["body"])["short_code"] for r in (first, again, other)]
+        assert codes[0] == codes[1] != codes[2]
+
+    def test_without_opt_in_every_call_creates_a_link(self):
+        first = handler(self._event(idempotent=False), None)
+        second = handler(self._event(idempotent=False), None)
+        assert second["statusCode"] == 201
+        assert json.loads(first["body"])["short_code"] != json.loads(second["body"])["short_code"]
+
+    def test_expired_entry_is_replaced(self, memory_storage):
+        first = json.loads(handler(self._event(), None)["body"])["short_code"]
+        key = generate_link.dedup_key(build_targets(json.loads(self._event()["body"])["urls"]))
+        memory_storage.update(key, {"expires_at": 1})
+        second = handler(self._event(), None)
+        assert second["statusCode"] == 201
+        assert json.loads(second["body"])["short_code"] != first
+        assert memory_storage.get(key)["link"] == json.loads(second["body"])["short_code"]
+
+    def test_concurrent_requests_converge(self, memory_storage, monkeypatch):
+        # Another request claims the same target set while this one is creating its link.
+        put = generate_link.put_item_with_retry
+
+        def racing_put(code, targets, expires_at, rules=None, edit_key_hash=None):
+            key = generate_link.dedup_key(targets)
+            memory_storage.put_if_absent({"short_code": key, "link": "other", "expires_at": expires_at})
+            return put(code, targets, expires_at)
+
+        monkeypatch.setattr(generate_link, "put_item_with_retry", racing_put)
+        result = handler(self._event(), None)
+        assert result["statusCode"] == 200
+        assert json.loads(result["body"])["short_code"] == "other"
+
+    def test_dedup_entries_cannot_be_redirected(self, memory_storage):
+        handler(self._event(), None)
+        key = next(k for k in memory_storage._items if k.startswith(generate_link.DEDUP_PREFIX))
+        redirect._storage = memory_storage
+        assert redirect.handler({"pathParameters": {"short_code": key}}, None)["statusCode"] == 404
+
+
+# ---------------------------------------------------------------------------
+# TestRateLimitedHandler
+# ---------------------------------------------------------------------------
+
+class TestRateLimitedHandler:
+    @pytest.fixture(autouse=True)
+    def limiter(self, monkeypatch):
+        generate_link._storage = MemoryStorage()
+        limiter = RateLimiter(0.5, 2, lambda: MemoryStorage(), sync_interval=3600)
+        monkeypatch.setattr(generate_link, "_rate_limiter", limiter)
+        yield limiter
+
+    @staticmethod
+    def _event(ip="203.0.113.7"):
+        return {
+            "body": json.dumps({"urls": [{"original_url": "https://example.com", "weight": 1}]}),
+            "requestContext": {"http": {"sourceIp": ip}},
+        }
+
+    def test_over_the_limit_gets_429_with_retry_after(self):
+        assert [handler(self._event(), None)["statusCode"] for _ in range(2)] == [201, 201]
+        result = handler(self._event(), None)
+        assert result["statusCode"] == 429
+        assert result["headers"]["Retry-After"] == "2"
+        assert json.loads(result["body"])["retry_after"] == 2
+
+    def test_clients_are_limited_separately(self):
+        for _ in range(3):
+            handler(self._event(), None)
+        assert handler(self._event("198.51.100.1"), None)["statusCode"] == 201
+
+    def test_rejected_before_any_storage_call(self, limiter, monkeypatch):
+        limiter._blocked["ip:203.0.113.7"] = time.time() + 60
+        monkeypatch.setattr(generate_link, "_get_storage", lambda: pytest.fail("storage touched"))
+        monkeypatch.setattr(generate_link, "_get_counter_storage", lambda: pytest.fail("storage touched"))
+        assert handler({**self._event(), "body": "{oops"}, None)["statusCode"] == 429
+
+    def test_bulk_requests_take_a_token_per_link(self, monkeypatch):
+        links = [{"urls": [{"original_url": f"https://{i}.com", "weight": 1}]} for i in range(2)]
+        event = {"body": json.dumps({"links": links}), "requestContext": {"http": {"sourceIp": "203.0.113.7"}}}
+        assert bulk_handler(event, None)["statusCode"] == 201
+        monkeypatch.setattr(generate_link, "_get_storage", lambda: pytest.fail("storage touched"))
+        result = bulk_handler(event, None)
+        assert result["statusCode"] == 429
+        assert handler(self._event(), None)["statusCode"] == 429
+
+
+@pytest.fixture
+def memory_storage():
+    generate_link._storage = MemoryStorage()
+    yield generate_link._storage
+
+
+# ---------------------------------------------------------------------------
+# TestUpdateHandler
+# ---------------------------------------------------------------------------
+
+class TestUpdateHandler:
+    @pytest.fixture(autouse=True)
+    def memory_storage(self):
+        generate_link._storage = MemoryStorage()
+        yield generate_link._storage
+
+    @pytest.fixture(autouse=True)
+    def reset_edit_keys(self):
+        self.edit_keys = {}
+
+    def _create(self, urls=None, **extra):
+        urls = urls or [{"original_url": "https://a.com", "weight": 90}, {"original_url": "https://b.com", "weight": 10}]
+        result = handler({"body": json.dumps({"urls": urls, **extra}), "headers": {}}, None)
+        body = json.loads(result["body"])
+        if "edit_key" in body:
+            self.edit_keys[body["short_code"]] = body["edit_key"]
+        return body["short_code"]
+
+    def _event(self, code, body, edit_key=None):
+        edit_key = edit_key or self.edit_keys.get(code, "unknown")
+        return {
+            "pathParameters": {"short_code": code},
+            "headers": {"Authorization": f"Bearer {edit_key}"},
+            "body": json.dumps(body),
+        }
+
+    def _patch(self, code, urls=None, version=1, edit_key=None):
+        urls = urls or [{"original_url": "https://a.com", "weight": 50}, {"original_url": "https://b.com", "weight": 50}]
+        result = update_handler(self._event(code, {"urls": urls, "version": version}, edit_key), None)
+        return result["statusCode"], json.loads(result["body"])
+
+    def test_created_links_start_at_version_1(self, memory_storage):
+        code = self._create()
+        assert memory_storage.get(code)["version"] == 1
+
+    def test_only_the_edit_key_hash_is_stored(self, memory_storage):
+        code = self._create()
+        edit_key = self.edit_keys[code]
+        item = memory_storage.get(code)
+        assert item["edit_key_hash"] == generate_link.hash_edit_key(edit_key)
+        assert edit_key not in json.dumps(item)
+
+    def test_missing_edit_key_returns_401_without_reading_storage(self, monkeypatch):
+        monkeypatch.setattr(generate_link, "_get_storage", lambda: pytest.fail("storage touched"))
+        for headers in ({}, {"Authorization": "Basic abc"}, {"authorization": "Bearer "}):
+            event = {**self._event("abc12", {}), "headers": headers}
+            result = update_handler(event, None)
+            assert result["statusCode"] == 401
+            assert result["headers"]["WWW-Authenticate"] == "Bearer"
+
+    def test_wrong_edit_key_returns_403(self, memory_storage):
+        code = self._create()
+        other = self._create()
+        assert self._patch(code, edit_key=self.edit_keys[other])[0] == 403
+        assert memory_storage.get(code)["version"] == 1
+
+    def test_links_without_an_edit_key_cannot_be_updated(self, memory_storage):
+        memory_storage.put_if_absent(generate_link.link_item("old00", [{"url": "https://a.com", "weight": 1}], 9999999999))
+        assert self._patch("old00", edit_key="anything")[0] == 403
+
+    def test_duplicates_do_not_return_the_edit_key(self):
+        first = handler({"body": json.dumps({"urls": [{"original_url": "https://a.com", "weight": 1}]}),
+                         "headers": {"Idempotency-Key": "k"}}, None)
+        again = handler({"body": json.dumps({"urls": [{"original_url": "https://a.com", "weight": 1}]}),
+                         "headers": {"Idempotency-Key": "k"}}, None)
+        assert "edit_key" in json.loads(first["body"])
+        assert again["statusCode"] == 200
+        assert "edit_key" not in json.loads(again["body"])
+
+    def test_update_replaces_weights_and_bumps_version(self, memory_storage):
+        code = self._create()
+        status, body = self._patch(code)
+        assert status == 200
+        assert body["version"] == 2
+        item = memory_storage.get(code)
+        assert item["version"] == 2
+        assert [t["weight"] for t in item["targets"]] == [50, 50]
+
+    def test_stale_version_is_rejected_with_current_version(self, memory_storage):
+        code = self._create()
+        self._patch(code)
+        status, body = self._patch(code, version=1)
+        assert status == 409
+        assert body["version"] == 2
+        assert memory_storage.get(code)["version"] == 2
+
+    def test_concurrent_update_is_rejected(self, memory_storage, monkeypatch):
+        code = self._create()
+        read = generate_link.current_targets
+
+        def racing_read(short_code, item):
+            memory_storage.update(short_code, {"version": 2})
+            return read(short_code, item)
+
+        monkeypatch.setattr(generate_link, "current_targets", racing_read)
+        status, body = self._patch(code)
+        assert status == 409
+        assert body["version"] == 2
+
+    def test_visits_of_kept_urls_are_carried_over(self, memory_storage):
+        code = self._create()
+        memory_storage.increment(code, {"targets[0].visits": 7, "targets[1].visits": 3})
+        urls = [{"original_url": "https://c.com", "weight": 1}, {"original_url": "https://a.com", "weight": 1}]
+        self._patch(code, urls)
+        assert [(t["url"], t["visits"]) for t in memory_storage.get(code)["targets"]] == [
+            ("https://c.com", 0), ("https://a.com", 7),
+        ]
+
+    def test_unknown_expired_and_internal_codes_return_404(self, memory_storage):
+        code = self._create()
+        memory_storage.update(code, {"expires_at": 1})
+        assert self._patch(code)[0] == 404
+        assert self._patch("nope0")[0] == 404
+        assert self._patch(f"{code}~0")[0] == 404
+
+    @pytest.mark.parametrize("body", [
+        {"urls": [{"original_url": "https://a.com", "weight": 1}]},
+        {"urls": [{"original_url": "https://a.com", "weight": 1}], "version": True},
+        {"urls": [{"original_url": "https://a.com", "weight": 1}], "version": 0},
+        {"urls": [], "version": 1},
+        [],
+    ])
+    def test_invalid_body_returns_400(self, body):
+        result = update_handler(self._event("abc12", body), None)
+        assert result["statusCode"] == 400
+
+    def test_link_can_become_packed_and_back(self, memory_storage, monkeypatch):
+        monkeypatch.setattr(generate_link, "PACKED_TARGETS_THRESHOLD", 3)
+        code = self._create()
+        many = [{"original_url": f"https://{i}.com", "weight": 1} for i in range(4)]
+        assert self._patch(code, many)[0] == 200
+        primary = memory_storage.get(code)
+        assert primary["format"] == "packed" and "targets" not in primary
+        assert memory_storage.get(f"{code}~2.0") is not None
+
+        assert self._patch(code, version=2)[0] == 200
+        primary = memory_storage.get(code)
+        assert "format" not in primary and "shards" not in primary
+        assert [t["url"] for t in primary["targets"]] == ["https://a.com", "https://b.com"]
+
+    def test_packed_update_keeps_visits_from_shards(self, memory_storage, monkeypatch):
+        monkeypatch.setattr(generate_link, "PACKED_TARGETS_THRESHOLD", 3)
+        many = [{"original_url": f"https://{i}.com", "weight": 1} for i in range(4)]
+        code = self._create(many)
+        memory_storage.increment(f"{code}~0", {"visits[2]": 5})
+        self._patch(code, [{"original_url": "https://2.com", "weight": 1}])
+        assert memory_storage.get(code)["targets"] == [{"url": "https://2.com", "weight": 1, "visits": 5}]
+
+    def test_live_replicas_are_rewritten(self, memory_storage):
+        code = self._create()
+        redirect._storage = memory_storage
+        redirect.replicate_link(code)
+        self._patch(code)
+        replica = memory_storage.get(f"{code}#1")
+        assert replica["version"] == 2
+        assert [t["weight"] for t in replica["targets"]] == [50, 50]
+
+    def test_replication_after_the_update_read_is_synced(self, memory_storage, monkeypatch):
+        code = self._create()
+        redirect._storage = memory_storage
+        read = generate_link.current_targets
+
+        def replicating_read(short_code, item):
+            redirect.replicate_link(short_code)
+            return read(short_code, item)
+
+        monkeypatch.setattr(generate_link, "current_targets", replicating_read)
+        assert self._patch(code)[0] == 200
+        assert memory_storage.get(code)["replicas"] == redirect.HOT_KEY_REPLICAS
+        assert memory_storage.get(f"{code}#1")["version"] == 2
+
+    def test_replicas_are_dropped_when_they_cannot_be_rewritten(self, memory_storage, monkeypatch):
+        code = self._create()
+        redirect._storage = memory_storage
+        redirect.replicate_link(code)
+        monkeypatch.setattr(memory_storage, "batch_put", lambda items: items)
+        assert self._patch(code)[0] == 200
+        primary = memory_storage.get(code)
+        assert primary["version"] == 2
+        assert "replicas" not in primary and "replica_until" not in primary
+
+    def test_updated_link_is_no_longer_a_duplicate(self):
+        code = self._create(idempotent=True)
+        self._patch(code)
+        assert self._create(idempotent=True) != code
+
+    def test_rules_are_stored_and_replaced(self, memory_storage):
+        rules = [{"country": ["de"], "weights": [0, 1]}]
+        code = self._create(rules=rules)
+        assert memory_storage.get(code)["rules"] == [{"country": ["DE"], "weights": [0, 1]}]
+        urls = [{"original_url": "https://a.com", "weight": 1}, {"original_url": "https://b.com", "weight": 1}]
+        result = update_handler(self._event(code, {"urls": urls, "version": 1}), None)
+        assert "rules" not in json.loads(result["body"])
+        assert "rules" not in memory_storage.get(code)
+
+    def test_duplicates_are_told_apart_by_rules(self):
+        rules = [{"device": ["mobile"], "weights": [0, 1]}]
+        plain = self._create(idempotent=True)
+        with_rules = self._create(idempotent=True, rules=rules)
+        assert with_rules != plain
+        assert self._create(idempotent=True, rules=rules) == with_rules
+
+
+# ---------------------------------------------------------------------------
+# TestAllocateUniqueCodes
+# ---------------------------------------------------------------------------
+
+class TestAllocateUniqueCodes:
+    def test_returns_requested_number_of_distinct_codes(self, memory_storage):
+        codes = allocate_unique_codes(250)
+        assert len(codes) == 250
+        assert len(set(codes)) == 250
+
+    def test_existing_codes_are_redrawn(self, monkeypatch, memory_storage):
+        memory_storage.put_if_absent({"short_code": "taken"})
+        draws = iter(["taken", "fresh"])
+        monkeypatch.setattr(generate_link, "generate_base62", lambda: next(draws))
+        assert allocate_unique_codes(1) == ["fresh"]
+
+    def test_excluded_codes_are_redrawn(self, monkeypatch, memory_storage):
+        draws = iter(["mine0", "fresh"])
+        monkeypatch.setattr(generate_link, "generate_base62", lambda: next(draws))
+        assert allocate_unique_codes(1, {"mine0"}) == ["fresh"]
+
+    def test_gives_up_after_max_retries(self, monkeypatch, memory_storage):
+        memory_storage.put_if_absent({"short_code": "taken"})
+        monkeypatch.setattr(generate_link, "generate_base62", lambda: "taken")
+        assert allocate_unique_codes(1) == [None]
+
+    def test_collision_check_is_one_batch_get_per_round(self):
+        generate_link._storage = MagicMock()
+        generate_link._storage.batch_get.return_value = {}
+        allocate_unique_codes(300)
+        generate_link._storage.batch_get.assert_called_once()
+
+
+# ---------------------------------------------------------------------------
+# TestBulkHandler
+# ---------------------------------------------------------------------------
+
+class TestBulkHandler:
+    def _event(self, links):
+        return {"body": json.dumps({"links": links})}
+
+    def test_rules_are_stored_per_link(self, memory_storage):
+        urls = [{"original_url": "https://a.com", "weight": 1}, {"original_url": "https://m.com", "weight": 1}]
+        links = [{"urls": urls, "rules": [{"hours": [22, 6], "weights": [1, 0]}]}, {"urls": urls}]
+        results = json.loads(bulk_handler(self._event(links), None)["body"])["results"]
+        assert results[0]["rules"] == [{"hours": [22, 6], "weights": [1, 0]}]
+        assert memory_storage.get(results[0]["short_code"])["rules"] == results[0]["rules"]
+        assert "rules" not in memory_storage.get(results[1]["short_code"])
+
+    def test_all_valid_returns_201_with_results_in_order(self, memory_storage):
+        links = [
+            {"urls": [{"original_url": "https://a.com", "weight": 1}]},
+            {"urls": [{"original_url": "https://b.com", "weight": 1}]},
+        ]
+        result = bulk_handler(self._event(links), None)
+        assert result["statusCode"] == 201
+        results = json.loads(result["body"])["results"]
+        assert [r["targets"][0]["url"] for r in results] == ["https://a.com", "https://b.com"]
+        assert all(r["short_url"] == f"https://short.ly/{r['short_code']}" for r in results)
+
+    def test_written_items_match_results(self, memory_storage):
+        links = [{"urls": [{"original_url": f"https://{i}.com", "weight": 1}]} for i in range(60)]
+        results = json.loads(bulk_handler(self._event(links), None)["body"])["results"]
+        assert len({r["short_code"] for r in results}) == 60
+        for r in results:
+            assert memory_storage.get(r["short_code"])["targets"] == r["targets"]
+
+    def test_each_link_gets_its_own_edit_key(self, memory_storage):
+        links = [{"urls": [{"original_url": f"https://{i}.com", "weight": 1}]} for i in range(3)]
+        results = json.loads(bulk_handler(self._event(links), None)["body"])["results"]
+        assert len({r["edit_key"] for r in results}) == 3
+        for r in results:
+            assert memory_storage.get(r["short_code"])["edit_key_hash"] == generate_link.hash_edit_key(r["edit_key"])
+
+    def test_large_links_are_stored_packed(self, memory_storage, monkeypatch):
+        monkeypatch.setattr(generate_link, "PACKED_TARGETS_THRESHOLD", 2)
+        links = [
+            {"urls": [{"original_url": "https://a.com", "weight": 1}]},
+            {"urls": [{"original_url": "https://b.com", "weight": 1}, {"original_url": "https://c.com", "weight": 1}]},
+        ]
+        results = json.loads(bulk_handler(self._event(links), None)["body"])["results"]
+        assert "targets" in memory_storage.get(results[0]["short_code"])
+        assert memory_storage.get(results[1]["short_code"])["format"] == "packed"
+        assert memory_storage.get(results[1]["short_code"] + "~0") is not None
+
+    def test_unwritten_shard_fails_its_link(self, monkeypatch):
+        monkeypatch.setattr(generate_link, "PACKED_TARGETS_THRESHOLD", 1)
+        generate_link._storage = MagicMock()
+        generate_link._storage.batch_get.return_value = {}
+        generate_link._storage.batch_put.side_effect = lambda items: [i for i in items if "~" in i["short_code"]]
+        links = [{"urls": [{"original_url": "https://a.com", "weight": 1}]}]
+        results = json.loads(bulk_handler(self._event(links), None)["body"])["results"]
+        assert "error" in results[0]
+
+    def test_invalid_entry_reports_error_at_its_index(self, memory_storage):
+        links = [
+            {"urls": [{"original_url": "https://a.com", "weight": 1}]},
+            {"urls": []},
+            "not-an-object",
+        ]
+        result = bulk_handler(self._event(links), None)
+        assert result["statusCode"] == 207
+        results = json.loads(result["body"])["results"]
+        assert "short_code" in results[0]
+        assert "urls" in results[1]["error"]
+        assert "error" in results[2]
+        assert len(memory_storage._items) == 1
+
+    def test_unwritten_entry_reports_error(self):
+        generate_link._storage = MagicMock()
+        generate_link._storage.batch_get.return_value = {}
+        generate_link._storage.batch_put.side_effect = lambda items: items
+        links = [{"urls": [{"original_url": "https://a.com", "weight": 1}]}]
+        result = bulk_handler(self._event(links), None)
+        assert result["statusCode"] == 207
+        assert "error" in json.loads(result["body"])["results"][0]
+
+    def test_storage_failure_returns_500(self):
+        generate_link._storage = MagicMock()
+        generate_link._storage.batch_get.side_effect = RetryableStorageError("throttled")
+        links = [{"urls": [{"original_url": "https://a.com", "weight": 1}]}]
+        result = bulk_handler(self._event(links), None)
+        assert result["statusCode"] == 500
+
+    def test_invalid_json_returns_400(self, memory_storage):
+        result = bulk_handler({"body": "not-json{{{"}, None)
+        assert result["statusCode"] == 400
+
+    def test_missing_links_returns_400(self, memory_storage):
+        result = bulk_handler({"body": json.dumps({})}, None)
+        assert result["statusCode"] == 400
+
+    def test_too_many_links_returns_400(self, memory_storage):
+        links = [{"urls": [{"original_url": "https://a.com", "weight": 1}]}] * (MAX_BULK_LINKS + 1)
+        result = bulk_handler(self._event(links), None)
+        assert result["statusCode"] == 400
+        assert len(memory_storage._items) == 0
+
+
+# ---------------------------------------------------------------------------
+# TestSequenceAllocation
+# ---------------------------------------------------------------------------
+
+class TestSequenceAllocation:
+    _valid_event = {
+        "body": json.dumps({"urls": [{"original_url": "https://example.com", "weight": 1}]})
+    }
+
+    @pytest.fixture(autouse=True)
+    def sequence_mode(self, monkeypatch):
+        monkeypatch.setattr(generate_link, "CODE_ALLOCATOR", "sequence")
+        monkeypatch.setenv("CODE_PERMUTATION_KEY", "test-key")
+        generate_link._storage = MagicMock()
+        generate_link._storage.put_if_absent.return_value = True
+        generate_link._counter_storage = MemoryStorage(key_name="name")
+        yield
+
+    def test_reserve_counter_block_returns_block_start(self):
+        assert reserve_counter_block(1000) == 0
+        assert reserve_counter_block(1000) == 1000
+        assert generate_link._counter_storage.get("short_code")["next_value"] == 2000
+
+    def test_handler_does_not_retry_or_draw_random_codes(self, monkeypatch):
+        monkeypatch.setattr(generate_link, "generate_base62", lambda: pytest.fail("random code drawn"))
+        result = handler(self._valid_event, None)
+        assert result["statusCode"] == 201
+        generate_link._storage.put_if_absent.assert_called_once()
+
+    def test_one_reservation_covers_many_links(self, monkeypatch):
+        calls = {"n": 0}
+        original = generate_link.reserve_counter_block
+
+        def counting_reserve(size):
+            calls["n"] += 1
+            return original(size)
+
+        monkeypatch.setattr(generate_link, "reserve_counter_block", counting_reserve)
+        codes = {json.loads(handler(self._valid_event, None)["body"])["short_code"] for _ in range(20)}
+        assert len(codes) == 20
+        assert calls["n"] == 1
+
+    def test_bulk_allocation_skips_codes_already_stored(self):
+        store = MemoryStorage()
+        generate_link._storage = store
+        taken = allocate_unique_codes(3)[1]
+        generate_link._allocator = None
+        generate_link._counter_storage = MemoryStorage(key_name="name")
+        store.put_if_absent({"short_code": taken, "targets": [{"url": "https://legacy.com", "weight": 1}]})
+        codes = allocate_unique_codes(3)
+        assert taken not in codes
+        assert None not in codes and len(set(codes)) == 3
+
+    def test_bulk_handler_does_not_overwrite_existing_links(self):
+        store = MemoryStorage()
+        generate_link._storage = store
+        taken = allocate_unique_codes(1)[0]
+        generate_link._allocator = None
+        generate_link._counter_storage = MemoryStorage(key_name="name")
+        store.put_if_absent({"short_code": taken, "targets": [{"url": "https://legacy.com", "weight": 1}]})
+        body = {"links": [{"urls": [{"original_url": "https://new.com", "weight": 1}]}]}
+        result = json.loads(bulk_handler({"body": json.dumps(body)}, None)["body"])
+        assert result["results"][0]["short_code"] != taken
+        assert store.get(taken)["targets"][0]["url"] == "https://legacy.com"
+
+    def test_collision_moves_on_to_the_next_sequence_code(self):
+        generate_link._storage.put_if_absent.side_effect = [False, True]
+        result = handler(self._valid_event, None)
+        assert result["statusCode"] == 201
+        first, second = (c[0][0]["short_code"] for c in generate_link._storage.put_if_absent.call_args_list)
+        assert json.loads(result["body"])["short_code"] == second != first
@@ -0,0 +1,137 @@
+import time
+
+import pytest
+from hot_keys import HotKeyDetector, make_replicas, replica_key, replicate, sync_replicas
+from storage import MemoryStorage, StorageError
+from target_codec import pack_link
+
+
+def _item(**extra):
+    return {
+        "short_code": "abc12",
+        "targets": [{"url": "https://a.com", "weight": 1, "visits": 3}],
+        **extra,
+    }
+
+
+# ---------------------------------------------------------------------------
+# TestMakeReplicas
+# ---------------------------------------------------------------------------
+
+class TestMakeReplicas:
+    def test_keys_are_numbered_from_one(self):
+        replicas = make_replicas(_item(), 3, replica_until=1000)
+        assert [r["short_code"] for r in replicas] == ["abc12#1", "abc12#2", "abc12#3"]
+        assert replica_key("abc12", 2) == "abc12#2"
+
+    def test_replicas_copy_targets(self):
+        replica = make_replicas(_item(), 1, replica_until=1000)[0]
+        assert replica["targets"] == _item()["targets"]
+        assert replica["replica_until"] == 1000
+
+    def test_link_expiry_is_carried_separately(self):
+        replica = make_replicas(_item(expires_at=5000), 1, replica_until=1000)[0]
+        assert replica["link_expires_at"] == 5000
+        assert replica["expires_at"] == 1000
+
+    def test_ttl_expiry_never_outlives_the_link(self):
+        replica = make_replicas(_item(expires_at=500), 1, replica_until=1000)[0]
+        assert replica["expires_at"] == 500
+
+    def test_replication_metadata_is_not_copied(self):
+        replica = make_replicas(_item(replicas=8, replica_until=1), 1, replica_until=1000)[0]
+        assert "replicas" not in replica
+        assert replica["replica_until"] == 1000
+
+    def test_edit_key_hash_is_not_copied(self):
+        replica = make_replicas(_item(edit_key_hash="0f" * 32), 1, replica_until=1000)[0]
+        assert "edit_key_hash" not in replica
+
+
+# ---------------------------------------------------------------------------
+# TestHotKeyDetector
+# ---------------------------------------------------------------------------
+
+class TestHotKeyDetector:
+    def test_fires_once_when_threshold_is_reached(self):
+        detector = HotKeyDetector(threshold=3, clock=lambda: 0.0)
+        assert [detector.record("abc12") for _ in range(5)] == [False, False, True, False, False]
+
+    def test_codes_are_counted_separately(self):
+        detector = HotKeyDetector(threshold=2, clock=lambda: 0.0)
+        assert detector.record("a") is False
+        assert detector.record("b") is False
+        assert detector.record("a") is True
+
+    def test_counts_reset_each_window(self):
+        now = [0.0]
+        detector = HotKeyDetector(threshold=2, window=10, clock=lambda: now[0])
+        detector.record("abc12")
+        now[0] = 11.0
+        assert detector.record("abc12") is False
+        assert detector.record("abc12") is True
+
+    def test_zero_threshold_disables_detection(self):
+        detector = HotKeyDetector(threshold=0)
+        assert not any(detector.record("abc12") for _ in range(100))
+
+
+# ---------------------------------------------------------------------------
+# TestReplicate
+# ---------------------------------------------------------------------------
+
+class TestReplicate:
+    @pytest.fixture
+    def store(self):
+        store = MemoryStorage()
+        store.put_if_absent(_item(expires_at=int(time.time()) + 86400))
+        return store
+
+    def test_writes_replicas_and_advertises_them(self, store):
+        replica_until = replicate(store, "abc12", 4, ttl=60)
+        assert replica_until == pytest.approx(time.time() + 60, abs=2)
+        primary = store.get("abc12")
+        assert primary["replicas"] == 4
+        assert primary["replica_until"] == replica_until
+        assert all(store.get(f"abc12#{k}")["targets"] == primary["targets"] for k in range(1, 5))
+
+    def test_packed_link_replicates_its_directory(self, store):
+        store.batch_put(pack_link({"short_code": "big00", "targets": _item()["targets"] * 3}))
+        assert replicate(store, "big00", 2, ttl=60) is not None
+        replica = store.get("big00#1")
+        assert replica["shards"] == store.get("big00")["shards"]
+        assert "packed" not in replica
+
+    def test_missing_link_is_not_replicated(self, store):
+        assert replicate(store, "nope0", 4, ttl=60) is None
+        assert store.get("nope0#1") is None
+
+    def test_update_during_replication_keeps_replicas_unadvertised(self, store):
+        batch_put = store.batch_put
+
+        def racing_batch_put(items):
+            unprocessed = batch_put(items)
+            store.update("abc12", {"version": 2})
+            return unprocessed
+
+        store.batch_put = racing_batch_put
+        assert replicate(store, "abc12", 2, ttl=60) is None
+        assert "replicas" not in store.get("abc12")
+
+    def test_sync_failure_raises(self, store):
+        replicate(store, "abc12", 2, ttl=60)
+        store.batch_put = lambda items: items
+        with pytest.raises(StorageError):
+            sync_replicas(store, store.get("abc12"))
+
+    def test_sync_rewrites_live_replicas(self, store):
+        replicate(store, "abc12", 2, ttl=60)
+        item = store.get("abc12")
+        item["targets"] = [{"url": "https://b.com", "weight": 1, "visits": 0}]
+        store.batch_put([item])
+        sync_replicas(store, item)
+        assert store.get("abc12#2")["targets"][0]["url"] == "https://b.com"
+
+    def test_sync_without_replicas_writes_nothing(self, store):
+        sync_replicas(store, store.get("abc12"))
+        assert store.get("abc12#1") is None
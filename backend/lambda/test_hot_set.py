@@ -0,0 +1,236 @@
+import json
+import threading
+import time
+
+import pytest
+import redirect
+from hot_set import (
+    FileSource,
+    HotSet,
+    TableSource,
+    build_links,
+    counts_from_events,
+    decode_snapshot,
+    encode_snapshot,
+    fit,
+    source_from_env,
+)
+from storage import MemoryStorage
+
+
+def _link(url="https://a.com", **extra):
+    return {"targets": [{"url": url, "weight": 1}], **extra}
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class StubLink:
+    def __init__(self, item):
+        self.item = item
+        self.expires_at = item.get("expires_at")
+
+
+# ---------------------------------------------------------------------------
+# TestSources
+# ---------------------------------------------------------------------------
+
+class TestSources:
+    @pytest.fixture(params=["table", "file"])
+    def source(self, request, tmp_path):
+        if request.param == "table":
+            return TableSource(MemoryStorage())
+        return FileSource(str(tmp_path / "hotset.bin"))
+
+    def test_empty_source_has_generation_zero(self, source):
+        assert source.generation() == 0
+        assert source.load() is None
+
+    def test_publish_increments_generation(self, source):
+        assert source.publish({"abc12": _link()}) == 1
+        assert source.publish({"abc12": _link("https://b.com")}) == 2
+        assert source.generation() == 2
+        snapshot = source.load()
+        assert snapshot["generation"] == 2
+        assert snapshot["links"]["abc12"]["targets"][0]["url"] == "https://b.com"
+
+    def test_snapshot_round_trips(self):
+        snapshot = {"generation": 3, "built_at": 1, "links": {"abc12": _link()}}
+        assert decode_snapshot(encode_snapshot(snapshot)) == snapshot
+
+    def test_source_from_env(self, monkeypatch):
+        monkeypatch.delenv("HOT_SET_SOURCE", raising=False)
+        assert source_from_env(MemoryStorage) is None
+        monkeypatch.setenv("HOT_SET_SOURCE", "table")
+        assert isinstance(source_from_env(MemoryStorage), TableSource)
+        monkeypatch.setenv("HOT_SET_SOURCE", "file:/tmp/hot.bin")
+        assert source_from_env(MemoryStorage).path == "/tmp/hot.bin"
+        monkeypatch.setenv("HOT_SET_SOURCE", "s3")
+        with pytest.raises(ValueError):
+            source_from_env(MemoryStorage)
+
+
+# ---------------------------------------------------------------------------
+# TestHotSet
+# ---------------------------------------------------------------------------
+
+class TestHotSet:
+    @pytest.fixture
+    def source(self):
+        source = TableSource(MemoryStorage())
+        source.publish({"abc12": _link(), "old00": _link(expires_at=1)})
+        return source
+
+    @pytest.fixture
+    def clock(self, source):
+        return FakeClock(source.load()["built_at"] + 1)
+
+    def _hot_set(self, source, clock, **kwargs):
+        hot = HotSet(source, lambda code, item: StubLink(item), clock=clock, **kwargs)
+        hot.refresh()
+        return hot
+
+    def test_serves_snapshot_links(self, source, clock):
+        hot = self._hot_set(source, clock)
+        assert hot.generation == 1
+        assert hot.get("abc12").item["targets"][0]["url"] == "https://a.com"
+        assert hot.get("nope0") is None
+
+    def test_links_are_built_once(self, source, clock):
+        hot = self._hot_set(source, clock)
+        assert hot.get("abc12") is hot.get("abc12")
+
+    def test_expired_links_are_not_served(self, source, clock):
+        assert self._hot_set(source, clock).get("old00") is None
+
+    def test_rejected_items_are_not_served(self, source, clock):
+        hot = HotSet(source, lambda code, item: None, clock=clock)
+        hot.refresh()
+        assert hot.get("abc12") is None
+
+    def test_old_snapshot_is_not_served(self, source, clock):
+        hot = self._hot_set(source, clock, max_age=60)
+        clock.now += 61
+        assert hot.get("abc12") is None
+
+    def test_refresh_loads_newer_generation_only(self, source, clock):
+        hot = self._hot_set(source, clock)
+        assert hot.refresh() is False
+        source.publish({"abc12": _link("https://b.com")})
+        assert hot.refresh() is True
+        assert hot.generation == 2
+        assert hot.get("abc12").item["targets"][0]["url"] == "https://b.com"
+
+    def test_unchanged_generation_reads_only_the_generation(self, source, clock, monkeypatch):
+        hot = self._hot_set(source, clock)
+        monkeypatch.setattr(source, "load", lambda: pytest.fail("snapshot reloaded"))
+        assert hot.refresh() is False
+
+    def test_maybe_refresh_runs_in_background_when_due(self, source, clock, monkeypatch):
+        hot = self._hot_set(source, clock, refresh_interval=60)
+        started = []
+        monkeypatch.setattr(threading.Thread, "start", lambda thread: started.append(thread))
+        hot.maybe_refresh()
+        assert started == []
+        clock.now += 61
+        hot.maybe_refresh()
+        hot.maybe_refresh()
+        assert len(started) == 1
+
+    def test_failed_background_refresh_keeps_current_snapshot(self, source, clock, monkeypatch):
+        hot = self._hot_set(source, clock)
+        monkeypatch.setattr(source, "generation", lambda: 1 / 0)
+        hot._refreshing.acquire()
+        hot._refresh_in_background()
+        assert hot.get("abc12") is not None
+        assert hot._refreshing.acquire(blocking=False)
+
+
+# ---------------------------------------------------------------------------
+# TestBuilding
+# ---------------------------------------------------------------------------
+
+class TestBuilding:
+    def test_counts_from_events(self, tmp_path):
+        path = tmp_path / "events.jsonl"
+        path.write_text("".join(json.dumps({"code": c}) + "\n" for c in ["a", "b", "a", "a"]) + "\n")
+        assert counts_from_events([str(path)]) == {"a": 3, "b": 1}
+
+    def test_counts_from_a_mixed_log(self, tmp_path):
+        path = tmp_path / "log.jsonl"
+        path.write_text("\n".join([
+            "START RequestId: 8f5c Version: $LATEST",
+            json.dumps({"code": "a"}),
+            json.dumps({"_aws": {"Timestamp": 1, "CloudWatchMetrics": []}, "cache_hits": 3}),
+            "2026-10-18T12:00:00.000Z " + json.dumps({"code": "a"}),
+            "{truncated",
+            json.dumps({"code": "b"}),
+            "REPORT RequestId: 8f5c Duration: 1.2 ms",
+        ]) + "\n")
+        assert counts_from_events([str(path)]) == {"a": 2, "b": 1}
+
+    def test_build_links_keeps_most_popular_live_links(self):
+        store = MemoryStorage()
+        future = int(time.time()) + 3600
+        store.batch_put([
+            {"short_code": "aaaaa", "targets": [{"url": "https://a.com", "weight": 2, "visits": 9}], "expires_at": future},
+            {"short_code": "bbbbb", "targets": [{"url": "https://b.com", "weight": 1, "visits": 0}]},
+            {"short_code": "old00", "targets": [{"url": "https://o.com", "weight": 1, "visits": 0}], "expires_at": 1},
+            {"short_code": "ccccc", "targets": [{"url": "https://c.com", "weight": 1, "visits": 0}]},
+        ])
+        store.update("aaaaa", {"version": 3})
+        links = build_links(store, {"aaaaa": 5, "bbbbb": 9, "old00": 7, "nope0": 6, "ccccc": 1}, size=4)
+        assert list(links) == ["bbbbb", "aaaaa"]
+        assert links["aaaaa"] == {"targets": [{"url": "https://a.com", "weight": 2}], "expires_at": future, "version": 3}
+
+    def test_fit_drops_least_popular(self):
+        links = {f"c{i:04d}": _link(f"https://example.com/{i}/{'x' * 40}") for i in range(2000)}
+        fitted = fit(links, max_bytes=2000)
+        assert 0 < len(fitted) < len(links)
+        assert list(fitted) == list(links)[:len(fitted)]
+        assert len(encode_snapshot({"generation": 0, "built_at": 0, "links": fitted})) <= 2000
+
+
+# ---------------------------------------------------------------------------
+# TestRedirectHotSet
+# ---------------------------------------------------------------------------
+
+class TestRedirectHotSet:
+    @pytest.fixture(autouse=True)
+    def hot(self, monkeypatch):
+        redirect._storage = MemoryStorage()
+        redirect._storage.put_if_absent({"short_code": "hot00", **_link("https://hot.com"), "version": 1})
+        source = TableSource(MemoryStorage())
+        source.publish({"hot00": _link("https://hot.com", version=1)})
+        hot = HotSet(source, redirect._hot_link)
+        hot.refresh()
+        monkeypatch.setattr(redirect, "_hot_set", hot)
+        yield hot
+
+    def test_hot_code_is_served_after_reading_only_its_version(self, monkeypatch):
+        reads = []
+        get = redirect._storage.get
+        monkeypatch.setattr(redirect._storage, "get", lambda key, attributes=None: reads.append(attributes) or get(key, attributes))
+        for _ in range(3):
+            result = redirect.handler({"pathParameters": {"short_code": "hot00"}}, None)
+            assert result["headers"]["Location"] == "https://hot.com"
+        assert reads == [redirect.REVALIDATE_ATTRIBUTES]
+
+    def test_changed_hot_code_is_read_again(self):
+        redirect._storage.update("hot00", {"targets": [{"url": "https://new.com", "weight": 1}], "version": 2})
+        result = redirect.handler({"pathParameters": {"short_code": "hot00"}}, None)
+        assert result["headers"]["Location"] == "https://new.com"
+
+    def test_other_codes_fall_through_to_storage(self):
+        redirect._storage.put_if_absent({"short_code": "cold0", "targets": [{"url": "https://c.com", "weight": 1}]})
+        result = redirect.handler({"pathParameters": {"short_code": "cold0"}}, None)
+        assert result["headers"]["Location"] == "https://c.com"
+
+    def test_visits_are_still_counted(self):
+        redirect.handler({"pathParameters": {"short_code": "hot00"}}, None)
+        assert redirect._visits.pending() == 1
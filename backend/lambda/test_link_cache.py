@@ -0,0 +1,121 @@
+import pytest
+from link_cache import NOT_FOUND, LinkCache
+
+
+class FakeClock:
+    def __init__(self, now: float = 1_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+# ---------------------------------------------------------------------------
+# TestLinkCache
+# ---------------------------------------------------------------------------
+
+class TestLinkCache:
+    @pytest.fixture
+    def clock(self):
+        return FakeClock()
+
+    @pytest.fixture
+    def cache(self, clock):
+        return LinkCache(max_size=3, ttl=60, negative_ttl=5, clock=clock)
+
+    def test_miss_returns_none(self, cache):
+        assert cache.get("abc12") is None
+
+    def test_put_then_get_returns_value(self, cache):
+        cache.put("abc12", ["target"])
+        assert cache.get("abc12") == ["target"]
+
+    def test_entry_expires_after_ttl(self, cache, clock):
+        cache.put("abc12", ["target"])
+        clock.now += 60
+        assert cache.get("abc12") is None
+
+    def test_expires_at_caps_entry_lifetime(self, cache, clock):
+        cache.put("abc12", ["target"], expires_at=clock.now + 10)
+        clock.now += 9
+        assert cache.get("abc12") == ["target"]
+        clock.now += 1
+        assert cache.get("abc12") is None
+
+    def test_expired_entry_is_kept_as_stale(self, cache, clock):
+        cache.put("abc12", ["target"])
+        assert cache.stale("abc12") is None
+        clock.now += 60
+        assert cache.get("abc12") is None
+        assert cache.stale("abc12") == ["target"]
+        cache.put("abc12", ["target"])
+        assert cache.get("abc12") == ["target"]
+
+    def test_negative_entry_is_never_stale(self, cache, clock):
+        cache.put_not_found("nope0")
+        clock.now += 5
+        assert cache.get("nope0") is None
+        assert cache.stale("nope0") is None
+
+    def test_negative_entry_returns_not_found(self, cache):
+        cache.put_not_found("nope0")
+        assert cache.get("nope0") is NOT_FOUND
+
+    def test_negative_entry_uses_negative_ttl(self, cache, clock):
+        cache.put_not_found("nope0")
+        clock.now += 5
+        assert cache.get("nope0") is None
+
+    def test_size_cap_evicts_least_recently_used(self, cache):
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.put("c", 3)
+        cache.get("a")
+        cache.put("d", 4)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert len(cache) == 3
+
+    def test_zero_size_disables_cache(self, clock):
+        cache = LinkCache(max_size=0, clock=clock)
+        cache.put("a", 1)
+        assert cache.get("a") is None
+
+    def test_invalidate_removes_entry(self, cache):
+        cache.put("a", 1)
+        cache.invalidate("a")
+        assert cache.get("a") is None
+
+    def test_stats_count_hits_misses_and_evictions(self, cache, clock):
+        cache.put("a", 1)
+        cache.get("a")
+        cache.get("zzz")
+        cache.put_not_found("nope0")
+        cache.get("nope0")
+        cache.put("b", 2)
+        cache.put("c", 3)
+        clock.now += 60
+        cache.get("c")
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["negative_hits"] == 1
+        assert stats["misses"] == 2
+        assert stats["evictions"] == 1
+        assert stats["expirations"] == 1
+
+    def test_peek_returns_live_values_without_counting(self, cache, clock):
+        cache.put("a", 1)
+        cache.put_not_found("nope0")
+        assert cache.peek("a") == 1
+        assert cache.peek("nope0") is NOT_FOUND
+        assert cache.peek("zzz") is None
+        clock.now += 60
+        assert cache.peek("a") is None
+        assert cache.stats()["hits"] == cache.stats()["misses"] == 0
+
+    def test_clear_resets_entries_and_counters(self, cache):
+        cache.put("a", 1)
+        cache.get("a")
+        cache.clear()
+        assert len(cache) == 0
+        assert cache.stats()["hits"] == 0
@@ -0,0 +1,171 @@
+import json
+
+import generate_link
+import metrics
+import pytest
+import redirect
+from metrics import MAX_VALUES_PER_DOCUMENT, Metrics, bucket
+from storage import MemoryStorage
+
+
+@pytest.fixture
+def lines(monkeypatch):
+    emitted = []
+    monkeypatch.setattr(metrics, "_metrics", Metrics(emitted.append))
+    return emitted
+
+
+def _documents(lines):
+    return [json.loads(line) for line in lines]
+
+
+# ---------------------------------------------------------------------------
+# TestBucket
+# ---------------------------------------------------------------------------
+
+class TestBucket:
+    @pytest.mark.parametrize("value, expected", [(1.234, 1.2), (0.01567, 0.016), (987.0, 990.0), (0.0, 0.0)])
+    def test_rounds_to_two_significant_digits(self, value, expected):
+        assert bucket(value) == expected
+
+
+# ---------------------------------------------------------------------------
+# TestMetrics
+# ---------------------------------------------------------------------------
+
+class TestMetrics:
+    def test_disabled_span_is_a_shared_noop(self):
+        m = Metrics()
+        assert m.span("a") is m.span("b")
+        with m.span("a"):
+            pass
+        m.record("a", 1.0)
+        assert m.snapshot() == {}
+
+    def test_values_are_aggregated_into_histograms(self):
+        m = Metrics(lambda line: None)
+        for value in [1.21, 1.19, 3.0]:
+            m.record("stage", value)
+        assert m.snapshot() == {"stage": {1.2: 2, 3.0: 1}}
+
+    def test_span_records_milliseconds(self):
+        m = Metrics(lambda line: None)
+        with m.span("stage"):
+            pass
+        (value,) = m.snapshot()["stage"]
+        assert 0 <= value < 50
+
+    def test_flush_emits_one_emf_document_and_resets(self):
+        emitted = []
+        m = Metrics(emitted.append, namespace="Test")
+        m.record("parse", 1.0)
+        m.record("parse", 1.0)
+        m.record("attempts", 2, "Count")
+        m.flush()
+        (document,) = _documents(emitted)
+        directive = document["_aws"]["CloudWatchMetrics"][0]
+        assert directive["Namespace"] == "Test"
+        assert {"Name": "attempts", "Unit": "Count"} in directive["Metrics"]
+        assert document["parse"] == [1.0, 1.0]
+        assert document["attempts"] == [2.0]
+        m.flush()
+        assert len(emitted) == 1
+
+    def test_counts_are_not_bucketed(self):
+        emitted = []
+        m = Metrics(emitted.append)
+        m.record("x", 1234, "Count")
+        m.record("latency", 1234)
+        m.flush()
+        (document,) = _documents(emitted)
+        assert document["x"] == [1234]
+        assert document["latency"] == [1200.0]
+
+    def test_large_histograms_are_split_at_the_emf_limit(self):
+        emitted = []
+        m = Metrics(emitted.append)
+        for i in range(MAX_VALUES_PER_DOCUMENT + 5):
+            m.record("stage", 1.0)
+        m.record("other", 2.0)
+        m.flush()
+        documents = _documents(emitted)
+        assert [len(d["stage"]) for d in documents] == [MAX_VALUES_PER_DOCUMENT, 5]
+        assert "other" in documents[0] and "other" not in documents[1]
+
+    def test_unknown_sink_raises(self, monkeypatch):
+        monkeypatch.setenv("METRICS_SINK", "statsd")
+        with pytest.raises(ValueError):
+            metrics.from_env()
+
+    def test_file_sink_appends_lines(self, monkeypatch, tmp_path):
+        path = tmp_path / "metrics.jsonl"
+        monkeypatch.setenv("METRICS_SINK", f"file:{path}")
+        m = metrics.from_env()
+        m.record("stage", 1.0)
+        m.flush()
+        m.record("stage", 2.0)
+        m.flush()
+        assert len(path.read_text().splitlines()) == 2
+
+
+# ---------------------------------------------------------------------------
+# TestInstrumented
+# ---------------------------------------------------------------------------
+
+class TestInstrumented:
+    def test_disabled_calls_through(self, monkeypatch):
+        monkeypatch.setattr(metrics, "_metrics", Metrics())
+        wrapped = metrics.instrumented("h")(lambda event, context: {"statusCode": 200})
+        assert wrapped({}, None) == {"statusCode": 200}
+
+    def test_flushes_once_per_invocation_with_handler_dimension(self, lines):
+        @metrics.instrumented("h")
+        def fn(event, context):
+            with metrics.span("stage"):
+                return {"statusCode": 200}
+
+        fn({}, None)
+        fn({}, None)
+        documents = _documents(lines)
+        assert len(documents) == 2
+        assert documents[0]["Handler"] == "h"
+        assert documents[0]["_aws"]["CloudWatchMetrics"][0]["Dimensions"] == [["Handler"]]
+        assert set(documents[0]) >= {"total", "stage"}
+
+    def test_flushes_when_the_handler_raises(self, lines):
+        @metrics.instrumented("h")
+        def fn(event, context):
+            raise RuntimeError
+
+        with pytest.raises(RuntimeError):
+            fn({}, None)
+        assert "total" in _documents(lines)[0]
+
+    def test_redirect_reports_each_stage(self, lines):
+        redirect._storage = MemoryStorage()
+        redirect._storage.put_if_absent({"short_code": "abc12", "targets": [{"url": "https://a.com", "weight": 1}]})
+        redirect.handler({"pathParameters": {"short_code": "abc12"}}, None)
+        (document,) = _documents(lines)
+        assert set(document) >= {"total", "resolve", "get_item", "pick"}
+
+    def test_redirect_reports_cache_stats_every_n_invocations(self, lines, monkeypatch):
+        monkeypatch.setattr(redirect, "CACHE_STATS_EVERY", 3)
+        monkeypatch.setattr(redirect, "_cache_stats_countdown", 3)
+        monkeypatch.setattr(redirect, "_cache_stats_reported", dict.fromkeys(redirect.CACHE_STATS_COUNTERS, 0))
+        redirect._storage = MemoryStorage()
+        redirect._storage.put_if_absent({"short_code": "abc12", "targets": [{"url": "https://a.com", "weight": 1}]})
+        for _ in range(6):
+            redirect.handler({"pathParameters": {"short_code": "abc12"}}, None)
+        reports = [d for d in _documents(lines) if "cache_hits" in d]
+        assert len(reports) == 2
+        assert (reports[0]["cache_misses"], reports[0]["cache_hits"], reports[0]["cache_size"]) == ([1.0], [1.0], [1.0])
+        assert (reports[1]["cache_misses"], reports[1]["cache_hits"]) == ([0.0], [3.0])
+        assert {"Name": "cache_size", "Unit": "Count"} in reports[0]["_aws"]["CloudWatchMetrics"][0]["Metrics"]
+
+    def test_generate_link_reports_each_stage(self, lines):
+        generate_link._storage = MemoryStorage()
+        body = json.dumps({"urls": [{"original_url": "https://a.com", "weight": 1}]})
+        generate_link.handler({"body": body}, None)
+        (document,) = _documents(lines)
+        assert set(document) >= {"total", "parse", "validate", "put_item", "put_attempts"}
+        assert document["put_attempts"] == [1.0]
@@ -0,0 +1,184 @@
+import time
+
+import pytest
+import rate_limit
+from rate_limit import RateLimiter, TokenBucket, client_key
+from storage import MemoryStorage, StorageError
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+# ---------------------------------------------------------------------------
+# TestClientKey
+# ---------------------------------------------------------------------------
+
+class TestClientKey:
+    def test_unverified_api_key_header_is_ignored(self):
+        event = {"headers": {"X-Api-Key": "secret"}, "requestContext": {"http": {"sourceIp": "203.0.113.7"}}}
+        assert client_key(event) == "ip:203.0.113.7"
+
+    @pytest.mark.parametrize("context", [
+        {"authorizer": {"principalId": "user-1"}},
+        {"authorizer": {"jwt": {"claims": {"sub": "user-1"}}}},
+        {"authorizer": {"lambda": {"principalId": "user-1"}}},
+        {"authorizer": {"iam": {"userArn": "arn:aws:iam::123456789012:user/user-1"}}},
+        {"identity": {"apiKeyId": "abc123", "sourceIp": "203.0.113.7"}},
+    ])
+    def test_verified_identity_wins_and_is_hashed(self, context):
+        key = client_key({"requestContext": {**context, "http": {"sourceIp": "203.0.113.7"}}})
+        assert key.startswith("key:")
+        assert "user-1" not in key and "abc123" not in key
+
+    def test_authorizer_principal_beats_api_key(self):
+        context = {"authorizer": {"principalId": "user-1"}, "identity": {"apiKeyId": "abc123"}}
+        assert client_key({"requestContext": context}) == client_key(
+            {"requestContext": {"authorizer": {"principalId": "user-1"}}}
+        )
+
+    def test_source_ip(self):
+        assert client_key({"requestContext": {"http": {"sourceIp": "203.0.113.7"}}}) == "ip:203.0.113.7"
+        assert client_key({"requestContext": {"identity": {"sourceIp": "203.0.113.7"}}}) == "ip:203.0.113.7"
+
+    def test_unidentified_requests_share_a_key(self):
+        assert client_key({}) == "anonymous"
+
+
+# ---------------------------------------------------------------------------
+# TestTokenBucket
+# ---------------------------------------------------------------------------
+
+class TestTokenBucket:
+    def test_burst_then_wait_for_refill(self):
+        bucket = TokenBucket(2, now=0.0)
+        assert bucket.take(0.5, 2, 0.0) == 0.0
+        assert bucket.take(0.5, 2, 0.0) == 0.0
+        assert bucket.take(0.5, 2, 0.0) == 2.0
+        assert bucket.take(0.5, 2, 1.0) == 1.0
+        assert bucket.take(0.5, 2, 2.0) == 0.0
+
+    def test_cost_takes_several_tokens(self):
+        bucket = TokenBucket(3, now=0.0)
+        assert bucket.take(1.0, 3, 0.0, cost=2) == 0.0
+        assert bucket.take(1.0, 3, 0.0, cost=2) == 1.0
+
+    def test_cost_over_burst_needs_a_full_bucket_and_leaves_debt(self):
+        bucket = TokenBucket(2, now=0.0)
+        assert bucket.take(1.0, 3, 0.0, cost=10) == 1.0
+        assert bucket.take(1.0, 3, 1.0, cost=10) == 0.0
+        assert bucket.tokens == -7
+        assert bucket.take(1.0, 3, 2.0) == 7.0
+
+    def test_refill_is_capped_at_burst(self):
+        bucket = TokenBucket(0, now=0.0)
+        bucket.take(1.0, 3, 100.0)
+        assert bucket.tokens == 2
+
+
+# ---------------------------------------------------------------------------
+# TestRateLimiter
+# ---------------------------------------------------------------------------
+
+class TestRateLimiter:
+    def _limiter(self, store=None, **kwargs):
+        clock = FakeClock()
+        kwargs.setdefault("window", 10.0)
+        limiter = RateLimiter(1.0, 3, (lambda: store) if store is not None else None, clock=clock, **kwargs)
+        return limiter, clock
+
+    def test_clients_have_separate_buckets(self):
+        limiter, _ = self._limiter()
+        assert [limiter.admit("a") for _ in range(4)] == [0.0, 0.0, 0.0, 1.0]
+        assert limiter.admit("b") == 0.0
+
+    def test_idle_clients_are_forgotten(self):
+        limiter, _ = self._limiter(max_clients=2)
+        for client in ("a", "b", "c"):
+            limiter.admit(client)
+        assert list(limiter._buckets) == ["b", "c"]
+
+    def test_refusals_are_not_counted(self):
+        store = MemoryStorage()
+        limiter, _ = self._limiter(store, sync_interval=3600)
+        for _ in range(5):
+            limiter.admit("a")
+        assert limiter._pending == {"a": 3}
+
+    def test_cost_is_counted_towards_the_shared_window(self):
+        limiter, _ = self._limiter(MemoryStorage(), sync_interval=3600)
+        limiter.admit("a", 3)
+        assert limiter._pending == {"a": 3}
+
+    def test_sync_adds_to_the_shared_window_counter(self):
+        store = MemoryStorage()
+        limiter, clock = self._limiter(store, sync_interval=3600)
+        limiter.admit("a")
+        limiter.admit("a")
+        limiter.sync()
+        assert store.get("rate#a#100") == {"short_code": "rate#a#100", "used": 2, "expires_at": 1020}
+        assert limiter._pending == {}
+
+    def test_shared_budget_blocks_until_the_window_ends(self):
+        store = MemoryStorage()
+        limiter, clock = self._limiter(store, sync_interval=3600)
+        store.increment("rate#a#100", {"used": limiter.window_budget - 1}, must_exist=False)
+        limiter.admit("a")
+        limiter.sync()
+        clock.now = 1004.0
+        assert limiter.admit("a") == 6.0
+        clock.now = 1010.0
+        assert limiter.admit("a") == 0.0
+
+    def test_refusals_do_not_touch_storage(self, monkeypatch):
+        store = MemoryStorage()
+        limiter, _ = self._limiter(store, sync_interval=3600)
+        limiter._blocked["a"] = 1005.0
+        monkeypatch.setattr(store, "increment", lambda *a, **k: pytest.fail("storage touched"))
+        assert limiter.admit("a") == 5.0
+
+    def test_storage_errors_fall_back_to_local_buckets(self, monkeypatch):
+        store = MemoryStorage()
+        limiter, _ = self._limiter(store, sync_interval=3600)
+
+        def unavailable(*args, **kwargs):
+            raise StorageError("unavailable")
+
+        monkeypatch.setattr(store, "increment", unavailable)
+        limiter.admit("a")
+        limiter.sync()
+        assert limiter.admit("a") == 0.0
+
+    def test_sync_runs_in_the_background_when_due(self):
+        store = MemoryStorage()
+        limiter, clock = self._limiter(store, sync_interval=1.0)
+        limiter.admit("a")
+        assert store.get("rate#a#100") is None
+        clock.now += 1
+        limiter.admit("a")
+        for _ in range(100):
+            if store.get("rate#a#100"):
+                break
+            time.sleep(0.01)
+        assert store.get("rate#a#100")["used"] == 2
+
+    def test_local_only_without_a_window(self):
+        limiter, _ = self._limiter(MemoryStorage(), window=0)
+        limiter.admit("a")
+        assert limiter._pending == {}
+
+    def test_invalid_limits_are_rejected(self):
+        with pytest.raises(ValueError):
+            RateLimiter(0, 10)
+
+    def test_from_env(self, monkeypatch):
+        monkeypatch.delenv("CREATE_RATE_LIMIT", raising=False)
+        assert rate_limit.from_env(MemoryStorage) is None
+        monkeypatch.setenv("CREATE_RATE_LIMIT", "2")
+        monkeypatch.setenv("CREATE_RATE_BURST", "5")
+        limiter = rate_limit.from_env(MemoryStorage)
+        assert (limiter.rate, limiter.burst, limiter.window_budget) == (2.0, 5.0, 25.0)
@@ -1,11 +1,18 @@
 import json
 import random
+import threading
+import time
 from decimal import Decimal
 from unittest.mock import MagicMock
 
 import pytest
 import redirect
-from redirect import handler, pick_url
+from distribution import validate
+from hot_keys import replicate, sync_replicas
+from redirect import flush_visits, handler, pick_url, pick_urls, replicate_in_background, visitor_key
+from storage import DynamoStorage, MemoryStorage, RetryableStorageError, StorageError
+from target_codec import pack_link
+from visit_counter import RetryableFlushError, StaleFlushError
 
 
 # ---------------------------------------------------------------------------
@@ -26,22 +33,13 @@ class TestPickUrl:
         result = pick_url(targets)
         assert result in {"https://a.com", "https://b.com"}
 
-    def test_monkeypatch_choices_receives_correct_weights(self, monkeypatch):
-        captured = {}
-
-        def fake_choices(population, weights, k):
-            captured["population"] = population
-            captured["weights"] = weights
-            return [population[0]]
-
-        monkeypatch.setattr(random, "choices", fake_choices)
+    def test_monkeypatch_random_controls_pick(self, monkeypatch):
+        monkeypatch.setattr(random, "random", lambda: 0.0)
         targets = [
             {"url": "https://a.com", "weight": 70},
             {"url": "https://b.com", "weight": 30},
         ]
-        pick_url(targets)
-        assert captured["weights"] == [70, 30]
-        assert captured["population"] == ["https://a.com", "https://b.com"]
+        assert pick_url(targets) == "https://a.com"
 
     def test_decimal_weights_from_dynamodb_do_not_raise(self):
         targets = [
@@ -51,16 +49,7 @@ class TestPickUrl:
         result = pick_url(targets)
         assert result in {"https://a.com", "https://b.com"}
 
-    def test_heavily_weighted_url_is_selected_more_often(self, monkeypatch):
-        calls = {"n": 0}
-
-        original_choices = random.choices
-
-        def biased_choices(population, weights, k):
-            calls["n"] += 1
-            return original_choices(population, weights=weights, k=k)
-
-        monkeypatch.setattr(random, "choices", biased_choices)
+    def test_heavily_weighted_url_is_selected_more_often(self):
         targets = [
             {"url": "https://a.com", "weight": 1000},
             {"url": "https://b.com", "weight": 1},
@@ -69,72 +58,104 @@ class TestPickUrl:
         assert results.count("https://a.com") > 90
 
 
+# ---------------------------------------------------------------------------
+# TestPickUrls
+# ---------------------------------------------------------------------------
+
+class TestPickUrls:
+    @pytest.fixture(autouse=True)
+    def np(self):
+        return pytest.importorskip("numpy")
+
+    def test_returns_n_urls(self, np):
+        targets = [{"url": "https://a.com", "weight": 1}, {"url": "https://b.com", "weight": 1}]
+        urls = pick_urls(targets, 1000, np.random.default_rng(0))
+        assert len(urls) == 1000
+        assert set(urls.tolist()) == {"https://a.com", "https://b.com"}
+
+    def test_decimal_weights_are_accepted(self, np):
+        targets = [{"url": "https://a.com", "weight": Decimal("70")}, {"url": "https://b.com", "weight": Decimal("30")}]
+        assert len(pick_urls(targets, 10)) == 10
+
+    def test_matches_pick_url_weighting(self, np):
+        targets = [
+            {"url": "https://alpha.com", "weight": 60},
+            {"url": "https://beta.com", "weight": 30},
+            {"url": "https://gamma.com", "weight": 10},
+        ]
+        urls = pick_urls(targets, 1_000_000, np.random.default_rng(5))
+        counts = [int((urls == t["url"]).sum()) for t in targets]
+        assert validate(counts, [t["weight"] for t in targets])["passed"]
+
+
 # ---------------------------------------------------------------------------
 # TestHandler
 # ---------------------------------------------------------------------------
 
 class TestHandler:
     @pytest.fixture(autouse=True)
-    def mock_table(self):
-        redirect._table = MagicMock()
-        yield redirect._table
+    def mock_storage(self):
+        redirect._storage = MagicMock()
+        yield redirect._storage
 
-    def test_missing_path_parameters_returns_400(self, mock_table):
+    def test_missing_path_parameters_returns_400(self, mock_storage):
         result = handler({}, None)
         assert result["statusCode"] == 400
         assert "Missing short code" in json.loads(result["body"])["error"]
 
-    def test_none_path_parameters_returns_400(self, mock_table):
+    def test_none_path_parameters_returns_400(self, mock_storage):
         result = handler({"pathParameters": None}, None)
         assert result["statusCode"] == 400
 
-    def test_missing_short_code_key_returns_400(self, mock_table):
+    def test_missing_short_code_key_returns_400(self, mock_storage):
         result = handler({"pathParameters": {}}, None)
         assert result["statusCode"] == 400
 
-    def test_short_code_not_found_returns_404(self, mock_table):
-        mock_table.get_item.return_value = {}
+    def test_short_code_not_found_returns_404(self, mock_storage):
+        mock_storage.get.return_value = None
         result = handler({"pathParameters": {"short_code": "abc12"}}, None)
         assert result["statusCode"] == 404
         assert "not found" in json.loads(result["body"])["error"]
 
-    def test_found_single_target_returns_301(self, mock_table):
-        mock_table.get_item.return_value = {
-            "Item": {"short_code": "abc12", "targets": [{"url": "https://example.com", "weight": 1}]}
+    def test_found_single_target_returns_301(self, mock_storage):
+        mock_storage.get.return_value = {
+            "short_code": "abc12",
+            "targets": [{"url": "https://example.com", "weight": 1}],
         }
         result = handler({"pathParameters": {"short_code": "abc12"}}, None)
         assert result["statusCode"] == 301
 
-    def test_found_single_target_has_location_header(self, mock_table):
-        mock_table.get_item.return_value = {
-            "Item": {"short_code": "abc12", "targets": [{"url": "https://example.com", "weight": 1}]}
+    def test_found_single_target_has_location_header(self, mock_storage):
+        mock_storage.get.return_value = {
+            "short_code": "abc12",
+            "targets": [{"url": "https://example.com", "weight": 1}],
         }
         result = handler({"pathParameters": {"short_code": "abc12"}}, None)
         assert result["headers"]["Location"] == "https://example.com"
 
-    def test_found_single_target_body_is_empty_string(self, mock_table):
-        mock_table.get_item.return_value = {
-            "Item": {"short_code": "abc12", "targets": [{"url": "https://example.com", "weight": 1}]}
+    def test_found_single_target_body_is_empty_string(self, mock_storage):
+        mock_storage.get.return_value = {
+            "short_code": "abc12",
+            "targets": [{"url": "https://example.com", "weight": 1}],
         }
         result = handler({"pathParameters": {"short_code": "abc12"}}, None)
         assert result["body"] == ""
 
-    def test_get_item_called_with_correct_key(self, mock_table):
-        mock_table.get_item.return_value = {
-            "Item": {"short_code": "xyz99", "targets": [{"url": "https://example.com", "weight": 1}]}
+    def test_get_item_called_with_correct_key(self, mock_storage):
+        mock_storage.get.return_value = {
+            "short_code": "xyz99",
+            "targets": [{"url": "https://example.com", "weight": 1}],
         }
         handler({"pathParameters": {"short_code": "xyz99"}}, None)
-        mock_table.get_item.assert_called_once_with(Key={"short_code": "xyz99"})
-
-    def test_weighted_distribution_across_multiple_targets(self, mock_table):
-        mock_table.get_item.return_value = {
-            "Item": {
-                "short_code": "abc12",
-                "targets": [
-                    {"url": "https://a.com", "weight": 1000},
-                    {"url": "https://b.com", "weight": 1},
-                ],
-            }
+        mock_storage.get.assert_called_once_with("xyz99", attributes=redirect.LINK_ATTRIBUTES)
+
+    def test_weighted_distribution_across_multiple_targets(self, mock_storage):
+        mock_storage.get.return_value = {
+            "short_code": "abc12",
+            "targets": [
+                {"url": "https://a.com", "weight": 1000},
+                {"url": "https://b.com", "weight": 1},
+            ],
         }
         results = [
             json.loads("null") or handler({"pathParameters": {"short_code": "abc12"}}, None)["headers"]["Location"]
@@ -142,15 +163,743 @@ class TestHandler:
         ]
         assert results.count("https://a.com") > 90
 
-    def test_location_is_one_of_valid_targets(self, mock_table):
-        mock_table.get_item.return_value = {
-            "Item": {
-                "short_code": "abc12",
-                "targets": [
-                    {"url": "https://a.com", "weight": 1},
-                    {"url": "https://b.com", "weight": 1},
-                ],
-            }
+    def test_location_is_one_of_valid_targets(self, mock_storage):
+        mock_storage.get.return_value = {
+            "short_code": "abc12",
+            "targets": [
+                {"url": "https://a.com", "weight": 1},
+                {"url": "https://b.com", "weight": 1},
+            ],
         }
         result = handler({"pathParameters": {"short_code": "abc12"}}, None)
+        assert result["statusCode"] == 302
         assert result["headers"]["Location"] in {"https://a.com", "https://b.com"}
+
+    def test_repeated_requests_hit_cache(self, mock_storage):
+        mock_storage.get.return_value = {
+            "short_code": "abc12",
+            "targets": [{"url": "https://example.com", "weight": 1}],
+        }
+        for _ in range(5):
+            handler({"pathParameters": {"short_code": "abc12"}}, None)
+        mock_storage.get.assert_called_once()
+        assert redirect.cache_stats()["hits"] == 4
+
+    def test_empty_targets_returns_404(self, mock_storage):
+        mock_storage.get.return_value = {
+            "short_code": "abc12",
+            "targets": [],
+        }
+        result = handler({"pathParameters": {"short_code": "abc12"}}, None)
+        assert result["statusCode"] == 404
+
+    def test_not_found_is_negatively_cached(self, mock_storage):
+        mock_storage.get.return_value = None
+        for _ in range(3):
+            result = handler({"pathParameters": {"short_code": "nope0"}}, None)
+            assert result["statusCode"] == 404
+        mock_storage.get.assert_called_once()
+
+    def test_expired_item_returns_404(self, mock_storage):
+        mock_storage.get.return_value = {
+            "short_code": "abc12",
+            "targets": [{"url": "https://example.com", "weight": 1}],
+            "expires_at": Decimal(int(time.time()) - 10),
+        }
+        result = handler({"pathParameters": {"short_code": "abc12"}}, None)
+        assert result["statusCode"] == 404
+
+    def test_cached_entry_is_dropped_at_expires_at(self, mock_storage, monkeypatch):
+        now = time.time()
+        mock_storage.get.return_value = {
+            "short_code": "abc12",
+            "targets": [{"url": "https://example.com", "weight": 1}],
+            "expires_at": Decimal(int(now) + 5),
+        }
+        handler({"pathParameters": {"short_code": "abc12"}}, None)
+        monkeypatch.setattr(redirect._cache, "_clock", lambda: now + 10)
+        monkeypatch.setattr(time, "time", lambda: now + 10)
+        result = handler({"pathParameters": {"short_code": "abc12"}}, None)
+        assert result["statusCode"] == 404
+        assert mock_storage.get.call_count == 2
+
+    def test_redirect_records_visit_for_picked_target(self, mock_storage):
+        mock_storage.get.return_value = {
+            "short_code": "abc12",
+            "targets": [{"url": "https://example.com", "weight": 1}],
+        }
+        handler({"pathParameters": {"short_code": "abc12"}}, None)
+        handler({"pathParameters": {"short_code": "abc12"}}, None)
+        assert redirect._visits.pending() == 2
+        mock_storage.increment.assert_not_called()
+
+
+# ---------------------------------------------------------------------------
+# TestVisitorKey
+# ---------------------------------------------------------------------------
+
+class TestVisitorKey:
+    def test_disabled_returns_none(self):
+        assert visitor_key({"headers": {"x-visitor": "a"}}, "") is None
+
+    def test_ip_from_http_api_event(self):
+        event = {"requestContext": {"http": {"sourceIp": "203.0.113.7"}}}
+        assert visitor_key(event, "ip") == "203.0.113.7"
+
+    def test_ip_from_rest_api_event(self):
+        event = {"requestContext": {"identity": {"sourceIp": "203.0.113.7"}}}
+        assert visitor_key(event, "ip") == "203.0.113.7"
+
+    def test_header_lookup_is_case_insensitive(self):
+        assert visitor_key({"headers": {"X-Visitor-Id": "abc"}}, "header:x-visitor-id") == "abc"
+
+    def test_cookie_from_cookies_list(self):
+        event = {"cookies": ["theme=dark", "vid=123"]}
+        assert visitor_key(event, "cookie:vid") == "123"
+
+    def test_cookie_from_cookie_header(self):
+        event = {"headers": {"cookie": "theme=dark; vid=123"}}
+        assert visitor_key(event, "cookie:vid") == "123"
+
+    def test_missing_identifier_returns_none(self):
+        assert visitor_key({"headers": {}}, "cookie:vid") is None
+        assert visitor_key({}, "ip") is None
+
+    def test_unknown_source_raises(self):
+        with pytest.raises(ValueError):
+            visitor_key({}, "session:vid")
+
+
+# ---------------------------------------------------------------------------
+# TestStickyHandler
+# ---------------------------------------------------------------------------
+
+class TestStickyHandler:
+    @pytest.fixture(autouse=True)
+    def sticky(self, monkeypatch):
+        monkeypatch.setattr(redirect, "STICKY_KEY", "cookie:vid")
+        redirect._storage = MemoryStorage()
+        redirect._storage.put_if_absent({
+            "short_code": "abc12",
+            "targets": [{"url": f"https://{i}.com", "weight": 1, "visits": 0} for i in range(5)],
+        })
+
+    @staticmethod
+    def _location(vid=None):
+        event = {"pathParameters": {"short_code": "abc12"}}
+        if vid is not None:
+            event["cookies"] = [f"vid={vid}"]
+        return handler(event, None)["headers"]["Location"]
+
+    def test_same_visitor_is_sent_to_the_same_target(self):
+        assert len({self._location("visitor-1") for _ in range(20)}) == 1
+
+    def test_visitors_are_spread_across_targets(self):
+        assert len({self._location(f"visitor-{i}") for i in range(200)}) == 5
+
+    def test_request_without_identifier_falls_back_to_random(self, monkeypatch):
+        monkeypatch.setattr(random, "random", lambda: 0.0)
+        assert self._location() == "https://0.com"
+
+
+# ---------------------------------------------------------------------------
+# TestCacheHeaders
+# ---------------------------------------------------------------------------
+
+class TestCacheHeaders:
+    @pytest.fixture(autouse=True)
+    def memory_storage(self):
+        redirect._storage = MemoryStorage()
+        yield redirect._storage
+
+    @staticmethod
+    def _put(store, weights, **extra):
+        targets = [{"url": f"https://{i}.com", "weight": w, "visits": 0} for i, w in enumerate(weights)]
+        store.put_if_absent({"short_code": "abc12", "targets": targets, **extra})
+
+    @staticmethod
+    def _get(**event):
+        return handler({"pathParameters": {"short_code": "abc12"}, **event}, None)
+
+    def test_single_target_is_a_long_lived_301(self, memory_storage, monkeypatch):
+        monkeypatch.setattr(redirect, "REDIRECT_MAX_AGE", 86400)
+        self._put(memory_storage, [1])
+        result = self._get()
+        assert result["statusCode"] == 301
+        assert result["headers"]["Cache-Control"] == "public, max-age=86400"
+
+    def test_only_one_positive_weight_counts_as_single_target(self, memory_storage):
+        self._put(memory_storage, [0, 5, 0])
+        result = self._get()
+        assert result["statusCode"] == 301
+        assert result["headers"]["Location"] == "https://1.com"
+
+    def test_max_age_is_capped_by_expires_at(self, memory_storage, monkeypatch):
+        now = 1_700_000_000
+        monkeypatch.setattr(time, "time", lambda: now)
+        monkeypatch.setattr(redirect, "REDIRECT_MAX_AGE", 86400)
+        self._put(memory_storage, [1], expires_at=now + 120)
+        assert self._get()["headers"]["Cache-Control"] == "public, max-age=120"
+
+    def test_weighted_link_is_an_uncacheable_302(self, memory_storage):
+        self._put(memory_storage, [70, 30])
+        result = self._get()
+        assert result["statusCode"] == 302
+        assert result["headers"]["Cache-Control"] == "no-store"
+        assert "Vary" not in result["headers"]
+
+    def test_sticky_cookie_pick_is_privately_cacheable(self, memory_storage, monkeypatch):
+        monkeypatch.setattr(redirect, "STICKY_KEY", "cookie:vid")
+        monkeypatch.setattr(redirect, "STICKY_MAX_AGE", 300)
+        self._put(memory_storage, [70, 30])
+        result = self._get(cookies=["vid=123"])
+        assert result["statusCode"] == 302
+        assert result["headers"]["Cache-Control"] == "private, max-age=300"
+        assert result["headers"]["Vary"] == "Cookie"
+
+    def test_sticky_header_pick_varies_on_that_header(self, memory_storage, monkeypatch):
+        monkeypatch.setattr(redirect, "STICKY_KEY", "header:x-visitor-id")
+        self._put(memory_storage, [70, 30])
+        result = self._get(headers={"x-visitor-id": "123"})
+        assert result["headers"]["Vary"] == "x-visitor-id"
+
+    def test_sticky_max_age_is_capped_by_expires_at(self, memory_storage, monkeypatch):
+        now = 1_700_000_000
+        monkeypatch.setattr(time, "time", lambda: now)
+        monkeypatch.setattr(redirect, "STICKY_KEY", "ip")
+        monkeypatch.setattr(redirect, "STICKY_MAX_AGE", 300)
+        self._put(memory_storage, [70, 30], expires_at=now + 30)
+        result = self._get(requestContext={"http": {"sourceIp": "203.0.113.7"}})
+        assert result["headers"]["Cache-Control"] == "private, max-age=30"
+        assert "Vary" not in result["headers"]
+
+    def test_sticky_fallback_without_identifier_is_not_cached(self, memory_storage, monkeypatch):
+        monkeypatch.setattr(redirect, "STICKY_KEY", "cookie:vid")
+        self._put(memory_storage, [70, 30])
+        assert self._get()["headers"]["Cache-Control"] == "no-store"
+
+
+# ---------------------------------------------------------------------------
+# TestHotKeyReplication
+# ---------------------------------------------------------------------------
+
+class TestHotKeyReplication:
+    @pytest.fixture(autouse=True)
+    def memory_storage(self, monkeypatch):
+        monkeypatch.setattr(redirect._hot_keys, "threshold", 3)
+        monkeypatch.setattr(redirect, "HOT_KEY_REPLICAS", 4)
+        monkeypatch.setattr(redirect, "replicate_in_background", lambda code: replicate_in_background(code).join())
+        redirect._storage = MemoryStorage()
+        redirect._storage.put_if_absent({
+            "short_code": "abc12",
+            "targets": [{"url": "https://a.com", "weight": 1, "visits": 0}],
+            "expires_at": int(time.time()) + 86400,
+        })
+        yield redirect._storage
+
+    @staticmethod
+    def _get(code="abc12"):
+        return handler({"pathParameters": {"short_code": code}}, None)
+
+    def test_replication_does_not_hold_up_the_request(self, memory_storage, monkeypatch):
+        release = threading.Event()
+        monkeypatch.setattr(redirect, "replicate_in_background", replicate_in_background)
+        monkeypatch.setattr(redirect, "replicate", lambda *args: release.wait(5) and None)
+        assert all(self._get()["statusCode"] == 301 for _ in range(3))
+        release.set()
+
+    def test_hot_code_is_replicated(self, memory_storage):
+        for _ in range(3):
+            self._get()
+        assert memory_storage.get("abc12")["replicas"] == 4
+        assert memory_storage.get("abc12#4") is not None
+
+    def test_cold_code_is_not_replicated(self, memory_storage):
+        self._get()
+        assert "replicas" not in memory_storage.get("abc12")
+        assert memory_storage.get("abc12#1") is None
+
+    def test_replication_happens_once_while_replicas_are_live(self, memory_storage, monkeypatch):
+        for _ in range(3):
+            self._get()
+        calls = []
+        monkeypatch.setattr(redirect, "replicate", lambda *args: calls.append(args))
+        redirect._hot_keys.reset()
+        for _ in range(3):
+            self._get()
+        assert calls == []
+
+    def test_cache_misses_read_from_replicas(self, memory_storage, monkeypatch):
+        for _ in range(3):
+            self._get()
+        reads = []
+        get = memory_storage.get
+        monkeypatch.setattr(memory_storage, "get", lambda key, attributes=None: reads.append(key) or get(key, attributes))
+        for _ in range(50):
+            redirect._cache.clear()
+            assert self._get()["headers"]["Location"] == "https://a.com"
+        assert {key.partition("#")[0] for key in reads} == {"abc12"}
+        assert len(set(reads)) > 1
+
+    def test_replica_carries_link_expiry(self, memory_storage, monkeypatch):
+        for _ in range(3):
+            self._get()
+        monkeypatch.setattr(random, "randrange", lambda n: 1)
+        redirect._cache.clear()
+        assert redirect.get_link("abc12").expires_at == memory_storage.get("abc12")["expires_at"]
+
+    def test_missing_replica_falls_back_to_primary(self, memory_storage, monkeypatch):
+        for _ in range(3):
+            self._get()
+        memory_storage._items.pop("abc12#1")
+        monkeypatch.setattr(random, "randrange", lambda n: 1)
+        redirect._cache.clear()
+        assert self._get()["statusCode"] == 301
+
+    def test_replica_keys_cannot_be_requested_directly(self, memory_storage):
+        for _ in range(3):
+            self._get()
+        assert self._get("abc12#1")["statusCode"] == 404
+
+    def test_storage_error_during_replication_does_not_fail_redirect(self, memory_storage, monkeypatch):
+        def fail(*args):
+            raise StorageError("boom")
+
+        monkeypatch.setattr(memory_storage, "batch_put", fail)
+        assert all(self._get()["statusCode"] == 301 for _ in range(3))
+
+
+# ---------------------------------------------------------------------------
+# TestPackedLinks
+# ---------------------------------------------------------------------------
+
+class TestPackedLinks:
+    @pytest.fixture(autouse=True)
+    def memory_storage(self):
+        redirect._storage = MemoryStorage()
+        targets = [{"url": f"https://example.com/{i}", "weight": 1, "visits": 0} for i in range(200)]
+        items = pack_link({"short_code": "big00", "targets": targets, "expires_at": int(time.time()) + 86400}, max_shard_bytes=1000)
+        redirect._storage.batch_put(items)
+        yield redirect._storage
+
+    @staticmethod
+    def _get(code="big00", headers=None):
+        return handler({"pathParameters": {"short_code": code}, "headers": headers or {}}, None)
+
+    def test_redirects_to_a_target(self):
+        result = self._get()
+        assert result["statusCode"] == 302
+        assert result["headers"]["Location"].startswith("https://example.com/")
+
+    def test_only_picked_shards_are_read(self, memory_storage, monkeypatch):
+        reads = []
+        get = memory_storage.get
+        monkeypatch.setattr(memory_storage, "get", lambda key, attributes=None: reads.append(key) or get(key, attributes))
+        monkeypatch.setattr(random, "random", lambda: 0.0)
+        assert self._get()["headers"]["Location"] == "https://example.com/0"
+        assert reads == ["big00", "big00~0"]
+
+    def test_visits_are_counted_on_the_shard(self, memory_storage, monkeypatch):
+        monkeypatch.setattr(random, "random", lambda: 0.999999)
+        self._get()
+        redirect._visits.flush()
+        shards = memory_storage.get("big00")["shards"]
+        last = memory_storage.get(f"big00~{len(shards) - 1}")
+        assert last["visits"][-1] == 1
+        assert sum(sum(memory_storage.get(f"big00~{k}")["visits"]) for k in range(len(shards))) == 1
+
+    def test_missing_shard_returns_404_and_is_not_cached(self, memory_storage):
+        for key in [k for k in memory_storage._items if "~" in k]:
+            memory_storage._items.pop(key)
+        assert self._get()["statusCode"] == 404
+        assert not redirect.is_cached("big00")
+
+    def test_shard_keys_cannot_be_requested_directly(self):
+        assert self._get("big00~0")["statusCode"] == 404
+
+    def test_sticky_visitor_gets_same_target(self, monkeypatch):
+        monkeypatch.setattr(redirect, "STICKY_KEY", "ip")
+        event = {
+            "pathParameters": {"short_code": "big00"},
+            "requestContext": {"http": {"sourceIp": "203.0.113.9"}},
+        }
+        locations = set()
+        for _ in range(5):
+            redirect._cache.clear()
+            locations.add(handler(event, None)["headers"]["Location"])
+        assert len(locations) == 1
+
+
+# ---------------------------------------------------------------------------
+# TestFlushVisits
+# ---------------------------------------------------------------------------
+
+class TestFlushVisits:
+    @pytest.fixture(autouse=True)
+    def memory_storage(self):
+        redirect._storage = MemoryStorage()
+        redirect._storage.put_if_absent({
+            "short_code": "abc12",
+            "targets": [
+                {"url": "https://a.com", "weight": 1, "visits": 0},
+                {"url": "https://b.com", "weight": 1, "visits": 3},
+                {"url": "https://c.com", "weight": 1, "visits": 0},
+            ],
+        })
+        yield redirect._storage
+
+    def test_counts_are_added_to_targets(self, memory_storage):
+        flush_visits("abc12", 1, {0: 5, 1: 1})
+        targets = memory_storage.get("abc12")["targets"]
+        assert [t["visits"] for t in targets] == [5, 4, 0]
+
+    def test_single_increment_covers_all_targets(self):
+        redirect._storage = MagicMock()
+        flush_visits("abc12", 3, {0: 5, 2: 1})
+        redirect._storage.increment.assert_called_once_with(
+            "abc12", {"targets[0].visits": 5, "targets[2].visits": 1}, expected={"version": 3}
+        )
+
+    def test_shard_counts_go_to_its_visits_list(self):
+        redirect._storage = MagicMock()
+        flush_visits("abc12~1", None, {3: 2})
+        redirect._storage.increment.assert_called_once_with("abc12~1", {"visits[3]": 2})
+
+    def test_missing_item_is_not_created(self, memory_storage):
+        with pytest.raises(StaleFlushError):
+            flush_visits("gone0", 1, {0: 1})
+        assert memory_storage.get("gone0") is None
+
+    @staticmethod
+    def _dynamo_flush(short_code, version, count):
+        client = MagicMock()
+        redirect._storage = DynamoStorage("links", client=client)
+        flush_visits(short_code, version, {i: 1 for i in range(count)})
+        return [call[1] for call in client.update_item.call_args_list]
+
+    @staticmethod
+    def _assert_within_expression_limits(calls):
+        for kwargs in calls:
+            expression = kwargs["UpdateExpression"] + " " + kwargs.get("ConditionExpression", "")
+            assert len(expression.encode()) <= 4096
+            assert expression.count("+") + expression.count("=") + expression.count(" AND ") <= 300
+
+    def test_large_flush_is_split_within_expression_limits(self):
+        calls = self._dynamo_flush("abc12", 2, 1000)
+        assert len(calls) == 1000 // redirect.VISIT_FLUSH_CHUNK
+        self._assert_within_expression_limits(calls)
+        assert all(kwargs["ExpressionAttributeValues"][":e0"] == {"N": "2"} for kwargs in calls)
+        assert sum(kwargs["UpdateExpression"].count("+") for kwargs in calls) == 1000
+
+    def test_shard_flush_is_split_within_expression_limits(self):
+        calls = self._dynamo_flush("abc12~3.1", None, 2000)
+        assert len(calls) == 2000 // redirect.VISIT_FLUSH_CHUNK
+        self._assert_within_expression_limits(calls)
+        assert all(kwargs["ExpressionAttributeNames"] == {"#n0": "visits", "#key": "short_code"} for kwargs in calls)
+        assert all(kwargs["ConditionExpression"] == "attribute_exists(#key)" for kwargs in calls)
+
+    def test_retryable_failure_part_way_returns_only_the_unwritten_counts(self, memory_storage, monkeypatch):
+        monkeypatch.setattr(redirect, "VISIT_FLUSH_CHUNK", 2)
+        memory_storage.update("abc12", {"version": 1})
+        increment = memory_storage.increment
+        calls = []
+
+        def throttled_second(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RetryableStorageError("ThrottlingException")
+            return increment(*args, **kwargs)
+
+        monkeypatch.setattr(memory_storage, "increment", throttled_second)
+        with pytest.raises(RetryableFlushError) as e:
+            flush_visits("abc12", 1, {0: 1, 1: 1, 2: 1})
+        assert e.value.remaining == {2: 1}
+        assert [t["visits"] for t in memory_storage.get("abc12")["targets"]] == [1, 4, 0]
+
+    def test_counts_for_an_older_version_are_dropped(self, memory_storage):
+        memory_storage.update("abc12", {"version": 2, "targets": [{"url": "https://b.com", "weight": 1, "visits": 3}]})
+        with pytest.raises(StaleFlushError):
+            flush_visits("abc12", 1, {0: 5, 2: 1})
+        assert memory_storage.get("abc12")["targets"] == [{"url": "https://b.com", "weight": 1, "visits": 3}]
+        flush_visits("abc12", 2, {0: 1})
+        assert memory_storage.get("abc12")["targets"][0]["visits"] == 4
+
+    def test_counts_for_a_link_that_became_packed_are_dropped(self, memory_storage):
+        memory_storage.update("abc12", {"version": 2, "format": "packed", "shards": []}, remove=["targets"])
+        with pytest.raises(StaleFlushError):
+            flush_visits("abc12", 1, {0: 1})
+
+    def test_redirects_record_the_link_version(self, memory_storage, monkeypatch):
+        memory_storage.update("abc12", {"version": 4})
+        recorded = []
+        monkeypatch.setattr(redirect._visits, "record", lambda *slot: recorded.append(slot))
+        handler({"pathParameters": {"short_code": "abc12"}}, None)
+        assert recorded and recorded[0][0] == "abc12" and recorded[0][2] == 4
+
+    def test_retryable_storage_error_is_retryable(self):
+        redirect._storage = MagicMock()
+        redirect._storage.increment.side_effect = RetryableStorageError("ThrottlingException")
+        with pytest.raises(RetryableFlushError):
+            flush_visits("abc12", 1, {0: 1})
+
+    def test_ambiguous_storage_error_is_not_retryable(self):
+        redirect._storage = MagicMock()
+        redirect._storage.increment.side_effect = StorageError("InternalServerError")
+        with pytest.raises(StorageError):
+            flush_visits("abc12", 1, {0: 1})
+
+
+# ---------------------------------------------------------------------------
+# TestResolveHandler
+# ---------------------------------------------------------------------------
+
+class TestResolveHandler:
+    @pytest.fixture(autouse=True)
+    def memory_storage(self):
+        redirect._storage = MemoryStorage()
+        future = int(time.time()) + 86400
+        redirect._storage.batch_put([
+            {"short_code": "abc12", "targets": [{"url": "https://a.com", "weight": 1, "visits": 2}], "expires_at": future},
+            {"short_code": "old00", "targets": [{"url": "https://o.com", "weight": 1, "visits": 0}], "expires_at": 1},
+            *pack_link({
+                "short_code": "big00",
+                "targets": [{"url": f"https://example.com/{i}", "weight": 1, "visits": 0} for i in range(50)],
+                "expires_at": future,
+            }, max_shard_bytes=300),
+        ])
+        yield redirect._storage
+
+    @staticmethod
+    def _resolve(codes, **extra):
+        result = redirect.resolve_handler({"body": json.dumps({"codes": codes, **extra})}, None)
+        return result["statusCode"], json.loads(result["body"])
+
+    def test_returns_targets_and_statuses_in_order(self):
+        status, body = self._resolve(["abc12", "nope0", "old00", "abc12"])
+        assert status == 200
+        results = body["results"]
+        assert [r["short_code"] for r in results] == ["abc12", "nope0", "old00", "abc12"]
+        assert [r["status"] for r in results] == ["ok", "not_found", "expired", "ok"]
+        assert results[0]["targets"] == [{"url": "https://a.com", "weight": 1, "visits": 2}]
+
+    def test_packed_link_returns_all_targets(self):
+        _, body = self._resolve(["big00"])
+        targets = body["results"][0]["targets"]
+        assert [t["url"] for t in targets] == [f"https://example.com/{i}" for i in range(50)]
+
+    def test_pick_returns_one_url(self):
+        _, body = self._resolve(["abc12", "big00"], pick=True)
+        assert body["results"][0]["url"] == "https://a.com"
+        assert body["results"][1]["url"].startswith("https://example.com/")
+
+    def test_reads_are_batched(self, memory_storage, monkeypatch):
+        batch_get = MagicMock(wraps=memory_storage.batch_get)
+        monkeypatch.setattr(memory_storage, "batch_get", batch_get)
+        self._resolve(["abc12", "big00", "nope0"])
+        assert batch_get.call_count == 2
+
+    def test_pick_uses_and_fills_cache(self, memory_storage, monkeypatch):
+        self._resolve(["abc12"], pick=True)
+        assert redirect.is_cached("abc12")
+        monkeypatch.setattr(memory_storage, "batch_get", MagicMock(side_effect=AssertionError))
+        _, body = self._resolve(["abc12"], pick=True)
+        assert body["results"][0]["url"] == "https://a.com"
+
+    def test_resolving_does_not_count_visits(self):
+        self._resolve(["abc12"], pick=True)
+        assert redirect._visits.pending() == 0
+
+    def test_internal_keys_are_not_found(self):
+        _, body = self._resolve(["big00~0", "abc12#1"])
+        assert [r["status"] for r in body["results"]] == ["not_found", "not_found"]
+
+    def test_missing_shard_is_not_found(self, memory_storage):
+        memory_storage._items.pop("big00~1")
+        _, body = self._resolve(["big00"])
+        assert body["results"][0]["status"] == "not_found"
+
+    @pytest.mark.parametrize("body", [{}, {"codes": []}, {"codes": [1]}, {"codes": ["a"], "pick": "yes"}])
+    def test_invalid_body_returns_400(self, body):
+        result = redirect.resolve_handler({"body": json.dumps(body)}, None)
+        assert result["statusCode"] == 400
+
+    def test_too_many_codes_returns_400(self, monkeypatch):
+        monkeypatch.setattr(redirect, "MAX_RESOLVE_CODES", 2)
+        status, _ = self._resolve(["a", "b", "c"])
+        assert status == 400
+
+    def test_storage_failure_returns_500(self, memory_storage, monkeypatch):
+        monkeypatch.setattr(memory_storage, "batch_get", MagicMock(side_effect=RetryableStorageError("throttled")))
+        status, _ = self._resolve(["abc12"])
+        assert status == 500
+
+
+# ---------------------------------------------------------------------------
+# TestRevalidation
+# ---------------------------------------------------------------------------
+
+class TestRevalidation:
+    @pytest.fixture(autouse=True)
+    def memory_storage(self):
+        redirect._storage = MemoryStorage()
+        redirect._storage.put_if_absent({
+            "short_code": "abc12",
+            "targets": [{"url": "https://a.com", "weight": 1, "visits": 0}],
+            "expires_at": int(time.time()) + 86400,
+            "version": 1,
+        })
+        yield redirect._storage
+
+    @pytest.fixture
+    def reads(self, memory_storage, monkeypatch):
+        reads = []
+        get = memory_storage.get
+        monkeypatch.setattr(memory_storage, "get", lambda key, attributes=None: reads.append(attributes) or get(key, attributes))
+        return reads
+
+    @staticmethod
+    def _expire_cache(monkeypatch):
+        now = time.time()
+        monkeypatch.setattr(redirect._cache, "_clock", lambda: now + 61)
+
+    def test_unchanged_link_is_kept_after_reading_its_version(self, reads, monkeypatch):
+        link = redirect.get_link("abc12")
+        self._expire_cache(monkeypatch)
+        assert redirect.get_link("abc12") is link
+        assert reads == [redirect.LINK_ATTRIBUTES, redirect.REVALIDATE_ATTRIBUTES]
+
+    def test_changed_link_is_read_and_rebuilt(self, memory_storage, reads, monkeypatch):
+        link = redirect.get_link("abc12")
+        memory_storage.update("abc12", {"targets": [{"url": "https://b.com", "weight": 1, "visits": 0}], "version": 2})
+        self._expire_cache(monkeypatch)
+        fresh = redirect.get_link("abc12")
+        assert fresh is not link
+        assert fresh.version == 2
+        assert fresh.sampler.urls[0] == "https://b.com"
+        assert reads == [redirect.LINK_ATTRIBUTES, redirect.REVALIDATE_ATTRIBUTES, redirect.LINK_ATTRIBUTES]
+
+    def test_deleted_link_is_not_found(self, memory_storage, monkeypatch):
+        redirect.get_link("abc12")
+        memory_storage._items.pop("abc12")
+        self._expire_cache(monkeypatch)
+        assert redirect.get_link("abc12") is None
+
+    def test_hot_code_revalidates_against_replicas(self, memory_storage, monkeypatch):
+        redirect.replicate_link("abc12")
+        link = redirect.get_link("abc12")
+        keys = []
+        get = memory_storage.get
+        monkeypatch.setattr(memory_storage, "get", lambda key, attributes=None: keys.append(key) or get(key, attributes))
+        now = time.time()
+        for step in range(1, 6):
+            monkeypatch.setattr(redirect._cache, "_clock", lambda step=step: now + 61 * step)
+            assert redirect.get_link("abc12") is link
+        assert len(keys) == 5
+        assert all(key.startswith("abc12#") for key in keys)
+
+    def test_primary_revalidation_learns_of_replicas(self, memory_storage, monkeypatch):
+        redirect.get_link("abc12")
+        replicate(memory_storage, "abc12", 4, 3600)
+        self._expire_cache(monkeypatch)
+        redirect.get_link("abc12")
+        assert redirect._replicas.get("abc12") == 4
+
+    def test_update_reaches_replicated_links_through_their_replicas(self, memory_storage, monkeypatch):
+        redirect.replicate_link("abc12")
+        redirect.get_link("abc12")
+        memory_storage.update("abc12", {"targets": [{"url": "https://b.com", "weight": 1, "visits": 0}], "version": 2})
+        sync_replicas(memory_storage, memory_storage.get("abc12"))
+        self._expire_cache(monkeypatch)
+        link = redirect.get_link("abc12")
+        assert (link.version, link.sampler.urls) == (2, ["https://b.com"])
+
+    def test_lapsed_replica_falls_back_to_the_primary(self, memory_storage, monkeypatch):
+        redirect.replicate_link("abc12")
+        redirect.get_link("abc12")
+        memory_storage.update("abc12", {"targets": [{"url": "https://b.com", "weight": 1, "visits": 0}], "version": 2})
+        for k in range(1, redirect.HOT_KEY_REPLICAS + 1):
+            memory_storage.update(f"abc12#{k}", {"replica_until": 1})
+        monkeypatch.setattr(random, "randrange", lambda n: 1)
+        self._expire_cache(monkeypatch)
+        link = redirect.get_link("abc12")
+        assert (link.version, link.sampler.urls) == (2, ["https://b.com"])
+
+    def test_packed_link_reads_shards_of_its_version(self, memory_storage, monkeypatch):
+        targets = [{"url": f"https://example.com/{i}", "weight": 1, "visits": 0} for i in range(20)]
+        memory_storage.batch_put(pack_link({"short_code": "big00", "targets": targets, "version": 3}, max_shard_bytes=100))
+        monkeypatch.setattr(random, "random", lambda: 0.0)
+        assert handler({"pathParameters": {"short_code": "big00"}}, None)["headers"]["Location"] == "https://example.com/0"
+        redirect._visits.flush()
+        assert memory_storage.get("big00~3.0")["visits"][0] == 1
+
+    def test_resolve_reports_versions(self):
+        result = redirect.resolve_handler({"body": json.dumps({"codes": ["abc12"]})}, None)
+        assert json.loads(result["body"])["results"][0]["version"] == 1
+
+
+# ---------------------------------------------------------------------------
+# TestRoutingRules
+# ---------------------------------------------------------------------------
+
+class TestRoutingRules:
+    IPHONE = "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) Mobile/15E148"
+
+    @pytest.fixture(autouse=True)
+    def memory_storage(self):
+        redirect._storage = MemoryStorage()
+        redirect._storage.put_if_absent({
+            "short_code": "abc12",
+            "targets": [{"url": "https://desktop.com", "weight": 1, "visits": 0},
+                        {"url": "https://mobile.com", "weight": 0.001, "visits": 0}],
+            "rules": [{"device": ["mobile", "tablet"], "weights": [0, 100]}],
+            "version": 1,
+        })
+        yield redirect._storage
+
+    @staticmethod
+    def _get(user_agent=None):
+        headers = {"user-agent": user_agent} if user_agent else {}
+        return handler({"pathParameters": {"short_code": "abc12"}, "headers": headers}, None)
+
+    def test_matching_rule_sets_the_weights(self):
+        assert {self._get(self.IPHONE)["headers"]["Location"] for _ in range(50)} == {"https://mobile.com"}
+
+    def test_other_requests_use_the_link_weights(self, monkeypatch):
+        monkeypatch.setattr(random, "random", lambda: 0.0)
+        assert self._get("Mozilla/5.0 (Windows NT 10.0)")["headers"]["Location"] == "https://desktop.com"
+
+    def test_rules_add_no_reads(self, memory_storage, monkeypatch):
+        self._get(self.IPHONE)
+        monkeypatch.setattr(memory_storage, "get", lambda *args, **kwargs: pytest.fail("storage read"))
+        self._get(self.IPHONE)
+        self._get()
+
+    def test_visits_count_against_the_link_targets(self, memory_storage):
+        self._get(self.IPHONE)
+        redirect._visits.flush()
+        assert [t["visits"] for t in memory_storage.get("abc12")["targets"]] == [0, 1]
+
+    def test_links_with_rules_are_not_cached_by_clients(self, memory_storage):
+        memory_storage.put_if_absent({
+            "short_code": "one00",
+            "targets": [{"url": "https://desktop.com", "weight": 1, "visits": 0},
+                        {"url": "https://mobile.com", "weight": 0, "visits": 0}],
+            "rules": [{"device": ["mobile"], "weights": [0, 1]}],
+        })
+        result = handler({"pathParameters": {"short_code": "one00"}, "headers": {}}, None)
+        assert result["statusCode"] == 302
+        assert result["headers"]["Cache-Control"] == "no-store"
+
+    def test_rules_survive_replication(self, monkeypatch):
+        redirect.replicate_link("abc12")
+        monkeypatch.setattr(random, "randrange", lambda n: 1)
+        redirect._cache.clear()
+        assert self._get(self.IPHONE)["headers"]["Location"] == "https://mobile.com"
+
+    def test_resolve_picks_with_request_headers(self):
+        event = {"body": json.dumps({"codes": ["abc12"], "pick": True}), "headers": {"user-agent": self.IPHONE}}
+        assert json.loads(redirect.resolve_handler(event, None)["body"])["results"][0]["url"] == "https://mobile.com"
+
+    def test_resolve_returns_rules(self):
+        result = redirect.resolve_handler({"body": json.dumps({"codes": ["abc12"]})}, None)
+        assert json.loads(result["body"])["results"][0]["rules"] == [{"device": ["mobile", "tablet"], "weights": [0, 100]}]
@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+pytest.importorskip("pyarrow")
+pd = pytest.importorskip("pandas")
+
+import rollup_events  # noqa: E402
+
+DAY_MS = 86_400_000
+
+
+def _write(path, events):
+    path.write_text("".join(json.dumps(e) + "\n" for e in events))
+    return str(path)
+
+
+def _event(ts, code="abc12", target=0):
+    return {"ts": ts, "code": code, "target": target, "url": f"https://{target}.com",
+            "country": None, "device": "desktop", "referer": None}
+
+
+# ---------------------------------------------------------------------------
+# TestRollup
+# ---------------------------------------------------------------------------
+
+class TestRollup:
+    def test_partitions_by_day_and_code(self, tmp_path):
+        path = _write(tmp_path / "events.jsonl", [_event(0), _event(1, "xyz99"), _event(DAY_MS)])
+        assert rollup_events.rollup([path], str(tmp_path / "visits")) == 3
+        partitions = sorted(str(p.parent.relative_to(tmp_path / "visits")) for p in (tmp_path / "visits").rglob("*.parquet"))
+        assert partitions == ["day=1970-01-01/code=abc12", "day=1970-01-01/code=xyz99", "day=1970-01-02/code=abc12"]
+
+    def test_pandas_loads_and_filters_the_dataset(self, tmp_path):
+        events = [_event(i, target=i % 3) for i in range(300)] + [_event(5, "xyz99")]
+        path = _write(tmp_path / "events.jsonl", events)
+        rollup_events.rollup([path], str(tmp_path / "visits"))
+        df = pd.read_parquet(tmp_path / "visits", filters=[("code", "=", "abc12")])
+        assert len(df) == 300
+        assert df["target"].value_counts().to_dict() == {0: 100, 1: 100, 2: 100}
+
+    def test_runs_append_to_existing_dataset(self, tmp_path):
+        out = str(tmp_path / "visits")
+        rollup_events.rollup([_write(tmp_path / "a.jsonl", [_event(0)])], out)
+        rollup_events.rollup([_write(tmp_path / "b.jsonl", [_event(1)])], out)
+        assert len(pd.read_parquet(out)) == 2
+
+    def test_unknown_fields_are_ignored(self, tmp_path):
+        path = _write(tmp_path / "events.jsonl", [{**_event(0), "extra": 1}])
+        assert rollup_events.rollup([path], str(tmp_path / "visits")) == 1
+
+    def test_main(self, tmp_path, capsys):
+        path = _write(tmp_path / "events.jsonl", [_event(0)])
+        assert rollup_events.main([path, "--output", str(tmp_path / "visits")]) == 0
+        assert "Wrote 1 events" in capsys.readouterr().out
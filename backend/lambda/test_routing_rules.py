@@ -0,0 +1,95 @@
+import pytest
+from routing_rules import MAX_RULES, RoutingRules, normalize_rules, validate_rules
+
+TARGETS = [{"url": "https://desktop.com", "weight": 1}, {"url": "https://mobile.com", "weight": 1}]
+IPHONE = "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) Mobile/15E148"
+# 2024-01-01 10:00 UTC
+TEN_AM = 1704103200
+
+
+def _rule(**conditions):
+    return {"weights": [0, 1], **conditions}
+
+
+# ---------------------------------------------------------------------------
+# TestValidateRules
+# ---------------------------------------------------------------------------
+
+class TestValidateRules:
+    def test_valid_rules_return_none(self):
+        rules = [_rule(country=["de", "AT"]), _rule(device=["mobile"], hours=[22, 6])]
+        assert validate_rules(rules, 2) is None
+
+    @pytest.mark.parametrize("rules", [
+        "mobile",
+        ["mobile"],
+        [{"weights": [0, 1]}],
+        [_rule(country="DE")],
+        [_rule(country=["DEU"])],
+        [_rule(country=[])],
+        [_rule(device=["phone"])],
+        [_rule(hours=[9])],
+        [_rule(hours=[9, 25])],
+        [_rule(hours=[9, 9])],
+        [_rule(hours=[True, 9])],
+        [{"device": ["mobile"], "weights": [1]}],
+        [{"device": ["mobile"], "weights": [0, 0]}],
+        [{"device": ["mobile"], "weights": [-1, 2]}],
+        [{"device": ["mobile"], "weights": [1, True]}],
+        [{"device": ["mobile"]}],
+        [_rule(device=["mobile"], referer=["x.com"])],
+    ])
+    def test_invalid_rules_return_error(self, rules):
+        assert validate_rules(rules, 2) is not None
+
+    def test_too_many_rules_returns_error(self):
+        assert validate_rules([_rule(device=["mobile"])] * (MAX_RULES + 1), 2) is not None
+
+    def test_normalize_upper_cases_countries(self):
+        assert normalize_rules([_rule(country=["de"])]) == [_rule(country=["DE"])]
+
+
+# ---------------------------------------------------------------------------
+# TestRoutingRules
+# ---------------------------------------------------------------------------
+
+class TestRoutingRules:
+    def test_device_rule(self):
+        rules = RoutingRules([_rule(device=["mobile", "tablet"])], TARGETS)
+        assert rules.match({"user-agent": IPHONE}, TEN_AM) == 0
+        assert rules.match({"user-agent": "Mozilla/5.0 (Windows NT 10.0)"}, TEN_AM) is None
+        assert rules.match({}, TEN_AM) is None
+
+    def test_country_rule(self):
+        rules = RoutingRules([_rule(country=["DE", "AT"])], TARGETS)
+        assert rules.match({"cloudfront-viewer-country": "AT"}, TEN_AM) == 0
+        assert rules.match({"cloudfront-viewer-country": "FR"}, TEN_AM) is None
+        assert rules.match({}, TEN_AM) is None
+
+    def test_hours_rule_wraps_past_midnight(self):
+        rules = RoutingRules([_rule(hours=[22, 6])], TARGETS)
+        assert rules.match({}, TEN_AM) is None
+        assert rules.match({}, TEN_AM + 13 * 3600) == 0
+        assert rules.match({}, TEN_AM + 18 * 3600) == 0
+        assert rules.match({}, TEN_AM + 20 * 3600) is None
+
+    def test_all_conditions_must_match(self):
+        rules = RoutingRules([_rule(country=["DE"], device=["mobile"])], TARGETS)
+        assert rules.match({"cloudfront-viewer-country": "DE", "user-agent": IPHONE}, TEN_AM) == 0
+        assert rules.match({"cloudfront-viewer-country": "DE"}, TEN_AM) is None
+        assert rules.match({"cloudfront-viewer-country": "FR", "user-agent": IPHONE}, TEN_AM) is None
+
+    def test_first_matching_rule_wins(self):
+        rules = RoutingRules([_rule(country=["DE"]), _rule(device=["mobile"])], TARGETS)
+        assert rules.match({"cloudfront-viewer-country": "DE", "user-agent": IPHONE}, TEN_AM) == 0
+        assert rules.match({"cloudfront-viewer-country": "FR", "user-agent": IPHONE}, TEN_AM) == 1
+
+    def test_table_covers_only_conditions_in_use(self):
+        assert len(RoutingRules([_rule(hours=[9, 17])], TARGETS)._table) == 24
+        assert len(RoutingRules([_rule(country=["DE"]), _rule(device=["bot"])], TARGETS)._table) == 2 * 5
+
+    def test_each_rule_gets_a_sampler_over_the_same_targets(self):
+        rules = RoutingRules([_rule(device=["mobile"])], TARGETS)
+        assert len(rules) == 1
+        assert rules.samplers[0].urls == ["https://desktop.com", "https://mobile.com"]
+        assert rules.samplers[0].pick_index() == 1
@@ -0,0 +1,158 @@
+import random
+from collections import Counter
+from decimal import Decimal
+
+import pytest
+from distribution import validate
+from sampler import AliasSampler
+
+
+def _validate(counter: Counter, keys: list, weights: list) -> dict:
+    return validate([counter[k] for k in keys], weights)
+
+
+# ---------------------------------------------------------------------------
+# TestAliasSampler
+# ---------------------------------------------------------------------------
+
+class TestAliasSampler:
+    def test_single_target_always_picked(self):
+        sampler = AliasSampler([{"url": "https://example.com", "weight": 1}])
+        assert all(sampler.pick() == "https://example.com" for _ in range(50))
+
+    def test_empty_targets_raises(self):
+        with pytest.raises(ValueError):
+            AliasSampler([])
+
+    def test_decimal_weights_are_accepted(self):
+        sampler = AliasSampler([
+            {"url": "https://a.com", "weight": Decimal("70")},
+            {"url": "https://b.com", "weight": Decimal("30")},
+        ])
+        assert sampler.pick() in {"https://a.com", "https://b.com"}
+
+    def test_pick_index_is_in_range(self):
+        sampler = AliasSampler([{"url": f"https://{i}.com", "weight": i + 1} for i in range(7)])
+        assert all(0 <= sampler.pick_index() < 7 for _ in range(500))
+
+    def test_tables_encode_exact_weight_ratios(self):
+        weights = [5, 1, 3, 0.5, 10.5, 2]
+        sampler = AliasSampler([{"url": f"https://{i}.com", "weight": w} for i, w in enumerate(weights)])
+        total = sum(weights)
+        for p, w in zip(sampler.probabilities(), weights):
+            assert p == pytest.approx(w / total)
+
+    def test_tables_encode_ratios_for_many_targets(self):
+        rng = random.Random(7)
+        weights = [rng.uniform(0.01, 100) for _ in range(1000)]
+        sampler = AliasSampler([{"url": f"https://{i}.com", "weight": w} for i, w in enumerate(weights)])
+        total = sum(weights)
+        for p, w in zip(sampler.probabilities(), weights):
+            assert p == pytest.approx(w / total, rel=1e-9)
+
+    @pytest.mark.parametrize("weights", [[1, 1, 1, 1, 1], [70, 30], [5, 1, 3, 0.5, 10.5, 2]])
+    def test_distribution_matches_random_choices(self, weights):
+        targets = [{"url": f"https://{i}.com", "weight": w} for i, w in enumerate(weights)]
+        urls = [t["url"] for t in targets]
+        n = 100_000
+
+        random.seed(1234)
+        sampler = AliasSampler(targets)
+        alias_counts = Counter(sampler.pick() for _ in range(n))
+        random.seed(1234)
+        choices_counts = Counter(random.choices(urls, weights=weights, k=n))
+
+        assert _validate(alias_counts, urls, weights)["passed"]
+        assert _validate(choices_counts, urls, weights)["passed"]
+
+
+# ---------------------------------------------------------------------------
+# TestPickIndices
+# ---------------------------------------------------------------------------
+
+class TestPickIndices:
+    @pytest.fixture(autouse=True)
+    def np(self):
+        return pytest.importorskip("numpy")
+
+    def test_returns_requested_number_of_indices_in_range(self, np):
+        sampler = AliasSampler([{"url": f"https://{i}.com", "weight": i + 1} for i in range(7)])
+        indices = sampler.pick_indices(10_000, np.random.default_rng(1))
+        assert indices.shape == (10_000,)
+        assert indices.min() >= 0 and indices.max() < 7
+
+    def test_single_target(self, np):
+        sampler = AliasSampler([{"url": "https://a.com", "weight": 3}])
+        assert set(sampler.pick_indices(100).tolist()) == {0}
+
+    @pytest.mark.parametrize("weights", [[1, 1, 1, 1, 1], [70, 30], [1000, 1], [5, 1, 3, 0.5, 10.5, 2]])
+    def test_distribution_matches_weights(self, np, weights):
+        sampler = AliasSampler([{"url": f"https://{i}.com", "weight": w} for i, w in enumerate(weights)])
+        counts = np.bincount(sampler.pick_indices(1_000_000, np.random.default_rng(7)), minlength=len(weights))
+        assert validate(counts.tolist(), weights)["passed"]
+
+    def test_distribution_matches_for_many_skewed_targets(self, np):
+        rng = random.Random(3)
+        weights = [rng.paretovariate(1.2) for _ in range(5_000)]
+        sampler = AliasSampler([{"url": f"https://{i}.com", "weight": w} for i, w in enumerate(weights)])
+        counts = np.bincount(sampler.pick_indices(2_000_000, np.random.default_rng(3)), minlength=len(weights))
+        assert validate(counts.tolist(), weights)["passed"]
+
+
+# ---------------------------------------------------------------------------
+# TestPickIndexFor
+# ---------------------------------------------------------------------------
+
+def _targets(weights):
+    return [{"url": f"https://{i}.com", "weight": w} for i, w in enumerate(weights)]
+
+
+class TestPickIndexFor:
+    def test_same_visitor_gets_same_target(self):
+        sampler = AliasSampler(_targets([1, 1, 1, 1, 1]))
+        picks = {sampler.pick_index_for("visitor-42", "abc12") for _ in range(20)}
+        assert len(picks) == 1
+
+    def test_assignment_survives_rebuilding_the_sampler(self):
+        visitors = [f"v{i}" for i in range(200)]
+        first = [AliasSampler(_targets([3, 1, 2])).pick_index_for(v, "abc12") for v in visitors]
+        second = [AliasSampler(_targets([3, 1, 2])).pick_index_for(v, "abc12") for v in visitors]
+        assert first == second
+
+    def test_salt_changes_assignment(self):
+        sampler = AliasSampler(_targets([1, 1, 1, 1, 1]))
+        visitors = [f"v{i}" for i in range(200)]
+        a = [sampler.pick_index_for(v, "abc12") for v in visitors]
+        b = [sampler.pick_index_for(v, "xyz99") for v in visitors]
+        assert a != b
+
+    def test_zero_weight_target_is_never_picked(self):
+        sampler = AliasSampler(_targets([1, 0, 1]))
+        assert all(sampler.pick_index_for(f"v{i}") != 1 for i in range(500))
+
+    @pytest.mark.parametrize("weights", [[1, 1, 1, 1, 1], [70, 30], [5, 1, 3, 0.5, 10.5, 2]])
+    def test_population_matches_weights(self, weights):
+        sampler = AliasSampler(_targets(weights))
+        counts = Counter(sampler.pick_index_for(f"visitor-{i}", "abc12") for i in range(20_000))
+        assert _validate(counts, list(range(len(weights))), weights)["passed"]
+
+    def test_weight_change_only_moves_visitors_to_the_changed_target(self):
+        before = AliasSampler(_targets([1, 1, 1, 1]))
+        after = AliasSampler(_targets([1, 1, 1, 2]))
+        visitors = [f"v{i}" for i in range(5_000)]
+        moved = [
+            (before.pick_index_for(v), after.pick_index_for(v))
+            for v in visitors
+            if before.pick_index_for(v) != after.pick_index_for(v)
+        ]
+        assert moved
+        assert all(new == 3 for _, new in moved)
+        # Minimum possible churn is the change in target 3's share: 2/5 - 1/4 = 15%.
+        assert len(moved) / len(visitors) == pytest.approx(0.15, abs=0.02)
+
+    def test_adding_a_target_keeps_other_assignments(self):
+        before = AliasSampler(_targets([1, 1, 1]))
+        after = AliasSampler(_targets([1, 1, 1, 1]))
+        for i in range(2_000):
+            old, new = before.pick_index_for(f"v{i}"), after.pick_index_for(f"v{i}")
+            assert new == old or new == 3
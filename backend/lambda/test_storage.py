@@ -0,0 +1,491 @@
+import threading
+from decimal import Decimal
+from unittest.mock import MagicMock
+
+import pytest
+import storage
+from botocore.exceptions import ClientError
+from storage import (
+    BATCH_WRITE_SIZE,
+    DynamoStorage,
+    MemoryStorage,
+    RetryableStorageError,
+    SQLiteStorage,
+    StorageError,
+    deserialize,
+    deserialize_item,
+    parse_path,
+    serialize,
+    serialize_item,
+)
+
+
+def _client_error(code: str, operation: str = "PutItem") -> ClientError:
+    return ClientError({"Error": {"Code": code, "Message": ""}}, operation)
+
+
+# ---------------------------------------------------------------------------
+# TestParsePath
+# ---------------------------------------------------------------------------
+
+class TestParsePath:
+    def test_top_level_name(self):
+        assert parse_path("hits") == ["hits"]
+
+    def test_nested_list_element(self):
+        assert parse_path("targets[3].visits") == ["targets", 3, "visits"]
+
+    def test_invalid_path_raises(self):
+        with pytest.raises(ValueError):
+            parse_path("targets[x]")
+
+
+# ---------------------------------------------------------------------------
+# TestLocalStorage — the contract every backend must meet
+# ---------------------------------------------------------------------------
+
+class TestLocalStorage:
+    @pytest.fixture(params=["memory", "sqlite"])
+    def store(self, request, tmp_path):
+        if request.param == "memory":
+            return MemoryStorage()
+        return SQLiteStorage(str(tmp_path / "links.db"), "links")
+
+    def _item(self, code="abc12", visits=0):
+        return {
+            "short_code": code,
+            "targets": [{"url": "https://a.com", "weight": 1.5, "visits": visits}],
+            "expires_at": 9999999999,
+        }
+
+    def test_put_if_absent_then_get(self, store):
+        assert store.put_if_absent(self._item()) is True
+        assert store.get("abc12") == self._item()
+
+    def test_put_if_absent_refuses_existing_key(self, store):
+        store.put_if_absent(self._item())
+        assert store.put_if_absent(self._item(visits=7)) is False
+        assert store.get("abc12")["targets"][0]["visits"] == 0
+
+    def test_put_if_absent_replaces_expired_item(self, store):
+        store.put_if_absent({**self._item(), "expires_at": 100})
+        assert store.put_if_absent(self._item(visits=7), expired_before=101) is True
+        assert store.get("abc12")["targets"][0]["visits"] == 7
+
+    def test_put_if_absent_keeps_unexpired_item(self, store):
+        store.put_if_absent(self._item())
+        assert store.put_if_absent(self._item(visits=7), expired_before=101) is False
+        assert store.get("abc12")["targets"][0]["visits"] == 0
+
+    def test_put_if_absent_with_expiry_writes_new_item(self, store):
+        assert store.put_if_absent(self._item(), expired_before=101) is True
+        assert store.get("abc12") == self._item()
+
+    def test_get_missing_returns_none(self, store):
+        assert store.get("nope0") is None
+
+    def test_get_with_attributes_projects(self, store):
+        store.put_if_absent(self._item())
+        assert store.get("abc12", attributes=["expires_at"]) == {"expires_at": 9999999999}
+
+    def test_stored_item_is_isolated_from_caller(self, store):
+        item = self._item()
+        store.put_if_absent(item)
+        item["targets"][0]["url"] = "https://changed.com"
+        assert store.get("abc12")["targets"][0]["url"] == "https://a.com"
+
+    def test_batch_put_and_batch_get(self, store):
+        items = [self._item(f"c{i:04d}") for i in range(250)]
+        assert store.batch_put(items) == []
+        found = store.batch_get([f"c{i:04d}" for i in range(0, 300, 2)])
+        assert set(found) == {f"c{i:04d}" for i in range(0, 250, 2)}
+
+    def test_scan_segments_split_the_table(self, store, monkeypatch):
+        monkeypatch.setattr(storage, "SCAN_PAGE_SIZE", 7)
+        store.batch_put([self._item(f"c{i:04d}") for i in range(50)])
+        segments = [[item["short_code"] for item in store.scan(k, 3, attributes=["short_code"])] for k in range(3)]
+        assert sorted(sum(segments, [])) == [f"c{i:04d}" for i in range(50)]
+        assert all(segments)
+        assert set(next(store.scan(attributes=["short_code"]))) == {"short_code"}
+        assert len(list(store.scan())) == 50
+
+    def test_batch_put_overwrites(self, store):
+        store.put_if_absent(self._item())
+        store.batch_put([self._item(visits=9)])
+        assert store.get("abc12")["targets"][0]["visits"] == 9
+
+    def test_increment_nested_path(self, store):
+        store.put_if_absent(self._item())
+        store.increment("abc12", {"targets[0].visits": 3})
+        store.increment("abc12", {"targets[0].visits": 2})
+        assert store.get("abc12")["targets"][0]["visits"] == 5
+
+    def test_increment_missing_item_with_must_exist_returns_none(self, store):
+        assert store.increment("nope0", {"hits": 1}) is None
+        assert store.get("nope0") is None
+
+    def test_increment_creates_top_level_counter(self, store):
+        assert store.increment("counter", {"next_value": 10}, must_exist=False) == {"next_value": 10}
+        assert store.increment("counter", {"next_value": 10}, must_exist=False) == {"next_value": 20}
+
+    def test_increment_sets_values_in_the_same_write(self, store):
+        assert store.increment("rate", {"used": 2}, must_exist=False, values={"expires_at": 100}) == {"used": 2}
+        assert store.get("rate") == {"short_code": "rate", "used": 2, "expires_at": 100}
+
+    def test_increment_with_expected_values(self, store):
+        store.put_if_absent({**self._item(), "version": 2})
+        assert store.increment("abc12", {"targets[0].visits": 1}, expected={"version": 1}) is None
+        assert store.get("abc12")["targets"][0]["visits"] == 0
+        assert store.increment("abc12", {"targets[0].visits": 1}, expected={"version": 2}) == {}
+        assert store.get("abc12")["targets"][0]["visits"] == 1
+        assert store.increment("abc12", {"targets[0].visits": 1}, expected={"version": None}) is None
+
+    def test_concurrent_increments_are_not_lost(self, store):
+        store.put_if_absent(self._item())
+
+        def bump():
+            for _ in range(50):
+                store.increment("abc12", {"targets[0].visits": 1})
+
+        threads = [threading.Thread(target=bump) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert store.get("abc12")["targets"][0]["visits"] == 200
+
+    def test_update_sets_top_level_attributes(self, store):
+        store.put_if_absent(self._item())
+        assert store.update("abc12", {"replicas": 4, "expires_at": 5}) is True
+        item = store.get("abc12")
+        assert item["replicas"] == 4
+        assert item["expires_at"] == 5
+        assert item["targets"] == self._item()["targets"]
+
+    def test_update_missing_item_with_must_exist_returns_false(self, store):
+        assert store.update("nope0", {"replicas": 4}) is False
+        assert store.get("nope0") is None
+
+    def test_update_applies_when_expected_values_match(self, store):
+        store.put_if_absent({**self._item(), "version": 1})
+        assert store.update("abc12", {"version": 2}, expected={"version": 1}) is True
+        assert store.get("abc12")["version"] == 2
+
+    def test_update_refuses_when_expected_values_differ(self, store):
+        store.put_if_absent({**self._item(), "version": 2})
+        assert store.update("abc12", {"version": 3}, expected={"version": 1}) is False
+        assert store.get("abc12")["version"] == 2
+
+    def test_update_expected_none_means_absent(self, store):
+        store.put_if_absent(self._item())
+        assert store.update("abc12", {"version": 2}, expected={"version": None}) is True
+        assert store.update("abc12", {"version": 3}, expected={"version": None}) is False
+
+    def test_update_removes_attributes(self, store):
+        store.put_if_absent(self._item())
+        assert store.update("abc12", {"format": "packed"}, remove=["targets"]) is True
+        assert store.get("abc12") == {"short_code": "abc12", "format": "packed", "expires_at": 9999999999}
+
+
+# ---------------------------------------------------------------------------
+# TestSQLiteStorage
+# ---------------------------------------------------------------------------
+
+class TestSQLiteStorage:
+    def test_uses_wal_journal(self, tmp_path):
+        store = SQLiteStorage(str(tmp_path / "links.db"), "links")
+        assert store._connect().execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    def test_data_is_shared_between_instances(self, tmp_path):
+        path = str(tmp_path / "links.db")
+        SQLiteStorage(path, "links").put_if_absent({"short_code": "abc12"})
+        assert SQLiteStorage(path, "links").get("abc12") == {"short_code": "abc12"}
+
+    def test_tables_are_separate(self, tmp_path):
+        path = str(tmp_path / "links.db")
+        SQLiteStorage(path, "qaktus-links").put_if_absent({"short_code": "abc12"})
+        assert SQLiteStorage(path, "qaktus-counters").get("abc12") is None
+
+    def test_binary_values_round_trip(self, tmp_path):
+        store = SQLiteStorage(str(tmp_path / "links.db"), "links")
+        store.batch_put([{"short_code": "abc12~0", "packed": b"\x00\xffblob", "visits": [0, 1]}])
+        assert store.get("abc12~0") == {"short_code": "abc12~0", "packed": b"\x00\xffblob", "visits": [0, 1]}
+
+
+# ---------------------------------------------------------------------------
+# TestDynamoStorage
+# ---------------------------------------------------------------------------
+
+class TestDynamoStorage:
+    @pytest.fixture
+    def client(self, monkeypatch):
+        monkeypatch.setattr(storage, "_backoff", lambda attempt: None)
+        client = MagicMock()
+        client.batch_get_item.return_value = {"Responses": {"links": []}}
+        client.batch_write_item.return_value = {"UnprocessedItems": {}}
+        return client
+
+    @pytest.fixture
+    def store(self, client):
+        return DynamoStorage("links", client=client)
+
+    def test_put_if_absent_is_conditional(self, store, client):
+        assert store.put_if_absent({"short_code": "abc12"}) is True
+        kwargs = client.put_item.call_args[1]
+        assert kwargs["TableName"] == "links"
+        assert kwargs["ConditionExpression"] == "attribute_not_exists(#key)"
+        assert kwargs["ExpressionAttributeNames"] == {"#key": "short_code"}
+
+    def test_put_if_absent_serializes_item(self, store, client):
+        store.put_if_absent({"short_code": "abc12", "targets": [{"weight": 0.5}]})
+        assert client.put_item.call_args[1]["Item"] == {
+            "short_code": {"S": "abc12"},
+            "targets": {"L": [{"M": {"weight": {"N": "0.5"}}}]},
+        }
+
+    def test_put_if_absent_can_replace_expired_item(self, store, client):
+        store.put_if_absent({"short_code": "abc12"}, expired_before=100)
+        kwargs = client.put_item.call_args[1]
+        assert kwargs["ConditionExpression"] == "attribute_not_exists(#key) OR #expires_at < :expired_before"
+        assert kwargs["ExpressionAttributeNames"] == {"#key": "short_code", "#expires_at": "expires_at"}
+        assert kwargs["ExpressionAttributeValues"] == {":expired_before": {"N": "100"}}
+
+    def test_put_if_absent_returns_false_on_condition_failure(self, store, client):
+        client.put_item.side_effect = _client_error("ConditionalCheckFailedException")
+        assert store.put_if_absent({"short_code": "abc12"}) is False
+
+    def test_throttling_raises_retryable_error(self, store, client):
+        client.put_item.side_effect = _client_error("ProvisionedThroughputExceededException")
+        with pytest.raises(RetryableStorageError):
+            store.put_if_absent({"short_code": "abc12"})
+
+    def test_consistent_get_uses_consistent_read(self, store, client):
+        client.get_item.return_value = {}
+        store.get("abc12", consistent=True)
+        assert client.get_item.call_args[1]["ConsistentRead"] is True
+
+    def test_internal_server_error_is_not_retryable(self, store, client):
+        client.update_item.side_effect = _client_error("InternalServerError", "UpdateItem")
+        with pytest.raises(StorageError) as exc:
+            store.increment("abc12", {"targets[0].visits": 1})
+        assert not isinstance(exc.value, RetryableStorageError)
+
+    def test_increments_use_a_client_that_does_not_retry(self, monkeypatch):
+        monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+        monkeypatch.setattr(storage, "_shared_clients", {})
+        store = DynamoStorage("links")
+        increment_client = store._get_increment_client()
+        assert increment_client is not store._get_client()
+        assert increment_client.meta.config.retries["total_max_attempts"] == 1
+        assert DynamoStorage("counters")._get_increment_client() is increment_client
+
+    def test_other_client_error_raises_storage_error(self, store, client):
+        client.put_item.side_effect = _client_error("ValidationException")
+        with pytest.raises(StorageError) as exc:
+            store.put_if_absent({"short_code": "abc12"})
+        assert not isinstance(exc.value, RetryableStorageError)
+
+    def test_get_uses_key_and_projection(self, store, client):
+        client.get_item.return_value = {"Item": {"targets": {"L": []}}}
+        assert store.get("abc12", attributes=["targets"]) == {"targets": []}
+        kwargs = client.get_item.call_args[1]
+        assert kwargs["Key"] == {"short_code": {"S": "abc12"}}
+        assert kwargs["ProjectionExpression"] == "#a0"
+        assert kwargs["ExpressionAttributeNames"] == {"#a0": "targets"}
+
+    def test_get_missing_returns_none(self, store, client):
+        client.get_item.return_value = {}
+        assert store.get("abc12") is None
+
+    def test_warm_issues_a_get_and_ignores_errors(self, store, client):
+        client.get_item.side_effect = _client_error("AccessDeniedException", "GetItem")
+        store.warm()
+        client.get_item.assert_called_once()
+
+    def test_batch_put_is_chunked_to_batch_write_size(self, store, client):
+        items = [{"short_code": f"c{i}"} for i in range(BATCH_WRITE_SIZE * 2 + 1)]
+        assert store.batch_put(items) == []
+        sizes = sorted(len(c[1]["RequestItems"]["links"]) for c in client.batch_write_item.call_args_list)
+        assert sizes == [1, BATCH_WRITE_SIZE, BATCH_WRITE_SIZE]
+
+    def test_batch_put_retries_unprocessed_items(self, store, client):
+        client.batch_write_item.side_effect = [
+            {"UnprocessedItems": {"links": [{"PutRequest": {"Item": {"short_code": {"S": "c0"}}}}]}},
+            {"UnprocessedItems": {}},
+        ]
+        assert store.batch_put([{"short_code": "c0"}, {"short_code": "c1"}]) == []
+        assert client.batch_write_item.call_count == 2
+
+    def test_batch_put_returns_persistently_unprocessed_items(self, store, client):
+        client.batch_write_item.return_value = {
+            "UnprocessedItems": {"links": [{"PutRequest": {"Item": {"short_code": {"S": "c0"}}}}]}
+        }
+        assert store.batch_put([{"short_code": "c0"}]) == [{"short_code": "c0"}]
+
+    def test_batch_get_retries_unprocessed_keys(self, store, client):
+        client.batch_get_item.side_effect = [
+            {
+                "Responses": {"links": [{"short_code": {"S": "a"}}]},
+                "UnprocessedKeys": {"links": {"Keys": [{"short_code": {"S": "b"}}]}},
+            },
+            {"Responses": {"links": [{"short_code": {"S": "b"}}]}},
+        ]
+        assert set(store.batch_get(["a", "b"])) == {"a", "b"}
+
+    def test_batch_get_projection_always_includes_key(self, store, client):
+        store.batch_get(["a"], attributes=["targets"])
+        request = client.batch_get_item.call_args[1]["RequestItems"]["links"]
+        assert set(request["ExpressionAttributeNames"].values()) == {"short_code", "targets"}
+
+    def test_scan_follows_pages_of_its_segment(self, store, client):
+        client.scan.side_effect = [
+            {"Items": [{"short_code": {"S": "a"}}], "LastEvaluatedKey": {"short_code": {"S": "a"}}},
+            {"Items": [{"short_code": {"S": "b"}}]},
+        ]
+        assert list(store.scan(1, 4, attributes=["short_code"])) == [{"short_code": "a"}, {"short_code": "b"}]
+        first, second = (c[1] for c in client.scan.call_args_list)
+        assert (first["Segment"], first["TotalSegments"]) == (1, 4)
+        assert "ExclusiveStartKey" not in first
+        assert second["ExclusiveStartKey"] == {"short_code": {"S": "a"}}
+
+    def test_scan_retries_throttling(self, store, client):
+        client.scan.side_effect = [_client_error("ThrottlingException", "Scan"), {"Items": []}]
+        assert list(store.scan()) == []
+        assert "Segment" not in client.scan.call_args[1]
+
+    def test_increment_nested_uses_set_and_condition(self, store, client):
+        store.increment("abc12", {"targets[0].visits": 2})
+        kwargs = client.update_item.call_args[1]
+        assert kwargs["UpdateExpression"] == "SET #n0[0].#n1 = #n0[0].#n1 + :v0"
+        assert kwargs["ExpressionAttributeNames"]["#n0"] == "targets"
+        assert kwargs["ExpressionAttributeValues"] == {":v0": {"N": "2"}}
+        assert kwargs["ConditionExpression"] == "attribute_exists(#key)"
+
+    def test_increment_paths_share_name_placeholders(self, store, client):
+        store.increment("abc12", {"targets[0].visits": 1, "targets[7].visits": 2})
+        kwargs = client.update_item.call_args[1]
+        assert kwargs["UpdateExpression"] == "SET #n0[0].#n1 = #n0[0].#n1 + :v0, #n0[7].#n1 = #n0[7].#n1 + :v1"
+        assert kwargs["ExpressionAttributeNames"] == {"#n0": "targets", "#n1": "visits", "#key": "short_code"}
+
+    def test_increment_top_level_uses_add_and_returns_new_value(self, store, client):
+        client.update_item.return_value = {"Attributes": {"next_value": {"N": "2000"}}}
+        result = store.increment("short_code", {"next_value": 1000}, must_exist=False)
+        kwargs = client.update_item.call_args[1]
+        assert kwargs["UpdateExpression"] == "ADD #n0 :v0"
+        assert "ConditionExpression" not in kwargs
+        assert result == {"next_value": 2000}
+
+    def test_increment_values_are_set_alongside_add(self, store, client):
+        client.update_item.return_value = {"Attributes": {"used": {"N": "3"}}}
+        store.increment("rate#k#1", {"used": 1}, must_exist=False, values={"expires_at": 30})
+        kwargs = client.update_item.call_args[1]
+        assert kwargs["UpdateExpression"] == "SET #s0 = :s0 ADD #n0 :v0"
+        assert kwargs["ExpressionAttributeNames"] == {"#s0": "expires_at", "#n0": "used"}
+        assert kwargs["ExpressionAttributeValues"] == {":s0": {"N": "30"}, ":v0": {"N": "1"}}
+
+    def test_increment_with_expected_values(self, store, client):
+        store.increment("abc12", {"targets[0].visits": 2}, expected={"version": 3, "format": None})
+        kwargs = client.update_item.call_args[1]
+        assert kwargs["ExpressionAttributeNames"]["#e0"] == "version"
+        assert kwargs["ExpressionAttributeValues"][":e0"] == {"N": "3"}
+        assert kwargs["ConditionExpression"] == (
+            "attribute_exists(#key) AND #e0 = :e0 AND attribute_not_exists(#e1)"
+        )
+
+    def test_update_uses_set_and_condition(self, store, client):
+        assert store.update("abc12", {"replicas": 4}) is True
+        kwargs = client.update_item.call_args[1]
+        assert kwargs["UpdateExpression"] == "SET #n0 = :v0"
+        assert kwargs["ExpressionAttributeNames"] == {"#n0": "replicas", "#key": "short_code"}
+        assert kwargs["ExpressionAttributeValues"] == {":v0": {"N": "4"}}
+        assert kwargs["ConditionExpression"] == "attribute_exists(#key)"
+
+    def test_update_with_expected_values_and_remove(self, store, client):
+        assert store.update("abc12", {"version": 2}, expected={"version": 1, "dedup_key": None}, remove=["targets"])
+        kwargs = client.update_item.call_args[1]
+        assert kwargs["UpdateExpression"] == "SET #n0 = :v0 REMOVE #r0"
+        assert kwargs["ExpressionAttributeNames"] == {
+            "#n0": "version", "#r0": "targets", "#key": "short_code", "#e0": "version", "#e1": "dedup_key",
+        }
+        assert kwargs["ExpressionAttributeValues"] == {":v0": {"N": "2"}, ":e0": {"N": "1"}}
+        assert kwargs["ConditionExpression"] == (
+            "attribute_exists(#key) AND #e0 = :e0 AND attribute_not_exists(#e1)"
+        )
+
+    def test_update_missing_item_returns_false(self, store, client):
+        client.update_item.side_effect = _client_error("ConditionalCheckFailedException", "UpdateItem")
+        assert store.update("abc12", {"replicas": 4}) is False
+
+    def test_increment_missing_item_returns_none(self, store, client):
+        client.update_item.side_effect = _client_error("ConditionalCheckFailedException", "UpdateItem")
+        assert store.increment("abc12", {"targets[0].visits": 1}) is None
+
+
+# ---------------------------------------------------------------------------
+# TestItemCodec
+# ---------------------------------------------------------------------------
+
+class TestItemCodec:
+    _item = {
+        "short_code": "abc12",
+        "targets": [
+            {"url": "https://a.com", "weight": 70, "visits": 0},
+            {"url": "https://b.com", "weight": 0.5, "visits": 12},
+        ],
+        "expires_at": 1767225600,
+        "flag": True,
+        "nothing": None,
+    }
+
+    def test_round_trip(self):
+        assert deserialize_item(serialize_item(self._item)) == self._item
+
+    def test_matches_botocore_serializer(self):
+        from boto3.dynamodb.types import TypeSerializer
+
+        reference = TypeSerializer()
+        item = {**self._item, "targets": [{**t, "weight": Decimal(str(t["weight"]))} for t in self._item["targets"]]}
+        assert serialize_item(item) == {k: reference.serialize(v) for k, v in item.items()}
+
+    def test_numbers_decode_to_int_or_float(self):
+        assert deserialize({"N": "70"}) == 70
+        assert isinstance(deserialize({"N": "70"}), int)
+        assert deserialize({"N": "0.25"}) == 0.25
+        assert deserialize({"N": "1E+2"}) == 100.0
+
+    def test_decimal_is_encoded_as_number(self):
+        assert serialize(Decimal("1.5")) == {"N": "1.5"}
+
+    def test_unknown_type_raises(self):
+        with pytest.raises(ValueError):
+            deserialize({"SS": ["a"]})
+
+
+# ---------------------------------------------------------------------------
+# TestFromEnv
+# ---------------------------------------------------------------------------
+
+class TestFromEnv:
+    def test_default_backend_is_dynamodb(self, monkeypatch):
+        monkeypatch.delenv("STORAGE_BACKEND", raising=False)
+        monkeypatch.setenv("TABLE_NAME", "links")
+        store = storage.from_env("TABLE_NAME")
+        assert isinstance(store, DynamoStorage)
+        assert store.table_name == "links"
+
+    def test_memory_backend_is_shared_per_table(self, monkeypatch):
+        monkeypatch.setenv("STORAGE_BACKEND", "memory")
+        monkeypatch.setenv("TABLE_NAME", "shared-test-table")
+        assert storage.from_env("TABLE_NAME") is storage.from_env("TABLE_NAME")
+
+    def test_sqlite_backend_uses_sqlite_path(self, monkeypatch, tmp_path):
+        monkeypatch.setenv("STORAGE_BACKEND", "sqlite")
+        monkeypatch.setenv("SQLITE_PATH", str(tmp_path / "q.db"))
+        store = storage.from_env("TABLE_NAME")
+        assert isinstance(store, SQLiteStorage)
+        assert store.path == str(tmp_path / "q.db")
+
+    def test_unknown_backend_raises(self, monkeypatch):
+        monkeypatch.setenv("STORAGE_BACKEND", "redis")
+        with pytest.raises(ValueError):
+            storage.from_env("TABLE_NAME")
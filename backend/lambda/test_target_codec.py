@@ -0,0 +1,133 @@
+import random
+import zlib
+
+import pytest
+from distribution import counts_from_indices, validate
+from target_codec import (
+    PACKED_FORMAT,
+    PackedTargets,
+    ShardedSampler,
+    encode,
+    pack_link,
+    shard_key,
+    unpack_targets,
+)
+
+
+def _targets(n, weight=lambda i: i % 7 + 1):
+    return [{"url": f"https://example.com/{i}", "weight": weight(i), "visits": i % 3} for i in range(n)]
+
+
+def _sampler(items):
+    primary, *shards = items
+    loaded = []
+
+    def load(k):
+        loaded.append(k)
+        return PackedTargets(shards[k]["packed"])
+
+    return ShardedSampler(primary["shards"], load), loaded
+
+
+# ---------------------------------------------------------------------------
+# TestPackedTargets
+# ---------------------------------------------------------------------------
+
+class TestPackedTargets:
+    def test_round_trips_urls_and_weights(self):
+        packed = PackedTargets(encode(["https://a.com", "https://ü.com"], [2.0, 5.0]))
+        assert packed.count == 2
+        assert packed.total == 5.0
+        assert packed.targets() == [
+            {"url": "https://a.com", "weight": 2.0},
+            {"url": "https://ü.com", "weight": 3.0},
+        ]
+
+    def test_index_for_follows_cumulative_weights(self):
+        packed = PackedTargets(encode(["a", "b", "c"], [1.0, 3.0, 6.0]))
+        assert [packed.index_for(x) for x in (0.0, 0.99, 1.0, 2.5, 3.0, 5.99)] == [0, 0, 1, 1, 2, 2]
+
+    def test_blob_is_compressed(self):
+        urls = [f"https://example.com/campaign?id={i}" for i in range(1000)]
+        blob = encode(urls, [float(i + 1) for i in range(1000)])
+        assert len(blob) < sum(len(u) for u in urls)
+
+    def test_unknown_version_is_rejected(self):
+        raw = zlib.decompress(encode(["a"], [1.0]))
+        with pytest.raises(ValueError):
+            PackedTargets(zlib.compress(b"\x02" + raw[1:]))
+
+
+# ---------------------------------------------------------------------------
+# TestPackLink
+# ---------------------------------------------------------------------------
+
+class TestPackLink:
+    def test_primary_holds_directory_only(self):
+        item = {"short_code": "abc12", "targets": _targets(10), "expires_at": 123}
+        primary, *shards = pack_link(item)
+        assert primary["format"] == PACKED_FORMAT
+        assert primary["count"] == 10
+        assert primary["total_weight"] == sum(t["weight"] for t in item["targets"])
+        assert primary["expires_at"] == 123
+        assert "targets" not in primary
+        assert [s["short_code"] for s in shards] == [shard_key("abc12", 0)]
+
+    def test_splits_into_shards_by_size(self):
+        item = {"short_code": "abc12", "targets": _targets(100)}
+        primary, *shards = pack_link(item, max_shard_bytes=500)
+        assert len(shards) > 1
+        assert sum(s["count"] for s in primary["shards"]) == 100
+        assert [s["short_code"] for s in shards] == [shard_key("abc12", k) for k in range(len(shards))]
+
+    def test_later_versions_get_their_own_shard_keys(self):
+        item = {"short_code": "abc12", "targets": _targets(100), "version": 3}
+        primary, *shards = pack_link(item, max_shard_bytes=500)
+        assert primary["version"] == 3
+        assert [s["short_code"] for s in shards] == [f"abc12~3.{k}" for k in range(len(shards))]
+        assert shard_key("abc12", 0, 1) == "abc12~0"
+
+    def test_shards_carry_expiry_for_ttl(self):
+        _, *shards = pack_link({"short_code": "abc12", "targets": _targets(100), "expires_at": 9}, max_shard_bytes=500)
+        assert all(s["expires_at"] == 9 for s in shards)
+
+    def test_unpack_restores_targets_and_visits(self):
+        targets = _targets(100)
+        _, *shards = pack_link({"short_code": "abc12", "targets": targets}, max_shard_bytes=500)
+        assert unpack_targets(shards) == [{**t, "weight": float(t["weight"])} for t in targets]
+
+
+# ---------------------------------------------------------------------------
+# TestShardedSampler
+# ---------------------------------------------------------------------------
+
+class TestShardedSampler:
+    def test_urls_index_across_shards(self):
+        sampler, _ = _sampler(pack_link({"short_code": "abc12", "targets": _targets(100)}, max_shard_bytes=500))
+        assert len(sampler.urls) == 100
+        assert [sampler.urls[i] for i in (0, 37, 99)] == [f"https://example.com/{i}" for i in (0, 37, 99)]
+
+    def test_locate_maps_global_index_to_shard(self):
+        items = pack_link({"short_code": "abc12", "targets": _targets(100)}, max_shard_bytes=500)
+        sampler, _ = _sampler(items)
+        first = items[0]["shards"][0]["count"]
+        assert sampler.locate(0) == (0, 0)
+        assert sampler.locate(first) == (1, 0)
+
+    def test_only_the_picked_shard_is_loaded(self, monkeypatch):
+        sampler, loaded = _sampler(pack_link({"short_code": "abc12", "targets": _targets(100)}, max_shard_bytes=500))
+        monkeypatch.setattr(random, "random", lambda: 0.0)
+        assert sampler.pick_index() == 0
+        assert sampler.pick_index() == 0
+        assert loaded == [0]
+
+    def test_sticky_pick_is_stable(self):
+        sampler, _ = _sampler(pack_link({"short_code": "abc12", "targets": _targets(100)}, max_shard_bytes=500))
+        assert len({sampler.pick_index_for("visitor-1", "abc12") for _ in range(10)}) == 1
+
+    def test_picks_follow_weights(self):
+        targets = _targets(300, weight=lambda i: (i * 37) % 50 + 1)
+        sampler, _ = _sampler(pack_link({"short_code": "abc12", "targets": targets}, max_shard_bytes=2000))
+        random.seed(7)
+        counts = counts_from_indices((sampler.pick_index() for _ in range(60_000)), len(targets))
+        assert validate(counts, [t["weight"] for t in targets])["passed"]
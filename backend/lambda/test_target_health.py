@@ -0,0 +1,253 @@
+import json
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import redirect
+import target_health
+from hot_set import FileSource, TableSource
+from storage import MemoryStorage
+from target_health import HealthScores, build_scores, probe, probe_all, update_score, urls_from_events
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def _scores(scores, mode="skip", **kwargs):
+    source = TableSource(MemoryStorage(), target_health.SCORES_KEY, "scores")
+    source.publish(scores)
+    clock = FakeClock(source.load()["built_at"] + 1)
+    health = HealthScores(source, mode, clock=clock, **kwargs)
+    health.refresh()
+    return health, source, clock
+
+
+# ---------------------------------------------------------------------------
+# TestUpdateScore
+# ---------------------------------------------------------------------------
+
+class TestUpdateScore:
+    def test_first_success_records_latency(self):
+        assert update_score(None, True, 120.0) == [1, 120.0, 0]
+
+    def test_down_after_consecutive_failures(self):
+        score = update_score(None, False, None)
+        assert score == [1, 0, 1]
+        assert update_score(score, False, None) == [0, 0, 2]
+
+    def test_one_success_brings_it_back(self):
+        assert update_score([0, 100.0, 5], True, 100.0) == [1, 100.0, 0]
+
+    def test_latency_is_smoothed(self):
+        assert update_score([1, 100.0, 0], True, 200.0) == [1, 130.0, 0]
+
+    def test_failures_keep_the_last_latency(self):
+        assert update_score([1, 100.0, 0], False, None)[1] == 100.0
+
+
+# ---------------------------------------------------------------------------
+# TestHealthScores
+# ---------------------------------------------------------------------------
+
+class TestHealthScores:
+    URLS = ["https://a.com", "https://b.com", "https://c.com"]
+
+    def test_down_targets_get_no_weight(self):
+        health, _, _ = _scores({"https://b.com": [0, 0, 3]})
+        assert health.adjust(self.URLS, [1.0, 1.0, 2.0]) == [1.0, 0.0, 2.0]
+
+    def test_unchanged_weights_return_none(self):
+        health, _, _ = _scores({"https://b.com": [1, 50.0, 0]})
+        assert health.adjust(self.URLS, [1.0, 1.0, 1.0]) is None
+
+    def test_latency_mode_favours_fast_targets(self):
+        health, _, _ = _scores({"https://a.com": [1, 0.0, 0], "https://b.com": [1, 600.0, 0]}, "latency")
+        assert health.adjust(self.URLS[:2], [1.0, 1.0]) == [1.0, 0.25]
+
+    def test_all_down_keeps_configured_weights(self):
+        health, _, _ = _scores({url: [0, 0, 2] for url in self.URLS})
+        assert health.adjust(self.URLS, [1.0, 1.0, 1.0]) is None
+
+    def test_old_scores_are_ignored(self):
+        health, _, clock = _scores({"https://b.com": [0, 0, 3]}, max_age=60)
+        assert health.current() == 1
+        clock.now += 61
+        assert health.current() == 0
+        assert health.adjust(self.URLS, [1.0, 1.0, 1.0]) is None
+
+    def test_unknown_mode_is_rejected(self):
+        with pytest.raises(ValueError):
+            HealthScores(FileSource("/nonexistent", field="scores"), "fastest")
+
+    def test_from_env(self, monkeypatch):
+        monkeypatch.delenv("HEALTH_ROUTING", raising=False)
+        assert target_health.from_env(MemoryStorage) is None
+        monkeypatch.setenv("HEALTH_ROUTING", "latency")
+        monkeypatch.delenv("HEALTH_SOURCE", raising=False)
+        health = target_health.from_env(MemoryStorage)
+        assert health.mode == "latency"
+        assert health.source.key == target_health.SCORES_KEY
+
+
+# ---------------------------------------------------------------------------
+# TestBuilding
+# ---------------------------------------------------------------------------
+
+class TestBuilding:
+    def test_urls_from_events_most_visited_first(self, tmp_path):
+        path = tmp_path / "events.jsonl"
+        urls = ["https://a.com", "https://b.com", "https://b.com", "https://c.com", "https://b.com", "https://a.com"]
+        path.write_text("".join(json.dumps({"code": "abc12", "url": u}) + "\n" for u in urls))
+        assert urls_from_events([str(path)], 2) == ["https://b.com", "https://a.com"]
+
+    def test_urls_from_events_skips_non_event_lines(self, tmp_path):
+        path = tmp_path / "events.jsonl"
+        path.write_text(
+            "START RequestId: 1f2e Version: $LATEST\n"
+            + json.dumps({"code": "abc12", "url": "https://a.com"}) + "\n"
+            + '2026-10-18T12:00:00Z {"code": "abc12", "url": "https://b.com"}\n'
+            + "{not json\n"
+            + json.dumps(["https://c.com"]) + "\n"
+            + json.dumps({"code": "abc12"}) + "\n"
+            + json.dumps({"code": "abc12", "url": "https://a.com"}) + "\n"
+        )
+        assert urls_from_events([str(path)], 5) == ["https://a.com", "https://b.com"]
+
+    def test_reports_from_files_skips_non_report_lines(self, tmp_path):
+        path = tmp_path / "reports.jsonl"
+        path.write_text(
+            "END RequestId: 1f2e\n"
+            + json.dumps({"url": "https://a.com", "ok": False}) + "\n"
+            + "{truncated\n"
+            + json.dumps({"ok": True}) + "\n"
+            + json.dumps({"url": "https://b.com"}) + "\n"
+        )
+        assert target_health.reports_from_files([str(path)]) == [{"url": "https://a.com", "ok": False}]
+
+    def test_build_scores_merges_probes_and_reports(self):
+        previous = {"https://a.com": [1, 100.0, 1], "https://gone.com": [1, 10.0, 0]}
+        probes = {"https://a.com": (False, None), "https://b.com": (True, 40.0)}
+        reports = [{"url": "https://c.com", "ok": False}, {"url": "https://b.com", "ok": True, "latency_ms": 140.0}]
+        assert build_scores(previous, probes, reports) == {
+            "https://a.com": [0, 100.0, 2],
+            "https://b.com": [1, 70.0, 0],
+            "https://c.com": [1, 0, 1],
+        }
+
+    def test_main_publishes_scores(self, tmp_path, monkeypatch, capsys):
+        events = tmp_path / "events.jsonl"
+        events.write_text(json.dumps({"code": "abc12", "url": "https://a.com"}) + "\n")
+        reports = tmp_path / "reports.jsonl"
+        reports.write_text(json.dumps({"url": "https://b.com", "ok": False}) + "\n")
+        monkeypatch.setattr(target_health, "probe", lambda url, timeout: (True, 12.0))
+        output = tmp_path / "health.bin"
+        args = [str(events), "--reports", str(reports), "--unhealthy-after", "1", "--output", str(output)]
+        assert target_health.main(args) == 0
+        snapshot = FileSource(str(output), field="scores").load()
+        assert snapshot["scores"] == {"https://a.com": [1, 12.0, 0], "https://b.com": [0, 0, 1]}
+        assert "1 down" in capsys.readouterr().out
+
+
+# ---------------------------------------------------------------------------
+# TestProbe
+# ---------------------------------------------------------------------------
+
+class _Destination(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status):
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_HEAD(self):
+        self._send({"/ok": 200, "/missing": 404, "/broken": 503, "/no-head": 405}[self.path])
+
+    def do_GET(self):
+        self._send(200)
+
+
+class TestProbe:
+    @pytest.fixture
+    def server(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _Destination)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+        server.shutdown()
+
+    def test_statuses_below_500_are_up(self, server):
+        ok, latency_ms = probe(f"{server}/ok")
+        assert ok and latency_ms >= 0
+        assert probe(f"{server}/missing")[0] is True
+        assert probe(f"{server}/broken")[0] is False
+
+    def test_falls_back_to_get_when_head_is_refused(self, server):
+        assert probe(f"{server}/no-head")[0] is True
+
+    def test_unreachable_is_down(self):
+        assert probe("http://127.0.0.1:1/", timeout=1) == (False, None)
+
+    def test_probe_all_keeps_order(self, server):
+        urls = [f"{server}/broken", f"{server}/ok"]
+        assert [ok for ok, _ in probe_all(urls).values()] == [False, True]
+
+
+# ---------------------------------------------------------------------------
+# TestRedirectHealthRouting
+# ---------------------------------------------------------------------------
+
+class TestRedirectHealthRouting:
+    TARGETS = [
+        {"url": "https://a.com", "weight": 1, "visits": 0},
+        {"url": "https://down.com", "weight": 9, "visits": 0},
+    ]
+
+    @pytest.fixture(autouse=True)
+    def health(self, monkeypatch):
+        redirect._storage = MemoryStorage()
+        redirect._storage.put_if_absent({"short_code": "abc12", "targets": self.TARGETS})
+        health, _, _ = _scores({"https://down.com": [0, 0, 2]})
+        monkeypatch.setattr(redirect, "_health", health)
+        yield health
+
+    @staticmethod
+    def _get():
+        return redirect.handler({"pathParameters": {"short_code": "abc12"}}, None)
+
+    def test_down_target_is_skipped(self):
+        assert {self._get()["headers"]["Location"] for _ in range(50)} == {"https://a.com"}
+
+    def test_visits_count_against_configured_targets(self):
+        self._get()
+        redirect._visits.flush()
+        assert [t["visits"] for t in redirect._storage.get("abc12")["targets"]] == [1, 0]
+
+    def test_scores_are_not_read_on_requests(self, health, monkeypatch):
+        monkeypatch.setattr(health.source, "generation", lambda: pytest.fail("scores read"))
+        monkeypatch.setattr(health.source, "load", lambda: pytest.fail("scores read"))
+        for _ in range(5):
+            self._get()
+
+    def test_adjusted_sampler_is_built_once_per_generation(self, health):
+        self._get()
+        link = redirect.get_link("abc12")
+        sampler = link.routed[1][None]
+        self._get()
+        assert link.routed[1][None] is sampler
+        health.source.publish({})
+        health.refresh()
+        self._get()
+        assert link.routed[1][None] is link.sampler
+
+    def test_disabled_routing_uses_configured_weights(self, monkeypatch):
+        monkeypatch.setattr(redirect, "_health", None)
+        monkeypatch.setattr(random, "random", lambda: 0.99)
+        assert self._get()["headers"]["Location"] == "https://down.com"
@@ -0,0 +1,135 @@
+import threading
+
+import pytest
+from visit_counter import RetryableFlushError, StaleFlushError, VisitBuffer
+
+
+class RecordingFlush:
+    def __init__(self):
+        self.calls = []
+        self.fail_with = None
+
+    def __call__(self, short_code, version, increments):
+        if self.fail_with is not None:
+            raise self.fail_with
+        self.calls.append((short_code, version, dict(increments)))
+
+
+# ---------------------------------------------------------------------------
+# TestVisitBuffer
+# ---------------------------------------------------------------------------
+
+class TestVisitBuffer:
+    @pytest.fixture
+    def flush_fn(self):
+        return RecordingFlush()
+
+    @pytest.fixture
+    def buffer(self, flush_fn):
+        buf = VisitBuffer(flush_fn, max_pending=1_000_000, flush_interval=3600)
+        yield buf
+        buf.reset()
+
+    def test_record_does_not_flush_immediately(self, buffer, flush_fn):
+        buffer.record("abc12", 0)
+        assert flush_fn.calls == []
+        assert buffer.pending() == 1
+
+    def test_flush_aggregates_per_code_and_index(self, buffer, flush_fn):
+        for _ in range(3):
+            buffer.record("abc12", 0)
+        buffer.record("abc12", 1)
+        buffer.record("xyz99", 2)
+        buffer.flush()
+        assert sorted(flush_fn.calls) == [("abc12", None, {0: 3, 1: 1}), ("xyz99", None, {2: 1})]
+        assert buffer.pending() == 0
+
+    def test_versions_of_a_code_are_flushed_apart(self, buffer, flush_fn):
+        buffer.record("abc12", 0, 1)
+        buffer.record("abc12", 0, 2)
+        buffer.record("abc12", 1, 2)
+        buffer.flush()
+        assert sorted(flush_fn.calls) == [("abc12", 1, {0: 1}), ("abc12", 2, {0: 1, 1: 1})]
+
+    def test_second_flush_does_not_resend_counts(self, buffer, flush_fn):
+        buffer.record("abc12", 0)
+        buffer.flush()
+        buffer.flush()
+        assert len(flush_fn.calls) == 1
+
+    def test_retryable_failure_requeues_counts(self, buffer, flush_fn):
+        buffer.record("abc12", 0)
+        buffer.record("abc12", 0)
+        flush_fn.fail_with = RetryableFlushError("throttled")
+        buffer.flush()
+        assert buffer.pending() == 2
+        flush_fn.fail_with = None
+        buffer.flush()
+        assert flush_fn.calls == [("abc12", None, {0: 2})]
+
+    def test_partly_applied_flush_requeues_only_the_rest(self, buffer):
+        def partial(short_code, version, increments):
+            raise RetryableFlushError("throttled", {1: increments[1]})
+
+        buf = VisitBuffer(partial, max_pending=1_000_000, flush_interval=3600)
+        buf.record("abc12", 0)
+        buf.record("abc12", 1)
+        buf.record("abc12", 1)
+        buf.flush()
+        assert buf.pending() == 2
+        assert buf.flushed == 1
+
+    def test_stale_counts_are_dropped(self, buffer, flush_fn):
+        buffer.record("abc12", 0, 1)
+        flush_fn.fail_with = StaleFlushError("updated")
+        buffer.flush()
+        assert buffer.pending() == 0
+        assert buffer.dropped == 1
+
+    def test_other_failure_drops_counts(self, buffer, flush_fn):
+        buffer.record("abc12", 0)
+        flush_fn.fail_with = RuntimeError("unknown outcome")
+        buffer.flush()
+        assert buffer.pending() == 0
+        assert buffer.dropped == 1
+
+    def test_failure_for_one_code_does_not_block_others(self):
+        calls = []
+
+        def flaky(short_code, version, increments):
+            if short_code == "bad00":
+                raise RetryableFlushError("throttled")
+            calls.append(short_code)
+
+        buf = VisitBuffer(flaky, max_pending=1_000_000, flush_interval=3600)
+        buf.record("bad00", 0)
+        buf.record("good0", 0)
+        buf.flush()
+        assert calls == ["good0"]
+        assert buf.pending() == 1
+
+    def test_size_threshold_triggers_background_flush(self):
+        done = threading.Event()
+        calls = []
+
+        def flush_fn(short_code, version, increments):
+            calls.append(increments)
+            done.set()
+
+        buf = VisitBuffer(flush_fn, max_pending=3, flush_interval=3600)
+        for _ in range(3):
+            buf.record("abc12", 0)
+        assert done.wait(timeout=5)
+        assert calls == [{0: 3}]
+
+    def test_time_threshold_triggers_background_flush(self):
+        done = threading.Event()
+        buf = VisitBuffer(lambda code, version, inc: done.set(), max_pending=1_000_000, flush_interval=0.05)
+        buf.record("abc12", 0)
+        assert done.wait(timeout=5)
+
+    def test_close_flushes_remaining_counts(self, flush_fn):
+        buf = VisitBuffer(flush_fn, max_pending=1_000_000, flush_interval=3600)
+        buf.record("abc12", 4)
+        buf.close()
+        assert flush_fn.calls == [("abc12", None, {4: 1})]
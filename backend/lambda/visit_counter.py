@@ -0,0 +1,169 @@
+import atexit
+import logging
+import signal
+import threading
+import time
+from collections import Counter
+from typing import Callable
+
+logger = logging.getLogger()
+
+
+def install_shutdown_hooks(close: Callable[[], None]) -> None:
+    """Run ``close`` on interpreter exit and on SIGTERM.
+
+    Lambda only sends SIGTERM to the runtime when at least one extension
+    is registered; without one the time threshold is the backstop.
+    """
+    atexit.register(close)
+    try:
+        previous = signal.getsignal(signal.SIGTERM)
+    except ValueError:
+        return
+
+    def on_sigterm(signum, frame):
+        close()
+        if callable(previous):
+            previous(signum, frame)
+        else:
+            raise SystemExit(0)
+
+    try:
+        signal.signal(signal.SIGTERM, on_sigterm)
+    except ValueError:
+        # Not on the main thread; atexit still covers a clean exit.
+        pass
+
+
+class RetryableFlushError(Exception):
+    """Raised by a flush function when the write definitely did not apply and can be retried.
+
+    A flush written in several parts passes the counts of the parts that
+    did not apply as ``remaining``; None means none of them did.
+    """
+
+    def __init__(self, message: str, remaining: dict[int, int] | None = None):
+        super().__init__(message)
+        self.remaining = remaining
+
+
+class StaleFlushError(Exception):
+    """Raised by a flush function when the counts are for a version of the item that is no longer current."""
+
+
+class VisitBuffer:
+    """In-process aggregation buffer for per-target visit counts.
+
+    ``record`` only bumps a counter; a daemon thread hands the aggregated
+    counts to ``flush_fn(short_code, version, {target_index: visits})`` once
+    ``max_pending`` visits are buffered, every ``flush_interval`` seconds,
+    and on shutdown. Counts are kept apart by the item version they were
+    recorded against (None when the key alone pins it), since positions in
+    one version's target list mean nothing in another's. Counts are taken
+    out of the buffer before writing, so a flush that succeeds can never be
+    applied twice. Counts are put back only when ``flush_fn`` raises
+    ``RetryableFlushError``; ``StaleFlushError`` and any other error drop
+    them, trading a possible undercount for no double-counting.
+    """
+
+    def __init__(
+        self,
+        flush_fn: Callable[[str, int | None, dict[int, int]], None],
+        max_pending: int = 500,
+        flush_interval: float = 10.0,
+    ):
+        self._flush_fn = flush_fn
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self._counts: Counter[tuple[str, int | None, int]] = Counter()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.flushed = 0
+        self.dropped = 0
+
+    def record(self, short_code: str, index: int, version: int | None = None) -> None:
+        with self._lock:
+            self._counts[(short_code, version, index)] += 1
+            self._pending += 1
+            full = self._pending >= self.max_pending
+        if self._thread is None:
+            self._start()
+        if full:
+            self._wake.set()
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._pending
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            with self._lock:
+                counts, self._counts = self._counts, Counter()
+                self._pending = 0
+            if not counts:
+                return
+
+            by_code: dict[tuple[str, int | None], dict[int, int]] = {}
+            for (short_code, version, index), n in counts.items():
+                by_code.setdefault((short_code, version), {})[index] = n
+
+            for (short_code, version), increments in by_code.items():
+                total = sum(increments.values())
+                try:
+                    self._flush_fn(short_code, version, increments)
+                    self.flushed += total
+                except RetryableFlushError as e:
+                    logger.warning("Visit flush for '%s' will be retried: %s", short_code, e)
+                    remaining = increments if e.remaining is None else e.remaining
+                    self.flushed += total - sum(remaining.values())
+                    self._requeue(short_code, version, remaining)
+                except StaleFlushError as e:
+                    logger.info("Dropping %d visits for '%s': %s", total, short_code, e)
+                    self.dropped += total
+                except Exception:
+                    logger.exception("Dropping %d visits for '%s'", total, short_code)
+                    self.dropped += total
+
+    def close(self) -> None:
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.flush_interval)
+        self.flush()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counts.clear()
+            self._pending = 0
+
+    def install_shutdown_hooks(self) -> None:
+        install_shutdown_hooks(self.close)
+
+    def _requeue(self, short_code: str, version: int | None, increments: dict[int, int]) -> None:
+        with self._lock:
+            for index, n in increments.items():
+                self._counts[(short_code, version, index)] += n
+                self._pending += n
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="visit-flusher", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        last_flush = time.monotonic()
+        while not self._stopped.is_set():
+            remaining = self.flush_interval - (time.monotonic() - last_flush)
+            self._wake.wait(timeout=max(remaining, 0))
+            self._wake.clear()
+            if self._stopped.is_set():
+                return
+            if self.pending() >= self.max_pending or time.monotonic() - last_flush >= self.flush_interval:
+                self.flush()
+                last_flush = time.monotonic()
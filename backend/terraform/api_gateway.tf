@@ -5,8 +5,8 @@ resource "aws_apigatewayv2_api" "api" {
 
   cors_configuration {
     allow_origins = ["*"]
-    allow_methods = ["GET", "POST", "OPTIONS"]
-    allow_headers = ["Content-Type"]
+    allow_methods = ["GET", "POST", "PATCH", "OPTIONS"]
+    allow_headers = ["Content-Type", "Idempotency-Key", "Authorization"]
     max_age       = 300
   }
 }
@@ -24,6 +24,19 @@ resource "aws_apigatewayv2_route" "generate_link" {
   target    = "integrations/${aws_apigatewayv2_integration.generate_link.id}"
 }
 
+resource "aws_apigatewayv2_integration" "generate_links" {
+  api_id                 = aws_apigatewayv2_api.api.id
+  integration_type       = "AWS_PROXY"
+  integration_uri        = aws_lambda_function.generate_links.invoke_arn
+  payload_format_version = "2.0"
+}
+
+resource "aws_apigatewayv2_route" "generate_links" {
+  api_id    = aws_apigatewayv2_api.api.id
+  route_key = "POST /generate-links"
+  target    = "integrations/${aws_apigatewayv2_integration.generate_links.id}"
+}
+
 resource "aws_apigatewayv2_stage" "default" {
   api_id      = aws_apigatewayv2_api.api.id
   name        = "$default"
@@ -42,3 +55,29 @@ resource "aws_apigatewayv2_route" "redirect" {
   route_key = "GET /{short_code}"
   target    = "integrations/${aws_apigatewayv2_integration.redirect.id}"
 }
+
+resource "aws_apigatewayv2_integration" "resolve" {
+  api_id                 = aws_apigatewayv2_api.api.id
+  integration_type       = "AWS_PROXY"
+  integration_uri        = aws_lambda_function.resolve.invoke_arn
+  payload_format_version = "2.0"
+}
+
+resource "aws_apigatewayv2_route" "resolve" {
+  api_id    = aws_apigatewayv2_api.api.id
+  route_key = "POST /resolve"
+  target    = "integrations/${aws_apigatewayv2_integration.resolve.id}"
+}
+
+resource "aws_apigatewayv2_integration" "update_link" {
+  api_id                 = aws_apigatewayv2_api.api.id
+  integration_type       = "AWS_PROXY"
+  integration_uri        = aws_lambda_function.update_link.invoke_arn
+  payload_format_version = "2.0"
+}
+
+resource "aws_apigatewayv2_route" "update_link" {
+  api_id    = aws_apigatewayv2_api.api.id
+  route_key = "PATCH /{short_code}"
+  target    = "integrations/${aws_apigatewayv2_integration.update_link.id}"
+}
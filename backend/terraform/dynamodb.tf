@@ -13,3 +13,20 @@ resource "aws_dynamodb_table" "links" {
     enabled        = true
   }
 }
+
+resource "aws_dynamodb_table" "counters" {
+  name         = "qaktus-counters"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "name"
+
+  attribute {
+    name = "name"
+    type = "S"
+  }
+
+  # Rate limit window counters expire; the code allocator's counter has no expires_at.
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+}
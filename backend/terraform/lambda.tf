@@ -1,9 +1,14 @@
 data "aws_caller_identity" "current" {}
 
+locals {
+  lambda_source_excludes = ["test_*.py", "bench_*.py", "conftest.py", "asgi.py", "rollup_events.py", "distribution.py", "bulk_links.py", "__pycache__/**", ".pytest_cache/**"]
+}
+
 data "archive_file" "lambda_zip" {
   type        = "zip"
-  source_file = "${path.root}/../lambda/generate_link.py"
-  output_path = "${path.root}/../lambda/generate_link.zip"
+  source_dir  = "${path.root}/../lambda"
+  excludes    = local.lambda_source_excludes
+  output_path = "${path.root}/build/generate_link.zip"
 }
 
 resource "aws_iam_role" "lambda_exec" {
@@ -34,22 +39,94 @@ resource "aws_lambda_function" "generate_link" {
 
   environment {
     variables = {
-      TABLE_NAME = aws_dynamodb_table.links.name
+      TABLE_NAME               = aws_dynamodb_table.links.name
+      COUNTER_TABLE_NAME       = aws_dynamodb_table.counters.name
+      CODE_ALLOCATOR           = var.code_allocator
+      CODE_PERMUTATION_KEY     = var.code_permutation_key
+      METRICS_SINK             = var.metrics_sink
+      PACKED_TARGETS_THRESHOLD = "500"
+      CREATE_RATE_LIMIT        = var.create_rate_limit
+      CREATE_RATE_BURST        = var.create_rate_burst
     }
   }
 }
 
+resource "aws_lambda_function" "generate_links" {
+  function_name    = "qaktus-generate-links"
+  filename         = data.archive_file.lambda_zip.output_path
+  source_code_hash = data.archive_file.lambda_zip.output_base64sha256
+  runtime          = "python3.12"
+  handler          = "generate_link.bulk_handler"
+  role             = aws_iam_role.lambda_exec.arn
+  timeout          = 60
+  memory_size      = 512
+
+  environment {
+    variables = {
+      TABLE_NAME               = aws_dynamodb_table.links.name
+      COUNTER_TABLE_NAME       = aws_dynamodb_table.counters.name
+      CODE_ALLOCATOR           = var.code_allocator
+      CODE_PERMUTATION_KEY     = var.code_permutation_key
+      METRICS_SINK             = var.metrics_sink
+      PACKED_TARGETS_THRESHOLD = "500"
+      CREATE_RATE_LIMIT        = var.create_rate_limit
+      CREATE_RATE_BURST        = var.create_rate_burst
+    }
+  }
+}
+
+resource "aws_lambda_function" "update_link" {
+  function_name    = "qaktus-update-link"
+  filename         = data.archive_file.lambda_zip.output_path
+  source_code_hash = data.archive_file.lambda_zip.output_base64sha256
+  runtime          = "python3.12"
+  handler          = "generate_link.update_handler"
+  role             = aws_iam_role.lambda_exec.arn
+  timeout          = 30
+
+  environment {
+    variables = {
+      TABLE_NAME               = aws_dynamodb_table.links.name
+      METRICS_SINK             = var.metrics_sink
+      PACKED_TARGETS_THRESHOLD = "500"
+    }
+  }
+}
+
+resource "aws_lambda_permission" "update_link_apigw" {
+  statement_id  = "AllowAPIGatewayInvoke"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.update_link.function_name
+  principal     = "apigateway.amazonaws.com"
+  source_arn    = "arn:aws:execute-api:us-east-1:${data.aws_caller_identity.current.account_id}:${aws_apigatewayv2_api.api.id}/*/*"
+}
+
+resource "aws_lambda_permission" "generate_links_apigw" {
+  statement_id  = "AllowAPIGatewayInvoke"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.generate_links.function_name
+  principal     = "apigateway.amazonaws.com"
+  source_arn    = "arn:aws:execute-api:us-east-1:${data.aws_caller_identity.current.account_id}:${aws_apigatewayv2_api.api.id}/*/*"
+}
+
 resource "aws_iam_role_policy" "lambda_dynamodb" {
   name = "qaktus-lambda-dynamodb"
   role = aws_iam_role.lambda_exec.id
 
   policy = jsonencode({
     Version = "2012-10-17"
-    Statement = [{
-      Effect   = "Allow"
-      Action   = ["dynamodb:PutItem"]
-      Resource = aws_dynamodb_table.links.arn
-    }]
+    Statement = [
+      {
+        Effect   = "Allow"
+        Action   = ["dynamodb:GetItem", "dynamodb:PutItem", "dynamodb:UpdateItem", "dynamodb:BatchWriteItem", "dynamodb:BatchGetItem"]
+        Resource = aws_dynamodb_table.links.arn
+      },
+      {
+        Effect   = "Allow"
+        Action   = ["dynamodb:UpdateItem"]
+        Resource = aws_dynamodb_table.counters.arn
+      },
+    ]
   })
 }
 
@@ -65,8 +142,9 @@ resource "aws_lambda_permission" "apigw" {
 
 data "archive_file" "redirect_zip" {
   type        = "zip"
-  source_file = "${path.root}/../lambda/redirect.py"
-  output_path = "${path.root}/../lambda/redirect.zip"
+  source_dir  = "${path.root}/../lambda"
+  excludes    = local.lambda_source_excludes
+  output_path = "${path.root}/build/redirect.zip"
 }
 
 resource "aws_iam_role" "redirect_lambda_exec" {
@@ -95,7 +173,7 @@ resource "aws_iam_role_policy" "redirect_dynamo" {
     Version = "2012-10-17"
     Statement = [{
       Effect   = "Allow"
-      Action   = ["dynamodb:GetItem"]
+      Action   = ["dynamodb:GetItem", "dynamodb:UpdateItem", "dynamodb:BatchWriteItem", "dynamodb:BatchGetItem"]
       Resource = aws_dynamodb_table.links.arn
     }]
   })
@@ -111,7 +189,29 @@ resource "aws_lambda_function" "redirect" {
 
   environment {
     variables = {
-      TABLE_NAME = aws_dynamodb_table.links.name
+      TABLE_NAME               = aws_dynamodb_table.links.name
+      LINK_CACHE_SIZE          = "10000"
+      LINK_CACHE_TTL           = "60"
+      LINK_CACHE_NEGATIVE_TTL  = "5"
+      VISIT_FLUSH_SIZE         = "500"
+      VISIT_FLUSH_INTERVAL     = "10"
+      STICKY_KEY               = var.sticky_key
+      REDIRECT_MAX_AGE         = "86400"
+      STICKY_MAX_AGE           = "300"
+      HOT_KEY_THRESHOLD        = "1000"
+      HOT_KEY_WINDOW           = "10"
+      HOT_KEY_REPLICAS         = "8"
+      REPLICA_TTL              = "3600"
+      HOT_SET_SOURCE           = "table"
+      HOT_SET_REFRESH_INTERVAL = "300"
+      HOT_SET_MAX_AGE          = "3600"
+      HEALTH_ROUTING           = var.health_routing
+      HEALTH_SOURCE            = "table"
+      HEALTH_REFRESH_INTERVAL  = "60"
+      HEALTH_MAX_AGE           = "900"
+      HEALTH_LATENCY_SCALE_MS  = "200"
+      VISIT_EVENTS_SINK        = var.visit_events_sink
+      METRICS_SINK             = var.metrics_sink
     }
   }
 }
@@ -123,3 +223,38 @@ resource "aws_lambda_permission" "redirect_apigw" {
   principal     = "apigateway.amazonaws.com"
   source_arn    = "arn:aws:execute-api:us-east-1:${data.aws_caller_identity.current.account_id}:${aws_apigatewayv2_api.api.id}/*/*"
 }
+
+resource "aws_lambda_function" "resolve" {
+  function_name    = "qaktus-resolve"
+  filename         = data.archive_file.redirect_zip.output_path
+  source_code_hash = data.archive_file.redirect_zip.output_base64sha256
+  runtime          = "python3.12"
+  handler          = "redirect.resolve_handler"
+  role             = aws_iam_role.redirect_lambda_exec.arn
+  timeout          = 30
+  memory_size      = 512
+
+  environment {
+    variables = {
+      TABLE_NAME              = aws_dynamodb_table.links.name
+      LINK_CACHE_SIZE         = "10000"
+      LINK_CACHE_TTL          = "60"
+      LINK_CACHE_NEGATIVE_TTL = "5"
+      MAX_RESOLVE_CODES       = "1000"
+      HEALTH_ROUTING          = var.health_routing
+      HEALTH_SOURCE           = "table"
+      HEALTH_REFRESH_INTERVAL = "60"
+      HEALTH_MAX_AGE          = "900"
+      HEALTH_LATENCY_SCALE_MS = "200"
+      METRICS_SINK            = var.metrics_sink
+    }
+  }
+}
+
+resource "aws_lambda_permission" "resolve_apigw" {
+  statement_id  = "AllowAPIGatewayInvoke"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.resolve.function_name
+  principal     = "apigateway.amazonaws.com"
+  source_arn    = "arn:aws:execute-api:us-east-1:${data.aws_caller_identity.current.account_id}:${aws_apigatewayv2_api.api.id}/*/*"
+}
@@ -0,0 +1,48 @@
+variable "code_allocator" {
+  description = "Short code allocation mode: \"random\" (draw and retry on collision) or \"sequence\" (keyed permutation of a counter)"
+  type        = string
+  default     = "random"
+}
+
+variable "code_permutation_key" {
+  description = "Secret key for the sequence allocator's permutation. Changing it after codes were issued can cause collisions."
+  type        = string
+  sensitive   = true
+  default     = ""
+}
+
+variable "sticky_key" {
+  description = "Visitor identifier for sticky target assignment: \"ip\", \"header:<name>\", \"cookie:<name>\", or empty for an independent draw per click"
+  type        = string
+  default     = ""
+}
+
+variable "health_routing" {
+  description = "Health-aware target routing from the target_health.py scores: \"skip\" (no traffic to down targets), \"latency\" (also favour faster targets), or empty to disable"
+  type        = string
+  default     = ""
+}
+
+variable "create_rate_limit" {
+  description = "Links each client (API key, else source IP) may create per second through POST /generate-link, or \"0\" for no limit"
+  type        = string
+  default     = "0"
+}
+
+variable "create_rate_burst" {
+  description = "Links a client may create in a burst before create_rate_limit applies"
+  type        = string
+  default     = "20"
+}
+
+variable "metrics_sink" {
+  description = "Per-stage latency metrics: \"emf\" (CloudWatch Embedded Metric Format in the logs) or empty to disable"
+  type        = string
+  default     = "emf"
+}
+
+variable "visit_events_sink" {
+  description = "Per-click visit events from the redirect Lambda: \"stdout\" (CloudWatch Logs) or empty to disable"
+  type        = string
+  default     = ""
+}